@@ -1,7 +1,6 @@
 import os
 import subprocess
 import sys
-import threading
 import tkinter as tk
 from tkinter import messagebox
 
@@ -19,6 +18,8 @@ from matplotlib import font_manager
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 
+from watchlist_engine import WatchlistEngine
+
 
 # ==================== 0. 智能中文修复 (核心修改) ====================
 def get_chinese_font():
@@ -252,9 +253,18 @@ class StockMonitorApp:
         self.sell_signal_times = []  # 存储卖出信号时间点
         self.kline_options = [30, 60, 120, 'D']
         self.kline_idx = 1
+        self.use_choice = True
         
         self._setup_ui()
-        self._start_timer()
+        
+        # 多股票监控引擎: 批量轮询 config.WATCHLIST 中的股票，界面只订阅当前显示的股票
+        self.watchlist = WatchlistEngine(
+            codes=list(getattr(config, 'WATCHLIST', [])),
+            on_signal=self._on_signal,
+            history_loader=self._load_history,
+        )
+        self.watchlist.subscribe(self.current_code, self._on_symbol_update)
+        self.watchlist.start()
 
     def _setup_ui(self):
         control_frame = tk.Frame(self.root, pady=5)
@@ -266,7 +276,8 @@ class StockMonitorApp:
         self.entry_code.pack(side=tk.LEFT, padx=5)
         
         self.use_choice_var = tk.BooleanVar(value=True)
-        self.chk_choice = tk.Checkbutton(control_frame, text="优先Choice", variable=self.use_choice_var)
+        self.chk_choice = tk.Checkbutton(control_frame, text="优先Choice", variable=self.use_choice_var,
+                                         command=lambda: setattr(self, 'use_choice', self.use_choice_var.get()))
         self.chk_choice.pack(side=tk.LEFT, padx=5)
         
         btn_refresh = tk.Button(control_frame, text="确认/刷新", command=self.manual_refresh, bg="#e1f5fe")
@@ -287,77 +298,73 @@ class StockMonitorApp:
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         self.canvas.mpl_connect('scroll_event', self._on_scroll)
 
-    def _start_timer(self):
-        from datetime import datetime
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🔄 定时器触发 - 开始获取数据")
-        self.update_data()
-        self.root.after(60000, self._start_timer)
-
     def manual_refresh(self):
         code = self.entry_code.get().strip()
-        if code:
+        if not code:
+            return
+        if code != self.current_code:
+            # 换股票: 取消旧订阅（不在监控列表中的股票一并移除），订阅新股票
+            old_code = self.current_code
+            self.watchlist.unsubscribe(old_code, self._on_symbol_update)
+            if old_code not in getattr(config, 'WATCHLIST', []):
+                self.watchlist.remove(old_code)
             self.current_code = code
-            self.last_signal_time = None
-            # 清空历史信号（换股票时重置）
             self.buy_signal_times = []
             self.sell_signal_times = []
-            self.update_data()
+            self.watchlist.subscribe(code, self._on_symbol_update)
+        self.update_data()
 
     def update_data(self):
+        """重新加载当前股票的历史K线（Choice → 新浪 → Tushare）"""
         from datetime import datetime
         print(f"[{datetime.now().strftime('%H:%M:%S')}] 📡 开始获取股票 {self.current_code} 数据...")
-        use_choice = self.use_choice_var.get()
-        def task():
-            self.root.after(0, lambda: self.lbl_status.config(text=f"获取 {self.current_code}...", fg="blue"))
-            df, source = self.fetcher.get_realtime_data(self.current_code, use_choice=use_choice)
-            self.root.after(0, lambda: self.handle_data_update(df, source))
-        threading.Thread(target=task, daemon=True).start()
-
-    def handle_data_update(self, df, source):
+        self.lbl_status.config(text=f"获取 {self.current_code}...", fg="blue")
+        self.watchlist.reload(self.current_code)
+
+    def _load_history(self, code):
+        return self.fetcher.get_realtime_data(code, use_choice=self.use_choice)
+
+    def _on_symbol_update(self, code, state):
+        """引擎线程回调: 只在订阅的股票有变化时触发，切回主线程重绘"""
+        df = state.frame()
+        source = state.source
+        buy_times, sell_times = list(state.buy_times), list(state.sell_times)
+        self.root.after(0, lambda: self.handle_data_update(df, source, code, buy_times, sell_times))
+
+    def _on_signal(self, code, kind, bar_time, price):
+        """引擎线程回调: MACD 柱穿越零轴"""
+        if kind == 'buy':
+            print(f"【买入信号】{code} {bar_time} {price:.2f}")
+            self.run_bat_script("buy.bat", code)
+        else:
+            print(f"【卖出信号】{code} {bar_time} {price:.2f}")
+            self.run_bat_script("sell.bat", code)
+
+    def handle_data_update(self, df, source, code=None, buy_times=None, sell_times=None):
         from datetime import datetime
+        if code is not None and code != self.current_code:
+            return
         if df.empty:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] [FAIL] 数据获取失败 - 所有数据源不可用")
             self.lbl_status.config(text=f"获取失败: 数据源不可用 (Choice错误/新浪无数据)", fg="red")
             return
             
         self.df = df
+        if buy_times is not None:
+            self.buy_signal_times = buy_times
+        if sell_times is not None:
+            self.sell_signal_times = sell_times
         latest_price = df.iloc[-1]['Close']
         latest_time = df.index[-1].strftime('%H:%M')
         print(f"[{datetime.now().strftime('%H:%M:%S')}] [OK] 数据获取成功 - 来源: {source} | 现价: {latest_price:.2f} | 数据时间: {latest_time}")
         self.lbl_status.config(text=f"[OK] 来源: {source} | 现价: {latest_price:.2f} | 更新: {latest_time}", fg="green")
         
-        self.check_and_trigger_signal(df)
         self.redraw_chart()
 
-    def check_and_trigger_signal(self, df):
-        if df is None or len(df) < 30: return
-        try:
-            close_prices = df['Close'].values
-            dif, dea, macd_bar = MACD(close_prices)
-            curr_bar = macd_bar[-1]; prev_bar = macd_bar[-2]
-            current_time_idx = df.index[-1]
-            
-            if self.last_signal_time == current_time_idx: return
-            
-            signal_triggered = False
-            if prev_bar <= 0 and curr_bar > 0:
-                print(f"【买入信号】{current_time_idx}")
-                self.buy_signal_times.append(current_time_idx)
-                self.run_bat_script("buy.bat")
-                signal_triggered = True
-            elif prev_bar >= 0 and curr_bar < 0:
-                print(f"【卖出信号】{current_time_idx}")
-                self.sell_signal_times.append(current_time_idx)
-                self.run_bat_script("sell.bat")
-                signal_triggered = True
-            
-            if signal_triggered: self.last_signal_time = current_time_idx
-        except Exception as e: print(f"信号检测错误: {e}")
-
-    def run_bat_script(self, script_name):
+    def run_bat_script(self, script_name, code=None):
         try:
             script_path = os.path.join(CURRENT_DIR, script_name)
-            if os.path.exists(script_path): subprocess.Popen([script_path, self.current_code], shell=True)
+            if os.path.exists(script_path): subprocess.Popen([script_path, code or self.current_code], shell=True)
         except Exception: pass
 
     def _on_scroll(self, event):
@@ -0,0 +1,426 @@
+"""
+多股票监控引擎（无界面）
+
+- 每轮用一次新浪 hq 批量行情请求拉取 50~100 只股票的最新价，不再逐只拉取整段分钟K线;
+- 每只股票一个分钟K线环形缓冲区，最新价按分钟聚合进最后一根K线;
+- MACD 的 EMA 状态增量更新: 已走完的K线推进一次，未走完的K线只做临时计算;
+- 只有 MACD 柱穿越零轴时回调 on_signal，只有行情有变化时通知订阅该股票的界面。
+
+用法:
+    engine = WatchlistEngine(['600519', '000001'], on_signal=lambda code, kind, t, price: ...)
+    engine.subscribe('600519', lambda code, state: ...)
+    engine.start()
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+POLL_INTERVAL = 20      # 轮询间隔(秒)，一分钟内采样3次，保证每根分钟K线都有收盘价
+BATCH_SIZE = 80         # 每次 hq 请求的股票数
+BAR_CAPACITY = 300      # 每只股票保留的分钟K线数（与原先拉取的 300 根一致）
+MIN_SIGNAL_BARS = 30    # K线不足时不判断信号
+
+QUOTE_SOURCE = "新浪行情"
+SINA_HQ_URL = "https://hq.sinajs.cn/list="
+SINA_HEADERS = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://finance.sina.com.cn'}
+
+
+def sina_symbol(code: str) -> str:
+    """000001 / 000001.SZ → sz000001"""
+    if code.endswith('.SH'): return 'sh' + code.split('.')[0]
+    if code.endswith('.SZ'): return 'sz' + code.split('.')[0]
+    if code.endswith('.BJ'): return 'bj' + code.split('.')[0]
+    if code.startswith('6'): return 'sh' + code
+    if code.startswith(('4', '8')): return 'bj' + code
+    return 'sz' + code
+
+
+def fetch_sina_quotes(codes: List[str], session=None, timeout: float = 3) -> Dict[str, Tuple[datetime, float, float]]:
+    """
+    一次请求批量获取最新行情。
+
+    Returns:
+        {code: (行情时间, 最新价, 当日累计成交量)}，停牌或解析失败的股票不在结果中
+    """
+    if not codes:
+        return {}
+    symbols = {sina_symbol(c): c for c in codes}
+    http = session or requests
+    r = http.get(SINA_HQ_URL + ','.join(symbols), headers=SINA_HEADERS, timeout=timeout)
+    r.encoding = 'gbk'
+
+    quotes = {}
+    for line in r.text.splitlines():
+        # var hq_str_sh600000="名称,今开,昨收,最新价,最高,最低,买一,卖一,成交量,成交额,...,日期,时间,00";
+        try:
+            head, _, body = line.partition('="')
+            code = symbols.get(head.rsplit('_', 1)[-1])
+            fields = body.rstrip('";').split(',')
+            if code is None or len(fields) < 32:
+                continue
+            price = float(fields[3])
+            if price <= 0:
+                continue
+            ts = datetime.strptime(f"{fields[30]} {fields[31]}", '%Y-%m-%d %H:%M:%S')
+            quotes[code] = (ts, price, float(fields[8]))
+        except (ValueError, IndexError):
+            continue
+    return quotes
+
+
+def load_sina_minutes(code: str) -> Tuple[pd.DataFrame, str]:
+    """默认的历史K线加载: 新浪 300 根1分钟K线，只在开始监控时调用一次"""
+    try:
+        url = (f"https://quotes.sina.cn/cn/api/json_v2.php/CN_MarketData.getKLineData"
+               f"?symbol={sina_symbol(code)}&scale=1&ma=no&datalen={BAR_CAPACITY}")
+        data = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=3).json()
+        if not data:
+            return pd.DataFrame(), "Failed"
+        df = pd.DataFrame(data).rename(columns={
+            'day': 'trade_time', 'open': 'Open', 'high': 'High',
+            'low': 'Low', 'close': 'Close', 'volume': 'Volume'
+        })
+        df['trade_time'] = pd.to_datetime(df['trade_time'])
+        df.set_index('trade_time', inplace=True)
+        cols = ['Open', 'High', 'Low', 'Close', 'Volume']
+        df[cols] = df[cols].apply(pd.to_numeric, errors='coerce')
+        return df, "新浪财经"
+    except Exception:
+        return pd.DataFrame(), "Failed"
+
+
+class EMAState:
+    """增量 EMA，数值与 pd.Series.ewm(span=N, adjust=False).mean() 逐点一致"""
+
+    __slots__ = ('alpha', 'value')
+
+    def __init__(self, n: int):
+        self.alpha = 2.0 / (n + 1)
+        self.value = None
+
+    def peek(self, x: float) -> float:
+        """压入 x 后的 EMA 值，不改变状态"""
+        v = self.value
+        if v is None:
+            return x
+        if v == x:
+            return v
+        a = self.alpha
+        return ((1 - a) * v + a * x) / ((1 - a) + a)
+
+    def push(self, x: float) -> float:
+        self.value = self.peek(x)
+        return self.value
+
+
+class MACDState:
+    """增量 MACD(12, 26, 9)，公式同 main.MACD"""
+
+    def __init__(self, short: int = 12, long: int = 26, m: int = 9):
+        self.ema_short = EMAState(short)
+        self.ema_long = EMAState(long)
+        self.ema_dea = EMAState(m)
+
+    def peek(self, close: float) -> Tuple[float, float, float]:
+        dif = self.ema_short.peek(close) - self.ema_long.peek(close)
+        dea = self.ema_dea.peek(dif)
+        return dif, dea, (dif - dea) * 2
+
+    def push(self, close: float) -> Tuple[float, float, float]:
+        dif = self.ema_short.push(close) - self.ema_long.push(close)
+        dea = self.ema_dea.push(dif)
+        return dif, dea, (dif - dea) * 2
+
+
+class BarRing:
+    """定长分钟K线环形缓冲区"""
+
+    FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+    def __init__(self, capacity: int = BAR_CAPACITY):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype='datetime64[s]')
+        self.values = np.zeros((capacity, len(self.FIELDS)), dtype=np.float64)
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _pos(self, i: int) -> int:
+        return (self.start + (i % self.size if self.size else 0)) % self.capacity
+
+    def last_time(self) -> Optional[np.datetime64]:
+        return self.times[self._pos(-1)] if self.size else None
+
+    def last(self) -> np.ndarray:
+        return self.values[self._pos(-1)]
+
+    def append(self, t, open_, high, low, close, volume):
+        if self.size < self.capacity:
+            pos = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            pos = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[pos] = t
+        self.values[pos] = (open_, high, low, close, volume)
+
+    def frame(self) -> pd.DataFrame:
+        """按时间顺序的 DataFrame（索引 trade_time，列 Open/High/Low/Close/Volume）"""
+        order = (self.start + np.arange(self.size)) % self.capacity
+        df = pd.DataFrame(self.values[order], columns=list(self.FIELDS))
+        df.index = pd.DatetimeIndex(self.times[order], name='trade_time')
+        return df
+
+
+class SymbolState:
+    """单只股票的K线缓冲区、MACD 状态和信号记录"""
+
+    def __init__(self, code: str, capacity: int = BAR_CAPACITY):
+        self.code = code
+        self.bars = BarRing(capacity)
+        self.macd = MACDState()     # 推进到倒数第二根K线
+        self.prev_bar = None        # 倒数第二根K线的 MACD 柱
+        self.curr = None            # 最后一根K线的 (DIF, DEA, MACD柱)，临时值
+        self.cum_volume = None
+        self.last_quote = None
+        self.last_signal_time = None
+        self.buy_times = []
+        self.sell_times = []
+        self.source = ""
+        self.version = 0
+        self.seeded = False
+
+    def seed(self, df: pd.DataFrame, source: str = ""):
+        """用历史分钟K线初始化（列 Open/High/Low/Close/Volume，DatetimeIndex）"""
+        self.bars = BarRing(self.bars.capacity)
+        self.macd = MACDState()
+        self.prev_bar = self.curr = None
+        self.cum_volume = None
+        self.last_quote = None
+        self.source = source
+        self.seeded = True
+        if df is None or df.empty:
+            return
+        df = df.tail(self.bars.capacity)
+        times = df.index.values.astype('datetime64[s]')
+        values = df[list(BarRing.FIELDS)].to_numpy(dtype=np.float64)
+        for t, row in zip(times, values):
+            self._close_bar()
+            self.bars.append(t, *row)
+        self.curr = self.macd.peek(float(self.bars.last()[3]))
+        self.version += 1
+
+    def _close_bar(self):
+        """最后一根K线走完: 推进 MACD 状态"""
+        if self.bars.size:
+            self.prev_bar = self.macd.push(float(self.bars.last()[3]))[2]
+
+    def on_tick(self, ts: datetime, price: float, cum_volume: float) -> Tuple[bool, Optional[str]]:
+        """
+        处理一条最新行情，按分钟（右端点标记，同新浪分钟K线）聚合。
+
+        Returns:
+            (是否有变化, 'buy' / 'sell' / None)
+        """
+        quote = (ts, price, cum_volume)
+        if quote == self.last_quote:
+            return False, None
+        self.last_quote = quote
+
+        label = ts.replace(second=0, microsecond=0)
+        if ts.second or ts.microsecond:
+            label += timedelta(minutes=1)
+        label = np.datetime64(label, 's')
+
+        if self.cum_volume is None or cum_volume < self.cum_volume:
+            delta = 0.0 if self.cum_volume is None else cum_volume  # 跨日累计成交量归零
+        else:
+            delta = cum_volume - self.cum_volume
+        self.cum_volume = cum_volume
+
+        last_time = self.bars.last_time()
+        if last_time is None or label > last_time:
+            self._close_bar()
+            self.bars.append(label, price, price, price, price, delta)
+        elif label == last_time:
+            bar = self.bars.last()
+            bar[1] = max(bar[1], price)
+            bar[2] = min(bar[2], price)
+            bar[3] = price
+            bar[4] += delta
+        else:
+            return False, None
+
+        self.curr = self.macd.peek(price)
+        self.version += 1
+        return True, self._check_signal(label)
+
+    def _check_signal(self, label) -> Optional[str]:
+        """MACD 柱穿越零轴，同一根K线只触发一次"""
+        if len(self.bars) < MIN_SIGNAL_BARS or self.prev_bar is None or self.curr is None:
+            return None
+        if self.last_signal_time == label:
+            return None
+        prev_bar, curr_bar = self.prev_bar, self.curr[2]
+        signal = None
+        if prev_bar <= 0 and curr_bar > 0:
+            signal = 'buy'
+            self.buy_times.append(pd.Timestamp(label))
+        elif prev_bar >= 0 and curr_bar < 0:
+            signal = 'sell'
+            self.sell_times.append(pd.Timestamp(label))
+        if signal:
+            self.last_signal_time = label
+        return signal
+
+    def frame(self) -> pd.DataFrame:
+        return self.bars.frame()
+
+
+class WatchlistEngine:
+    """
+    批量轮询多只股票的监控引擎。
+
+    Args:
+        codes: 初始监控列表
+        on_signal: 信号回调 (code, 'buy'/'sell', K线时间, 最新价)，在轮询线程中调用
+        history_loader: 历史K线加载 code -> (DataFrame, 来源)，新增股票时调用一次
+        interval: 轮询间隔(秒)
+        batch_size: 每次 hq 请求的股票数
+    """
+
+    def __init__(self, codes: Optional[List[str]] = None,
+                 on_signal: Optional[Callable[[str, str, pd.Timestamp, float], None]] = None,
+                 history_loader: Optional[Callable[[str], Tuple[pd.DataFrame, str]]] = None,
+                 interval: float = POLL_INTERVAL, batch_size: int = BATCH_SIZE):
+        self.on_signal = on_signal
+        self.history_loader = history_loader or load_sina_minutes
+        self.interval = interval
+        self.batch_size = batch_size
+        self.states: Dict[str, SymbolState] = {}
+        self.subscribers: Dict[str, List[Callable]] = {}
+        self.session = requests.Session()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        for code in codes or []:
+            self.add(code)
+
+    # ---------------- 监控列表与订阅 ----------------
+    def add(self, code: str):
+        with self._lock:
+            if code not in self.states:
+                self.states[code] = SymbolState(code)
+        self._wake.set()
+
+    def remove(self, code: str):
+        with self._lock:
+            self.states.pop(code, None)
+            self.subscribers.pop(code, None)
+
+    def reload(self, code: str):
+        """下一轮重新加载该股票的历史K线"""
+        with self._lock:
+            state = self.states.get(code)
+            if state is not None:
+                state.seeded = False
+        self._wake.set()
+
+    def subscribe(self, code: str, callback: Callable[[str, SymbolState], None]):
+        """订阅单只股票的更新，callback(code, state) 在轮询线程中调用"""
+        self.add(code)
+        with self._lock:
+            self.subscribers.setdefault(code, []).append(callback)
+            state = self.states[code]
+        if state.seeded and len(state.bars):
+            callback(code, state)
+
+    def unsubscribe(self, code: str, callback: Callable = None):
+        with self._lock:
+            if callback is None:
+                self.subscribers.pop(code, None)
+            elif callback in self.subscribers.get(code, []):
+                self.subscribers[code].remove(callback)
+
+    def state(self, code: str) -> Optional[SymbolState]:
+        return self.states.get(code)
+
+    # ---------------- 轮询 ----------------
+    def _notify(self, code: str, state: SymbolState):
+        for callback in list(self.subscribers.get(code, [])):
+            try:
+                callback(code, state)
+            except Exception as e:
+                print(f"[WARN] 订阅回调异常 {code}: {e}")
+
+    def _emit(self, code: str, signal: str, state: SymbolState):
+        if self.on_signal is None:
+            return
+        try:
+            self.on_signal(code, signal, pd.Timestamp(state.bars.last_time()), float(state.bars.last()[3]))
+        except Exception as e:
+            print(f"[WARN] 信号回调异常 {code}: {e}")
+
+    def poll_once(self) -> int:
+        """执行一轮轮询，返回有变化的股票数"""
+        with self._lock:
+            pending = [s for s in self.states.values() if not s.seeded]
+        for state in pending:
+            df, source = self.history_loader(state.code)
+            with self._lock:
+                state.seed(df, source)
+            self._notify(state.code, state)
+
+        with self._lock:
+            codes = list(self.states)
+        changed = 0
+        for i in range(0, len(codes), self.batch_size):
+            batch = codes[i:i + self.batch_size]
+            try:
+                quotes = fetch_sina_quotes(batch, session=self.session)
+            except Exception as e:
+                print(f"[WARN] 批量行情获取失败 ({len(batch)}只): {e}")
+                continue
+            for code, (ts, price, volume) in quotes.items():
+                with self._lock:
+                    state = self.states.get(code)
+                    if state is None:
+                        continue
+                    updated, signal = state.on_tick(ts, price, volume)
+                    if updated:
+                        state.source = QUOTE_SOURCE
+                if signal:
+                    self._emit(code, signal, state)
+                if updated:
+                    changed += 1
+                    self._notify(code, state)
+        return changed
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"[WARN] 轮询异常: {e}")
+            self._wake.wait(max(0.0, self.interval - (time.time() - started)))
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
@@ -130,6 +130,15 @@ except ImportError:
     PERFORMANCE_OPTIMIZATION_AVAILABLE = False
     print("性能优化模块不可用，将使用标准处理")
 
+# 当日分析缓存：追加日志 + 定期压缩（与本文件同目录）
+if os.path.dirname(os.path.abspath(__file__)) not in sys.path:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from daily_cache_journal import DailyCacheJournal
+# LLM 响应缓存（同一股票同一提示词重复分析时直接命中）
+from llm_cache import get_llm_cache
+# 综合数据存储（按股票、按数据类别读取，不必解析整卷 JSON）
+from stock_data_store import open_stock_data_store, store_path_for
+
 # 导入筹码分析模块
 try:
     from chip_health_analyzer import ChipHealthAnalyzer
@@ -584,6 +593,7 @@ class AShareAnalyzerGUI:
         shared_data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'TradingShared', 'data')
         self.cache_file = os.path.join(shared_data_dir, 'stock_analysis_cache.json')
         self.daily_cache = {}            # 当日股票分析缓存
+        self.cache_journal = DailyCacheJournal(self.cache_file)  # 逐条追加日志，定期压缩成快照
         self.load_daily_cache()          # 加载当日缓存
 
         # 新增：批量评分数据存储 - 按LLM模型分别保存在共享data目录下
@@ -829,8 +839,11 @@ class AShareAnalyzerGUI:
             if not os.path.exists(data_dir):
                 return "无本地数据"
             
-            # 检查分卷数据文件
+            # 检查分卷数据文件 / 综合数据存储
             part_files = [f for f in os.listdir(data_dir) if f.startswith('comprehensive_stock_data_part_') and f.endswith('.json')]
+            store_file = store_path_for(os.path.join(data_dir, 'comprehensive_stock_data.json'))
+            if os.path.exists(store_file):
+                part_files.append(os.path.basename(store_file))
             
             if not part_files:
                 return "无本地数据"
@@ -859,8 +872,9 @@ class AShareAnalyzerGUI:
                                 kline_date_str = f" | K线: {kline_date_formatted}"
                     
                     # 如果状态文件不可用，回退到读取第一分卷
-                    if not kline_date_str:
-                        first_part = os.path.join(data_dir, sorted(part_files)[0])
+                    json_parts = sorted(f for f in part_files if f.endswith('.json'))
+                    if not kline_date_str and json_parts:
+                        first_part = os.path.join(data_dir, json_parts[0])
                         with open(first_part, 'r', encoding='utf-8') as f:
                             data = json.load(f)
                         
@@ -1162,25 +1176,20 @@ class AShareAnalyzerGUI:
             return False
     
     def load_daily_cache(self):
-        """加载当日股票分析缓存"""
-        import json
+        """加载当日股票分析缓存（快照 + 追加日志重放，日志末尾的残行会被跳过）"""
         import os
         from datetime import datetime
         
         today = datetime.now().strftime('%Y-%m-%d')
         
         try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-                
+            if os.path.exists(self.cache_file) or os.path.exists(self.cache_journal.journal_file):
                 # 只加载当日数据
-                if cache_data.get('date') == today:
-                    self.daily_cache = cache_data.get('stocks', {})
+                self.daily_cache = self.cache_journal.load(today)
+                if self.daily_cache:
                     print(f"加载当日缓存：{len(self.daily_cache)}只股票")
                 else:
                     print(f"缓存数据不是今日({today})，重新开始分析")
-                    self.daily_cache = {}
             else:
                 print("首次运行，创建新的缓存文件")
                 self.daily_cache = {}
@@ -1189,22 +1198,9 @@ class AShareAnalyzerGUI:
             self.daily_cache = {}
     
     def save_daily_cache(self):
-        """保存当日股票分析缓存"""
-        import json
-        from datetime import datetime
-        
-        cache_data = {
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'stocks': self.daily_cache
-        }
-        
-        try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+        """保存当日股票分析缓存（写完整快照并清空追加日志）"""
+        if self.cache_journal.compact(self.daily_cache):
             print(f"💾 缓存已保存：{len(self.daily_cache)}只股票")
-        except Exception as e:
-            print(f"保存缓存失败: {e}")
     
     def get_stock_from_cache(self, ticker):
         """从缓存获取股票分析数据"""
@@ -1217,8 +1213,8 @@ class AShareAnalyzerGUI:
         analysis_data['cache_time'] = datetime.now().strftime('%H:%M:%S')
         self.daily_cache[ticker] = analysis_data
         
-        # 实时保存到文件
-        self.save_daily_cache()
+        # 追加到日志（按条数/时间批量 flush，日志过长时自动压缩成快照）
+        self.cache_journal.append(ticker, analysis_data, self.daily_cache)
     
     def load_batch_scores(self, silent=False):
         """加载批量评分数据 - 根据AI模型加载对应文件"""
@@ -1822,12 +1818,24 @@ class AShareAnalyzerGUI:
         shared_data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'TradingShared', 'data')
         data_dir = shared_data_dir
         
-        # 1. 首先加载分卷数据 (作为基础/历史补充)
+        # 1. 首先加载分卷数据 (作为基础/历史补充)；已迁移到综合数据存储时直接读存储
         base_name = os.path.basename(self.comprehensive_data_file).replace('.json', '')
         part_pattern = os.path.join(data_dir, f"{base_name}_part_*.json")
         part_files = glob.glob(part_pattern)
+        data_store = self._get_data_store()
         
-        if part_files:
+        if data_store is not None:
+            try:
+                self.comprehensive_stock_data = data_store.load_all()
+                store_name = os.path.basename(data_store.path)
+                # 数据已全部在内存中，按单文件模式索引（不能指向 SQLite 文件按 JSON 读取）
+                self.stock_file_index = {code: 'single_file' for code in self.comprehensive_stock_data}
+                print(f"\033[1;32m[INFO] 已从 {store_name} 加载了 {len(self.comprehensive_stock_data)} 条基础数据\033[0m")
+            except Exception as e:
+                print(f"\033[1;31m[ERROR] 读取综合数据存储失败: {e}\033[0m")
+                data_store = None
+        
+        if data_store is None and part_files:
             print(f"\033[1;33m[DEBUG] 发现 {len(part_files)} 个分卷数据文件，正在加载基础数据...\033[0m")
             # 按编号排序
             try:
@@ -2776,37 +2784,27 @@ class AShareAnalyzerGUI:
             bonus_score = 0
             bonus_details = []
             
-            # 热门概念板块检查（前20名）
+            # 热门概念/行业板块检查（前20名）：成分股走板块倒排索引，
+            # 每个板块每天只下载一次，之后每只股票都是 O(1) 查询
+            from sector_membership import get_sector_index, hot_rank_bonus
+            index = get_sector_index()
             hot_concept_names = [c['name'] for c in hot_sectors['concepts'][:20]]
-            for rank, concept in enumerate(hot_concept_names, 1):
-                try:
-                    if not AKSHARE_AVAILABLE:
-                        break
-                    concept_stocks = ak.stock_board_concept_cons_em(symbol=concept)
-                    if stock_code in list(concept_stocks['代码']):
-                        # 计算概念板块加分：排名越靠前分数越高（最高+2.5分）
-                        concept_bonus = (21 - rank) / 20 * 2.5
-                        bonus_score += concept_bonus
-                        bonus_details.append(f"概念板块[{concept}]第{rank}名(+{concept_bonus:.2f})")
-                        break  # 只取最高排名的概念板块
-                except Exception as e:
-                    continue
-            
-            # 热门行业板块检查（前20名）
             hot_industry_names = [i['name'] for i in hot_sectors['industries'][:20]]
-            for rank, industry in enumerate(hot_industry_names, 1):
-                try:
-                    if not AKSHARE_AVAILABLE:
-                        break
-                    industry_stocks = ak.stock_board_industry_cons_em(symbol=industry)
-                    if stock_code in list(industry_stocks['代码']):
-                        # 计算行业板块加分：排名越靠前分数越高（最高+2.5分）
-                        industry_bonus = (21 - rank) / 20 * 2.5
-                        bonus_score += industry_bonus
-                        bonus_details.append(f"行业板块[{industry}]第{rank}名(+{industry_bonus:.2f})")
-                        break  # 只取最高排名的行业板块
-                except Exception as e:
-                    continue
+            if AKSHARE_AVAILABLE:
+                index.ensure(hot_concept_names, 'concept')
+                index.ensure(hot_industry_names, 'industry')
+
+            # 计算概念板块加分：排名越靠前分数越高（最高+2.5分），只取最高排名的概念板块
+            rank, concept_bonus = hot_rank_bonus(index.concepts_of(stock_code), hot_concept_names)
+            if rank:
+                bonus_score += concept_bonus
+                bonus_details.append(f"概念板块[{hot_concept_names[rank - 1]}]第{rank}名(+{concept_bonus:.2f})")
+
+            # 计算行业板块加分：同上，只取最高排名的行业板块
+            rank, industry_bonus = hot_rank_bonus(index.industries_of(stock_code), hot_industry_names)
+            if rank:
+                bonus_score += industry_bonus
+                bonus_details.append(f"行业板块[{hot_industry_names[rank - 1]}]第{rank}名(+{industry_bonus:.2f})")
             
             # 计算最终得分（限制在1-10分）
             final_score = min(10.0, max(1.0, base_score + bonus_score))
@@ -4336,6 +4334,14 @@ KDJ: {tech_data.get('kdj', 'N/A')}
                     except Exception as e:
                         print(f"[CSV-BATCH] 筹码数据预取失败: {e}")
 
+                # 筹码健康度：全部股票一次性批量计算（K线列式存储），循环内按代码查表
+                chip_table = None
+                if self.chip_analyzer:
+                    try:
+                        chip_table = self.chip_analyzer.analyze_batch(stock_codes)
+                    except Exception as e:
+                        print(f"[CSV-BATCH] 批量筹码分析失败: {e}")
+
                 # 初始化进度条
                 results = []
                 total = len(stock_codes)
@@ -4400,11 +4406,10 @@ KDJ: {tech_data.get('kdj', 'N/A')}
                             main_force_status = "未分析"
                             scr_value = None
 
-                            if self.chip_analyzer:
+                            if chip_table is not None and code in chip_table.index:
                                 try:
-                                    # 批量模式下启用 is_batch_mode=True，跳过耗时的单只股票网络请求
-                                    chip_result = self.chip_analyzer.analyze_stock(code, is_batch_mode=True)
-                                    if chip_result and not chip_result.get('error') and chip_result.get('health_score', 0) > 0:
+                                    chip_result = chip_table.loc[code].to_dict()
+                                    if chip_result.get('health_score', 0) > 0:
                                         chip_score = chip_result.get('health_score', 0)
                                         chip_health_level = chip_result.get('health_level', '未知')
                                         main_force_status = chip_result.get('main_force_status', '状态不明')
@@ -18563,39 +18568,31 @@ WARNING: 重要声明:
                             except Exception:
                                 pass
 
-                    # 2. 获取热门概念的成分股 (扩大到前20个热门概念)
-                    for concept in hot_sectors.get('concepts', [])[:20]:
-                        concept_name = concept['name']
-                        try:
-                            concept_stocks = ak.stock_board_concept_cons_em(symbol=concept_name)
-                            if concept_stocks is not None and not concept_stocks.empty:
-                                concept_codes = concept_stocks['代码'].tolist()
-                                for stock in top_recommendations:
-                                    if stock['code'] in concept_codes:
-                                        # 如果匹配到，更新该股票的概念信息
-                                        current_concept = stock.get('concept', '')
-                                        if not current_concept or current_concept in ['未知', 'None', '未知概念']:
-                                            stock['concept'] = concept_name
-                                        elif concept_name not in current_concept:
-                                            stock['concept'] = f"{current_concept},{concept_name}"
-                        except Exception as e:
-                            print(f"获取概念 {concept_name} 成分股失败: {e}")
-                    
-                    # 3. 获取热门行业的成分股 (扩大到前20个热门行业)
-                    for industry in hot_sectors.get('industries', [])[:20]:
-                        industry_name = industry['name']
-                        try:
-                            industry_stocks = ak.stock_board_industry_cons_em(symbol=industry_name)
-                            if industry_stocks is not None and not industry_stocks.empty:
-                                industry_codes = industry_stocks['代码'].tolist()
-                                for stock in top_recommendations:
-                                    if stock['code'] in industry_codes:
-                                        # 如果匹配到，更新该股票的行业信息
-                                        current_industry = stock.get('industry', '')
-                                        if not current_industry or current_industry in ['未知', 'None', '未知行业']:
-                                            stock['industry'] = industry_name
-                        except Exception as e:
-                            print(f"获取行业 {industry_name} 成分股失败: {e}")
+                    # 2/3. 热门概念、行业的成分股 (扩大到前20个)，走板块倒排索引，每个板块每天只下载一次
+                    from sector_membership import get_sector_index
+                    sector_index = get_sector_index()
+                    hot_concept_names = [c['name'] for c in hot_sectors.get('concepts', [])[:20]]
+                    hot_industry_names = [i['name'] for i in hot_sectors.get('industries', [])[:20]]
+                    sector_index.ensure(hot_concept_names, 'concept')
+                    sector_index.ensure(hot_industry_names, 'industry')
+
+                    for concept_name in hot_concept_names:
+                        for stock in top_recommendations:
+                            if concept_name in sector_index.concepts_of(stock['code']):
+                                # 如果匹配到，更新该股票的概念信息
+                                current_concept = stock.get('concept', '')
+                                if not current_concept or current_concept in ['未知', 'None', '未知概念']:
+                                    stock['concept'] = concept_name
+                                elif concept_name not in current_concept:
+                                    stock['concept'] = f"{current_concept},{concept_name}"
+
+                    for industry_name in hot_industry_names:
+                        for stock in top_recommendations:
+                            if industry_name in sector_index.industries_of(stock['code']):
+                                # 如果匹配到，更新该股票的行业信息
+                                current_industry = stock.get('industry', '')
+                                if not current_industry or current_industry in ['未知', 'None', '未知行业']:
+                                    stock['industry'] = industry_name
                 except Exception as e:
                     print(f"精准匹配热门板块异常: {e}")
 
@@ -20273,7 +20270,24 @@ WARNING: 重要声明:
                         }
                         return result
             
-            # 2. 尝试从batch_scores获取（兼容旧格式）
+            # 2. 综合数据存储按股票读取（只取基础信息、行业、技术指标和顶层字段）
+            store = self._get_data_store()
+            if store is not None:
+                cached_data = store.get(code, kinds=('basic', 'industry', 'technical', 'meta'))
+                if cached_data:
+                    basic_info = cached_data.get('basic_info') or {}
+                    technical_indicators = cached_data.get('technical_indicators') or {}
+                    industry_concept = cached_data.get('industry_concept') or {}
+                    result = {
+                        'name': basic_info.get('name', '') or cached_data.get('name', ''),
+                        'industry': industry_concept.get('industry', basic_info.get('industry', '')),
+                        'concept': ', '.join(industry_concept.get('concepts', [])) if industry_concept.get('concepts') else '',
+                        'price': technical_indicators.get('current_price', basic_info.get('current_price', 0))
+                    }
+                    if result['name']:
+                        return result
+
+            # 3. 尝试从batch_scores获取（兼容旧格式）
             if hasattr(self, 'batch_scores') and self.batch_scores and code in self.batch_scores:
                 batch_data = self.batch_scores[code]
                 result = {
@@ -20284,7 +20298,7 @@ WARNING: 重要声明:
                 }
                 return result
             
-            # 3. 尝试从分析结果文件获取
+            # 4. 尝试从分析结果文件获取
             for part_num in range(1, 25):  # 检查所有分析结果文件
                 try:
                     analysis_file = f"data/stock_analysis_results_part_{part_num}.json"
@@ -20385,11 +20399,15 @@ WARNING: 重要声明:
             return None
 
     def _load_stock_tech_data_from_json(self, code: str) -> dict:
-        """从本地JSON文件中加载股票技术面数据"""
+        """从本地JSON文件中加载股票技术面数据（优先按字段查综合数据存储）"""
         try:
             import json
             import os
 
+            stored = self._load_stock_fields_from_store(code, ['tech_data', 'technical_indicators', 'technical_data'])
+            if stored:
+                return stored
+
             # 首先检查是否已经建立了索引，否则加载索引
             if not self.stock_file_index:
                 self._load_stock_file_index()
@@ -20441,11 +20459,15 @@ WARNING: 重要声明:
             return None
 
     def _load_stock_fund_data_from_json(self, code: str) -> dict:
-        """从本地JSON文件中加载股票基本面数据"""
+        """从本地JSON文件中加载股票基本面数据（优先按字段查综合数据存储）"""
         try:
             import json
             import os
 
+            stored = self._load_stock_fields_from_store(code, ['fund_data', 'financial_data', 'fund_info'])
+            if stored:
+                return stored
+
             # 首先检查是否已经建立了索引，否则加载索引
             if not self.stock_file_index:
                 self._load_stock_file_index()
@@ -20496,6 +20518,29 @@ WARNING: 重要声明:
             print(f"[DEBUG] 从JSON读取 {code} 基本面数据失败: {e}")
             return None
 
+    def _get_data_store(self):
+        """综合数据存储（数据采集器已写入时才有），不存在返回 None"""
+        data_file = os.path.join(SHARED_PATH, 'data', 'comprehensive_stock_data.json')
+        if not os.path.exists(store_path_for(data_file)):
+            return None
+        try:
+            store = open_stock_data_store(data_file, migrate=False)
+            return store if len(store) > 0 else None
+        except Exception as e:
+            print(f"[WARN] 打开综合数据存储失败: {e}")
+            return None
+
+    def _load_stock_fields_from_store(self, code: str, fields: list):
+        """从综合数据存储按字段读取单只股票，返回第一个存在的字段值；存储不可用返回 None"""
+        store = self._get_data_store()
+        if store is None:
+            return None
+        for field in fields:
+            value = store.get_field(code, field)
+            if value:
+                return value
+        return None
+
     def _load_stock_file_index(self):
         """加载 stock_file_index.json 文件到内存"""
         try:
@@ -20570,8 +20615,9 @@ WARNING: 重要声明:
         else:
             return "不推荐：基本面偏弱，建议规避风险"
 
-    def _analyze_stock_with_llm(self, code: str, stock_info: dict, model: str = "deepseek") -> dict:
-        """使用LLM分析单只股票"""
+    def _analyze_stock_with_llm(self, code: str, stock_info: dict, model: str = "deepseek",
+                                use_cache: bool = True) -> dict:
+        """使用LLM分析单只股票（use_cache=False 时跳过本地LLM响应缓存重新请求）"""
         try:
             # 构建分析提示词
             prompt = f"""请分析股票 {code} ({stock_info.get('name', '未知')})：
@@ -20599,8 +20645,15 @@ WARNING: 重要声明:
     "recommendation": "投资建议"
 }}"""
 
-            # 调用LLM
-            response = call_llm(prompt, model)
+            # 调用LLM（先查本地缓存，键含模型、默认系统提示词和温度）
+            llm_cache = get_llm_cache()
+            cache_key = llm_cache.key(model, globals().get(f"{model.upper()}_MODEL_NAME", ''),
+                                      "你是一位专业的A股投资分析师，擅长技术分析和基本面分析。",
+                                      prompt, AI_TEMPERATURE, AI_MAX_TOKENS)
+            response = llm_cache.get(cache_key) if use_cache else None
+            from_cache = response is not None
+            if not from_cache:
+                response = call_llm(prompt, model)
             
             if not response:
                 return None
@@ -20615,6 +20668,8 @@ WARNING: 重要声明:
                 json_str = json_match.group()
                 try:
                     analysis_data = json.loads(json_str)
+                    if not from_cache:
+                        llm_cache.put(cache_key, response, model)
                     
                     # 确保评分在合理范围内
                     for score_key in ['short_term_score', 'medium_term_score', 'long_term_score', 'overall_score']:
@@ -20673,6 +20728,7 @@ def main():
     root.geometry('{}x{}+{}+{}'.format(width, height, x, y))
     # 设置窗口关闭事件
     def on_closing():
+        app.cache_journal.flush()  # 缓冲中的分析结果落盘
         root.destroy()  # 直接关闭，不显示确认对话框
     root.protocol("WM_DELETE_WINDOW", on_closing)
     print("A股智能分析系统GUI启动成功！")
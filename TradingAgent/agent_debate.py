@@ -19,6 +19,8 @@ import os
 import sys
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional
 
@@ -29,17 +31,35 @@ if _SHARED_DIR not in sys.path:
     sys.path.insert(0, _SHARED_DIR)
 
 from llm.base_client import LLMClient, _get_providers
+from llm_cache import get_llm_cache
 import requests as _requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 logger = logging.getLogger('AgentDebate')
 
+# 并发辩论配置
+CONCURRENT_DEBATE = True      # integrate_with_v28 默认使用并发模式
+MAX_PARALLEL_STOCKS = 5       # 同时辩论的股票数上限
+PROVIDER_CONCURRENCY = 4      # 每个 provider 同时在途的请求上限（可按 provider 名配置为 dict）
 
-def _make_session():
-    """创建一个不使用代理的 requests session"""
+# 单只股票内的辩论阶段（用于分阶段耗时统计）
+DEBATE_STAGES = [
+    ('briefing', '简报'),
+    ('bull_bear', '多空'),
+    ('judge', '裁决'),
+    ('risk', '风险'),
+    ('decision', '决策'),
+]
+
+
+def _make_session(pool_maxsize: int = 10):
+    """创建一个不使用代理的 requests session（连接池按并发数放大）"""
     s = _requests.Session()
     s.trust_env = False
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
     return s
 
 
@@ -51,22 +71,58 @@ class FastLLMClient:
     # 已知不可用的 provider（按需更新）
     DISABLED = {'Qwen', 'DeepSeek'}  # Qwen 无权限, DeepSeek 无余额
 
-    def __init__(self, timeout: int = 45):
+    def __init__(self, timeout: int = 45, providers: Optional[List[Dict]] = None,
+                 provider_concurrency=PROVIDER_CONCURRENCY, use_cache: bool = True):
+        """
+        Args:
+            timeout: 单次请求超时秒数
+            providers: provider 列表，默认取 llm.base_client 的配置（测试时可指向本地 mock 服务）
+            provider_concurrency: 每个 provider 同时在途的请求上限，int 或 {provider名: int}
+            use_cache: 是否使用本地 LLM 响应缓存 (llm_cache)
+        """
         self.timeout = timeout
-        self.session = _make_session()
+        self.providers = providers
+        self.use_cache = use_cache
+        self.provider_concurrency = provider_concurrency
+        self._semaphores = {}
+        self._sem_lock = threading.Lock()
+        self.session = _make_session(pool_maxsize=max(10, self._limit_of(None) * 2))
         self._last_provider = None
 
+    def _limit_of(self, name: Optional[str]) -> int:
+        if isinstance(self.provider_concurrency, dict):
+            return max(1, int(self.provider_concurrency.get(name, PROVIDER_CONCURRENCY)))
+        return max(1, int(self.provider_concurrency))
+
+    def _provider_slot(self, name: str) -> threading.BoundedSemaphore:
+        """provider 的并发信号量（首次使用时创建）"""
+        with self._sem_lock:
+            sem = self._semaphores.get(name)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self._limit_of(name))
+                self._semaphores[name] = sem
+            return sem
+
     def chat(self, system_prompt: str, user_prompt: str,
-             temperature: float = 0.3, max_tokens: int = 2000) -> Optional[str]:
-        providers = _get_providers()
+             temperature: float = 0.3, max_tokens: int = 2000,
+             use_cache: Optional[bool] = None) -> Optional[str]:
+        providers = self.providers if self.providers is not None else _get_providers()
+        providers = [p for p in providers if p['name'] not in self.DISABLED]
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
 
+        cache = get_llm_cache()
+        keys = {p['name']: cache.key(p['name'], p['model'], system_prompt, user_prompt, temperature, max_tokens)
+                for p in providers}
+        if self.use_cache if use_cache is None else use_cache:
+            hit_key, cached = cache.get_any(keys.values())
+            if cached is not None:
+                self._last_provider = next(name for name, k in keys.items() if k == hit_key)
+                return cached
+
         for provider in providers:
-            if provider['name'] in self.DISABLED:
-                continue
 
             try:
                 headers = {
@@ -82,13 +138,14 @@ class FastLLMClient:
 
                 verify = provider.get('verify_ssl', True)
 
-                resp = self.session.post(
-                    provider['api_url'],
-                    headers=headers,
-                    json=payload,
-                    timeout=self.timeout,
-                    verify=verify,
-                )
+                with self._provider_slot(provider['name']):
+                    resp = self.session.post(
+                        provider['api_url'],
+                        headers=headers,
+                        json=payload,
+                        timeout=self.timeout,
+                        verify=verify,
+                    )
 
                 if resp.status_code == 429:
                     logging.warning(f"[{provider['name']}] 429 限流")
@@ -102,6 +159,7 @@ class FastLLMClient:
                 content = data.get('choices', [{}])[0].get('message', {}).get('content', '')
                 if content:
                     self._last_provider = provider['name']
+                    cache.put(keys[provider['name']], content, provider['name'], provider['model'])
                     return content
 
             except _requests.exceptions.Timeout:
@@ -138,22 +196,57 @@ class FastLLMClient:
         return None
 
 
+def _format_stages(stage_seconds: Dict) -> str:
+    """{'briefing': 1.2, ...} → '简报 1.2s / 多空 3.4s / ...'"""
+    return " / ".join(f"{label} {stage_seconds[key]:.1f}s"
+                      for key, label in DEBATE_STAGES if key in stage_seconds)
+
+
+def summarize_stage_latency(debate_results: List[Dict]) -> List[str]:
+    """汇总多只股票的分阶段耗时，返回 ['简报 1.0/1.5s', ...]"""
+    lines = []
+    for key, label in DEBATE_STAGES:
+        values = [r['stage_seconds'][key] for r in debate_results
+                  if key in (r.get('stage_seconds') or {})]
+        if values:
+            lines.append(f"{label} {sum(values) / len(values):.1f}/{max(values):.1f}s")
+    return lines
+
+
 class AgentDebateSystem:
     """多Agent辩论系统，为V28推荐增加定性分析层"""
 
     def __init__(self, debate_rounds: int = 3, risk_rounds: int = 2,
-                 timeout: int = 60, verbose: bool = True):
+                 timeout: int = 60, verbose: bool = True,
+                 concurrent: bool = False, max_parallel_stocks: int = MAX_PARALLEL_STOCKS,
+                 provider_concurrency=PROVIDER_CONCURRENCY,
+                 providers: Optional[List[Dict]] = None, use_cache: bool = True):
         """
         Args:
             debate_rounds: Bull vs Bear 辩论轮数
             risk_rounds: 风险管理三方辩论轮数
             timeout: 单次LLM调用超时秒数
             verbose: 是否打印辩论过程
+            concurrent: 并发模式 —— 多只股票并行辩论，单只股票内互不依赖的首轮发言并行
+            max_parallel_stocks: 并发模式下同时辩论的股票数上限
+            provider_concurrency: 每个 provider 同时在途的请求上限，int 或 {provider名: int}
+            providers: 覆盖 LLM provider 列表（如本地 mock 服务）
+            use_cache: 是否使用本地 LLM 响应缓存（重跑同一天的辩论时直接命中）
         """
         self.debate_rounds = debate_rounds
         self.risk_rounds = risk_rounds
         self.verbose = verbose
-        self.llm = FastLLMClient(timeout=timeout)
+        self.concurrent = concurrent
+        self.max_parallel_stocks = max(1, max_parallel_stocks)
+        self.llm = FastLLMClient(timeout=timeout, providers=providers,
+                                 provider_concurrency=provider_concurrency, use_cache=use_cache)
+
+    @staticmethod
+    def _run_parallel(calls):
+        """并行执行一组无依赖的 LLM 调用 [(fn, args), ...]，按顺序返回结果"""
+        with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+            futures = [pool.submit(fn, *args) for fn, args in calls]
+            return [f.result() for f in futures]
 
     def _log(self, msg: str):
         if self.verbose:
@@ -198,49 +291,39 @@ V28总评分: {stock['final_score']}
     # Bull vs Bear 辩论
     # ============================================================
 
-    def run_bull_bear_debate(self, briefing: str, stock: Dict) -> Dict:
-        """
-        多轮 Bull vs Bear 辩论
-        返回: {history, bull_history, bear_history, rounds}
-        """
-        history = ""
-        bull_history = ""
-        bear_history = ""
-        rounds_completed = 0
-
-        self._log(f"\n    📣 多空辩论开始 ({self.debate_rounds}轮)")
+    BULL_SYSTEM = (
+        "你是多头分析师（Bull Analyst），你主张买入该股票。"
+        "你的任务是构建强有力的论据，强调增长潜力、竞争优势和积极信号。"
+        "用对话方式直接回应空头观点，展开有说服力的辩论。"
+        "语言简洁有力，不超过200字。"
+    )
+    BEAR_SYSTEM = (
+        "你是空头分析师（Bear Analyst），你主张该股票存在风险，不建议买入。"
+        "你的任务是揭示潜在风险、估值泡沫、行业挑战和负面信号。"
+        "用对话方式直接回应多头观点，展开有说服力的辩论。"
+        "语言简洁有力，不超过200字。"
+    )
 
-        for rnd in range(self.debate_rounds):
-            # Bull 发言
-            bull_system = (
-                "你是多头分析师（Bull Analyst），你主张买入该股票。"
-                "你的任务是构建强有力的论据，强调增长潜力、竞争优势和积极信号。"
-                "用对话方式直接回应空头观点，展开有说服力的辩论。"
-                "语言简洁有力，不超过200字。"
-            )
-            bull_prompt = f"""分析师简报:
+    def _bull_speak(self, briefing: str, history: str, bear_history: str) -> str:
+        bull_prompt = f"""分析师简报:
 {briefing}
 
 {f'辩论记录:{history}' if history else '（首轮发言，请阐述你的多头论点）'}
 {f'上一轮空头观点: {bear_history.split(chr(10))[-1]}' if bear_history else ''}
 
 请阐述你的多头论点，直接回应空头的质疑。"""
+        return self.llm.chat(self.BULL_SYSTEM, bull_prompt, temperature=0.6, max_tokens=600) or "（多头发言失败）"
 
-            bull_response = self.llm.chat(bull_system, bull_prompt, temperature=0.6, max_tokens=600)
-            if not bull_response:
-                bull_response = "（多头发言失败）"
-            bull_arg = f"【第{rnd+1}轮-多头】{bull_response}"
-            history += f"\n{bull_arg}"
-            bull_history += f"\n{bull_arg}"
-            self._log(f"    🐂 多手: {bull_response[:80]}...")
+    def _bear_speak(self, briefing: str, history: str, bull_arg: Optional[str]) -> str:
+        if bull_arg is None:
+            # 并发模式首轮：空头与多头同时开场，不依赖多头发言
+            bear_prompt = f"""分析师简报:
+{briefing}
 
-            # Bear 发言
-            bear_system = (
-                "你是空头分析师（Bear Analyst），你主张该股票存在风险，不建议买入。"
-                "你的任务是揭示潜在风险、估值泡沫、行业挑战和负面信号。"
-                "用对话方式直接回应多头观点，展开有说服力的辩论。"
-                "语言简洁有力，不超过200字。"
-            )
+（首轮发言，请阐述你的空头论点）
+
+请揭示该股票的主要风险。"""
+        else:
             bear_prompt = f"""分析师简报:
 {briefing}
 
@@ -250,10 +333,41 @@ V28总评分: {stock['final_score']}
 上一轮多头观点: {bull_arg}
 
 请反驳多头的论点，揭示风险。"""
+        return self.llm.chat(self.BEAR_SYSTEM, bear_prompt, temperature=0.6, max_tokens=600) or "（空头发言失败）"
 
-            bear_response = self.llm.chat(bear_system, bear_prompt, temperature=0.6, max_tokens=600)
-            if not bear_response:
-                bear_response = "（空头发言失败）"
+    def run_bull_bear_debate(self, briefing: str, stock: Dict,
+                             parallel_opening: bool = False) -> Dict:
+        """
+        多轮 Bull vs Bear 辩论
+        parallel_opening: 首轮多空开场陈述并行（空头开场不回应多头开场）
+        返回: {history, bull_history, bear_history, rounds}
+        """
+        history = ""
+        bull_history = ""
+        bear_history = ""
+        rounds_completed = 0
+
+        self._log(f"\n    📣 多空辩论开始 ({self.debate_rounds}轮)")
+
+        for rnd in range(self.debate_rounds):
+            if rnd == 0 and parallel_opening:
+                bull_response, bear_response = self._run_parallel([
+                    (self._bull_speak, (briefing, history, bear_history)),
+                    (self._bear_speak, (briefing, history, None)),
+                ])
+            else:
+                bull_response = self._bull_speak(briefing, history, bear_history)
+                bear_response = None
+
+            # Bull 发言
+            bull_arg = f"【第{rnd+1}轮-多头】{bull_response}"
+            history += f"\n{bull_arg}"
+            bull_history += f"\n{bull_arg}"
+            self._log(f"    🐂 多手: {bull_response[:80]}...")
+
+            # Bear 发言
+            if bear_response is None:
+                bear_response = self._bear_speak(briefing, history, bull_arg)
             bear_arg = f"【第{rnd+1}轮-空头】{bear_response}"
             history += f"\n{bear_arg}"
             bear_history += f"\n{bear_arg}"
@@ -312,25 +426,15 @@ V28量化评分: {stock['final_score']} (趋势{stock['scores']['trend']}/资金
     # 风险管理三方辩论
     # ============================================================
 
-    def run_risk_debate(self, briefing: str, debate: Dict, rating: Dict) -> Dict:
-        """
-        风险管理三方辩论: 激进 vs 保守 vs 中立
-        """
-        history = ""
-        aggressive_history = ""
-        conservative_history = ""
-        neutral_history = ""
-        rounds_completed = 0
-
-        self._log(f"\n    ⚖️ 风险管理辩论 ({self.risk_rounds}轮)")
+    RISK_ROLES = [
+        ("激进", "你是激进风险分析师（Aggressive）。你主张承担更高风险以获取超额回报。质疑保守和中立观点的过度谨慎。不超过150字。", "aggressive"),
+        ("保守", "你是保守风险分析师（Conservative）。你强调风险控制、本金安全。质疑激进观点的鲁莽。不超过150字。", "conservative"),
+        ("中立", "你是中立风险分析师（Neutral）。你平衡收益与风险，寻找中间路线。不超过150字。", "neutral"),
+    ]
 
-        for rnd in range(self.risk_rounds):
-            for role_name, system_prompt, stance in [
-                ("激进", "你是激进风险分析师（Aggressive）。你主张承担更高风险以获取超额回报。质疑保守和中立观点的过度谨慎。不超过150字。", "aggressive"),
-                ("保守", "你是保守风险分析师（Conservative）。你强调风险控制、本金安全。质疑激进观点的鲁莽。不超过150字。", "conservative"),
-                ("中立", "你是中立风险分析师（Neutral）。你平衡收益与风险，寻找中间路线。不超过150字。", "neutral"),
-            ]:
-                prompt = f"""分析师简报:
+    def _risk_speak(self, role_name: str, system_prompt: str, briefing: str,
+                    debate: Dict, rating: Dict, history: str) -> str:
+        prompt = f"""分析师简报:
 {briefing[:200]}
 
 研究经理评级: {rating.get('rating', '?')} (置信度 {rating.get('confidence', '?')})
@@ -339,19 +443,35 @@ V28量化评分: {stock['final_score']} (趋势{stock['scores']['trend']}/资金
 {f'风险辩论记录:{history}' if history else '（请阐述你的{role_name}观点）'}
 
 请以{role_name}风险分析师的身份发言。"""
+        return self.llm.chat(system_prompt, prompt, temperature=0.5, max_tokens=400) or f"（{role_name}发言失败）"
 
-                resp = self.llm.chat(system_prompt, prompt, temperature=0.5, max_tokens=400)
-                if not resp:
-                    resp = f"（{role_name}发言失败）"
-                arg = f"【{role_name}】{resp}"
-                history += f"\n{arg}"
+    def run_risk_debate(self, briefing: str, debate: Dict, rating: Dict,
+                        parallel_opening: bool = False) -> Dict:
+        """
+        风险管理三方辩论: 激进 vs 保守 vs 中立
+        parallel_opening: 首轮三方开场陈述并行（各自只看简报和评级，不看彼此发言）
+        """
+        history = ""
+        role_history = {stance: "" for _, _, stance in self.RISK_ROLES}
+        rounds_completed = 0
+
+        self._log(f"\n    ⚖️ 风险管理辩论 ({self.risk_rounds}轮)")
 
-                if stance == "aggressive":
-                    aggressive_history += f"\n{arg}"
-                elif stance == "conservative":
-                    conservative_history += f"\n{arg}"
+        for rnd in range(self.risk_rounds):
+            opening = None
+            if rnd == 0 and parallel_opening:
+                opening = self._run_parallel([
+                    (self._risk_speak, (role_name, system_prompt, briefing, debate, rating, history))
+                    for role_name, system_prompt, _ in self.RISK_ROLES
+                ])
+            for k, (role_name, system_prompt, stance) in enumerate(self.RISK_ROLES):
+                if opening is not None:
+                    resp = opening[k]
                 else:
-                    neutral_history += f"\n{arg}"
+                    resp = self._risk_speak(role_name, system_prompt, briefing, debate, rating, history)
+                arg = f"【{role_name}】{resp}"
+                history += f"\n{arg}"
+                role_history[stance] += f"\n{arg}"
 
                 self._log(f"    🔥 {role_name}: {resp[:60]}...")
 
@@ -359,9 +479,9 @@ V28量化评分: {stock['final_score']} (趋势{stock['scores']['trend']}/资金
 
         return {
             "history": history,
-            "aggressive": aggressive_history,
-            "conservative": conservative_history,
-            "neutral": neutral_history,
+            "aggressive": role_history["aggressive"],
+            "conservative": role_history["conservative"],
+            "neutral": role_history["neutral"],
             "rounds": rounds_completed,
         }
 
@@ -431,30 +551,38 @@ V28量化评分: {stock['final_score']}
         self._log(f"  {'─' * 56}")
 
         t0 = time.time()
+        stage_seconds = {}
+        parallel = self.concurrent
+
+        def timed(stage, fn, *args, **kwargs):
+            t = time.time()
+            out = fn(*args, **kwargs)
+            stage_seconds[stage] = round(time.time() - t, 2)
+            return out
 
         # 1. 分析师简报
         self._log(f"\n    📋 [1/5] 分析师简报...")
-        briefing = self.generate_briefing(stock, market_context)
+        briefing = timed('briefing', self.generate_briefing, stock, market_context)
         self._log(f"    ✅ 简报: {briefing[:100]}...")
 
         # 2. 多空辩论
         self._log(f"\n    📣 [2/5] 多空辩论...")
-        debate = self.run_bull_bear_debate(briefing, stock)
+        debate = timed('bull_bear', self.run_bull_bear_debate, briefing, stock, parallel_opening=parallel)
 
         # 3. 研究经理裁决
         self._log(f"\n    📊 [3/5] 研究经理裁决...")
-        rating = self.research_manager_judge(debate, stock)
+        rating = timed('judge', self.research_manager_judge, debate, stock)
 
         # 4. 风险管理辩论
         self._log(f"\n    ⚖️ [4/5] 风险管理辩论...")
-        risk_debate = self.run_risk_debate(briefing, debate, rating)
+        risk_debate = timed('risk', self.run_risk_debate, briefing, debate, rating, parallel_opening=parallel)
 
         # 5. 最终决策
         self._log(f"\n    📋 [5/5] 投资组合经理决策...")
-        final = self.portfolio_manager_decision(stock, rating, risk_debate)
+        final = timed('decision', self.portfolio_manager_decision, stock, rating, risk_debate)
 
         elapsed = time.time() - t0
-        self._log(f"\n    ⏱️ 辩论耗时: {elapsed:.0f}s")
+        self._log(f"\n    ⏱️ 辩论耗时: {elapsed:.0f}s ({_format_stages(stage_seconds)})")
 
         return {
             "code": code,
@@ -465,6 +593,7 @@ V28量化评分: {stock['final_score']}
             "risk_debate": risk_debate,
             "portfolio_manager_decision": final,
             "debate_time_seconds": round(elapsed, 1),
+            "stage_seconds": stage_seconds,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         }
 
@@ -481,28 +610,43 @@ V28量化评分: {stock['final_score']}
         self._log(f"\n{'═' * 60}")
         self._log(f"🤖 Agent 辩论系统启动")
         self._log(f"   候选股: {total} 只 | 多空轮数: {self.debate_rounds} | 风险轮数: {self.risk_rounds}")
+        if self.concurrent:
+            self._log(f"   并发模式: 同时辩论 {min(self.max_parallel_stocks, max(total, 1))} 只 | "
+                      f"单 provider 并发上限: {self.llm.provider_concurrency}")
         self._log(f"{'═' * 60}")
 
-        results = []
         t_total = time.time()
 
-        for i, stock in enumerate(candidates, 1):
+        def run_one(i, stock):
             self._log(f"\n[{i}/{total}] 处理: {stock['code']} {stock.get('name', '')}")
             try:
-                result = self.debate_single_stock(stock, market_context)
-                results.append(result)
+                return self.debate_single_stock(stock, market_context)
             except Exception as e:
                 logger.error(f"辩论失败 {stock['code']}: {e}")
-                results.append({
+                return {
                     "code": stock['code'],
                     "name": stock.get('name', ''),
                     "error": str(e),
                     "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                })
+                }
+
+        if self.concurrent and total > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_parallel_stocks, total)) as pool:
+                futures = [pool.submit(run_one, i, stock) for i, stock in enumerate(candidates, 1)]
+                results = [f.result() for f in futures]
+        else:
+            results = [run_one(i, stock) for i, stock in enumerate(candidates, 1)]
 
         elapsed_total = time.time() - t_total
+        serial_total = sum(r.get('debate_time_seconds', 0) for r in results)
         self._log(f"\n{'═' * 60}")
-        self._log(f"✅ 全部辩论完成! 总耗时: {elapsed_total:.0f}s")
+        self._log(f"✅ 全部辩论完成! 总耗时: {elapsed_total:.0f}s (各股耗时之和 {serial_total:.0f}s)")
+        if self.llm.use_cache:
+            cache_stats = get_llm_cache().stats()
+            self._log(f"   LLM缓存: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}")
+        stage_lines = summarize_stage_latency(results)
+        if stage_lines:
+            self._log("   分阶段耗时 (平均/最大): " + " | ".join(stage_lines))
         self._log(f"{'═' * 60}")
 
         return results
@@ -564,7 +708,9 @@ V28量化评分: {stock['final_score']}
             if bear_lines and bear_lines[-1]:
                 lines.append(f"  🐻 空头最终观点: {bear_lines[-1][20:]}")
 
-            lines.append(f"  ⏱️ 辩论耗时: {r.get('debate_time_seconds', '?')}s")
+            stages = r.get('stage_seconds')
+            stage_text = f" ({_format_stages(stages)})" if stages else ""
+            lines.append(f"  ⏱️ 辩论耗时: {r.get('debate_time_seconds', '?')}s{stage_text}")
 
         lines.append("")
         lines.append("═" * 60)
@@ -577,7 +723,8 @@ V28量化评分: {stock['final_score']}
 
 def integrate_with_v28(v28_result: Dict, top_n: int = 3,
                        debate_rounds: int = 3, risk_rounds: int = 2,
-                       verbose: bool = True) -> Dict:
+                       verbose: bool = True, concurrent: Optional[bool] = None,
+                       providers: Optional[List[Dict]] = None) -> Dict:
     """
     将 Agent 辩论集成到 V28 推荐结果中
 
@@ -587,6 +734,8 @@ def integrate_with_v28(v28_result: Dict, top_n: int = 3,
         debate_rounds: 多空辩论轮数
         risk_rounds: 风险辩论轮数
         verbose: 打印过程
+        concurrent: 并发辩论，默认取 CONCURRENT_DEBATE
+        providers: 覆盖 LLM provider 列表（如本地 mock 服务）
 
     Returns:
         v28_result 增加 'agent_debate' 字段
@@ -603,6 +752,8 @@ def integrate_with_v28(v28_result: Dict, top_n: int = 3,
         debate_rounds=debate_rounds,
         risk_rounds=risk_rounds,
         verbose=verbose,
+        concurrent=CONCURRENT_DEBATE if concurrent is None else concurrent,
+        providers=providers,
     )
 
     debate_results = debate_system.debate_candidates(recommendations, market_context, top_n)
@@ -632,6 +783,7 @@ def integrate_with_v28(v28_result: Dict, top_n: int = 3,
         'report': report,
         'debate_rounds': debate_rounds,
         'risk_rounds': risk_rounds,
+        'stage_latency': summarize_stage_latency(debate_results),
         'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     }
 
@@ -650,9 +802,14 @@ if __name__ == '__main__':
     parser.add_argument('--top-n', type=int, default=3, help='辩论股票数')
     parser.add_argument('--rounds', type=int, default=3, help='多空辩论轮数')
     parser.add_argument('--risk-rounds', type=int, default=2, help='风险辩论轮数')
+    parser.add_argument('--serial', action='store_true', help='关闭并发，逐只逐步辩论')
+    parser.add_argument('--mock-llm', type=str, default=None,
+                        help='使用本地 mock LLM 服务，如 http://127.0.0.1:8765 (见 mock_llm_server.py)')
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.mock_llm:
+        from mock_llm_server import mock_provider
 
     if args.result_json:
         with open(args.result_json, 'r', encoding='utf-8') as f:
@@ -678,6 +835,8 @@ if __name__ == '__main__':
         debate_rounds=args.rounds,
         risk_rounds=args.risk_rounds,
         verbose=True,
+        concurrent=False if args.serial else None,
+        providers=[mock_provider(args.mock_llm)] if args.mock_llm else None,
     )
 
     # 打印报告
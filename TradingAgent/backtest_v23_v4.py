@@ -47,6 +47,7 @@ RESULT_DIR = os.path.join(BASE_DIR, 'backtest_results')
 SHARED_DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 
 sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
+from forward_returns import get_forward_returns, index_return
 
 # ============================================================================
 # Config
@@ -631,29 +632,9 @@ def get_adaptive_top_n(risk_level):
     elif risk_level == 3: return 3
     else: return 3
 
-def get_stock_return(df, date):
-    """T+1 return: buy at test_date close, sell at next trading day close"""
-    day_rows = df[df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
-
 def get_index_return(index_df, date):
     """T+1 return: aligned with stock_return"""
-    day_rows = index_df[index_df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
+    return index_return(index_df, date)
 
 def build_blacklist(stock_recent_perf, risk):
     blacklist = set()
@@ -675,8 +656,12 @@ def build_blacklist(stock_recent_perf, risk):
 # ============================================================================
 # Sub-score computation (same as V16)
 # ============================================================================
-def compute_stock_subscores(code, df, test_date, index_df, idx_rets_20, idx_ret_5d, idx_ret_3d, static, daily_sector_avg):
-    """Compute all sub-scores for a single stock on a given date."""
+def compute_stock_subscores(code, df, test_date, index_df, idx_rets_20, idx_ret_5d, idx_ret_3d, static, daily_sector_avg,
+                            stock_return=None):
+    """Compute all sub-scores for a single stock on a given date.
+
+    stock_return: T+1 return looked up in the forward-return table by the caller.
+    """
     feats = calc_features(df, test_date)
     if feats is None:
         return None
@@ -707,8 +692,6 @@ def compute_stock_subscores(code, df, test_date, index_df, idx_rets_20, idx_ret_
     feats['rel_strength_5d'] = rel_str
     feats['rel_strength_3d'] = rel_str_3d
     
-    stock_return = get_stock_return(df, test_date)
-    
     f = feats
     if f.get('pct_1d', 0) > 9.5 or f.get('pct_1d', 0) < -9.5:
         return None
@@ -1011,6 +994,7 @@ def precompute_period(kline, index_df, scores, sector_avg, start_str, end_str):
     date_range = pd.date_range(eval_start, eval_end, freq='B')
     valid_dates = [d for d in date_range if get_index_return(index_df, d) is not None]
     
+    fwd_table = get_forward_returns(kline)
     daily_data = []
     
     for day_idx, test_date in enumerate(valid_dates):
@@ -1048,11 +1032,13 @@ def precompute_period(kline, index_df, scores, sector_avg, start_str, end_str):
         if idx_ret is None: idx_ret = 0
         
         stock_subscores = []
+        day_ret = fwd_table.day_returns(test_date)
         for code, df in kline.items():
             if len(df[df['date'] >= test_date]) == 0: continue
             ss = compute_stock_subscores(code, df, test_date, index_df,
                                           idx_rets_20, idx_ret_5d, idx_ret_3d,
-                                          scores.get(code), daily_sector_avg)
+                                          scores.get(code), daily_sector_avg,
+                                          stock_return=day_ret.get(code))
             if ss is not None:
                 stock_subscores.append(ss)
         
@@ -37,6 +37,11 @@ SHARED_DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 
 sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
 
+from forward_returns import get_forward_returns, index_return
+from panel_engine import build_panel, encode_labels
+from parallel_optuna import optimize_parallel, best_user_attrs
+from fast_evaluator import PackedDays, pack_days, Ranking, materialize, ret_mean
+
 # ============================================================================
 # Config
 # ============================================================================
@@ -73,6 +78,12 @@ L2_LAMBDA = 0.02  # Stronger than V22
 MIN_SCORE_PERCENTILE = 70  # Only pick stocks in top 30% by score
 SKIP_DAY_IF_NO_CONFIDENT = True  # Skip trading when no stock is confident enough
 
+# 面板引擎：按位置切片历史 + 向量化行业热度（False 则走逐日布尔掩码的旧循环）
+USE_PANEL_ENGINE = True
+
+# 快速评估：Optuna 目标函数使用打包后的数组数据（结果与逐股循环逐位一致）
+USE_FAST_EVALUATOR = True
+
 # ============================================================================
 # Memory Monitor
 # ============================================================================
@@ -320,8 +331,9 @@ def _load_scores():
 # ============================================================================
 # Feature Engineering (unchanged from V22)
 # ============================================================================
-def calc_features(df, target_date):
-    hist = df[df['date'] < target_date].copy()
+def calc_features(df, target_date, hist=None):
+    if hist is None:
+        hist = df[df['date'] < target_date].copy()
     if len(hist) < 20:
         return None
     
@@ -605,25 +617,9 @@ def get_adaptive_top_n(risk_level):
     elif risk_level == 3: return 3
     else: return 3
 
-def get_stock_return(df, date):
-    day_rows = df[df['date'] >= date]
-    if len(day_rows) < 2: return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
-
 def get_index_return(index_df, date):
-    day_rows = index_df[index_df['date'] >= date]
-    if len(day_rows) < 2: return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
+    """T+1 index return (forward-return table; None when unavailable)"""
+    return index_return(index_df, date)
 
 def build_blacklist(stock_recent_perf, risk):
     blacklist = set()
@@ -639,16 +635,18 @@ def build_blacklist(stock_recent_perf, risk):
 # ============================================================================
 # Sub-score computation (with tradeability filter)
 # ============================================================================
-def compute_stock_subscores(code, df, test_date, index_df, idx_rets_20, idx_ret_5d, idx_ret_3d, static, daily_sector_avg):
+def compute_stock_subscores(code, df, test_date, index_df, idx_rets_20, idx_ret_5d, idx_ret_3d, static, daily_sector_avg,
+                            hist=None, stock_return=None):
+    """hist: 面板引擎已按位置切好的历史，传入时不再做日期掩码；stock_return: 远期收益表中的次日收益"""
     # V24: Tradeability check
     name = static.get('name', '') if static else ''
     if not is_tradeable(code, name, static):
         return None
     
-    feats = calc_features(df, test_date)
+    feats = calc_features(df, test_date, hist=hist)
     if feats is None: return None
     
-    stock_hist = df[df['date'] < test_date]
+    stock_hist = df[df['date'] < test_date] if hist is None else hist
     s_closes = stock_hist['close'].values
     s_n = len(s_closes)
     
@@ -672,7 +670,6 @@ def compute_stock_subscores(code, df, test_date, index_df, idx_rets_20, idx_ret_
     feats['rel_strength_5d'] = rel_str
     feats['rel_strength_3d'] = rel_str_3d
     
-    stock_return = get_stock_return(df, test_date)
     f = feats
     if f.get('pct_1d', 0) > 9.5 or f.get('pct_1d', 0) < -9.5: return None
     
@@ -862,15 +859,138 @@ def score_unified(s, p):
     return score
 
 
+# ============================================================================
+# 数组快速路径（Optuna 用）：score_unified 的逐列版本，运算顺序与上面完全一致
+# ============================================================================
+WF_NUM_KEYS = ['momentum_s', 'trend_s', 'consistency_s', 'mr_s', 'vol_s', 'rsi_s',
+               'static_score', 'defense_s', 'sector_heat', 'low_vol_s', 'rel_str', 'rel_str_3d',
+               'bb_s', 'support_s', 'obv_s',
+               'consistency', 'r1', 'r3', 'r5', 'close_ma20', 'close_ma5', 'vol5', 'rsi',
+               'ind_heat', 'streak', 'vol_shrink', 'turn_spike', 'beta']
+WF_DEFAULTS = {'bb_s': 2.5, 'support_s': 2.5, 'obv_s': 2.0}
+WF_FLAGS = {
+    'exhaustion': lambda s: s.get('exhaustion'),
+    'vol_price_diverge': lambda s: s.get('vol_price_diverge'),
+    'is_high_beta': lambda s: s['is_high_beta'],
+    'is_defensive': lambda s: s['is_defensive'],
+}
+
+
+def pack_wf(daily_data, codebook=None):
+    """把 precompute_period 的结果打包成数组（一次打包，evaluate_wf 可反复调用）"""
+    return pack_days(daily_data, WF_NUM_KEYS, defaults=WF_DEFAULTS, flags=WF_FLAGS,
+                     codebook=codebook)
+
+
+def pack_wf_split(train_data, valid_data):
+    """{期间: daily_data} 训练集 + 验证集按同一编码表打包"""
+    codebook = ({}, {})
+    train = {k: pack_wf(v, codebook) for k, v in train_data.items()}
+    return train, pack_wf(valid_data, codebook)
+
+
+def _score_unified_packed(day, p):
+    """score_unified 的逐列版：返回一天所有股票的 Scores"""
+    c = day.col
+    f = day.flags
+    score = (
+        c('momentum_s') * p['w_momentum'] +
+        c('trend_s') * p['w_trend'] +
+        c('consistency_s') * p['w_consistency'] +
+        c('mr_s') * p['w_mr'] +
+        c('vol_s') * p['w_vol'] +
+        c('rsi_s') * p['w_rsi'] +
+        c('static_score') * p['w_static'] +
+        c('defense_s') * p['w_defense'] +
+        c('sector_heat') * p['w_sector_heat'] +
+        c('low_vol_s') * p['w_low_vol'] +
+        c('rel_str') * p['w_rel_str'] +
+        c('rel_str_3d') * p['w_rel_str_3d'] +
+        c('bb_s') * p.get('w_bb', 0.02) +
+        c('support_s') * p.get('w_support', 0.02) +
+        c('obv_s') * p.get('w_obv', 0.01)
+    )
+    
+    # if / elif 链：后一个条件只作用于前面都不成立的股票
+    consistency = c('consistency')
+    hi = consistency >= 4
+    score = score.add_where(hi, p['b_consistency_high'])
+    score = score.add_where(~hi & (consistency >= 3), p['b_consistency_mid'])
+    up3 = c('r3') > 0
+    full = up3 & (c('r5') > 0)
+    score = score.add_where(full, p['b_uptrend_full'])
+    score = score.add_where(~full & up3, p['b_uptrend_partial'])
+    
+    ma20 = c('close_ma20')
+    above = ma20 > 0
+    score = score.add_where(above, p['b_ma20_above'])
+    score = score.sub_where(~above & (ma20 < -0.05), p['p_ma20_below'])
+    
+    vol5 = c('vol5')
+    m1 = vol5 < 1.5
+    m2 = ~m1 & (vol5 < 2.0)
+    score = score.add_where(m1, p['b_low_vol_high'])
+    score = score.add_where(m2, p['b_low_vol_mid'])
+    score = score.sub_where(~m1 & ~m2 & (vol5 > 3.5), p['p_high_vol'])
+    
+    rsi = c('rsi')
+    m1 = rsi > 75
+    m2 = ~m1 & (rsi > 65)
+    score = score.sub_where(m1, p['p_rsi_overbought'])
+    score = score.sub_where(m2, p['p_rsi_high'])
+    score = score.add_where(~m1 & ~m2 & (rsi >= 45) & (rsi <= 60), p['b_rsi_sweet'])
+    
+    heat = c('ind_heat')
+    m1 = heat > 2
+    m2 = ~m1 & (heat > 0.5)
+    score = score.add_where(m1, p['b_sector_strong'])
+    score = score.add_where(m2, p['b_sector_mild'])
+    score = score.sub_where(~m1 & ~m2 & (heat < -2), p['p_sector_cold'])
+    
+    rel = c('rel_str')
+    m1 = rel > 3
+    score = score.add_where(m1, p['b_rel_str_strong'])
+    score = score.add_where(~m1 & (rel > 1), p['b_rel_str_mild'])
+    
+    r1 = c('r1')
+    big = abs(r1)
+    score = score.sub_where(big > 5, p['p_big_move5'])
+    score = score.sub_where(big > 3, p['p_big_move3'])
+    score = score.sub_where(c('streak') <= -2, p['p_streak'])
+    score = score.sub_where(c('vol_shrink') < 0.7, p['p_vol_shrink'])
+    score = score.sub_where(c('turn_spike') > 2.0, p['p_turn_spike'])
+    score = score.sub_where(c('close_ma5') < -0.02, p['p_ma5_below'])
+    
+    score = score.sub_where(f['exhaustion'], p.get('p_exhaustion', 0.5))
+    score = score.sub_where(f['vol_price_diverge'], p.get('p_vp_diverge', 0.5))
+    
+    if p.get('_current_risk', 3) >= 4:
+        beta = c('beta')
+        score = score.mul_where(beta > 1.3, 0.5)
+        score = score.mul_where(r1 < -3, 0.3)
+        score = score.mul_where(f['is_high_beta'], 0.5)
+        score = score.add_where(f['is_defensive'], p.get('b_crisis_defensive', 0.3))
+        score = score.add_where(beta < 0.5, p.get('b_crisis_low_beta', 0.2))
+    
+    return score
+
+
 # ============================================================================
 # Precompute (unchanged structure)
 # ============================================================================
-def precompute_period(kline, index_df, scores, sector_avg, start_str, end_str):
+def precompute_period(kline, index_df, scores, sector_avg, start_str, end_str, panel=None):
+    """panel: panel_engine.KlinePanel，传入时按位置切片历史，行业3日涨幅整块计算"""
     eval_start = pd.to_datetime(start_str)
     eval_end = pd.to_datetime(end_str)
     date_range = pd.date_range(eval_start, eval_end, freq='B')
     valid_dates = [d for d in date_range if get_index_return(index_df, d) is not None]
     
+    if panel is not None:
+        statics = [scores.get(code, None) for code in panel.codes]
+        sector_codes, sector_names = encode_labels(
+            [s.get('industry', 'unknown') if s is not None else None for s in statics])
+    
+    fwd_table = get_forward_returns(panel if panel is not None else kline)
     daily_data = []
     for day_idx, test_date in enumerate(valid_dates):
         regime, momentum, vol_state, risk = detect_market_state(index_df, test_date)
@@ -888,17 +1008,21 @@ def precompute_period(kline, index_df, scores, sector_avg, start_str, end_str):
         idx_ret_5d = (idx_closes[-1] - idx_closes[-6]) / idx_closes[-6] * 100 if idx_n >= 6 else 0
         idx_ret_3d = (idx_closes[-1] - idx_closes[-4]) / idx_closes[-4] * 100 if idx_n >= 4 else 0
         
-        dynamic_sector_heat = defaultdict(list)
-        for code, df in kline.items():
-            static = scores.get(code, None)
-            if static is None: continue
-            industry = static.get('industry', 'unknown')
-            s_hist = df[df['date'] < test_date]
-            s_closes = s_hist['close'].values
-            if len(s_closes) >= 4:
-                ret_3d = (s_closes[-1] - s_closes[-4]) / s_closes[-4] * 100
-                dynamic_sector_heat[industry].append(ret_3d)
-        daily_sector_avg = {ind: float(np.mean(rets)) for ind, rets in dynamic_sector_heat.items() if len(rets) >= 3}
+        if panel is not None:
+            pos = panel.positions(test_date)
+            daily_sector_avg = panel.sector_avg_return(pos, sector_codes, sector_names, lookback=3)
+        else:
+            dynamic_sector_heat = defaultdict(list)
+            for code, df in kline.items():
+                static = scores.get(code, None)
+                if static is None: continue
+                industry = static.get('industry', 'unknown')
+                s_hist = df[df['date'] < test_date]
+                s_closes = s_hist['close'].values
+                if len(s_closes) >= 4:
+                    ret_3d = (s_closes[-1] - s_closes[-4]) / s_closes[-4] * 100
+                    dynamic_sector_heat[industry].append(ret_3d)
+            daily_sector_avg = {ind: float(np.mean(rets)) for ind, rets in dynamic_sector_heat.items() if len(rets) >= 3}
         if not daily_sector_avg:
             daily_sector_avg = sector_avg
         
@@ -906,13 +1030,25 @@ def precompute_period(kline, index_df, scores, sector_avg, start_str, end_str):
         if idx_ret is None: idx_ret = 0
         
         stock_subscores = []
-        for code, df in kline.items():
-            if len(df[df['date'] >= test_date]) == 0: continue
-            ss = compute_stock_subscores(code, df, test_date, index_df,
-                                          idx_rets_20, idx_ret_5d, idx_ret_3d,
-                                          scores.get(code), daily_sector_avg)
-            if ss is not None:
-                stock_subscores.append(ss)
+        day_ret = fwd_table.day_returns(test_date)
+        if panel is not None:
+            for i, (code, df) in enumerate(kline.items()):
+                if pos[i] >= panel.lengths[i]: continue
+                ss = compute_stock_subscores(code, df, test_date, index_df,
+                                              idx_rets_20, idx_ret_5d, idx_ret_3d,
+                                              statics[i], daily_sector_avg,
+                                              hist=df.iloc[:pos[i]], stock_return=day_ret.get(code))
+                if ss is not None:
+                    stock_subscores.append(ss)
+        else:
+            for code, df in kline.items():
+                if len(df[df['date'] >= test_date]) == 0: continue
+                ss = compute_stock_subscores(code, df, test_date, index_df,
+                                              idx_rets_20, idx_ret_5d, idx_ret_3d,
+                                              scores.get(code), daily_sector_avg,
+                                              stock_return=day_ret.get(code))
+                if ss is not None:
+                    stock_subscores.append(ss)
         
         daily_data.append({
             'test_date': test_date,
@@ -940,7 +1076,11 @@ def evaluate_wf(daily_data, params, apply_confidence=False, min_score_pct=MIN_SC
     """
     Evaluate beat_idx using unified scoring model.
     If apply_confidence=True, only trade when stocks pass minimum score threshold.
+    daily_data 也可以是 pack_wf() 打包后的 PackedDays（数组快速路径，结果逐位一致）
     """
+    if isinstance(daily_data, PackedDays):
+        return _evaluate_wf_packed(daily_data, params, apply_confidence, min_score_pct)
+    
     stock_recent_perf = defaultdict(list)
     beat_count = 0
     total = 0
@@ -1025,16 +1165,99 @@ def evaluate_wf(daily_data, params, apply_confidence=False, min_score_pct=MIN_SC
     return beat_pct, stats_by_risk, beat_count, total, skipped
 
 
+def _evaluate_wf_packed(packed, params, apply_confidence=False, min_score_pct=MIN_SCORE_PERCENTILE):
+    """evaluate_wf 的数组版：逐列打分 + 前 K 名候选，黑名单/近期表现按 code_id 记录"""
+    stock_recent_perf = defaultdict(list)
+    beat_count = 0
+    total = 0
+    skipped = 0
+    stats_by_risk = defaultdict(lambda: {'beat_idx': 0, 'total': 0})
+    any_scored = False
+    
+    for day in packed.days:
+        dd = day.meta
+        risk = dd['risk']
+        actual_n = dd['actual_n']
+        idx_ret = dd['idx_ret']
+        
+        p = dict(params)
+        p['_current_risk'] = risk
+        scores = _score_unified_packed(day, p)
+        any_scored = any_scored or day.n > 0
+        rank = Ranking(scores)
+        order = rank
+        
+        # V24: Confidence filter（需要完整排序与原始标量，走 Python）
+        if apply_confidence and any_scored:
+            order = list(rank)
+            if len(order) >= 5:
+                objs = materialize(scores.v, scores.k)
+                day_scores = [objs[i] for i in order]
+                threshold = np.percentile(day_scores, min_score_pct)
+                order = [i for i in order if objs[i] >= threshold]
+                if not order:
+                    skipped += 1
+                    continue
+        
+        blacklist = build_blacklist(stock_recent_perf, risk)
+        code_id = day.code_id
+        ind_id = day.ind_id
+        low = scores < 0.3
+        
+        selected = []
+        ind_count = defaultdict(int)
+        for i in order:
+            if len(selected) >= actual_n: break
+            if code_id[i] in blacklist: continue
+            if ind_count[ind_id[i]] >= MAX_INDUSTRY: continue
+            if low[i]:
+                if order is rank and rank.monotone: break
+                continue
+            selected.append(i)
+            ind_count[ind_id[i]] += 1
+        
+        # Fallback
+        if not selected:
+            limit = 1 if risk >= 3 else 2
+            for i in order:
+                if len(selected) >= limit: break
+                if code_id[i] not in blacklist:
+                    selected.append(i)
+        if not selected:
+            for i in order:
+                if len(selected) >= 2: break
+                selected.append(i)
+        if not selected: continue
+        
+        for i in selected:
+            ret = day.ret[i]
+            if ret is not None:
+                perf = stock_recent_perf[code_id[i]]
+                perf.append(ret)
+                if len(perf) > 5:
+                    stock_recent_perf[code_id[i]] = perf[-5:]
+        
+        avg_ret = ret_mean(day, selected)
+        if avg_ret is not None:
+            beat_idx = avg_ret > idx_ret
+            total += 1
+            if beat_idx: beat_count += 1
+            stats_by_risk[risk]['total'] += 1
+            if beat_idx: stats_by_risk[risk]['beat_idx'] += 1
+    
+    beat_pct = beat_count / total if total > 0 else 0
+    return beat_pct, stats_by_risk, beat_count, total, skipped
+
+
 # ============================================================================
 # V24: Walk-Forward Optimization (train on A+B, validate on C)
 # ============================================================================
-def optimize_unified_wf(train_data, valid_data, n_trials=N_TRIALS):
-    """Optimize unified model on train periods, select best by validation."""
-    import optuna
-    optuna.logging.set_verbosity(optuna.logging.WARNING)
-    
-    print(f"\n[Phase 1] Walk-Forward Optimization - {n_trials} trials")
-    print(f"  Train: A+B combined, Valid: C")
+def _make_unified_objective(data):
+    """构造 optimize_unified_wf 的目标函数（模块级，供并行 worker 按引用调用）"""
+    train_data, valid_data = data['train'], data['valid']
+    if USE_FAST_EVALUATOR and not isinstance(valid_data, PackedDays):
+        # 未在主进程打包时（直接调用）在此打包一次，之后所有 trial 复用
+        train_data, valid_data = pack_wf_split(train_data, valid_data)
     
     WEIGHT_KEYS = ['w_momentum', 'w_trend', 'w_consistency', 'w_mr', 'w_vol', 'w_rsi',
                    'w_static', 'w_defense', 'w_sector_heat', 'w_low_vol', 'w_rel_str', 'w_rel_str_3d',
@@ -1060,7 +1283,7 @@ def optimize_unified_wf(train_data, valid_data, n_trials=N_TRIALS):
     for k in ['p_big_move5', 'p_high_vol', 'p_rsi_overbought', 'p_ma20_below', 'p_sector_cold']:
         MULT_RANGES[k] = (0.05, 0.8)
     
-    best_valid = {'obj': -999, 'train_obj': -999, 'params': None}
+    best_valid = {'obj': -999}
     
     def objective(trial):
         # Sample weights
@@ -1096,21 +1319,40 @@ def optimize_unified_wf(train_data, valid_data, n_trials=N_TRIALS):
         # Heavy weight on validation to prevent overfitting
         obj = 0.4 * train_obj + 0.6 * valid_bi
         
+        trial.set_user_attr('params', params)
+        trial.set_user_attr('train_obj', float(train_obj))
+        
         if obj > best_valid['obj']:
             best_valid['obj'] = obj
-            best_valid['train_obj'] = train_obj
-            best_valid['params'] = dict(params)
             print(f"    [Trial {trial.number}] obj={obj:.4f} "
                   f"train={np.mean(train_beats)*100:.0f}% valid={valid_bi*100:.0f}%")
         
-        return obj
+        return float(obj)
     
-    study = optuna.create_study(direction='maximize')
-    study.optimize(objective, n_trials=n_trials, timeout=TIMEOUT_PER_PHASE, show_progress_bar=False)
+    return objective
+
+
+def optimize_unified_wf(train_data, valid_data, n_trials=N_TRIALS, n_jobs=None):
+    """Optimize unified model on train periods, select best by validation.
+
+    n_jobs > 1 时 trial 分发到进程池（见 parallel_optuna），None 取 OPTUNA_N_JOBS / CPU 核数
+    """
+    print(f"\n[Phase 1] Walk-Forward Optimization - {n_trials} trials")
+    print(f"  Train: A+B combined, Valid: C")
     
-    print(f"\n  Best valid obj: {best_valid['obj']:.4f}")
-    print(f"  Best train obj: {best_valid['train_obj']:.4f}")
-    return best_valid['params'], best_valid['obj']
+    if USE_FAST_EVALUATOR:
+        # 主进程打包一次：数组放进共享内存，各 worker 共用同一份只读数据
+        train_data, valid_data = pack_wf_split(train_data, valid_data)
+    study = optimize_parallel(_make_unified_objective, {'train': train_data, 'valid': valid_data},
+                              n_trials=n_trials, timeout=TIMEOUT_PER_PHASE, n_jobs=n_jobs,
+                              study_name='v24_unified_wf')
+    best = best_user_attrs(study)
+    if best is None:
+        return None, -999
+    
+    print(f"\n  Best valid obj: {best['value']:.4f}")
+    print(f"  Best train obj: {best['train_obj']:.4f}")
+    return best['params'], best['value']
 
 
 # ============================================================================
@@ -1144,14 +1386,15 @@ def main():
     
     # Precompute all periods
     print("\n[Precompute] Computing sub-scores for 4 periods...")
+    panel = build_panel(kline) if USE_PANEL_ENGINE else None
     periods_data = {}
     for plabel, (ps, pe) in [('A', PERIOD_A), ('B', PERIOD_B), ('C', PERIOD_C), ('D', PERIOD_D)]:
         print(f"\n  Period {plabel}: {ps} ~ {pe}")
-        periods_data[plabel] = precompute_period(kline, index_df, scores, sector_avg, ps, pe)
+        periods_data[plabel] = precompute_period(kline, index_df, scores, sector_avg, ps, pe, panel=panel)
         gc.collect()
         print_mem(f"After Period {plabel}")
     
-    del kline
+    del kline, panel
     gc.collect()
     print_mem("After freeing kline")
     
@@ -41,6 +41,9 @@ SHARED_DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 
 sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
 
+from forward_returns import get_forward_returns, index_return
+from panel_engine import build_panel, precompute_panel
+
 # ============================================================================
 # Config
 # ============================================================================
@@ -66,6 +69,9 @@ PERIOD_D = ('2026-04-22', '2026-05-09')
 
 N_TRIALS = 50
 
+# 面板引擎：子分数整块向量化预计算（False 则走逐日逐股的旧循环）
+USE_PANEL_ENGINE = True
+
 PT_ST_KEYWORDS = ['PT', 'ST', '*ST', '退']
 BLOCKED_CODE_PREFIXES = ['2', '9', '4']
 
@@ -304,27 +310,9 @@ def _load_scores():
 # ============================================================================
 # Helpers
 # ============================================================================
-def get_stock_return(df, date):
-    day_rows = df[df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
-
 def get_index_return(index_df, date):
-    day_rows = index_df[index_df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
+    """T+1 index return (forward-return table; None when unavailable)"""
+    return index_return(index_df, date)
 
 
 # ============================================================================
@@ -666,7 +654,7 @@ def detect_divergence(hist_closes, hist_volumes, lookback=20):
 # ============================================================================
 # Precompute V25 sub-scores for each stock-day pair
 # ============================================================================
-def precompute_v25(kline, index_df, scores, start_str, end_str):
+def precompute_v25(kline, index_df, scores, start_str, end_str, panel=None):
     """
     Precompute all 6 dimension scores for every stock on every day.
     This makes Optuna evaluation fast (just apply weights).
@@ -676,8 +664,16 @@ def precompute_v25(kline, index_df, scores, start_str, end_str):
     date_range = pd.date_range(eval_start, eval_end, freq='B')
     valid_dates = [d for d in date_range if get_index_return(index_df, d) is not None]
 
+    if panel is not None:
+        daily_data = _precompute_v25_panel(panel, index_df, scores, valid_dates)
+        check_memory()
+        print(f"  Period {start_str}~{end_str}: {len(daily_data)} days")
+        return daily_data
+
+    fwd_table = get_forward_returns(kline)
     daily_data = []
     for day_idx, test_date in enumerate(valid_dates):
+        day_ret = fwd_table.day_returns(test_date)
         # Market regime
         regime, confidence, risk = detect_market_regime_v25(index_df, test_date)
         should, n_rec = should_trade(regime, confidence, risk)
@@ -741,7 +737,7 @@ def precompute_v25(kline, index_df, scores, start_str, end_str):
             stock_hist_cache[code] = {
                 'c': c, 'v': v, 'hi': hi, 'lo': lo, 'turn': turn,
                 'industry': industry, 'name': name,
-                'stock_return': get_stock_return(df, test_date),
+                'stock_return': day_ret.get(code),
             }
 
         # Apply sector filter based on pool size
@@ -825,6 +821,33 @@ def precompute_v25(kline, index_df, scores, start_str, end_str):
     return daily_data
 
 
+def _precompute_v25_panel(panel, index_df, scores, valid_dates):
+    """面板版 precompute_v25：市场层面逐日计算，个股子分数从面板按位置取值"""
+    def day_fields(test_date, sector_info):
+        regime, confidence, risk = detect_market_regime_v25(index_df, test_date)
+        should, n_rec = should_trade(regime, confidence, risk)
+        idx_ret = get_index_return(index_df, test_date)
+        return {
+            'test_date': test_date,
+            'regime': regime,
+            'confidence': confidence,
+            'risk': risk,
+            'should_trade': should,
+            'n_recommend': n_rec,
+            'idx_ret': idx_ret if idx_ret is not None else 0,
+        }
+
+    def tradeable(code, static):
+        if static:
+            return is_tradeable(code, static.get('name', ''), static)
+        return code[0] not in BLOCKED_CODE_PREFIXES
+
+    return precompute_panel(
+        panel, scores, valid_dates, day_fields, tradeable_fn=tradeable,
+        classify_fn=lambda ind: (is_defensive_industry(ind), is_high_beta_industry(ind)),
+        profile='v25', with_extra=False, sector_exclude=('unknown',))
+
+
 # ============================================================================
 # Fast evaluation using precomputed scores
 # ============================================================================
@@ -1043,15 +1066,16 @@ def main():
 
     # Precompute all periods
     print("\n[Precompute] Computing V25 sub-scores for 4 periods...")
+    panel = build_panel(kline) if USE_PANEL_ENGINE else None
     periods_data = {}
     for plabel, (ps, pe) in [('A', PERIOD_A), ('B', PERIOD_B),
                               ('C', PERIOD_C), ('D', PERIOD_D)]:
         print(f"\n  Period {plabel}: {ps} ~ {pe}")
-        periods_data[plabel] = precompute_v25(kline, index_df, scores, ps, pe)
+        periods_data[plabel] = precompute_v25(kline, index_df, scores, ps, pe, panel=panel)
         gc.collect()
         print_mem(f"After Period {plabel}")
 
-    del kline
+    del kline, panel
     gc.collect()
     print_mem("After freeing kline")
 
@@ -17,7 +17,7 @@ Walk-Forward Split:
   Test:    04/22 ~ 05/13 (D) — extended
 """
 
-import json, os, sys, time, gc, warnings, functools
+import json, os, re, sys, time, gc, warnings, functools
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
@@ -37,6 +37,9 @@ SHARED_DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 
 sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
 
+from forward_returns import get_forward_returns, index_return
+from panel_engine import build_panel, precompute_panel
+
 # ============================================================================
 # Config
 # ============================================================================
@@ -66,6 +69,9 @@ N_TRIALS = 300
 COOLDOWN_DAYS = 3  # Same stock can't be recommended within 3 days
 USE_COOLDOWN = True  # Toggle cooldown on/off
 
+# 面板引擎：子分数整块向量化预计算（False 则走逐日逐股的旧循环）
+USE_PANEL_ENGINE = True
+
 # FIX #4: Limit-up filter settings
 LIMIT_UP_THRESHOLD = 15.0  # >15% daily gain considered limit-up
 IPO_MIN_DAYS = 30  # Minimum trading days since IPO
@@ -128,6 +134,15 @@ def is_tradeable(code, name='', static=None):
     return True  # FIX #5: Don't reject stocks with unknown industry
 
 
+def tradeable_mask(codes, names):
+    """Vectorized is_tradeable over many codes at once; returns a bool array."""
+    codes = pd.Series(list(codes), dtype=object).astype(str)
+    names = pd.Series(list(names), dtype=object).fillna('').astype(str)
+    blocked = codes.str[:1].isin(BLOCKED_CODE_PREFIXES).values
+    pattern = '|'.join(re.escape(kw) for kw in PT_ST_KEYWORDS)
+    return ~(blocked | names.str.contains(pattern, regex=True).values)
+
+
 # ============================================================================
 # Data Loading (same as V25)
 # ============================================================================
@@ -316,27 +331,9 @@ def get_trading_dates(index_df, start_str, end_str):
 # ============================================================================
 # Helpers
 # ============================================================================
-def get_stock_return(df, date):
-    day_rows = df[df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
-
 def get_index_return(index_df, date):
-    day_rows = index_df[index_df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
+    """T+1 index return (forward-return table; None when unavailable)"""
+    return index_return(index_df, date)
 
 
 # ============================================================================
@@ -372,6 +369,11 @@ def is_ipo_stock(total_trading_days):
     return total_trading_days < IPO_MIN_DAYS
 
 
+def ipo_mask(total_trading_days):
+    """Vectorized is_ipo_stock; returns a bool array."""
+    return np.asarray(total_trading_days) < IPO_MIN_DAYS
+
+
 # ============================================================================
 # MODULE 1: Market Regime Detection (same as V25)
 # ============================================================================
@@ -710,7 +712,7 @@ def detect_divergence(hist_closes, hist_volumes, lookback=20):
 # ============================================================================
 # Precompute V26 sub-scores (with FIX #1, #4)
 # ============================================================================
-def precompute_v26(kline, index_df, scores, start_str, end_str):
+def precompute_v26(kline, index_df, scores, start_str, end_str, panel=None):
     """
     Precompute all 6 dimension scores for every stock on every day.
     FIX #1: Use real trading dates from index data
@@ -724,8 +726,21 @@ def precompute_v26(kline, index_df, scores, start_str, end_str):
     print(f"  Real trading days: {len(valid_dates)} "
           f"({valid_dates[0].date() if valid_dates else 'N/A'} ~ {valid_dates[-1].date() if valid_dates else 'N/A'})")
 
+    if panel is not None:
+        daily_data = _precompute_v26_panel(panel, index_df, scores, valid_dates)
+        print(f"  Period {start_str}~{end_str}: {len(daily_data)} valid trading days")
+        return daily_data
+
+    # Tradeable / IPO flags don't depend on the date: compute them once for all codes
+    kline_codes = list(kline.keys())
+    kline_names = [(scores.get(code) or {}).get('name', '') for code in kline_codes]
+    tradeable_flags = dict(zip(kline_codes, tradeable_mask(kline_codes, kline_names).tolist()))
+    ipo_flags = dict(zip(kline_codes, ipo_mask([len(kline[code]) for code in kline_codes]).tolist()))
+
+    fwd_table = get_forward_returns(kline)
     daily_data = []
     for day_idx, test_date in enumerate(valid_dates):
+        day_ret = fwd_table.day_returns(test_date)
         # Market regime
         regime, confidence, risk = detect_market_regime_v25(index_df, test_date)
         should, n_rec = should_trade(regime, confidence, risk)
@@ -746,7 +761,7 @@ def precompute_v26(kline, index_df, scores, start_str, end_str):
             static = scores.get(code)
             name = static.get('name', '') if static else ''
 
-            if not is_tradeable(code, name):
+            if not tradeable_flags[code]:
                 debug_skip['pt_st'] += 1
                 continue
 
@@ -756,14 +771,13 @@ def precompute_v26(kline, index_df, scores, start_str, end_str):
 
             hist = df[df['date'] < test_date]
             c = hist['close'].values
-            total_days = len(df)  # Total trading history
 
             if len(c) < 20:
                 debug_skip['short_hist'] += 1
                 continue
 
             # FIX #4: Filter IPO stocks (< 30 trading days total history)
-            if is_ipo_stock(total_days):
+            if ipo_flags[code]:
                 debug_skip['ipo'] += 1
                 continue
 
@@ -801,7 +815,7 @@ def precompute_v26(kline, index_df, scores, start_str, end_str):
             stock_hist_cache[code] = {
                 'c': c, 'v': v, 'hi': hi, 'lo': lo, 'turn': turn,
                 'industry': industry, 'name': name,
-                'stock_return': get_stock_return(df, test_date),
+                'stock_return': day_ret.get(code),
                 'last_pct': last_pct,
                 'recent_limit_ups': recent_limit_ups,
                 'extra_score': extra_score,
@@ -886,6 +900,29 @@ def precompute_v26(kline, index_df, scores, start_str, end_str):
     return daily_data
 
 
+def _precompute_v26_panel(panel, index_df, scores, valid_dates):
+    """面板版 precompute_v26：市场层面逐日计算，个股子分数从面板按位置取值"""
+    def day_fields(test_date, sector_info):
+        regime, confidence, risk = detect_market_regime_v25(index_df, test_date)
+        should, n_rec = should_trade(regime, confidence, risk)
+        idx_ret = get_index_return(index_df, test_date)
+        return {
+            'test_date': test_date,
+            'regime': regime,
+            'confidence': confidence,
+            'risk': risk,
+            'should_trade': should,
+            'n_recommend': n_rec,
+            'idx_ret': idx_ret if idx_ret is not None else 0,
+        }
+
+    return precompute_panel(
+        panel, scores, valid_dates, day_fields,
+        tradeable_fn=lambda code, static: is_tradeable(code, static.get('name', '') if static else ''),
+        classify_fn=lambda ind: (is_defensive_industry(ind), is_high_beta_industry(ind)),
+        profile='v26', limit_up_threshold=LIMIT_UP_THRESHOLD, ipo_min_days=IPO_MIN_DAYS)
+
+
 # ============================================================================
 # FIX #2: Cooldown tracking across days
 # ============================================================================
@@ -1194,15 +1231,16 @@ def main():
 
     # Precompute all periods
     print("\n[Precompute] Computing V26 sub-scores for 4 periods...")
+    panel = build_panel(kline) if USE_PANEL_ENGINE else None
     periods_data = {}
     for plabel, (ps, pe) in [('A', PERIOD_A), ('B', PERIOD_B),
                               ('C', PERIOD_C), ('D', PERIOD_D)]:
         print(f"\n  Period {plabel}: {ps} ~ {pe}")
-        periods_data[plabel] = precompute_v26(kline, index_df, scores, ps, pe)
+        periods_data[plabel] = precompute_v26(kline, index_df, scores, ps, pe, panel=panel)
         gc.collect()
         print_mem(f"After Period {plabel}")
 
-    del kline
+    del kline, panel
     gc.collect()
     print_mem("After freeing kline")
 
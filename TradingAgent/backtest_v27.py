@@ -16,7 +16,7 @@ CRITICAL: V25's 6 base weights are FROZEN (from optuna_v25_best_params.json).
 Only new parameters are tuned (no-trade thresholds, volatility penalties, etc.).
 """
 
-import json, os, sys, time, gc, warnings, functools
+import json, os, re, sys, time, gc, warnings, functools
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
@@ -36,6 +36,10 @@ SHARED_DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 
 sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
 
+from forward_returns import get_forward_returns, index_return
+from panel_engine import build_panel, precompute_panel
+from parallel_optuna import optimize_parallel, best_user_attrs
+
 # ============================================================================
 # Config
 # ============================================================================
@@ -65,6 +69,9 @@ N_TRIALS = 500
 COOLDOWN_DAYS = 3
 USE_COOLDOWN = True
 
+# 面板引擎：子分数整块向量化预计算（False 则走逐日逐股的旧循环）
+USE_PANEL_ENGINE = True
+
 # Limit-up filter (same as V26)
 LIMIT_UP_THRESHOLD = 15.0
 IPO_MIN_DAYS = 30
@@ -158,6 +165,15 @@ def is_tradeable(code, name='', static=None):
     return True
 
 
+def tradeable_mask(codes, names):
+    """Vectorized is_tradeable over many codes at once; returns a bool array."""
+    codes = pd.Series(list(codes), dtype=object).astype(str)
+    names = pd.Series(list(names), dtype=object).fillna('').astype(str)
+    blocked = codes.str[:1].isin(BLOCKED_CODE_PREFIXES).values
+    pattern = '|'.join(re.escape(kw) for kw in PT_ST_KEYWORDS)
+    return ~(blocked | names.str.contains(pattern, regex=True).values)
+
+
 # ============================================================================
 # Data Loading (same as V26)
 # ============================================================================
@@ -339,27 +355,9 @@ def get_trading_dates(index_df, start_str, end_str):
     return trading_dates
 
 
-def get_stock_return(df, date):
-    day_rows = df[df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
-
 def get_index_return(index_df, date):
-    day_rows = index_df[index_df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
+    """T+1 index return (forward-return table; None when unavailable)"""
+    return index_return(index_df, date)
 
 
 def has_limit_up_yesterday(hist_closes, threshold=LIMIT_UP_THRESHOLD):
@@ -382,6 +380,11 @@ def is_ipo_stock(total_trading_days):
     return total_trading_days < IPO_MIN_DAYS
 
 
+def ipo_mask(total_trading_days):
+    """Vectorized is_ipo_stock; returns a bool array."""
+    return np.asarray(total_trading_days) < IPO_MIN_DAYS
+
+
 # ============================================================================
 # V27 NEW: Enhanced Market Regime Detection
 # ============================================================================
@@ -833,15 +836,29 @@ def compute_stock_volatility(hist_closes, lookback=10):
 # ============================================================================
 # Precompute V27 sub-scores
 # ============================================================================
-def precompute_v27(kline, index_df, scores, start_str, end_str):
+def precompute_v27(kline, index_df, scores, start_str, end_str, panel=None):
     valid_dates = get_trading_dates(index_df, start_str, end_str)
     valid_dates = [d for d in valid_dates if get_index_return(index_df, d) is not None]
 
     print(f"  Real trading days: {len(valid_dates)} "
           f"({valid_dates[0].date() if valid_dates else 'N/A'} ~ {valid_dates[-1].date() if valid_dates else 'N/A'})")
 
+    if panel is not None:
+        daily_data = _precompute_v27_panel(panel, index_df, scores, valid_dates)
+        check_memory()
+        print(f"  Period {start_str}~{end_str}: {len(daily_data)} valid trading days")
+        return daily_data
+
+    # Tradeable / IPO flags don't depend on the date: compute them once for all codes
+    kline_codes = list(kline.keys())
+    kline_names = [(scores.get(code) or {}).get('name', '') for code in kline_codes]
+    tradeable_flags = dict(zip(kline_codes, tradeable_mask(kline_codes, kline_names).tolist()))
+    ipo_flags = dict(zip(kline_codes, ipo_mask([len(kline[code]) for code in kline_codes]).tolist()))
+
+    fwd_table = get_forward_returns(kline)
     daily_data = []
     for day_idx, test_date in enumerate(valid_dates):
+        day_ret = fwd_table.day_returns(test_date)
         # V27: Enhanced market regime
         regime, confidence, risk, extra_market_info = detect_market_regime_v27(index_df, test_date)
 
@@ -855,7 +872,7 @@ def precompute_v27(kline, index_df, scores, start_str, end_str):
             static = scores.get(code)
             name = static.get('name', '') if static else ''
 
-            if not is_tradeable(code, name):
+            if not tradeable_flags[code]:
                 debug_skip['pt_st'] += 1
                 continue
 
@@ -865,13 +882,12 @@ def precompute_v27(kline, index_df, scores, start_str, end_str):
 
             hist = df[df['date'] < test_date]
             c = hist['close'].values
-            total_days = len(df)
 
             if len(c) < 20:
                 debug_skip['short_hist'] += 1
                 continue
 
-            if is_ipo_stock(total_days):
+            if ipo_flags[code]:
                 debug_skip['ipo'] += 1
                 continue
 
@@ -905,7 +921,7 @@ def precompute_v27(kline, index_df, scores, start_str, end_str):
             stock_hist_cache[code] = {
                 'c': c, 'v': v, 'hi': hi, 'lo': lo, 'turn': turn,
                 'industry': industry, 'name': name,
-                'stock_return': get_stock_return(df, test_date),
+                'stock_return': day_ret.get(code),
                 'last_pct': last_pct,
                 'recent_limit_ups': recent_limit_ups,
                 'extra_score': extra_score,
@@ -985,6 +1001,29 @@ def precompute_v27(kline, index_df, scores, start_str, end_str):
     return daily_data
 
 
+def _precompute_v27_panel(panel, index_df, scores, valid_dates):
+    """面板版 precompute_v27：市场层面逐日计算，个股子分数从面板按位置取值"""
+    def day_fields(test_date, sector_info):
+        regime, confidence, risk, extra_market_info = detect_market_regime_v27(index_df, test_date)
+        idx_ret = get_index_return(index_df, test_date)
+        return {
+            'test_date': test_date,
+            'regime': regime,
+            'confidence': confidence,
+            'risk': risk,
+            'idx_ret': idx_ret if idx_ret is not None else 0,
+            'extra_market_info': extra_market_info,
+            'sector_concentration': sector_info['sector_concentration'],
+        }
+
+    return precompute_panel(
+        panel, scores, valid_dates, day_fields,
+        tradeable_fn=lambda code, static: is_tradeable(code, static.get('name', '') if static else ''),
+        classify_fn=lambda ind: (is_defensive_industry(ind), is_high_beta_industry(ind)),
+        profile='v26', with_stock_vol=True,
+        limit_up_threshold=LIMIT_UP_THRESHOLD, ipo_min_days=IPO_MIN_DAYS)
+
+
 # ============================================================================
 # Cooldown tracker (same as V26)
 # ============================================================================
@@ -1220,13 +1259,11 @@ def _get_no_trade_reason(extra_market_info, config, sector_concentration):
 # ============================================================================
 # V27 Optuna: Only tune NEW parameters, FROZEN base weights from V25
 # ============================================================================
-def optimize_v27(train_data, valid_data, n_trials=N_TRIALS):
-    import optuna
-    optuna.logging.set_verbosity(optuna.logging.WARNING)
-
-    print(f"\n[Optimization] V27 — {n_trials} trials, tuning ONLY new params (base weights FROZEN)")
+def _make_v27_objective(data):
+    """构造 optimize_v27 的目标函数（模块级，供并行 worker 按引用调用）"""
+    train_data, valid_data = data['train'], data['valid']
 
-    best_result = {'obj': -999, 'params': None}
+    best_result = {'obj': -999}
 
     all_train = train_data['A'] + train_data['B'] + valid_data
 
@@ -1332,9 +1369,10 @@ def optimize_v27(train_data, valid_data, n_trials=N_TRIALS):
         variance_penalty = abs(ab_bi - c_bi) * 0.3
         obj = 0.5 * train_bi + 0.4 * stability - variance_penalty * 0.1
 
+        trial.set_user_attr('params', weights_config)
+
         if obj > best_result['obj']:
             best_result['obj'] = obj
-            best_result['params'] = weights_config
             print(f"    [Trial {trial.number}] obj={obj:.4f} "
                   f"all={train_bc}/{train_bt}={train_bi*100:.0f}% "
                   f"AB={ab_bi*100:.0f}% C={c_bi*100:.0f}% "
@@ -1342,13 +1380,23 @@ def optimize_v27(train_data, valid_data, n_trials=N_TRIALS):
                   f"prev>{prev_day_gain_threshold:.1f}(w{prev_gain_weight:.1f}),"
                   f"trigger>{danger_trigger:.1f}]")
 
-        return obj
+        return float(obj)
+
+    return objective
+
+
+def optimize_v27(train_data, valid_data, n_trials=N_TRIALS, n_jobs=None):
+    """n_jobs > 1 时 trial 分发到进程池（见 parallel_optuna），None 取 OPTUNA_N_JOBS / CPU 核数"""
+    print(f"\n[Optimization] V27 — {n_trials} trials, tuning ONLY new params (base weights FROZEN)")
 
-    study = optuna.create_study(direction='maximize')
-    study.optimize(objective, n_trials=n_trials, timeout=900, show_progress_bar=False)
+    study = optimize_parallel(_make_v27_objective, {'train': train_data, 'valid': valid_data},
+                              n_trials=n_trials, timeout=900, n_jobs=n_jobs, study_name='v27')
+    best = best_user_attrs(study)
+    if best is None:
+        return None, -999
 
-    print(f"\n  Best obj: {best_result['obj']:.4f}")
-    return best_result['params'], best_result['obj']
+    print(f"\n  Best obj: {best['value']:.4f}")
+    return best['params'], best['value']
 
 
 # ============================================================================
@@ -1379,15 +1427,16 @@ def main():
 
     # Precompute all periods
     print("\n[Precompute] Computing V27 sub-scores for 4 periods...")
+    panel = build_panel(kline) if USE_PANEL_ENGINE else None
     periods_data = {}
     for plabel, (ps, pe) in [('A', PERIOD_A), ('B', PERIOD_B),
                               ('C', PERIOD_C), ('D', PERIOD_D)]:
         print(f"\n  Period {plabel}: {ps} ~ {pe}")
-        periods_data[plabel] = precompute_v27(kline, index_df, scores, ps, pe)
+        periods_data[plabel] = precompute_v27(kline, index_df, scores, ps, pe, panel=panel)
         gc.collect()
         print_mem(f"After Period {plabel}")
 
-    del kline
+    del kline, panel
     gc.collect()
     print_mem("After freeing kline")
 
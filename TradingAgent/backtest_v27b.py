@@ -36,6 +36,7 @@ KLINE_CACHE = os.path.join(DATA_DIR, 'kline_cache')
 RESULT_DIR = os.path.join(BASE_DIR, 'backtest_results')
 SHARED_DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
+from forward_returns import get_forward_returns, index_return
 
 MIN_KLINE_DAYS = 30
 MEMORY_LIMIT_MB = 8000
@@ -185,17 +186,9 @@ def get_trading_dates(index_df, start_str, end_str):
     start, end = pd.to_datetime(start_str), pd.to_datetime(end_str)
     return sorted(index_df.loc[(index_df['date'] >= start) & (index_df['date'] <= end), 'date'].tolist())
 
-def get_stock_return(df, date):
-    rows = df[df['date'] >= date]
-    if len(rows) < 2: return None
-    try: return (float(rows.iloc[1]['close']) - float(rows.iloc[0]['close'])) / float(rows.iloc[0]['close']) * 100
-    except: return None
-
 def get_index_return(index_df, date):
-    rows = index_df[index_df['date'] >= date]
-    if len(rows) < 2: return None
-    try: return (float(rows.iloc[1]['close']) - float(rows.iloc[0]['close'])) / float(rows.iloc[0]['close']) * 100
-    except: return None
+    """T+1 index return (forward-return table; None when unavailable)"""
+    return index_return(index_df, date)
 
 def count_recent_limit_ups(c, lookback=5, threshold=LIMIT_UP_THRESHOLD):
     n = len(c); count = 0
@@ -368,8 +361,10 @@ def precompute(kline, index_df, scores, start_str, end_str):
     valid_dates = [d for d in valid_dates if get_index_return(index_df, d) is not None]
     print(f"  {start_str}~{end_str}: {len(valid_dates)} trading days")
 
+    fwd_table = get_forward_returns(kline)
     daily_data = []
     for day_idx, test_date in enumerate(valid_dates):
+        day_ret = fwd_table.day_returns(test_date)
         regime, confidence, risk, extra = detect_market_regime(index_df, test_date)
         should, n_rec = should_trade(regime, confidence, risk, extra)
         idx_ret = get_index_return(index_df, test_date) or 0
@@ -400,7 +395,7 @@ def precompute(kline, index_df, scores, start_str, end_str):
             if static:
                 es = (static.get('tech',5)*5+static.get('fund',5)*3+static.get('chip',5)*2+static.get('sector',5)*3)/13*10
             cache[code] = {'c':c,'v':v,'hi':hi,'lo':lo,'turn':turn,'industry':ind,'name':name,
-                           'stock_return':get_stock_return(df, test_date),'extra_score':es,
+                           'stock_return':day_ret.get(code),'extra_score':es,
                            'stock_vol':compute_stock_volatility(c)}
 
         stock_scores = []
@@ -25,7 +25,7 @@ Uses V25 Optuna params (no re-optimization).
 Test window: 04-22 ~ 05-13
 """
 
-import json, os, sys, time, gc, warnings, functools
+import json, os, re, sys, time, gc, warnings, functools
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
@@ -45,6 +45,10 @@ SHARED_DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 
 sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
 
+from forward_returns import get_forward_returns, index_return
+from panel_engine import build_panel, percentile_rank_map, precompute_panel
+from fast_evaluator import PackedDays, pack_days, Ranking, CooldownArray, ret_mean, date_ns
+
 # ============================================================================
 # Config
 # ============================================================================
@@ -72,6 +76,12 @@ PERIOD_D = ('2026-04-22', '2026-05-13')
 COOLDOWN_DAYS = 3
 USE_COOLDOWN = True
 
+# 面板引擎：子分数整块向量化预计算（False 则走逐日逐股的旧循环）
+USE_PANEL_ENGINE = True
+
+# 快速评估：不需要逐日明细的 evaluate_v28 调用使用打包后的数组数据（结果与逐股循环逐位一致）
+USE_FAST_EVALUATOR = True
+
 # FIX #4: Limit-up filter settings
 LIMIT_UP_THRESHOLD = 15.0
 IPO_MIN_DAYS = 30
@@ -134,6 +144,15 @@ def is_tradeable(code, name='', static=None):
     return True
 
 
+def tradeable_mask(codes, names):
+    """Vectorized is_tradeable over many codes at once; returns a bool array."""
+    codes = pd.Series(list(codes), dtype=object).astype(str)
+    names = pd.Series(list(names), dtype=object).fillna('').astype(str)
+    blocked = codes.str[:1].isin(BLOCKED_CODE_PREFIXES).values
+    pattern = '|'.join(re.escape(kw) for kw in PT_ST_KEYWORDS)
+    return ~(blocked | names.str.contains(pattern, regex=True).values)
+
+
 # ============================================================================
 # Data Loading (same as V26)
 # ============================================================================
@@ -148,9 +167,12 @@ def load_merged_kline():
     new_file = os.path.join(KLINE_CACHE, 'kline_full_latest.json')
     NEED_COLS = {'date', 'open', 'high', 'low', 'close', 'volume', 'pctChg', 'turn'}
 
+    merged = _load_merged_from_store(new_file, v19_pool, NEED_COLS)
+    if merged is not None:
+        return merged
+
     print(f"  Loading: {os.path.basename(new_file)} ({os.path.getsize(new_file)/1024/1024:.1f}MB)")
-    with open(new_file, 'r', encoding='utf-8') as f:
-        raw_data = json.load(f)
+    raw_data = _load_raw_kline(new_file)
 
     merged = {}
     skipped_pool = 0
@@ -192,6 +214,42 @@ def load_merged_kline():
     return merged
 
 
+def _load_merged_from_store(source_file, v19_pool, need_cols):
+    """列式存储可用时直接内存映射读取，结果与 JSON 路径一致（float32、按日期排序、去重）"""
+    try:
+        from kline_store import open_kline_store
+    except ImportError:
+        return None
+    store = open_kline_store(source=source_file)
+    if store is None:
+        return None
+
+    print(f"  Loading: {os.path.basename(store.store_dir)} (mmap, {len(store)} stocks)")
+    codes = [c for c in store.codes if v19_pool is None or c in v19_pool]
+    skipped_pool = len(store) - len(codes)
+    fields = [f for f in store.fields if f in need_cols]
+    merged = store.frames(codes, min_days=MIN_KLINE_DAYS, fields=fields)
+    skipped_days = len(codes) - len(merged)
+    if not merged:
+        return None
+
+    all_min_dates = [df['date'].min() for df in merged.values()]
+    all_max_dates = [df['date'].max() for df in merged.values()]
+    print(f"  Loaded: {len(merged)} stocks (skipped {skipped_pool} out-of-pool, {skipped_days} too short)")
+    print(f"  Date range: {min(all_min_dates).date()} ~ {max(all_max_dates).date()}")
+    return merged
+
+
+def _load_raw_kline(kline_file):
+    """读取 K 线 JSON，并重放尚未压缩的增量段（kline_delta）"""
+    try:
+        from kline_delta import load_kline_json
+    except ImportError:
+        with open(kline_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return load_kline_json(kline_file)
+
+
 def _parse_index_file(filepath):
     with open(filepath, 'r', encoding='utf-8') as f:
         raw = json.load(f)
@@ -321,27 +379,9 @@ def get_trading_dates(index_df, start_str, end_str):
 # ============================================================================
 # Helpers
 # ============================================================================
-def get_stock_return(df, date):
-    day_rows = df[df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
-
 def get_index_return(index_df, date):
-    day_rows = index_df[index_df['date'] >= date]
-    if len(day_rows) < 2:
-        return None
-    try:
-        buy_price = float(day_rows.iloc[0]['close'])
-        sell_price = float(day_rows.iloc[1]['close'])
-        return (sell_price - buy_price) / buy_price * 100
-    except:
-        return None
+    """T+1 index return (forward-return table; None when unavailable)"""
+    return index_return(index_df, date)
 
 
 # ============================================================================
@@ -367,6 +407,11 @@ def is_ipo_stock(total_trading_days):
     return total_trading_days < IPO_MIN_DAYS
 
 
+def ipo_mask(total_trading_days):
+    """Vectorized is_ipo_stock; returns a bool array."""
+    return np.asarray(total_trading_days) < IPO_MIN_DAYS
+
+
 # ============================================================================
 # ★★★ V28 NEW: No-Trade Signal Detection ★★★
 # ============================================================================
@@ -773,16 +818,33 @@ def detect_divergence(hist_closes, hist_volumes, lookback=20):
 # ============================================================================
 # Precompute sub-scores (with no-trade signal detection)
 # ============================================================================
-def precompute_v28(kline, index_df, scores, start_str, end_str):
-    """Precompute all sub-scores + no-trade signals for every trading day."""
+def precompute_v28(kline, index_df, scores, start_str, end_str, panel=None):
+    """Precompute all sub-scores + no-trade signals for every trading day.
+
+    panel: panel_engine.KlinePanel，传入时走向量化路径（结果结构相同）
+    """
     valid_dates = get_trading_dates(index_df, start_str, end_str)
     valid_dates = [d for d in valid_dates if get_index_return(index_df, d) is not None]
 
     print(f"  Real trading days: {len(valid_dates)} "
           f"({valid_dates[0].date() if valid_dates else 'N/A'} ~ {valid_dates[-1].date() if valid_dates else 'N/A'})")
 
+    if panel is not None:
+        daily_data = _precompute_v28_panel(panel, index_df, scores, valid_dates)
+        check_memory()
+        print(f"  Period {start_str}~{end_str}: {len(daily_data)} valid trading days")
+        return daily_data
+
+    # Tradeable / IPO flags don't depend on the date: compute them once for all codes
+    kline_codes = list(kline.keys())
+    kline_names = [(scores.get(code) or {}).get('name', '') for code in kline_codes]
+    tradeable_flags = dict(zip(kline_codes, tradeable_mask(kline_codes, kline_names).tolist()))
+    ipo_flags = dict(zip(kline_codes, ipo_mask([len(kline[code]) for code in kline_codes]).tolist()))
+
+    fwd_table = get_forward_returns(kline)
     daily_data = []
     for day_idx, test_date in enumerate(valid_dates):
+        day_ret = fwd_table.day_returns(test_date)
         # ★ V28: No-trade signal detection
         skip_day, no_trade_signals, no_trade_risk = detect_no_trade_signals(index_df, test_date)
 
@@ -797,8 +859,6 @@ def precompute_v28(kline, index_df, scores, start_str, end_str):
         # Sector info
         sector_info = identify_hot_sectors(kline, scores, test_date)
 
-        # Precompute industry peer returns
-        industry_peers = defaultdict(list)
         stock_hist_cache = {}
         debug_skip = defaultdict(int)
 
@@ -806,7 +866,7 @@ def precompute_v28(kline, index_df, scores, start_str, end_str):
             static = scores.get(code)
             name = static.get('name', '') if static else ''
 
-            if not is_tradeable(code, name):
+            if not tradeable_flags[code]:
                 debug_skip['pt_st'] += 1
                 continue
 
@@ -816,13 +876,12 @@ def precompute_v28(kline, index_df, scores, start_str, end_str):
 
             hist = df[df['date'] < test_date]
             c = hist['close'].values
-            total_days = len(df)
 
             if len(c) < 20:
                 debug_skip['short_hist'] += 1
                 continue
 
-            if is_ipo_stock(total_days):
+            if ipo_flags[code]:
                 debug_skip['ipo'] += 1
                 continue
 
@@ -838,7 +897,6 @@ def precompute_v28(kline, index_df, scores, start_str, end_str):
 
             industry = static.get('industry', 'unknown') if static else 'unknown'
             ret5 = (c[-1] - c[-6]) / c[-6] * 100 if len(c) >= 6 else 0
-            industry_peers[industry].append((code, ret5))
 
             v = hist['volume'].values
             hi = hist['high'].values if 'high' in hist.columns else c
@@ -853,12 +911,18 @@ def precompute_v28(kline, index_df, scores, start_str, end_str):
             stock_hist_cache[code] = {
                 'c': c, 'v': v, 'hi': hi, 'lo': lo, 'turn': turn,
                 'industry': industry, 'name': name,
-                'stock_return': get_stock_return(df, test_date),
+                'stock_return': day_ret.get(code),
                 'last_pct': last_pct,
                 'recent_limit_ups': recent_limit_ups,
                 'extra_score': extra_score,
+                'ret5': ret5,
             }
 
+        # Industry relative strength for all stocks in one sorted pass
+        rs_rank = percentile_rank_map(stock_hist_cache.keys(),
+                                      [cache['ret5'] for cache in stock_hist_cache.values()],
+                                      [cache['industry'] for cache in stock_hist_cache.values()])
+
         # Compute sub-scores
         stock_scores = []
         for code, cache in stock_hist_cache.items():
@@ -872,8 +936,7 @@ def precompute_v28(kline, index_df, scores, start_str, end_str):
             sector_heat_val = sector_info['all_heat'].get(industry, 0)
             sector_s = max(0, min(100, (sector_heat_val + 5) * 10))
 
-            peer_data = industry_peers.get(industry, [])
-            rs_s = relative_strength_rank(code, c, industry, peer_data)
+            rs_s = rs_rank[code]
 
             vol_s = calc_volume_health(c, v)
 
@@ -932,6 +995,33 @@ def precompute_v28(kline, index_df, scores, start_str, end_str):
     return daily_data
 
 
+def _precompute_v28_panel(panel, index_df, scores, valid_dates):
+    """面板版 precompute_v28：市场层面逐日计算，个股子分数从面板按位置取值"""
+    def day_fields(test_date, sector_info):
+        skip_day, no_trade_signals, no_trade_risk = detect_no_trade_signals(index_df, test_date)
+        regime, confidence, risk = detect_market_regime_v25(index_df, test_date)
+        should, n_rec = should_trade(regime, confidence, risk)
+        idx_ret = get_index_return(index_df, test_date)
+        return {
+            'test_date': test_date,
+            'regime': regime,
+            'confidence': confidence,
+            'risk': risk,
+            'should_trade': should,
+            'n_recommend': n_rec,
+            'idx_ret': idx_ret if idx_ret is not None else 0,
+            'skip_day': skip_day,
+            'no_trade_signals': no_trade_signals,
+            'no_trade_risk': no_trade_risk,
+        }
+
+    return precompute_panel(
+        panel, scores, valid_dates, day_fields,
+        tradeable_fn=lambda code, static: is_tradeable(code, static.get('name', '') if static else ''),
+        classify_fn=lambda ind: (is_defensive_industry(ind), is_high_beta_industry(ind)),
+        profile='v26', limit_up_threshold=LIMIT_UP_THRESHOLD, ipo_min_days=IPO_MIN_DAYS)
+
+
 # ============================================================================
 # Cooldown tracking
 # ============================================================================
@@ -965,7 +1055,14 @@ def evaluate_v28(daily_data, weights_config, detailed=False, use_cooldown=True):
     """
     V28 evaluation: skip days with no-trade signals.
     No-trade days are excluded from beat_idx calculation.
+
+    daily_data 也可以是 pack_v28() 打包后的 PackedDays（数组快速路径，结果逐位一致，不含 day_details）
     """
+    if isinstance(daily_data, PackedDays):
+        if detailed:
+            raise ValueError("detailed=True 需要原始 daily_data")
+        return _evaluate_v28_packed(daily_data, weights_config, use_cooldown)
+
     beat_count = 0
     total = 0
     skipped = 0
@@ -1123,6 +1220,142 @@ def evaluate_v28(daily_data, weights_config, detailed=False, use_cooldown=True):
     return beat_rate, stats_by_risk, beat_count, total, skipped, no_trade, no_trade_regime, day_details
 
 
+# ============================================================================
+# 数组快速路径（Optuna / 批量评估用）
+# ============================================================================
+V28_NUM_KEYS = ['trend_s', 'money_s', 'sector_s', 'rs_s', 'vol_s', 'risk_adj', 'extra_s',
+                'div_strength']
+V28_FLAGS = {
+    'div_bullish': lambda s: s['div_bullish'],
+    'div_bearish': lambda s: s['div_bearish'],
+    'strong_down': lambda s: s['trend_dir'] == 'strong_down',
+}
+
+
+def pack_v28(daily_data, codebook=None):
+    """把 precompute_v28 的结果打包成数组（一次打包，evaluate_v28 可反复调用）"""
+    return pack_days(daily_data, V28_NUM_KEYS, flags=V28_FLAGS, codebook=codebook)
+
+
+def _evaluate_v28_packed(packed, weights_config, use_cooldown=True):
+    """evaluate_v28 的数组版：逐列加权 + 前 K 名候选 + 整数编码的行业上限/冷却期"""
+    beat_count = 0
+    total = 0
+    skipped = 0
+    no_trade = 0
+    no_trade_regime = 0
+    stats_by_risk = defaultdict(lambda: {'beat': 0, 'total': 0, 'no_trade': 0})
+
+    cooldown = CooldownArray(COOLDOWN_DAYS)
+    use_cooldown = USE_COOLDOWN and use_cooldown
+    cooldown_penalty_weight = weights_config.get('cooldown_penalty_weight', 5.0)
+    w_extra = weights_config.get('w_extra', 0.0)
+    min_score = weights_config.get('min_score_threshold', 55)
+
+    for day in packed.days:
+        dd = day.meta
+        risk = dd['risk']
+        if dd['skip_day']:
+            no_trade += 1
+            continue
+        if not dd['should_trade']:
+            no_trade_regime += 1
+            continue
+        if day.n == 0:
+            skipped += 1
+            continue
+
+        if risk <= 2:
+            n_rec = weights_config.get('n_rec_low_risk', dd['n_recommend'])
+            w = weights_config['weights_bull']
+        elif risk >= 4:
+            n_rec = 1
+            w = weights_config['weights_bear']
+        else:
+            n_rec = weights_config.get('n_rec_med_risk', dd['n_recommend'])
+            w = weights_config['weights_range']
+
+        # 与逐股表达式相同的运算顺序
+        col = day.col
+        final = (col('trend_s') * w[0] + col('money_s') * w[1] + col('sector_s') * w[2]
+                 + col('rs_s') * w[3] + col('vol_s') * w[4] + col('risk_adj') * w[5]
+                 + col('extra_s') * w_extra)
+        total_w = sum(w) + w_extra
+        if total_w > 0:
+            final = final / total_w
+
+        strength = col('div_strength')
+        flags = day.flags
+        final = final.add_where(flags['div_bullish'], 5 * strength)
+        final = final.sub_where(flags['div_bearish'], 8 * strength)
+
+        blocked = flags['strong_down']
+        if use_cooldown:
+            t_ns = date_ns(dd['test_date'])
+            final = final - cooldown.penalty(day.code_id, t_ns) * cooldown_penalty_weight
+            blocked = blocked | ~cooldown.cooled(day.code_id, t_ns)
+
+        rank = Ranking(final)
+        below = final < min_score
+        bearish = flags['div_bearish'] & (strength > 0.5)
+        ind_id = day.ind_id
+
+        selected = []
+        ind_count = defaultdict(int)
+        for i in rank:
+            if len(selected) >= n_rec:
+                break
+            if below[i]:
+                if rank.monotone:
+                    break
+                continue
+            if blocked[i] or bearish[i]:
+                continue
+            if ind_count[ind_id[i]] >= MAX_INDUSTRY:
+                continue
+            selected.append(i)
+            ind_count[ind_id[i]] += 1
+
+        # Fallback
+        if len(selected) < n_rec:
+            floor = final < min_score - 10
+            chosen = {day.code_id[i] for i in selected}
+            for i in rank:
+                if len(selected) >= n_rec:
+                    break
+                if day.code_id[i] in chosen:
+                    continue
+                if floor[i]:
+                    break
+                if blocked[i]:
+                    continue
+                if ind_count[ind_id[i]] >= MAX_INDUSTRY:
+                    continue
+                selected.append(i)
+                chosen.add(day.code_id[i])
+                ind_count[ind_id[i]] += 1
+
+        if not selected:
+            skipped += 1
+            continue
+
+        if use_cooldown:
+            cooldown.mark(day.code_id[selected], t_ns)
+
+        avg_ret = ret_mean(day, selected)
+        if avg_ret is not None:
+            beat_idx = avg_ret > dd['idx_ret']
+            total += 1
+            if beat_idx:
+                beat_count += 1
+            stats_by_risk[risk]['total'] += 1
+            if beat_idx:
+                stats_by_risk[risk]['beat'] += 1
+
+    beat_rate = beat_count / total if total > 0 else 0
+    return beat_rate, stats_by_risk, beat_count, total, skipped, no_trade, no_trade_regime, []
+
+
 # ============================================================================
 # Load V25 pre-optimized params
 # ============================================================================
@@ -1182,15 +1415,16 @@ def main():
 
     # Precompute all periods
     print("\n[Precompute] Computing V28 sub-scores for 4 periods...")
+    panel = build_panel(kline) if USE_PANEL_ENGINE else None
     periods_data = {}
     for plabel, (ps, pe) in [('A', PERIOD_A), ('B', PERIOD_B),
                               ('C', PERIOD_C), ('D', PERIOD_D)]:
         print(f"\n  Period {plabel}: {ps} ~ {pe}")
-        periods_data[plabel] = precompute_v28(kline, index_df, scores, ps, pe)
+        periods_data[plabel] = precompute_v28(kline, index_df, scores, ps, pe, panel=panel)
         gc.collect()
         print_mem(f"After Period {plabel}")
 
-    del kline
+    del kline, panel
     gc.collect()
     print_mem("After freeing kline")
 
@@ -1261,6 +1495,8 @@ def main():
 
     # Train & valid summary
     train_all = periods_data['A'] + periods_data['B']
+    if USE_FAST_EVALUATOR:
+        train_all = pack_v28(train_all)
     train_bi, _, train_bc, train_bt, _, _, _, _ = evaluate_v28(train_all, best_params)
     valid_bi = period_results['C']['beat_rate']
 
@@ -24,9 +24,15 @@ SHARED_DIR = os.path.join(os.path.dirname(BASE_DIR), 'TradingShared')
 if SHARED_DIR not in sys.path:
     sys.path.insert(0, SHARED_DIR)
 
-from chanlun.hourly_fetcher import fetch_hourly_kline, fetch_hourly_batch, get_small_cap_stocks
+from chanlun.hourly_fetcher import (fetch_hourly_kline, fetch_hourly_batch, get_small_cap_stocks, update_hourly_store,
+                                   HOURLY_FETCH_WORKERS)
+from chanlun.hourly_store import STORE_FILE, HourlyStore
 from chanlun.chanlun_core import analyze_chanlun
 
+# 全市场扫描: 进程池每批分析的股票数、最低评分
+SCAN_CHUNK_SIZE = 100
+MIN_SCAN_SCORE = 30
+
 
 def score_stock(chanlun_result: dict, df_hourly: pd.DataFrame, stock_info: dict) -> dict:
     """
@@ -136,6 +142,87 @@ def score_stock(chanlun_result: dict, df_hourly: pd.DataFrame, stock_info: dict)
     }
 
 
+def _pool_info(stock_pool: pd.DataFrame) -> Dict[str, dict]:
+    """小盘股池按代码建索引，返回 {code: stock_info}"""
+    info = {}
+    cols = ['代码', '名称', '总市值', '换手率', '最新价']
+    for code, name, cap, turnover, price in stock_pool[cols].itertuples(index=False, name=None):
+        info[code] = {
+            'code': code,
+            'name': name,
+            'market_cap': float(cap),
+            'turnover_rate': float(turnover),
+            'price': float(price),
+        }
+    return info
+
+
+def _scan_one(df: pd.DataFrame, stock_info: dict, min_score: float = MIN_SCAN_SCORE) -> Optional[dict]:
+    """单只股票缠论分析 + 评分，未达标返回 None"""
+    cl_result = analyze_chanlun(df)
+    
+    # 只要有买点才评分
+    if cl_result.get('last_buy_signal') is None and cl_result.get('trend') != 'up':
+        return None
+    
+    score_result = score_stock(cl_result, df, stock_info)
+    return score_result if score_result['score'] >= min_score else None
+
+
+_WORKER_STORE = None
+
+
+def _init_scan_worker(store_path: str):
+    """进程池初始化: 每个 worker 只读一次合并缓存"""
+    global _WORKER_STORE
+    _WORKER_STORE = HourlyStore(store_path)
+
+
+def _scan_chunk(args) -> List[dict]:
+    items, min_score = args
+    results = []
+    for code, stock_info in items:
+        try:
+            df = _WORKER_STORE.frame(code)
+            if df is None or len(df) < 20:
+                continue
+            score_result = _scan_one(df, stock_info, min_score)
+            if score_result:
+                results.append(score_result)
+        except Exception:
+            continue
+    return results
+
+
+def _report(results: List[dict], top_n: int, file_prefix: str) -> List[dict]:
+    """排序、打印并保存扫描结果"""
+    results.sort(key=lambda x: x['score'], reverse=True)
+    results = results[:top_n]
+    
+    # 打印结果
+    print(f"\n{'='*50}")
+    print(f"Top {len(results)} 激进小盘股:")
+    print(f"{'='*50}")
+    
+    for i, r in enumerate(results):
+        print(f"\n#{i+1} {r['code']} {r['name']}")
+        print(f"  评分: {r['score']} | 买点: {r['signal']}")
+        det = r['details']
+        if 'vol_ratio' in det:
+            print(f"  量比: {det['vol_ratio']}x | 趋势: {det['trend']}")
+        if 'market_cap' in det:
+            print(f"  市值: {det['market_cap']/1e8:.1f}亿 | 换手: {det.get('turnover_rate', 0):.1f}%")
+    
+    # 保存结果
+    output_file = os.path.join(BASE_DIR, 'data', f'{file_prefix}_{datetime.now().strftime("%Y%m%d_%H%M")}.json')
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output_file}")
+    
+    return results
+
+
 def run_aggressive_scan(top_n: int = 10, max_stocks: int = 200) -> List[dict]:
     """
     执行激进小盘股扫描。
@@ -178,32 +265,15 @@ def run_aggressive_scan(top_n: int = 10, max_stocks: int = 200) -> List[dict]:
     print(f"\n[3/4] 缠论分析 + 评分...")
     results = []
     
+    stock_info_map = _pool_info(stock_pool)
     for code, df in kline_data.items():
         try:
-            # 缠论分析
-            cl_result = analyze_chanlun(df)
-            
-            # 只要有买点才评分
-            if cl_result.get('last_buy_signal') is None and cl_result.get('trend') != 'up':
-                continue
-            
-            # 获取股票信息
-            row = stock_pool[stock_pool['代码'] == code]
-            if row.empty:
+            stock_info = stock_info_map.get(code)
+            if stock_info is None:
                 continue
             
-            stock_info = {
-                'code': code,
-                'name': row.iloc[0]['名称'],
-                'market_cap': float(row.iloc[0]['总市值']),
-                'turnover_rate': float(row.iloc[0]['换手率']),
-                'price': float(row.iloc[0]['最新价']),
-            }
-            
-            score_result = score_stock(cl_result, df, stock_info)
-            
-            # 过滤低分
-            if score_result['score'] >= 30:
+            score_result = _scan_one(df, stock_info)
+            if score_result:
                 results.append(score_result)
                 
         except Exception as e:
@@ -211,32 +281,86 @@ def run_aggressive_scan(top_n: int = 10, max_stocks: int = 200) -> List[dict]:
     
     # Step 4: 排序输出
     print(f"\n[4/4] 排序输出...")
-    results.sort(key=lambda x: x['score'], reverse=True)
-    results = results[:top_n]
+    return _report(results, top_n, 'aggressive_scan')
+
+
+def run_market_scan(top_n: int = 10, max_stocks: Optional[int] = None, workers: Optional[int] = None,
+                    refresh: bool = True, fetch_workers: int = HOURLY_FETCH_WORKERS) -> List[dict]:
+    """
+    全市场小盘股扫描（盘中可用）。
     
-    # 打印结果
-    print(f"\n{'='*50}")
-    print(f"Top {len(results)} 激进小盘股:")
-    print(f"{'='*50}")
+    与 run_aggressive_scan 的区别:
+    - 1小时K线读写合并列式缓存，只补拉新K线，已是最新的股票不再请求;
+    - 缠论分析分块交给进程池，每个 worker 只读一次缓存;
+    - 股票信息按代码建索引查找。
     
-    for i, r in enumerate(results):
-        print(f"\n#{i+1} {r['code']} {r['name']}")
-        print(f"  评分: {r['score']} | 买点: {r['signal']}")
-        det = r['details']
-        if 'vol_ratio' in det:
-            print(f"  量比: {det['vol_ratio']}x | 趋势: {det['trend']}")
-        if 'market_cap' in det:
-            print(f"  市值: {det['market_cap']/1e8:.1f}亿 | 换手: {det.get('turnover_rate', 0):.1f}%")
+    Args:
+        top_n: 返回前N只
+        max_stocks: 最多扫描多少只，None 为全部小盘股
+        workers: 进程数，None 为 CPU 核数（上限8），<=1 在当前进程分析
+        refresh: 是否先增量更新1小时K线缓存
+        fetch_workers: 更新缓存时同时在途的请求数（限速见 hourly_fetcher.HOURLY_FETCH_RATE）
+    """
+    print("=" * 50)
+    print("全市场小盘股缠论扫描")
+    print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    print("=" * 50)
     
-    # 保存结果
-    output_file = os.path.join(BASE_DIR, 'data', f'aggressive_scan_{datetime.now().strftime("%Y%m%d_%H%M")}.json')
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
-    print(f"\n结果已保存: {output_file}")
+    # Step 1: 获取小盘股池
+    print("\n[1/4] 筛选小盘股池...")
+    stock_pool = get_small_cap_stocks(
+        max_cap=50e8,
+        min_price=3.0,
+        max_price=30.0,
+        min_turnover=2.0
+    )
     
-    return results
+    if stock_pool.empty:
+        print("未获取到小盘股数据，可能非交易时间")
+        return []
+    
+    stock_info_map = _pool_info(stock_pool)
+    symbols = stock_pool['代码'].tolist()
+    if max_stocks:
+        symbols = symbols[:max_stocks]
+    print(f"  筛选出 {len(stock_pool)} 只小盘股，扫描 {len(symbols)} 只")
+    
+    # Step 2: 增量更新1小时K线缓存
+    if refresh:
+        print("\n[2/4] 增量更新1小时K线缓存...")
+        store = update_hourly_store(symbols, days=30, workers=fetch_workers)
+    else:
+        print("\n[2/4] 读取1小时K线缓存...")
+        store = HourlyStore(STORE_FILE)
+    symbols = [s for s in symbols if s in store]
+    
+    # Step 3: 缠论分析 + 评分
+    if workers is None:
+        workers = min(os.cpu_count() or 1, 8)
+    print(f"\n[3/4] 缠论分析 + 评分 ({len(symbols)}只, {max(workers, 1)}进程)...")
+    items = [(code, stock_info_map[code]) for code in symbols]
+    chunks = [(items[i:i + SCAN_CHUNK_SIZE], MIN_SCAN_SCORE) for i in range(0, len(items), SCAN_CHUNK_SIZE)]
+    
+    results = []
+    if workers <= 1 or len(chunks) <= 1:
+        global _WORKER_STORE
+        _WORKER_STORE = store
+        for chunk in chunks:
+            results.extend(_scan_chunk(chunk))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker,
+                                 initargs=(store.path,)) as pool:
+            for part in pool.map(_scan_chunk, chunks):
+                results.extend(part)
+    
+    # Step 4: 排序输出
+    print(f"\n[4/4] 排序输出... ({len(results)}只达标)")
+    return _report(results, top_n, 'market_scan')
 
 
 if __name__ == '__main__':
-    results = run_aggressive_scan(top_n=10, max_stocks=200)
+    if '--market' in sys.argv:
+        results = run_market_scan(top_n=10)
+    else:
+        results = run_aggressive_scan(top_n=10, max_stocks=200)
@@ -19,6 +19,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from chanlun.chanlun_core import analyze_chanlun
+from chanlun.chanlun_engine import replay_chanlun
 from chanlun.aggressive_scanner import score_stock
 import json
 import time
@@ -92,12 +93,18 @@ def run_backtest(max_stocks=300, delays=0.25):
         if df_full is None or len(df_full) < 50:
             continue
         
+        # 一次扫描得到各截断点的缠论快照，不再逐个前缀重算
+        try:
+            snapshots = replay_chanlun(df_full, [len(df_full) - o for o in [3, 5, 8]])
+        except Exception:
+            snapshots = {}
+        
         # 多个截断点，每个点模拟"当时分析、未来N天验证"
         for offset in [3, 5, 8]:
             if len(df_full) < offset + 40:
                 continue
             
-            df_slice = df_full.iloc[:-offset].copy()
+            df_slice = df_full.iloc[:-offset]
             if len(df_slice) < 40:
                 continue
             
@@ -111,7 +118,7 @@ def run_backtest(max_stocks=300, delays=0.25):
             actual_return = (future_price - current_price) / current_price * 100
             
             try:
-                result = analyze_chanlun(df_slice)
+                result = snapshots.get(len(df_slice)) or analyze_chanlun(df_slice)
                 
                 stock_info = {
                     'code': code,
@@ -11,6 +11,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from chanlun.chanlun_core import analyze_chanlun
+from chanlun.chanlun_engine import replay_chanlun
 from chanlun.aggressive_scanner import score_stock
 import time
 import json
@@ -70,12 +71,18 @@ def run_sliding_backtest():
 
         code = ts_code[:6]
 
+        # 一次扫描得到各截断点的缠论快照，不再逐个前缀重算
+        try:
+            snapshots = replay_chanlun(df_full, [len(df_full) - o for o in [3, 5, 10, 15, 20]])
+        except Exception:
+            snapshots = {}
+
         # 在多个截断点分析
         for offset in [3, 5, 10, 15, 20]:
             if len(df_full) < offset + 40:
                 continue
 
-            df_slice = df_full.iloc[:-offset].copy()
+            df_slice = df_full.iloc[:-offset]
             if len(df_slice) < 30:
                 continue
 
@@ -90,7 +97,7 @@ def run_sliding_backtest():
             actual_return = (future_price - current_price) / current_price * 100
 
             try:
-                result = analyze_chanlun(df_slice)
+                result = snapshots.get(len(df_slice)) or analyze_chanlun(df_slice)
 
                 stock_info = {
                     'code': code,
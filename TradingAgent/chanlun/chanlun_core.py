@@ -6,6 +6,10 @@ import pandas as pd
 import numpy as np
 from typing import List, Optional, Tuple
 from .kline_merge import merge_klines, find_fractals
+from .chanlun_engine import ChanlunEngine
+
+# 使用增量引擎（数组存储，一次扫描）；False 时走逐步重建的旧流程
+USE_CHANLUN_ENGINE = True
 
 
 def find_bi(fractals: List[dict]) -> List[dict]:
@@ -253,6 +257,11 @@ def analyze_chanlun(df: pd.DataFrame) -> dict:
         'trend': 'up'/'down'/'consolidation',
     }
     """
+    if USE_CHANLUN_ENGINE and len(df) >= 2:
+        engine = ChanlunEngine()
+        engine.extend(df)
+        return engine.snapshot(df)
+    
     # 1. K线合并
     merged = merge_klines(df)
     
@@ -0,0 +1,444 @@
+"""
+缠论增量引擎
+逐根压入K线，保存合并K线、分型、笔、中枢和买卖点的状态，全部用数组存储。
+
+只有最后一根合并K线会被后续K线改写，所以:
+- 倒数第二根合并K线之前的分型、除最后一笔外的笔、后续笔已确定的中枢及其前面的买卖点都是定局，
+  压入新K线时只做增量推进，不再重算;
+- snapshot() 只对尾部做临时推演，结果与 analyze_chanlun(df.iloc[:n]) 完全一致。
+
+滑动窗口回测用 replay_chanlun 一遍扫完，在各个截断点取快照，不必对每个前缀重新分析。
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .kline_merge import KlineMerger
+
+TOP, BOTTOM = 1, -1
+
+# 买卖点编码 -> (类型, 强度)
+BUY1, BUY2, BUY3, SELL1, SELL3 = 1, 2, 3, 4, 5
+SIGNAL_INFO = {
+    BUY1: ('buy1', 2),
+    BUY2: ('buy2', 1),
+    BUY3: ('buy3', 3),
+    SELL1: ('sell1', 3),
+    SELL3: ('sell3', 1),
+}
+
+
+def _scan_zhongshu(lo, hi, i: int, n: int, pending=None, final: bool = False):
+    """
+    按 find_zhongshu 的贪心规则从第 i 笔扫描到第 n 笔。
+
+    pending 为上次未闭合的中枢 (start, end, high, low)，从 end+1 继续延伸。
+    final=True 时只输出后面已有笔打断的中枢，延伸到末尾的中枢作为新的 pending 返回。
+
+    返回: (中枢列表, 下次扫描起点, pending)
+    """
+    out = []
+    while True:
+        if pending is not None:
+            start, end, zs_high, zs_low = pending
+            pending = None
+            j = end + 1
+        else:
+            if i > n - 3:
+                break
+            zs_high = min(hi[i], hi[i + 1], hi[i + 2])
+            zs_low = max(lo[i], lo[i + 1], lo[i + 2])
+            if not zs_high > zs_low:
+                i += 1
+                continue
+            start, end, j = i, i + 2, i + 3
+
+        while j < n and lo[j] < zs_high and hi[j] > zs_low:
+            # 笔进入中枢区间，延伸
+            zs_high = min(zs_high, hi[j])
+            zs_low = max(zs_low, lo[j])
+            end = j
+            j += 1
+
+        if final and j >= n:
+            return out, start, (start, end, zs_high, zs_low)
+        out.append((start, end, zs_high, zs_low))
+        i = end + 1
+    return out, i, None
+
+
+def _bi_signal(b: int, up, frm, to, zs_start, zs_end, zs_high, zs_low, codes):
+    """
+    第 b 笔结束时的买卖点，规则同 find_buy_sell_signals。
+
+    返回: (信号编码, 中枢序号)，无信号时编码为 0
+    """
+    if not zs_start:
+        return 0, -1
+
+    # 该笔之前最近的中枢；没有则取包含该笔的第一个中枢
+    k = bisect_left(zs_end, b) - 1
+    if k < 0:
+        if zs_start[0] > b:
+            return 0, -1
+        k = 0
+    high, low = zs_high[k], zs_low[k]
+    to_price, from_price = to[b], frm[b]
+
+    if not up[b]:
+        if to_price > low and from_price > high:
+            return BUY3, k
+        elif to_price < low * 0.98:
+            if b >= 4:
+                # 背驰判断: 当前下跌幅度 < 前一段下跌幅度
+                curr_drop = from_price - to_price
+                prev_drop = abs(frm[b - 2] - to[b - 2])
+                if prev_drop > 0 and curr_drop < prev_drop * 0.6:
+                    return BUY1, k
+        elif to_price > low * 0.98:
+            # 二买: 前4笔内有一买且不破一买低点
+            buy1_price = None
+            for j in range(max(0, b - 4), b):
+                if codes[j] == BUY1:
+                    buy1_price = to[j]
+            if buy1_price is not None and to_price > buy1_price:
+                return BUY2, k
+    else:
+        if to_price > high:
+            if b >= 2 and frm[b - 1] > high:
+                return SELL1, k
+        elif to_price < high and from_price < high:
+            if from_price < low:
+                return SELL3, k
+    return 0, -1
+
+
+class ChanlunEngine:
+    """
+    单只股票的缠论状态机。
+
+    用法:
+        engine = ChanlunEngine()
+        for bar in bars:
+            new_signals = engine.push(bar['open'], bar['high'], bar['low'], bar['close'], bar['volume'], bar['datetime'])
+        result = engine.snapshot()   # 与 analyze_chanlun(全部K线) 相同的字典
+    """
+
+    def __init__(self):
+        self.merger = KlineMerger()
+        self.datetimes = []  # 每根合并K线首根原始K线的时间
+        self.last_price = None
+
+        # 已确定的分型
+        self.f_type = array('b')
+        self.f_idx = array('q')
+        self.f_price = array('d')
+        self.f_other = array('d')  # 顶分型记低点，底分型记高点
+
+        # 顶底交替过滤后的分型序号，只有最后一个可能被替换
+        self.filtered = array('q')
+
+        # 已确定的笔: 起止价格、方向、区间
+        self.bi_from = array('d')
+        self.bi_to = array('d')
+        self.bi_up = array('b')
+        self.bi_lo = array('d')
+        self.bi_hi = array('d')
+
+        # 已确定的中枢及下一次扫描的起点
+        self.zs_start = array('q')
+        self.zs_end = array('q')
+        self.zs_high = array('d')
+        self.zs_low = array('d')
+        self.zs_next = 0
+        self.zs_pending = None
+
+        # 每笔的买卖点编码（0=无）与中枢序号，前 len(bi_signal) 笔已确定
+        self.bi_signal = array('b')
+        self.bi_signal_zs = array('q')
+
+    def __len__(self):
+        return self.merger.raw_count
+
+    # ------------------------------------------------------------------
+    # 增量推进
+    # ------------------------------------------------------------------
+    def push(self, open_: float, high: float, low: float, close: float,
+             volume: float = 0.0, dt=None) -> List[dict]:
+        """
+        压入一根K线。
+
+        返回: 因这根K线而确定下来的新买卖点（与 snapshot()['signals'] 中的元素格式相同）
+        """
+        self.last_price = close
+        if not self.merger.push(high, low, close, volume):
+            return []
+        self.datetimes.append(dt)
+
+        # 新增一根合并K线后，倒数第三根的分型确定
+        i = len(self.merger) - 3
+        if i < 1:
+            return []
+        ftype = self._fractal_at(i)
+        if not ftype:
+            return []
+        self._commit_fractal(ftype, i)
+        return self._advance()
+
+    def extend(self, df: pd.DataFrame, start: int = 0) -> List[dict]:
+        """依次压入 df 第 start 行之后的K线，返回期间确定的买卖点"""
+        signals = []
+        for bar in self._iter_bars(df, start, len(df)):
+            signals.extend(self.push(*bar))
+        return signals
+
+    @staticmethod
+    def _iter_bars(df: pd.DataFrame, start: int, stop: int):
+        n = stop - start
+        cols = [df[c].iloc[start:stop].tolist() for c in ('open', 'high', 'low', 'close')]
+        cols.append(df['volume'].iloc[start:stop].tolist() if 'volume' in df.columns else [0.0] * n)
+        cols.append(df['datetime'].iloc[start:stop].tolist() if 'datetime' in df.columns else [None] * n)
+        return zip(*cols)
+
+    def _fractal_at(self, i: int) -> int:
+        H, L = self.merger.high, self.merger.low
+        if H[i] > H[i - 1] and H[i] > H[i + 1]:
+            return TOP
+        if L[i] < L[i - 1] and L[i] < L[i + 1]:
+            return BOTTOM
+        return 0
+
+    def _commit_fractal(self, ftype: int, i: int):
+        H, L = self.merger.high, self.merger.low
+        self.f_type.append(ftype)
+        self.f_idx.append(i)
+        self.f_price.append(H[i] if ftype == TOP else L[i])
+        self.f_other.append(L[i] if ftype == TOP else H[i])
+
+        filtered = self.filtered
+        action = self._filter_action(filtered[-1] if filtered else -1, len(self.f_type) - 1)
+        if action == 'append':
+            filtered.append(len(self.f_type) - 1)
+        elif action == 'replace':
+            filtered[-1] = len(self.f_type) - 1
+
+    def _filter_action(self, prev: int, f: int, f_type=None, f_price=None) -> Optional[str]:
+        """分型 f 进入顶底交替序列的方式: append / replace / None，规则同 find_bi"""
+        if prev < 0:
+            return 'append'
+        f_type = f_type if f_type is not None else self.f_type[f]
+        f_price = f_price if f_price is not None else self.f_price[f]
+        p_type, p_price = self.f_type[prev], self.f_price[prev]
+        if f_type != p_type:
+            if p_type == TOP:
+                return 'append' if p_price > f_price else None
+            return 'append' if f_price > p_price else None
+        if f_type == TOP:
+            return 'replace' if f_price > p_price else None
+        return 'replace' if f_price < p_price else None
+
+    def _advance(self) -> List[dict]:
+        """把已确定的笔推进到中枢和买卖点"""
+        # 除最后一笔外的笔都已确定
+        n_fixed = max(0, len(self.filtered) - 2)
+        for k in range(len(self.bi_from), n_fixed):
+            a, b = self.filtered[k], self.filtered[k + 1]
+            pa, pb = self.f_price[a], self.f_price[b]
+            self.bi_from.append(pa)
+            self.bi_to.append(pb)
+            self.bi_up.append(1 if self.f_type[b] == TOP else 0)
+            self.bi_lo.append(min(pa, pb))
+            self.bi_hi.append(max(pa, pb))
+
+        if n_fixed - self.zs_next < 3 and self.zs_pending is None:
+            return []
+
+        new_zs, self.zs_next, self.zs_pending = _scan_zhongshu(
+            self.bi_lo, self.bi_hi, self.zs_next, n_fixed, self.zs_pending, final=True)
+        for start, end, high, low in new_zs:
+            self.zs_start.append(start)
+            self.zs_end.append(end)
+            self.zs_high.append(high)
+            self.zs_low.append(low)
+
+        # 后续中枢只会从 zs_next 开始，之前各笔的买卖点已确定
+        new_signals = []
+        for b in range(len(self.bi_signal), self.zs_next):
+            code, k = _bi_signal(b, self.bi_up, self.bi_from, self.bi_to, self.zs_start,
+                                 self.zs_end, self.zs_high, self.zs_low, self.bi_signal)
+            self.bi_signal.append(code)
+            self.bi_signal_zs.append(k)
+            if code:
+                new_signals.append(b)
+
+        return [self._signal_dict(b) for b in new_signals]
+
+    def _signal_dict(self, b: int) -> dict:
+        """已确定的第 b 笔买卖点"""
+        k = self.bi_signal_zs[b]
+        high, low = self.zs_high[k], self.zs_low[k]
+        sig_type, strength = SIGNAL_INFO[self.bi_signal[b]]
+        return {
+            'type': sig_type,
+            'price': self.bi_to[b],
+            'idx': self.f_idx[self.filtered[b + 1]],
+            'zhongshu': {
+                'start_idx': self.zs_start[k],
+                'end_idx': self.zs_end[k],
+                'high': high,
+                'low': low,
+                'bi_count': self.zs_end[k] - self.zs_start[k] + 1,
+                'center': (high + low) / 2,
+            },
+            'strength': strength,
+        }
+
+    # ------------------------------------------------------------------
+    # 快照
+    # ------------------------------------------------------------------
+    def snapshot(self, df: Optional[pd.DataFrame] = None) -> dict:
+        """
+        当前状态下的完整缠论结果，格式同 analyze_chanlun。
+
+        df 为已压入的原始K线时附带 'merged' 合并K线表，否则为 None。
+        """
+        merger = self.merger
+        m = len(merger)
+
+        # 1. 分型: 已确定的 + 倒数第二根合并K线上的临时分型
+        f_type = self.f_type.tolist()
+        f_idx = self.f_idx.tolist()
+        f_price = self.f_price.tolist()
+        f_other = self.f_other.tolist()
+        filtered = self.filtered.tolist()
+        if m >= 3:
+            ftype = self._fractal_at(m - 2)
+            if ftype:
+                i = m - 2
+                price = merger.high[i] if ftype == TOP else merger.low[i]
+                f_type.append(ftype)
+                f_idx.append(i)
+                f_price.append(price)
+                f_other.append(merger.low[i] if ftype == TOP else merger.high[i])
+                action = self._filter_action(filtered[-1] if filtered else -1, -1, ftype, price)
+                if action == 'append':
+                    filtered.append(len(f_type) - 1)
+                elif action == 'replace':
+                    filtered[-1] = len(f_type) - 1
+
+        # 2. 笔: 已确定的 + 尾部
+        n_bi = max(0, len(filtered) - 1)
+        bi_from = self.bi_from.tolist()
+        bi_to = self.bi_to.tolist()
+        bi_up = self.bi_up.tolist()
+        bi_lo = self.bi_lo.tolist()
+        bi_hi = self.bi_hi.tolist()
+        for k in range(len(bi_from), n_bi):
+            pa, pb = f_price[filtered[k]], f_price[filtered[k + 1]]
+            bi_from.append(pa)
+            bi_to.append(pb)
+            bi_up.append(1 if f_type[filtered[k + 1]] == TOP else 0)
+            bi_lo.append(min(pa, pb))
+            bi_hi.append(max(pa, pb))
+
+        # 3. 中枢: 已确定的 + 从 zs_next 起重新扫描
+        tail_zs, _, _ = _scan_zhongshu(bi_lo, bi_hi, self.zs_next, n_bi, self.zs_pending)
+        zs_start = self.zs_start.tolist() + [z[0] for z in tail_zs]
+        zs_end = self.zs_end.tolist() + [z[1] for z in tail_zs]
+        zs_high = self.zs_high.tolist() + [z[2] for z in tail_zs]
+        zs_low = self.zs_low.tolist() + [z[3] for z in tail_zs]
+
+        # 4. 买卖点: 已确定的 + 尾部各笔
+        codes = self.bi_signal.tolist()
+        code_zs = self.bi_signal_zs.tolist()
+        for b in range(len(codes), n_bi):
+            code, k = _bi_signal(b, bi_up, bi_from, bi_to, zs_start, zs_end, zs_high, zs_low, codes)
+            codes.append(code)
+            code_zs.append(k)
+
+        # 5. 组装与 analyze_chanlun 相同的字典
+        dts = self.datetimes
+        fractals = []
+        for t, i, p, o in zip(f_type, f_idx, f_price, f_other):
+            if t == TOP:
+                fractals.append({'type': 'top', 'idx': i, 'price': p, 'low': o, 'datetime': dts[i]})
+            else:
+                fractals.append({'type': 'bottom', 'idx': i, 'price': p, 'high': o, 'datetime': dts[i]})
+
+        bi = [{
+            'from': fractals[filtered[k]],
+            'to': fractals[filtered[k + 1]],
+            'direction': 'up' if bi_up[k] else 'down',
+        } for k in range(n_bi)]
+
+        zhongshu = [{
+            'start_idx': s,
+            'end_idx': e,
+            'high': h,
+            'low': l,
+            'bi_count': e - s + 1,
+            'center': (h + l) / 2,
+        } for s, e, h, l in zip(zs_start, zs_end, zs_high, zs_low)]
+
+        signals = []
+        for b, code in enumerate(codes):
+            if code:
+                sig_type, strength = SIGNAL_INFO[code]
+                signals.append({
+                    'type': sig_type,
+                    'price': bi_to[b],
+                    'idx': bi[b]['to']['idx'],
+                    'zhongshu': zhongshu[code_zs[b]],
+                    'strength': strength,
+                })
+
+        trend = 'consolidation'
+        if bi:
+            trend = 'up' if bi[-1]['direction'] == 'up' else 'down'
+        buy_signals = [s for s in signals if s['type'].startswith('buy')]
+
+        return {
+            'merged': self.merged_frame(df) if df is not None else None,
+            'fractals': fractals,
+            'bi': bi,
+            'zhongshu': zhongshu,
+            'signals': signals,
+            'current_signal': signals[-1] if signals else None,
+            'last_buy_signal': buy_signals[-1] if buy_signals else None,
+            'trend': trend,
+            'last_price': float(self.last_price) if self.last_price is not None else None,
+        }
+
+    def merged_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """按当前合并状态从原始K线 df 生成合并K线表，格式同 merge_klines"""
+        merger = self.merger
+        result = df.iloc[np.frombuffer(merger.first, dtype=np.int64)].reset_index(drop=True)
+        for col, values in (('high', merger.high), ('low', merger.low), ('close', merger.close)):
+            result[col] = np.frombuffer(values, dtype=np.float64).astype(df[col].dtype, copy=False)
+        if 'volume' in df.columns:
+            result['volume'] = np.frombuffer(merger.volume, dtype=np.float64).astype(df['volume'].dtype, copy=False)
+        result['merged_idx'] = [list(range(a, b + 1)) for a, b in zip(merger.first, merger.last)]
+        return result
+
+
+def replay_chanlun(df: pd.DataFrame, ends: Iterable[int]) -> Dict[int, dict]:
+    """
+    一遍扫描 df，在每个截断点取快照。
+
+    ends: 前缀长度列表，结果[n] 等价于 analyze_chanlun(df.iloc[:n])（不含 'merged'）
+    """
+    engine = ChanlunEngine()
+    results = {}
+    pos = 0
+    for n in sorted(set(ends)):
+        if n <= 0 or n > len(df):
+            continue
+        for bar in engine._iter_bars(df, pos, n):
+            engine.push(*bar)
+        pos = n
+        results[n] = engine.snapshot()
+    return results
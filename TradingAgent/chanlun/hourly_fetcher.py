@@ -7,16 +7,30 @@ import akshare as ak
 import pandas as pd
 import numpy as np
 import os
+import sys
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'TradingShared', 'api'))
+from kline_fetch_engine import TokenBucket
+
+try:
+    from .hourly_store import HourlyStore, open_hourly_store
+except ImportError:  # 直接运行本文件
+    from hourly_store import HourlyStore, open_hourly_store
+
 
 # 缓存目录
 CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'hourly_kline')
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# 增量更新并发参数：同时在途请求数 / 每秒请求数（令牌桶限速，替代逐只 sleep）
+HOURLY_FETCH_WORKERS = 8
+HOURLY_FETCH_RATE = 5.0
+
 
 def fetch_hourly_kline(symbol: str, days: int = 30, use_cache: bool = True) -> Optional[pd.DataFrame]:
     """
@@ -98,6 +112,124 @@ def fetch_hourly_batch(symbols: List[str], days: int = 30, delay: float = 0.3) -
     return results
 
 
+# A股1小时K线的收盘时刻
+HOURLY_BAR_CLOSES = ('10:30', '11:30', '14:00', '15:00')
+
+
+def latest_bar_time(now: Optional[datetime] = None) -> np.datetime64:
+    """当前时刻已经走完的最后一根1小时K线时间（不识别节假日，节假日只会多拉一次）"""
+    now = now or datetime.now()
+    day = now
+    for _ in range(8):
+        if day.weekday() < 5:
+            for hhmm in reversed(HOURLY_BAR_CLOSES):
+                h, m = map(int, hhmm.split(':'))
+                bar = day.replace(hour=h, minute=m, second=0, microsecond=0)
+                if bar <= now:
+                    return np.datetime64(bar, 's')
+        day = (day - timedelta(days=1)).replace(hour=23, minute=59)
+    return np.datetime64(now, 's')
+
+
+def _fetch_hourly_raw(symbol: str, start: datetime, end: datetime,
+                      bucket: Optional[TokenBucket] = None) -> Optional[pd.DataFrame]:
+    """拉取 [start, end] 的前复权1小时K线（已 _normalize），失败或为空返回 None"""
+    if bucket is not None:
+        bucket.acquire()
+    df = ak.stock_zh_a_hist_min_em(
+        symbol=symbol,
+        period='60',
+        start_date=start.strftime('%Y-%m-%d %H:%M:%S'),
+        end_date=end.strftime('%Y-%m-%d %H:%M:%S'),
+        adjust='qfq'
+    )
+    if df is None or len(df) == 0:
+        return None
+    df = _normalize(df)
+    return df if len(df) > 0 else None
+
+
+def needs_update(store: HourlyStore, symbol: str, target: np.datetime64) -> bool:
+    """没有缓存、缺少已走完的K线，或最后一根K线拉取时尚未走完（盘中）时需要更新"""
+    last = store.last_time(symbol)
+    if last is None or last < target:
+        return True
+    fetched = store.fetched_time(symbol)
+    return fetched is None or fetched < last
+
+
+def _same_adjust_basis(df: pd.DataFrame, anchor) -> bool:
+    """新拉取的K线在锚点K线上的收盘价与缓存一致，说明前复权基准没有变化（期间无除权除息）"""
+    anchor_ts, anchor_close = anchor
+    ts = pd.to_datetime(df['datetime'], errors='coerce').to_numpy(dtype='datetime64[s]')
+    hit = np.flatnonzero(ts == anchor_ts)
+    if len(hit) == 0:
+        return False
+    return bool(np.isclose(df['close'].iloc[hit[-1]], anchor_close, rtol=0, atol=1e-3))
+
+
+def _update_one(symbol: str, anchor, days: int, bucket: TokenBucket):
+    """单只股票的增量拉取（工作线程中执行，不读写 store），返回 (拉取时间, df, 是否因复权基准变化整段重拉)"""
+    now = datetime.now()
+    full_start = now - timedelta(days=days)
+    if anchor is None:
+        return now, _fetch_hourly_raw(symbol, full_start, now, bucket), False
+    df = _fetch_hourly_raw(symbol, pd.Timestamp(anchor[0]).to_pydatetime(), now, bucket)
+    refetch = df is not None and not _same_adjust_basis(df, anchor)
+    if refetch:
+        df = _fetch_hourly_raw(symbol, full_start, now, bucket)
+    return now, df, refetch
+
+
+def update_hourly_store(symbols: List[str], days: int = 30, store: Optional[HourlyStore] = None,
+                        save_every: int = 200, workers: int = HOURLY_FETCH_WORKERS,
+                        rate: float = HOURLY_FETCH_RATE) -> HourlyStore:
+    """
+    增量更新1小时K线合并缓存。
+    
+    已有最新K线且拉取时已走完的股票直接跳过；其余从拉取时已走完的最后一根K线起补拉
+    （之后盘中未走完的K线一并刷新），并用这根K线的收盘价核对前复权基准：
+    不一致（期间除权除息）时整段重拉最近 days 天替换缓存，避免新旧复权基准混在一起。
+    没有缓存的股票拉取最近 days 天。
+    
+    请求由 workers 个线程并发发出，共用一个每秒 rate 次的令牌桶限速；
+    结果在当前线程合并进缓存（HourlyStore 非线程安全）。
+    
+    Returns:
+        更新后的 HourlyStore
+    """
+    store = store if store is not None else open_hourly_store()
+    target = latest_bar_time()
+    todo = [s for s in symbols if needs_update(store, s, target)]
+    print(f"  缓存已是最新: {len(symbols) - len(todo)} 只，需要更新: {len(todo)} 只")
+    
+    bucket = TokenBucket(rate, burst=max(1, workers))
+    ok = refetched = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        anchors = {sym: store.anchor_bar(sym) for sym in todo}
+        futures = {pool.submit(_update_one, sym, anchors[sym], days, bucket): sym for sym in todo}
+        for i, fut in enumerate(as_completed(futures)):
+            sym = futures[fut]
+            try:
+                fetched, df, refetch = fut.result()
+                if df is not None:
+                    # 无锚点（缓存为空或不可用）时整段替换已有记录
+                    replace = refetch or (anchors[sym] is None and sym in store)
+                    store.append(sym, df, fetched=fetched, replace=replace)
+                    ok += 1
+                    refetched += refetch
+            except Exception as e:
+                print(f"[WARN] 获取 {sym} 1小时K线失败: {e}")
+            
+            if (i + 1) % save_every == 0:
+                store.save()
+                print(f"  进度: {i+1}/{len(todo)}")
+    
+    store.save()
+    print(f"  完成: {ok}/{len(todo)} 只股票更新成功（{refetched} 只复权基准变化整段重拉），缓存共 {len(store)} 只")
+    return store
+
+
 def get_small_cap_stocks(max_cap: float = 50e8, min_price: float = 3.0, 
                           max_price: float = 30.0, min_turnover: float = 2.0) -> pd.DataFrame:
     """
@@ -0,0 +1,209 @@
+"""
+1小时K线合并列式缓存
+全部股票的1小时K线存放在同一个 npz 文件里，按股票分段:
+
+    codes     (股票数,)     股票代码
+    offsets   (股票数+1,)   每只股票在各列中的起止行 [offsets[i], offsets[i+1])
+    ts        (总行数,)     K线时间 datetime64[s]，每只股票内部递增
+    open/high/low/close/volume (总行数,) float64
+    fetched   (股票数,)     每只股票最近一次拉取的时间 datetime64[s]，早于最后一根K线时间说明该K线拉取时尚未走完
+
+替代每只股票一个 JSON 文件的缓存: 一次 np.load 读全市场，更新时只追加新K线。
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+STORE_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'hourly_kline', 'hourly_store.npz')
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+KEEP_DAYS = 60  # 只保留最近60天，缓存大小不随时间增长
+
+
+class HourlyStore:
+    """合并后的1小时K线缓存，append 暂存新K线，save 时合并去重并落盘"""
+
+    def __init__(self, path: str = STORE_FILE):
+        self.path = path
+        self.codes = []
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.ts = np.empty(0, dtype='datetime64[s]')
+        self.cols = {f: np.empty(0, dtype=np.float64) for f in FIELDS}
+        self.fetched = np.empty(0, dtype='datetime64[s]')
+        self.updated = None
+        self._pending = []
+
+        if os.path.exists(path):
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    self.codes = data['codes'].tolist()
+                    self.offsets = data['offsets']
+                    self.ts = data['ts']
+                    self.cols = {f: data[f] for f in FIELDS}
+                    if 'fetched' in data.files:
+                        self.fetched = data['fetched']
+                    else:  # 旧缓存没有拉取时间，视为未知
+                        self.fetched = np.full(len(self.codes), np.datetime64('NaT'), dtype='datetime64[s]')
+                self.updated = os.path.getmtime(path)
+            except Exception as e:
+                print(f"[WARN] 读取1小时K线缓存失败，将重新建立: {e}")
+        self.index = {code: i for i, code in enumerate(self.codes)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def _span(self, code):
+        i = self.index.get(code)
+        if i is None:
+            return None
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def arrays(self, code: str) -> Optional[Dict[str, np.ndarray]]:
+        """单只股票的各列视图 {'ts', 'open', ...}，不存在返回 None"""
+        span = self._span(code)
+        if span is None:
+            return None
+        a, b = span
+        out = {'ts': self.ts[a:b]}
+        for f in FIELDS:
+            out[f] = self.cols[f][a:b]
+        return out
+
+    def frame(self, code: str) -> Optional[pd.DataFrame]:
+        """单只股票的 DataFrame [datetime, open, high, low, close, volume]，格式同 fetch_hourly_kline"""
+        arrays = self.arrays(code)
+        if arrays is None:
+            return None
+        df = pd.DataFrame({f: arrays[f] for f in FIELDS})
+        df.insert(0, 'datetime', pd.to_datetime(arrays['ts']))
+        return df
+
+    def last_time(self, code: str) -> Optional[np.datetime64]:
+        """该股票最后一根K线的时间"""
+        span = self._span(code)
+        if span is None or span[1] == span[0]:
+            return None
+        return self.ts[span[1] - 1]
+
+    def fetched_time(self, code: str) -> Optional[np.datetime64]:
+        """该股票最近一次拉取的时间，未知返回 None"""
+        i = self.index.get(code)
+        if i is None or np.isnat(self.fetched[i]):
+            return None
+        return self.fetched[i]
+
+    def anchor_bar(self, code: str):
+        """(时间, 收盘价)：拉取时已经走完的最后一根K线，用于核对复权基准；没有返回 None
+
+        拉取时间未知（旧缓存）时保守地取倒数第二根。
+        """
+        arrays = self.arrays(code)
+        if arrays is None or len(arrays['ts']) == 0:
+            return None
+        fetched = self.fetched_time(code)
+        if fetched is None:
+            n = len(arrays['ts']) - 1
+        else:
+            n = int(np.searchsorted(arrays['ts'], fetched, side='right'))
+        if n <= 0:
+            return None
+        return arrays['ts'][n - 1], float(arrays['close'][n - 1])
+
+    def append(self, code: str, df: pd.DataFrame, fetched: Optional[datetime] = None, replace: bool = False):
+        """暂存一只股票新拉取的K线（已 _normalize），同一时间的K线以新数据为准
+
+        fetched: 拉取时间（默认当前时间）；replace=True 时丢弃该股票已有的全部K线（复权基准变化后整段重拉）
+        """
+        if df is None or len(df) == 0 or 'datetime' not in df.columns:
+            return
+        ts = pd.to_datetime(df['datetime'], errors='coerce').to_numpy(dtype='datetime64[s]')
+        valid = ~np.isnat(ts)
+        if not valid.any():
+            return
+        cols = {}
+        for f in FIELDS:
+            if f in df.columns:
+                cols[f] = pd.to_numeric(df[f], errors='coerce').to_numpy(dtype=np.float64)[valid]
+            else:
+                cols[f] = np.full(int(valid.sum()), np.nan)
+        if replace:
+            self._pending = [p for p in self._pending if p[0] != code]
+        fetched = np.datetime64(fetched or datetime.now(), 's')
+        self._pending.append((code, ts[valid], cols, fetched, replace))
+
+    def save(self, keep_days: int = KEEP_DAYS):
+        """合并暂存的K线，按 (股票, 时间) 排序去重，裁掉 keep_days 之前的数据后原子写入"""
+        if not self._pending:
+            return
+        codes = list(self.codes)
+        index = dict(self.index)
+        fetched = list(self.fetched)
+        replaced = set()
+        for code, _, _, when, replace in self._pending:
+            if code not in index:
+                index[code] = len(codes)
+                codes.append(code)
+                fetched.append(when)
+            else:
+                old = fetched[index[code]]
+                fetched[index[code]] = when if np.isnat(old) else max(old, when)
+            if replace:
+                replaced.add(index[code])
+
+        counts = np.diff(self.offsets)
+        old_code = np.repeat(np.arange(len(self.codes), dtype=np.int64), counts)
+        keep_old = ~np.isin(old_code, list(replaced)) if replaced else np.ones(len(old_code), dtype=bool)
+        parts_code = [old_code[keep_old]]
+        parts_ts = [self.ts[keep_old]]
+        parts_cols = {f: [self.cols[f][keep_old]] for f in FIELDS}
+        for code, ts, cols, _, _ in self._pending:
+            parts_code.append(np.full(len(ts), index[code], dtype=np.int64))
+            parts_ts.append(ts)
+            for f in FIELDS:
+                parts_cols[f].append(cols[f])
+
+        code_idx = np.concatenate(parts_code)
+        ts = np.concatenate(parts_ts)
+        cols = {f: np.concatenate(parts_cols[f]) for f in FIELDS}
+
+        # 稳定排序后同一 (股票, 时间) 保留最后写入的一根
+        seq = np.arange(len(ts))
+        order = np.lexsort((seq, ts, code_idx))
+        code_idx, ts = code_idx[order], ts[order]
+        keep = np.ones(len(ts), dtype=bool)
+        keep[:-1] = (code_idx[1:] != code_idx[:-1]) | (ts[1:] != ts[:-1])
+        if keep_days and len(ts):
+            keep &= ts >= ts.max() - np.timedelta64(keep_days, 'D')
+        order = order[keep]
+        code_idx, ts = code_idx[keep], ts[keep]
+        cols = {f: cols[f][order] for f in FIELDS}
+
+        # 去掉已经没有K线的股票
+        counts = np.bincount(code_idx, minlength=len(codes))
+        present = np.flatnonzero(counts)
+        self.codes = [codes[i] for i in present]
+        self.offsets = np.concatenate([[0], np.cumsum(counts[present])]).astype(np.int64)
+        self.fetched = np.array(fetched, dtype='datetime64[s]')[present]
+        self.ts = ts
+        self.cols = cols
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self._pending = []
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp.npz'
+        np.savez(tmp, codes=np.array(self.codes, dtype='U12'), offsets=self.offsets, ts=self.ts,
+                 fetched=self.fetched, **self.cols)
+        os.replace(tmp, self.path)
+        self.updated = time.time()
+
+
+def open_hourly_store(path: str = STORE_FILE) -> HourlyStore:
+    """打开合并缓存（不存在时为空缓存）"""
+    return HourlyStore(path)
@@ -5,9 +5,67 @@ K线合并处理模块
 
 import pandas as pd
 import numpy as np
+from array import array
 from typing import List, Tuple
 
 
+class KlineMerger:
+    """
+    包含关系的增量处理器。
+    
+    逐根压入原始K线，合并后的序列保存在数组里；只有最后一根合并K线会被后续K线改写，
+    其余都已确定。merge_klines 和 ChanlunEngine 共用这一套规则。
+    """
+    
+    def __init__(self):
+        self.high = array('d')
+        self.low = array('d')
+        self.close = array('d')
+        self.volume = array('d')
+        self.first = array('q')  # 每根合并K线对应的首根原始K线索引
+        self.last = array('q')   # 每根合并K线对应的末根原始K线索引
+        self.direction = 0  # 1=上, -1=下
+        self.raw_count = 0
+    
+    def __len__(self):
+        return len(self.high)
+    
+    def push(self, high: float, low: float, close: float, volume: float = 0.0) -> bool:
+        """压入一根原始K线，新增了合并K线返回 True，并入最后一根返回 False"""
+        i = self.raw_count
+        self.raw_count += 1
+        H, L = self.high, self.low
+        
+        if H:
+            ph, pl = H[-1], L[-1]
+            # 包含关系: 当前K线被前一根包含，或包含前一根
+            if (ph >= high and pl <= low) or (high >= ph and low <= pl):
+                if len(H) >= 2:
+                    if ph > H[-2] and pl > L[-2]:
+                        self.direction = 1
+                    elif ph < H[-2] and pl < L[-2]:
+                        self.direction = -1
+                
+                if self.direction >= 0:  # 向上或无方向: 取高高
+                    H[-1] = max(ph, high)
+                    L[-1] = max(pl, low)
+                else:  # 向下: 取低低
+                    H[-1] = min(ph, high)
+                    L[-1] = min(pl, low)
+                self.close[-1] = close
+                self.volume[-1] = self.volume[-1] + volume
+                self.last[-1] = i
+                return False
+        
+        H.append(high)
+        L.append(low)
+        self.close.append(close)
+        self.volume.append(volume)
+        self.first.append(i)
+        self.last.append(i)
+        return True
+
+
 def merge_klines(df: pd.DataFrame) -> pd.DataFrame:
     """
     对K线进行包含关系处理。
@@ -25,57 +83,19 @@ def merge_klines(df: pd.DataFrame) -> pd.DataFrame:
         df['merged_idx'] = range(len(df))
         return df
     
-    records = df.to_dict('records')
-    merged = []
+    merger = KlineMerger()
+    has_volume = 'volume' in df.columns
+    volumes = df['volume'].tolist() if has_volume else [0.0] * len(df)
+    for h, l, c, v in zip(df['high'].tolist(), df['low'].tolist(), df['close'].tolist(), volumes):
+        merger.push(h, l, c, v)
     
-    # 添加原始索引
-    for i, r in enumerate(records):
-        r['_orig_idx'] = i
-    
-    merged.append(records[0].copy())
-    direction = 0  # 1=上, -1=下
-    
-    for i in range(1, len(records)):
-        curr = records[i]
-        prev = merged[-1]
-        
-        # 检查包含关系: 当前K线是否被前一根包含，或包含前一根
-        if _has_inclusion(prev, curr):
-            # 判断方向
-            if len(merged) >= 2:
-                pp = merged[-2]
-                if prev['high'] > pp['high'] and prev['low'] > pp['low']:
-                    direction = 1  # 向上
-                elif prev['high'] < pp['high'] and prev['low'] < pp['low']:
-                    direction = -1  # 向下
-            
-            # 合并
-            if direction >= 0:  # 向上或无方向: 取高高
-                new_high = max(prev['high'], curr['high'])
-                new_low = max(prev['low'], curr['low'])
-            else:  # 向下: 取低低
-                new_high = min(prev['high'], curr['high'])
-                new_low = min(prev['low'], curr['low'])
-            
-            # 更新最后一根
-            prev['high'] = new_high
-            prev['low'] = new_low
-            prev['close'] = curr['close']
-            prev['volume'] = prev.get('volume', 0) + curr.get('volume', 0)
-            # 保留orig_idx为列表
-            if isinstance(prev.get('_orig_idx'), list):
-                prev['_orig_idx'].append(curr['_orig_idx'])
-            else:
-                prev['_orig_idx'] = [prev['_orig_idx'], curr['_orig_idx']]
-        else:
-            merged.append(curr.copy())
-    
-    result = pd.DataFrame(merged)
-    result['merged_idx'] = result['_orig_idx'].apply(
-        lambda x: x if isinstance(x, list) else [x]
-    )
-    result = result.drop(columns=['_orig_idx'])
-    result = result.reset_index(drop=True)
+    # 合并K线保留首根K线的其余字段，高低收量取合并结果
+    result = df.iloc[np.frombuffer(merger.first, dtype=np.int64)].reset_index(drop=True)
+    for col, values in (('high', merger.high), ('low', merger.low), ('close', merger.close)):
+        result[col] = np.frombuffer(values, dtype=np.float64).astype(df[col].dtype, copy=False)
+    if has_volume:
+        result['volume'] = np.frombuffer(merger.volume, dtype=np.float64).astype(df['volume'].dtype, copy=False)
+    result['merged_idx'] = [list(range(a, b + 1)) for a, b in zip(merger.first, merger.last)]
     
     return result
 
@@ -97,34 +117,34 @@ def find_fractals(merged_df: pd.DataFrame) -> List[dict]:
     返回: [{'type': 'top'/'bottom', 'idx': int, 'price': float, 'datetime': ...}, ...]
     """
     fractals = []
-    records = merged_df.to_dict('records')
+    if len(merged_df) < 3:
+        return fractals
     
-    for i in range(1, len(records) - 1):
-        left = records[i - 1]
-        mid = records[i]
-        right = records[i + 1]
-        
-        # 顶分型
-        if mid['high'] > left['high'] and mid['high'] > right['high']:
-            if mid['low'] > left['low'] and mid['low'] > right['low']:
-                # 标准顶分型 (三根K线高低点关系)
-                pass
+    high = merged_df['high'].to_numpy(dtype=np.float64)
+    low = merged_df['low'].to_numpy(dtype=np.float64)
+    has_dt = 'datetime' in merged_df.columns
+    
+    # 顶分型: 中间K线高点最高；否则底分型: 中间K线低点最低
+    is_top = (high[1:-1] > high[:-2]) & (high[1:-1] > high[2:])
+    is_bottom = ~is_top & (low[1:-1] < low[:-2]) & (low[1:-1] < low[2:])
+    
+    for i in (np.flatnonzero(is_top | is_bottom) + 1).tolist():
+        dt = merged_df['datetime'].iat[i] if has_dt else None
+        if is_top[i - 1]:
             fractals.append({
                 'type': 'top',
                 'idx': i,
-                'price': mid['high'],
-                'low': mid['low'],
-                'datetime': mid.get('datetime', None)
+                'price': float(high[i]),
+                'low': float(low[i]),
+                'datetime': dt
             })
-        
-        # 底分型
-        elif mid['low'] < left['low'] and mid['low'] < right['low']:
+        else:
             fractals.append({
                 'type': 'bottom',
                 'idx': i,
-                'price': mid['low'],
-                'high': mid['high'],
-                'datetime': mid.get('datetime', None)
+                'price': float(low[i]),
+                'high': float(high[i]),
+                'datetime': dt
             })
     
     return fractals
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+筹码分布引擎 — 成交量加权的价格分布，一次构建，多项指标共用
+
+ChipHealthAnalyzer 原来每个指标各自处理同一段 40/60 日窗口：
+  - 成本分位数：每根K线 extend([price] * (volume/10000))，流动性好的股票一次就是上百万个 float，
+    再对整张列表 np.percentile
+  - 获利盘 / 时间衰减获利盘 / HHI / 基尼 / 峰型：各自重新掩码、重新分箱
+
+这里每个窗口只构建一次 ChipDistribution：
+  1. 有效K线按价格排序，累计「筹码单位」（每万手一个，与原实现一致）、成交量、时间衰减成交量
+  2. P10/P50/P90：在累计筹码单位上二分查找秩次，按 np.percentile 的线性插值取值，
+     结果与展开列表后 np.percentile 逐位一致，但不再构建展开列表
+  3. 获利盘 / 套牢盘（含时间衰减）：当前价在价格序列中的位置 → 累计成交量
+  4. HHI / 基尼（19 个价格区间）与峰型（10 个价格区间）：按需分箱并缓存，
+     区间边界与「左闭右开、最高价不入箱」的原语义一致
+
+批量模式 batch_chip_metrics() 把多只股票的窗口右对齐成 (股票数 × 窗口) 矩阵，
+分位数、获利盘、分箱、HHI/基尼都是整矩阵运算，只有峰型分类逐行判断（10 个数）；
+batch_chip_metrics_pooled() 按行切块交给进程池（ChipHealthAnalyzer.analyze_batch 使用）。
+
+数值说明：成交量为整数（A 股K线均如此）时，各项与原实现逐位一致；
+时间衰减获利盘和批量模式的 HHI/基尼因求和顺序不同，可能有末位舍入差异。
+
+使用方法：
+    from chip_engine import ChipEngine, batch_chip_metrics
+    chips = ChipEngine.from_hist(hist_data)       # hist_data 含 收盘 / 成交量 列
+    dist = chips.window(60)
+    p10, p50, p90 = dist.percentiles()
+    profit, loss = dist.profit_loss(current_price)
+"""
+
+import os
+
+import numpy as np
+
+CHIP_UNIT = 10000      # 每万手一个筹码单位
+DECAY_RATE = 0.05      # 时间衰减因子：权重 = exp(-距今天数 * DECAY_RATE)
+PEAK_BINS = 10         # 峰型识别的价格区间数
+HHI_BINS = 19          # HHI/基尼的价格区间数（原实现 linspace(min, max, 20)）
+MIN_BARS_PERCENTILE = 5
+MIN_BARS_HISTOGRAM = 10
+POOL_MIN_ROWS = 20000     # 超过该股票数才默认启用进程池
+POOL_CHUNK_ROWS = 2000    # 进程池每块的股票数
+
+
+def _lerp(a, b, t):
+    """与 numpy 分位数相同的线性插值（t >= 0.5 时从右端点回推）"""
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def _clean(prices, volumes):
+    prices = np.asarray(prices, dtype=np.float64)
+    volumes = np.asarray(volumes, dtype=np.float64)
+    valid = (prices > 0) & (volumes > 0) & np.isfinite(prices) & np.isfinite(volumes)
+    return prices[valid], volumes[valid]
+
+
+def _chip_units(volumes):
+    """每根K线的筹码单位数 max(1, int(volume / CHIP_UNIT))"""
+    return np.maximum((volumes / CHIP_UNIT).astype(np.int64), 1)
+
+
+def _bin_edges(lo, hi, nbins):
+    """逐行等分区间边界，与标量 np.linspace(lo, hi, nbins + 1) 逐位一致
+
+    （数组参数的 np.linspace 只要有一行步长为 0，整批都会改用先除后乘的算法，舍入不同）
+    """
+    lo = np.asarray(lo, dtype=np.float64)
+    hi = np.asarray(hi, dtype=np.float64)
+    step = (hi - lo) / nbins
+    edges = np.arange(nbins + 1) * step[..., None] + lo[..., None]
+    edges[..., -1] = hi
+    return edges
+
+
+def peak_type_from_histogram(volume_distribution):
+    """由价格区间成交量（从低到高）判断峰型，逻辑与原 _identify_peak_type 一致"""
+    volume_distribution = list(volume_distribution)
+
+    # 平滑处理，减少噪声
+    if len(volume_distribution) >= 3:
+        smoothed = []
+        for i in range(len(volume_distribution)):
+            if i == 0:
+                smoothed.append((volume_distribution[i] + volume_distribution[i+1]) / 2)
+            elif i == len(volume_distribution) - 1:
+                smoothed.append((volume_distribution[i-1] + volume_distribution[i]) / 2)
+            else:
+                smoothed.append((volume_distribution[i-1] + volume_distribution[i] + volume_distribution[i+1]) / 3)
+        volume_distribution = smoothed
+
+    avg_volume = np.mean(volume_distribution)
+    if avg_volume == 0:
+        return '无有效数据'
+
+    # 找出峰值（局部最大值）并计算峰强度
+    peaks = []
+    peak_strengths = []
+    for i in range(1, len(volume_distribution) - 1):
+        if volume_distribution[i] > volume_distribution[i-1] and \
+           volume_distribution[i] > volume_distribution[i+1]:
+            if volume_distribution[i] > avg_volume * 0.8:
+                peaks.append(i)
+                peak_strengths.append(volume_distribution[i] / avg_volume)
+
+    if len(peaks) == 0:
+        return '分散型（无明显峰）'
+    elif len(peaks) == 1:
+        peak_pos = peaks[0]
+        peak_strength = peak_strengths[0]
+        if peak_pos < 3:
+            if peak_strength > 2.0:
+                return '底部单峰密集 ⭐⭐⭐⭐⭐'
+            else:
+                return '底部单峰（弱）'
+        elif peak_pos > 7:
+            if peak_strength > 2.0:
+                return '高位单峰密集 [WARN]'
+            else:
+                return '高位单峰（弱）[WARN]'
+        else:
+            return '中位单峰'
+    elif len(peaks) == 2:
+        avg_strength = np.mean(peak_strengths)
+        if avg_strength > 1.5:
+            return '双峰分布（可能洗盘中）'
+        else:
+            return '双峰分布（弱）'
+    else:
+        return '多峰林立（散户博弈）[WARN]'
+
+
+def hhi_gini_from_histogram(chip_shares):
+    """由价格区间成交量计算 (HHI, 基尼系数)，公式与原 _calculate_hhi_and_gini 一致"""
+    total_chips = sum(chip_shares)
+    if total_chips == 0:
+        return 0, 0
+    chip_shares = [s / total_chips for s in chip_shares if s > 0]
+    hhi = sum(s**2 for s in chip_shares)
+    chip_shares_sorted = sorted(chip_shares)
+    n = len(chip_shares_sorted)
+    gini = 0
+    if n > 0:
+        gini = (2 * sum((i+1) * chip_shares_sorted[i] for i in range(n))) / (n * sum(chip_shares_sorted)) - (n + 1) / n
+    return float(hhi), float(gini)
+
+
+# ============================================================================
+# 单只股票
+# ============================================================================
+class ChipDistribution:
+    """一个窗口内的筹码分布（有效K线按价格排序后的累计量）"""
+
+    def __init__(self, prices, volumes, decay_rate=DECAY_RATE):
+        self.prices, self.volumes = _clean(prices, volumes)
+        self.n = len(self.prices)
+        self.decay_rate = decay_rate
+        order = np.argsort(self.prices, kind='stable')
+        self.sorted_prices = self.prices[order]
+        self._order = order
+        self.cum_units = np.cumsum(_chip_units(self.volumes)[order])
+        self.cum_volume = np.cumsum(self.volumes[order])
+        self._cum_decay = None
+        self._hist = {}
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def total_volume(self):
+        return float(self.cum_volume[-1]) if self.n else 0.0
+
+    def _price_at_rank(self, rank):
+        """展开后的第 rank 个筹码（0 起）对应的价格"""
+        return self.sorted_prices[np.searchsorted(self.cum_units, rank, side='right')]
+
+    def percentiles(self, qs=(10, 50, 90)):
+        """筹码成本分位数，数据不足返回全 0"""
+        if self.n < MIN_BARS_PERCENTILE:
+            return tuple(0 for _ in qs)
+        total = int(self.cum_units[-1])
+        out = []
+        for q in qs:
+            vi = (total - 1) * (q / 100)
+            if vi >= total - 1:
+                out.append(float(self.sorted_prices[-1]))
+                continue
+            lo = int(np.floor(vi))
+            a = self._price_at_rank(lo)
+            b = self._price_at_rank(lo + 1)
+            out.append(float(_lerp(a, b, vi - lo)))
+        return tuple(out)
+
+    def _decayed(self):
+        if self._cum_decay is None:
+            days_old = np.arange(self.n)[::-1]
+            weighted = self.volumes * np.exp(-days_old * self.decay_rate)
+            self._cum_decay = np.cumsum(weighted[self._order])
+        return self._cum_decay
+
+    def profit_loss(self, current_price, time_decay=False):
+        """(获利盘%, 套牢盘%)：低于 / 高于当前价的（衰减）成交量占比"""
+        if self.n == 0 or current_price <= 0:
+            return 0, 0
+        cum = self._decayed() if time_decay else self.cum_volume
+        total = cum[-1]
+        if total <= 0:
+            return 0, 0
+        below = np.searchsorted(self.sorted_prices, current_price, side='left')
+        upto = np.searchsorted(self.sorted_prices, current_price, side='right')
+        profit = cum[below - 1] if below > 0 else 0.0
+        loss = total - (cum[upto - 1] if upto > 0 else 0.0)
+        profit_ratio = max(0.0, min(100.0, (profit / total) * 100))
+        loss_ratio = max(0.0, min(100.0, (loss / total) * 100))
+        return profit_ratio, loss_ratio
+
+    def histogram(self, nbins):
+        """[min, max] 等分 nbins 个左闭右开区间的成交量（最高价不入箱，与原实现一致）"""
+        hist = self._hist.get(nbins)
+        if hist is None:
+            if self.n == 0:
+                hist = [0.0] * nbins
+            else:
+                edges = _bin_edges(self.sorted_prices[0], self.sorted_prices[-1], nbins)
+                idx = np.searchsorted(edges, self.prices, side='right') - 1
+                ok = idx < nbins
+                hist = np.bincount(idx[ok], weights=self.volumes[ok], minlength=nbins).tolist()
+            self._hist[nbins] = hist
+        return hist
+
+    def hhi_gini(self):
+        if self.n < MIN_BARS_HISTOGRAM:
+            return 0, 0
+        return hhi_gini_from_histogram(self.histogram(HHI_BINS))
+
+    def peak_type(self):
+        if self.n < MIN_BARS_HISTOGRAM:
+            return '数据不足'
+        if self.sorted_prices[-1] <= self.sorted_prices[0]:
+            return '价格无波动'
+        return peak_type_from_histogram(self.histogram(PEAK_BINS))
+
+
+class ChipEngine:
+    """一只股票的收盘价 / 成交量序列，按窗口缓存 ChipDistribution"""
+
+    def __init__(self, prices, volumes):
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.volumes = np.asarray(volumes, dtype=np.float64)
+        self._windows = {}
+
+    @classmethod
+    def from_hist(cls, hist_data, price_col='收盘', volume_col='成交量'):
+        return cls(hist_data[price_col].astype(float).values,
+                   hist_data[volume_col].astype(float).values)
+
+    def window(self, window):
+        """最近 window 根K线的筹码分布（先取窗口再剔除无效K线，与原实现一致）"""
+        dist = self._windows.get(window)
+        if dist is None:
+            dist = ChipDistribution(self.prices[-window:], self.volumes[-window:])
+            self._windows[window] = dist
+        return dist
+
+
+# ============================================================================
+# 批量模式
+# ============================================================================
+def stack_windows(series, window):
+    """[(prices, volumes), ...] → 右对齐的 (股票数 × window) 矩阵，不足处为 NaN"""
+    n = len(series)
+    price_mat = np.full((n, window), np.nan)
+    vol_mat = np.full((n, window), np.nan)
+    for i, (p, v) in enumerate(series):
+        p = np.asarray(p, dtype=np.float64)[-window:]
+        v = np.asarray(v, dtype=np.float64)[-window:]
+        if len(p):
+            price_mat[i, window - len(p):] = p
+            vol_mat[i, window - len(v):] = v
+    return price_mat, vol_mat
+
+
+def _row_searchsorted(cum, targets):
+    """逐行在非降序 cum 中查找 targets（side='right'），一次 searchsorted 完成"""
+    rows, width = cum.shape
+    span = float(cum[:, -1].max()) + 1 if rows else 1.0
+    offset = np.arange(rows) * span
+    flat = (cum + offset[:, None]).ravel()
+    pos = np.searchsorted(flat, targets + offset, side='right')
+    return np.minimum(pos - np.arange(rows) * width, width - 1)
+
+
+def batch_chip_metrics(price_mat, vol_mat, current_prices, qs=(10, 50, 90), peaks=True):
+    """多只股票同一窗口长度的筹码指标
+
+    price_mat / vol_mat: (股票数 × 窗口) 矩阵（stack_windows 的结果），无效K线为 NaN 或 <= 0
+    current_prices: 每只股票的当前价
+    返回 dict: 'p10'/'p50'/'p90'、'profit_ratio'/'loss_ratio'、'hhi'/'gini' 为数组，
+             'peak_type' 为字符串列表（peaks=False 时不计算）
+    """
+    price_mat = np.asarray(price_mat, dtype=np.float64)
+    vol_mat = np.asarray(vol_mat, dtype=np.float64)
+    current = np.asarray(current_prices, dtype=np.float64)
+    rows, width = price_mat.shape
+
+    valid = (price_mat > 0) & (vol_mat > 0) & np.isfinite(price_mat) & np.isfinite(vol_mat)
+    n_valid = valid.sum(axis=1)
+    prices = np.where(valid, price_mat, np.inf)      # 无效K线排到最后
+    vols = np.where(valid, vol_mat, 0.0)
+    order = np.argsort(prices, axis=1, kind='stable')
+    sp = np.take_along_axis(prices, order, axis=1)
+    sv = np.take_along_axis(vols, order, axis=1)
+    units = np.where(np.take_along_axis(valid, order, axis=1), _chip_units(sv), 0)
+    cum_units = np.cumsum(units, axis=1)
+    cum_vol = np.cumsum(sv, axis=1)
+    out = {}
+
+    # 成本分位数
+    total_units = cum_units[:, -1]
+    enough = n_valid >= MIN_BARS_PERCENTILE
+    last_price = np.take_along_axis(sp, np.maximum(n_valid - 1, 0)[:, None], axis=1)[:, 0]
+    for q in qs:
+        vi = (total_units - 1) * (q / 100)
+        lo = np.floor(np.maximum(vi, 0))
+        a = np.take_along_axis(sp, _row_searchsorted(cum_units, lo)[:, None], axis=1)[:, 0]
+        b = np.take_along_axis(sp, _row_searchsorted(cum_units, lo + 1)[:, None], axis=1)[:, 0]
+        with np.errstate(invalid='ignore'):
+            val = np.where(vi >= total_units - 1, last_price, _lerp(a, b, vi - lo))
+        out[f'p{q}'] = np.where(enough, val, 0.0)
+
+    # 获利盘 / 套牢盘
+    total_vol = cum_vol[:, -1]
+    below = (sp < current[:, None]).sum(axis=1)
+    upto = (sp <= current[:, None]).sum(axis=1)
+    padded = np.concatenate([np.zeros((rows, 1)), cum_vol], axis=1)
+    profit = np.take_along_axis(padded, below[:, None], axis=1)[:, 0]
+    loss = total_vol - np.take_along_axis(padded, upto[:, None], axis=1)[:, 0]
+    ok = (n_valid > 0) & (current > 0) & (total_vol > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['profit_ratio'] = np.where(ok, np.clip(profit / total_vol * 100, 0, 100), 0.0)
+        out['loss_ratio'] = np.where(ok, np.clip(loss / total_vol * 100, 0, 100), 0.0)
+
+    # 价格分箱（每行 [min, max] 等分），HHI/基尼与峰型共用
+    pmin = np.where(n_valid > 0, sp[:, 0], 0.0)
+    pmax = np.where(n_valid > 0, last_price, 0.0)
+
+    def histogram(nbins):
+        edges = _bin_edges(pmin, pmax, nbins)
+        idx = (price_mat[:, :, None] >= edges[:, None, :]).sum(axis=2) - 1
+        ok_bin = valid & (idx >= 0) & (idx < nbins)
+        flat = (np.arange(rows)[:, None] * nbins + idx)[ok_bin]
+        return np.bincount(flat, weights=vol_mat[ok_bin], minlength=rows * nbins).reshape(rows, nbins)
+
+    enough_hist = n_valid >= MIN_BARS_HISTOGRAM
+    hh = histogram(HHI_BINS)
+    # 求和一律用 cumsum 的最后一列：按顺序逐项累加，与原实现的 Python sum() 结果逐位相同
+    tot = np.cumsum(hh, axis=1)[:, -1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = np.where(tot[:, None] > 0, hh / tot[:, None], 0.0)
+        hhi = np.cumsum(shares ** 2, axis=1)[:, -1]
+        s_sorted = np.sort(np.where(shares > 0, shares, np.inf), axis=1)
+        k = (shares > 0).sum(axis=1)
+        rank = np.arange(1, HHI_BINS + 1)
+        finite = np.isfinite(s_sorted)
+        s_fin = np.where(finite, s_sorted, 0.0)
+        # 正份额排在前面，rank 从 1 开始，与原实现只对正份额求和一致
+        gini = ((2 * np.cumsum(rank * s_fin, axis=1)[:, -1]) / (k * np.cumsum(s_fin, axis=1)[:, -1])
+                - (k + 1) / k)
+    good = enough_hist & (tot > 0)
+    out['hhi'] = np.where(good, hhi, 0.0)
+    out['gini'] = np.where(good, gini, 0.0)
+
+    if peaks:
+        hp = histogram(PEAK_BINS)
+        types = []
+        for i in range(rows):
+            if not enough_hist[i]:
+                types.append('数据不足')
+            elif pmax[i] <= pmin[i]:
+                types.append('价格无波动')
+            else:
+                types.append(peak_type_from_histogram(hp[i].tolist()))
+        out['peak_type'] = types
+    return out
+
+
+def _batch_chunk(args):
+    price_mat, vol_mat, current, qs, peaks = args
+    return batch_chip_metrics(price_mat, vol_mat, current, qs=qs, peaks=peaks)
+
+
+def batch_chip_metrics_pooled(price_mat, vol_mat, current_prices, qs=(10, 50, 90), peaks=True,
+                              workers=None, chunk_rows=POOL_CHUNK_ROWS):
+    """batch_chip_metrics 的进程池版本：按行切块并行，结果按原顺序拼接
+
+    workers=None 时行数不超过 POOL_MIN_ROWS 直接在当前进程计算
+    （全市场 60 日窗口单进程约 0.1 秒，进程启动与序列化反而更慢）。
+    """
+    rows = len(price_mat)
+    if workers is None:
+        workers = 0 if rows <= POOL_MIN_ROWS else min(os.cpu_count() or 1, 8)
+    if workers <= 1 or rows <= chunk_rows:
+        return batch_chip_metrics(price_mat, vol_mat, current_prices, qs=qs, peaks=peaks)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    current = np.asarray(current_prices, dtype=np.float64)
+    bounds = list(range(0, rows, chunk_rows))
+    tasks = [(price_mat[s:s + chunk_rows], vol_mat[s:s + chunk_rows], current[s:s + chunk_rows], qs, peaks)
+             for s in bounds]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_batch_chunk, tasks))
+    out = {}
+    for key in parts[0]:
+        if key == 'peak_type':
+            out[key] = [t for part in parts for t in part[key]]
+        else:
+            out[key] = np.concatenate([part[key] for part in parts])
+    return out
+
+
+def bottom_locked(prices, volumes, current_price, long_window=60):
+    """底部筹码是否锁定：长周期底部 20% 价格区间的成交量占比 > 15%，且近 20 日占比不低于其 70%
+
+    prices / volumes 为完整的收盘价、成交量序列（不剔除无效K线，与原 _check_bottom_locked 一致）。
+    """
+    if current_price <= 0 or len(prices) < 20:
+        return False
+    prices_long = prices[-long_window:]
+    volumes_long = volumes[-long_window:]
+    price_min = prices_long.min()
+    price_20pct = price_min + (current_price - price_min) * 0.2
+
+    bottom_volume_long = volumes_long[prices_long <= price_20pct].sum()
+    total_volume_long = volumes_long.sum()
+    prices_20d = prices[-20:]
+    volumes_20d = volumes[-20:]
+    bottom_volume_20d = volumes_20d[prices_20d <= price_20pct].sum()
+    total_volume_20d = volumes_20d.sum()
+    if total_volume_long == 0 or total_volume_20d == 0:
+        return False
+
+    bottom_ratio_long = bottom_volume_long / total_volume_long
+    bottom_ratio_20d = bottom_volume_20d / total_volume_20d
+    return bool(bottom_ratio_long > 0.15 and bottom_ratio_20d > bottom_ratio_long * 0.7)
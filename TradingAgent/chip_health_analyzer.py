@@ -15,12 +15,17 @@
 日期: 2025-12-10
 """
 
+import os
+import sys
+import time
 import warnings
 from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
 
+from chip_engine import ChipEngine, batch_chip_metrics_pooled, bottom_locked, stack_windows
+
 warnings.filterwarnings('ignore')
 
 # 尝试导入akshare
@@ -53,6 +58,30 @@ except ImportError:
     ML_AVAILABLE = False
     print("⚠ scikit-learn库未安装 - 机器学习增强未启用")
 
+TRADING_SHARED = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'TradingShared')
+STORE_PRICE_DECIMALS = 4   # 列式存储 float32 收盘价还原的小数位数
+
+# analyze_batch 输出表的列
+BATCH_RESULT_COLUMNS = [
+    'health_score', 'health_level', 'signal_strength', 'main_force_status',
+    'current_price', 'scr', 'scr_40', 'chip_cost', 'chip_cost_p10', 'chip_cost_p90',
+    'profit_ratio', 'loss_ratio', 'chip_bias', 'peak_type', 'peak_confidence', 'bottom_locked',
+    'hhi', 'gini_coefficient', 'turnover_rate', 'chip_concentration', 'holder_count_change',
+    'concentration_score', 'turnover_score', 'profit_loss_score', 'bias_score', 'pattern_score',
+    'trading_suggestion', 'data_days',
+]
+
+
+def _open_kline_store():
+    """打开与 kline_full_latest.json 一致的K线列式存储（过期则先转换），不可用时返回 None"""
+    if TRADING_SHARED not in sys.path:
+        sys.path.insert(0, TRADING_SHARED)
+    try:
+        from kline_store import open_kline_store
+    except ImportError:
+        return None
+    return open_kline_store(auto_convert=True)
+
 
 class ChipHealthAnalyzer:
     """筹码健康度分析器（v2.0 - 增强版）"""
@@ -125,7 +154,8 @@ class ChipHealthAnalyzer:
         
         Args:
             top10_concentrations: 字典 {stock_code: concentration_value}
-            holder_changes: 字典 {stock_code: change_value}
+            holder_changes: 字典 {stock_code: change_value}，股东户数增减比例(%)，
+                写入股东户数缓存，与预取数据同一只股票时以注入值为准
         """
         if top10_concentrations:
             for code, conc in top10_concentrations.items():
@@ -133,8 +163,225 @@ class ChipHealthAnalyzer:
                 self._top10_holders_cache[code] = {'concentration': conc, 'source': 'external'}
                 
         if holder_changes:
-            # 如果需要，也可以注入股东户数变化数据
-            pass
+            external = pd.DataFrame({
+                # sh600000 / 600000.SH / 600000 统一成6位代码
+                '代码': [''.join(ch for ch in str(code) if ch.isdigit())[-6:] for code in holder_changes],
+                '股东户数-增减比例': list(holder_changes.values()),
+            })
+            # 注入的行放在前面：按代码查找时取第一条匹配
+            if self._holder_count_cache is not None:
+                external = pd.concat([external, self._holder_count_cache], ignore_index=True)
+            self._holder_count_cache = external
+
+    def calculate_chip_metrics_batch(self, kline_by_code, windows=(60, 40)):
+        """
+        批量计算多只股票的筹码分布指标（整矩阵运算，不逐只构建 DataFrame）
+
+        Args:
+            kline_by_code: 字典 {stock_code: cached_kline_data}，K线格式同 analyze_stock
+            windows: 计算的窗口长度
+
+        Returns:
+            dict: {stock_code: {'current_price', 'hhi', 'gini_coefficient',
+                                'periods': {'60d': {p10/p50/p90/scr/profit_ratio/loss_ratio/
+                                                    chip_bias/peak_type}, ...}}}
+        """
+        codes, series = [], []
+        for code, records in kline_by_code.items():
+            prices, volumes = self._kline_close_volume(records)
+            if len(prices) == 0:
+                continue
+            codes.append(code)
+            series.append((prices, volumes))
+        return self._batch_period_metrics(codes, series, windows)
+
+    def _batch_period_metrics(self, codes, series, windows=(60, 40), workers=None):
+        """(收盘价, 成交量) 序列列表 → calculate_chip_metrics_batch 的结果结构"""
+        if not codes:
+            return {}
+        currents = np.array([float(prices[-1]) for prices, _ in series])
+        results = {code: {'current_price': cur, 'periods': {}} for code, cur in zip(codes, currents.tolist())}
+        for window in windows:
+            price_mat, vol_mat = stack_windows(series, window)
+            m = batch_chip_metrics_pooled(price_mat, vol_mat, currents, workers=workers)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scr = np.where(m['p50'] > 0, (m['p90'] - m['p10']) / (2 * m['p50']) * 100, 100.0)
+                bias = np.where((m['p50'] > 0) & (currents > 0), (currents - m['p50']) / m['p50'] * 100, 0.0)
+            scr = np.clip(scr, 0.0, 100.0)
+            for i, code in enumerate(codes):
+                results[code]['periods'][f'{window}d'] = {
+                    'p10': float(m['p10'][i]),
+                    'p50': float(m['p50'][i]),
+                    'p90': float(m['p90'][i]),
+                    'scr': float(scr[i]),
+                    'profit_ratio': float(m['profit_ratio'][i]),
+                    'loss_ratio': float(m['loss_ratio'][i]),
+                    'chip_bias': float(bias[i]),
+                    'peak_type': m['peak_type'][i],
+                }
+                if window == 60:
+                    results[code]['hhi'] = float(m['hhi'][i])
+                    results[code]['gini_coefficient'] = float(m['gini'][i])
+        return results
+
+    def analyze_batch(self, stock_codes=None, kline_by_code=None, workers=None):
+        """
+        全市场批量筹码分析，评分与逐只 analyze_stock 相同，但不逐只构建 DataFrame、不打印报告
+
+        1. K线一次性取得：kline_by_code 给出时直接使用（格式同 analyze_stock 的 cached_kline_data），
+           否则从列式K线存储 (kline_store) 读取收盘价/成交量
+        2. 40/60日分位数、获利盘、HHI/基尼、峰型按窗口整矩阵计算（chip_engine），
+           股票数超过 chip_engine.POOL_MIN_ROWS 或指定 workers 时按行分块交给进程池
+        3. 逐只只做底部锁定判断和评分（_calculate_health_score 等原方法），
+           十大股东/股东户数取自 prefetch_data / inject_batch_data 的缓存，不访问网络
+
+        注意：列式存储为 float32，收盘价按 STORE_PRICE_DECIMALS 位小数还原；
+        超过 2^24 的成交量会有末位误差，与 JSON 路径的结果可能略有差异。
+
+        Args:
+            stock_codes: 股票代码列表；为None时取 kline_by_code 或列式存储中的全部股票
+            kline_by_code: 可选，字典 {stock_code: cached_kline_data}
+            workers: 进程数；None 为按股票数自动决定，0/1 为不使用进程池
+
+        Returns:
+            DataFrame: 以股票代码为索引，列见 BATCH_RESULT_COLUMNS；无K线数据的股票不在表中
+        """
+        t0 = time.time()
+        series = self._load_batch_series(stock_codes, kline_by_code)
+        codes = [code for code, s in series.items() if s[0][-1] != 0]
+        if not codes:
+            print("[FAIL] 批量筹码分析: 无可用K线数据")
+            return pd.DataFrame(columns=BATCH_RESULT_COLUMNS)
+        t_load = time.time() - t0
+
+        metrics = self._batch_period_metrics(codes, [series[c][:2] for c in codes], workers=workers)
+        t_calc = time.time() - t0 - t_load
+        holder_changes = self._holder_change_map()
+
+        rows = []
+        for code in codes:
+            prices, volumes, turnover = series[code]
+            m = metrics[code]
+            current_price = m['current_price']
+            periods = m['periods']
+            for key, long_window in (('60d', 60), ('40d', 40)):
+                periods[key]['bottom_locked'] = bottom_locked(prices, volumes, current_price, long_window)
+            p60 = periods['60d']
+            result = {
+                'stock_code': code,
+                'current_price': current_price,
+                'chip_concentration': 0,
+                'scr': p60['scr'],
+                'chip_cost': p60['p50'],
+                'chip_cost_p10': p60['p10'],
+                'chip_cost_p90': p60['p90'],
+                'profit_ratio': p60['profit_ratio'],
+                'loss_ratio': p60['loss_ratio'],
+                'turnover_rate': turnover,
+                'chip_bias': p60['chip_bias'],
+                'peak_type': p60['peak_type'],
+                'bottom_locked': p60['bottom_locked'],
+                'hhi': m['hhi'],
+                'gini_coefficient': m['gini_coefficient'],
+                'holder_count_change': 0,
+                'periods': periods,
+                'data_days': len(prices),
+            }
+            top10_data = self._get_top10_holders(code)
+            if top10_data is not None:
+                result['chip_concentration'] = self._calculate_concentration(top10_data)
+            short_code = code[-6:] if len(code) > 6 else code
+            result['holder_count_change'] = holder_changes.get(short_code, 0)
+
+            health_score, _signals = self._calculate_health_score(result)
+            result['health_score'] = health_score
+            result['health_level'] = self._get_health_level(health_score)
+            result['main_force_status'] = self._identify_main_force_status(result)
+            result['scr_40'] = periods['40d']['scr']
+            rows.append({col: result[col] for col in BATCH_RESULT_COLUMNS})
+
+        table = pd.DataFrame(rows, index=pd.Index(codes, name='stock_code'), columns=BATCH_RESULT_COLUMNS)
+        print(f"[OK] 批量筹码分析: {len(table)} 只 (加载 {t_load:.1f}s, 计算 {t_calc:.1f}s, "
+              f"总计 {time.time() - t0:.1f}s)")
+        return table
+
+    def _load_batch_series(self, stock_codes=None, kline_by_code=None):
+        """{stock_code: (收盘价, 成交量, 近5日平均换手率)}，无数据的股票跳过"""
+        series = {}
+        if kline_by_code is not None:
+            for code in (stock_codes if stock_codes is not None else list(kline_by_code)):
+                records = kline_by_code.get(code)
+                prices, volumes = self._kline_close_volume(records)
+                if len(prices):
+                    series[code] = (prices, volumes, self._kline_turnover(records))
+            return series
+
+        store = _open_kline_store()
+        if store is None:
+            print("[FAIL] K线列式存储不可用，请先运行 TradingShared/kline_store.py convert")
+            return series
+        for code in (stock_codes if stock_codes is not None else store.codes):
+            arr = store.arrays(code, fields=['close', 'volume'])
+            if arr is None or 'close' not in arr or 'volume' not in arr or len(arr['close']) == 0:
+                continue
+            # float32 收盘价还原到 4 位小数，免得 10.8 → 10.800000190734863 跨过分箱边界改变峰型
+            prices = np.round(arr['close'].astype(np.float64), STORE_PRICE_DECIMALS)
+            # 列式存储没有中文「换手率」列，与 DataFrame 路径一样按估算值处理
+            series[code] = (prices, arr['volume'].astype(np.float64), 2.5)
+        return series
+
+    def _holder_change_map(self):
+        """预取的股东户数表 → {6位代码: 增减比例}，避免逐只在整表上筛选"""
+        if self._holder_count_cache is None:
+            return {}
+        changes = {}
+        try:
+            df = self._holder_count_cache
+            for code, change in zip(df['代码'].tolist(), df['股东户数-增减比例'].tolist()):
+                if code in changes:
+                    continue
+                try:
+                    changes[code] = float(change)
+                except (TypeError, ValueError):
+                    continue
+        except Exception as e:
+            print(f"  ⚠ 股东户数缓存解析失败: {e}")
+        return changes
+
+    @staticmethod
+    def _kline_close_volume(cached_kline_data):
+        """缓存K线 → 按日期排序的 (收盘价, 成交量) 数组，支持中英文字段名"""
+        rows = []
+        for r in cached_kline_data or []:
+            if not isinstance(r, dict):
+                continue
+            d = r.get('date', r.get('日期'))
+            d = str(d).split(' ')[0].replace('-', '').replace('/', '')
+            close = r.get('close', r.get('收盘'))
+            volume = r.get('volume', r.get('成交量'))
+            try:
+                rows.append((d, float(close), float(volume)))
+            except (TypeError, ValueError):
+                continue
+        rows.sort(key=lambda x: x[0])
+        prices = np.array([x[1] for x in rows], dtype=np.float64)
+        volumes = np.array([x[2] for x in rows], dtype=np.float64)
+        return prices, volumes
+
+    @staticmethod
+    def _kline_turnover(cached_kline_data):
+        """缓存K线的近5日平均换手率（需有「换手率」字段），与 _calculate_turnover_rate 一致"""
+        rows = [r for r in cached_kline_data or [] if isinstance(r, dict)]
+        if not any('换手率' in r for r in rows):
+            return 2.5
+        rows.sort(key=lambda r: str(r.get('date', r.get('日期'))).split(' ')[0].replace('-', '').replace('/', ''))
+        values = []
+        for r in rows[-5:]:
+            try:
+                values.append(float(r.get('换手率')))
+            except (TypeError, ValueError):
+                values.append(np.nan)
+        return float(np.nanmean(values))
             
     def analyze_stock(self, stock_code, cached_kline_data=None, is_batch_mode=False):
         """
@@ -283,10 +530,12 @@ class ChipHealthAnalyzer:
         print("")
         step_log("计算筹码成本分位数和SCR (40日 & 60日)...")
         
+        # 筹码分布每个窗口只构建一次，分位数/获利盘/HHI/峰型共用
+        chips = ChipEngine.from_hist(hist_data)
         # 60日数据 (长期)
-        p10_60, p50_60, p90_60 = self._calculate_chip_cost_percentiles(hist_data, window=60)
+        p10_60, p50_60, p90_60 = self._calculate_chip_cost_percentiles(hist_data, window=60, chips=chips)
         # 40日数据 (中期)
-        p10_40, p50_40, p90_40 = self._calculate_chip_cost_percentiles(hist_data, window=40)
+        p10_40, p50_40, p90_40 = self._calculate_chip_cost_percentiles(hist_data, window=40, chips=chips)
         
         result['chip_cost_p10'] = p10_60
         result['chip_cost'] = p50_60
@@ -321,8 +570,8 @@ class ChipHealthAnalyzer:
         # 5. 计算获利盘/套牢盘比例
         print("")
         step_log("计算获利盘/套牢盘 (40日 & 60日)...")
-        pr_60, lr_60 = self._calculate_profit_loss_ratio(hist_data, current_price, window=60)
-        pr_40, lr_40 = self._calculate_profit_loss_ratio(hist_data, current_price, window=40)
+        pr_60, lr_60 = self._calculate_profit_loss_ratio(hist_data, current_price, window=60, chips=chips)
+        pr_40, lr_40 = self._calculate_profit_loss_ratio(hist_data, current_price, window=40, chips=chips)
         
         result['periods']['60d']['profit_ratio'] = pr_60
         result['periods']['60d']['loss_ratio'] = lr_60
@@ -355,7 +604,7 @@ class ChipHealthAnalyzer:
         # 8. 计算HHI和基尼系数
         print("")
         step_log("计算HHI和基尼系数...")
-        hhi, gini = self._calculate_hhi_and_gini(hist_data)
+        hhi, gini = self._calculate_hhi_and_gini(hist_data, chips=chips)
         result['hhi'] = hhi
         result['gini_coefficient'] = gini
         print(f"[OK] 赫芬达尔指数(HHI): {hhi:.4f}, 基尼系数: {gini:.4f}")
@@ -363,8 +612,8 @@ class ChipHealthAnalyzer:
         # 9. 识别筹码峰型
         print("")
         step_log("识别筹码峰型 (40日 & 60日)...")
-        pt_60 = self._identify_peak_type(hist_data, window=60)
-        pt_40 = self._identify_peak_type(hist_data, window=40)
+        pt_60 = self._identify_peak_type(hist_data, window=60, chips=chips)
+        pt_40 = self._identify_peak_type(hist_data, window=40, chips=chips)
         result['periods']['60d']['peak_type'] = pt_60
         result['periods']['40d']['peak_type'] = pt_40
         result['peak_type'] = pt_60
@@ -688,7 +937,7 @@ class ChipHealthAnalyzer:
     
     def _get_holder_count_change(self, stock_code):
         """获取股东户数变化"""
-        if not self.akshare_available:
+        if not self.akshare_available and self._holder_count_cache is None:
             return 0
         
         try:
@@ -731,52 +980,27 @@ class ChipHealthAnalyzer:
         # 实际应该从数据中计算
         return 35.6
     
-    def _calculate_chip_cost_percentiles(self, hist_data, window=60):
-        """计算筹码成本分位数（P10, P50, P90）- 改进版"""
+    def _calculate_chip_cost_percentiles(self, hist_data, window=60, chips=None):
+        """计算筹码成本分位数（P10, P50, P90）- 改进版
+
+        每万手一个筹码单位，在累计筹码单位上二分查找分位点（chip_engine），
+        与展开成 [price] * weight 列表后 np.percentile 的结果一致。
+        """
         if hist_data is None or hist_data.empty:
             return 0, 0, 0
         
         try:
-            # 使用指定周期数据计算筹码成本分布
-            recent_data = hist_data.tail(window)
+            dist = (chips or ChipEngine.from_hist(hist_data)).window(window)
             
-            prices = recent_data['收盘'].astype(float).values
-            volumes = recent_data['成交量'].astype(float).values
-            
-            # 数据验证：过滤无效数据
-            valid_mask = (prices > 0) & (volumes > 0) & np.isfinite(prices) & np.isfinite(volumes)
-            prices = prices[valid_mask]
-            volumes = volumes[valid_mask]
-            
-            if len(prices) < 5:  # 数据量太少
+            if len(dist) < 5:  # 数据量太少
                 return 0, 0, 0
             
-            # 基于成交量构建筹码分布
-            # 将每日成交量按价格分布
-            chip_distribution = []
-            for price, volume in zip(prices, volumes):
-                # 改进：使用对数缩放避免内存溢出，同时保持分布特性
-                weight = max(1, int(volume / 10000))  # 每万手为单位
-                chip_distribution.extend([price] * weight)
-            
-            if len(chip_distribution) == 0:
-                # 回退到简单加权平均
-                total_volume = volumes.sum()
-                if total_volume > 0:
-                    weighted_price = (prices * volumes).sum() / total_volume
-                    return weighted_price, weighted_price, weighted_price
-                else:
-                    return 0, 0, 0
-            
-            # 计算分位数
-            p10 = np.percentile(chip_distribution, 10)
-            p50 = np.percentile(chip_distribution, 50)  # 中位数成本
-            p90 = np.percentile(chip_distribution, 90)
+            p10, p50, p90 = dist.percentiles((10, 50, 90))
             
             # 边界检查：确保 P10 <= P50 <= P90
             if not (p10 <= p50 <= p90):
                 # 数据异常，使用简单方法
-                p_sorted = np.sort(prices)
+                p_sorted = dist.sorted_prices
                 p10 = p_sorted[int(len(p_sorted) * 0.1)]
                 p50 = p_sorted[int(len(p_sorted) * 0.5)]
                 p90 = p_sorted[int(len(p_sorted) * 0.9)]
@@ -847,85 +1071,27 @@ class ChipHealthAnalyzer:
                 'pattern': 0.20
             }
     
-    def _calculate_profit_loss_ratio_with_time_decay(self, hist_data, current_price, window=60):
-        """计算获利盘和套牢盘比例 - 增强版（带时间衰减权重）"""
+    def _calculate_profit_loss_ratio_with_time_decay(self, hist_data, current_price, window=60, chips=None):
+        """计算获利盘和套牢盘比例 - 增强版（带时间衰减权重，衰减因子0.05）"""
         if hist_data is None or hist_data.empty or current_price <= 0:
             return 0, 0
         
         try:
-            # 使用指定周期数据
-            recent_data = hist_data.tail(window)
-            
-            prices = recent_data['收盘'].astype(float).values
-            volumes = recent_data['成交量'].astype(float).values
-            
-            # 数据验证
-            valid_mask = (prices > 0) & (volumes > 0) & np.isfinite(prices) & np.isfinite(volumes)
-            prices = prices[valid_mask]
-            volumes = volumes[valid_mask]
-            
-            if len(prices) == 0:
-                return 0, 0
-            
-            # 计算时间衰减权重（越近期权重越高）
-            days_old = np.arange(len(prices))[::-1]  # 0表示最新，59表示最旧
-            time_weight = np.exp(-days_old * 0.05)  # 指数衰减，衰减因子0.05
-            
-            # 计算加权获利盘和套牢盘
-            profit_mask = prices < current_price
-            loss_mask = prices > current_price
-            
-            weighted_profit_volume = (volumes[profit_mask] * time_weight[:len(volumes)][profit_mask]).sum()
-            weighted_loss_volume = (volumes[loss_mask] * time_weight[:len(volumes)][loss_mask]).sum()
-            weighted_total_volume = (volumes * time_weight[:len(volumes)]).sum()
-            
-            if weighted_total_volume > 0:
-                profit_ratio = (weighted_profit_volume / weighted_total_volume) * 100
-                loss_ratio = (weighted_loss_volume / weighted_total_volume) * 100
-                profit_ratio = max(0.0, min(100.0, profit_ratio))
-                loss_ratio = max(0.0, min(100.0, loss_ratio))
-                return profit_ratio, loss_ratio
-            
+            dist = (chips or ChipEngine.from_hist(hist_data)).window(window)
+            return dist.profit_loss(current_price, time_decay=True)
         except Exception as e:
             print(f"计算时间衰减获利盘失败: {e}")
         
         return 0, 0
     
-    def _calculate_profit_loss_ratio(self, hist_data, current_price, window=60):
+    def _calculate_profit_loss_ratio(self, hist_data, current_price, window=60, chips=None):
         """计算获利盘和套牢盘比例 - 改进版（增加数据验证）"""
         if hist_data is None or hist_data.empty or current_price <= 0:
             return 0, 0
         
         try:
-            # 使用指定周期数据
-            recent_data = hist_data.tail(window)
-            
-            prices = recent_data['收盘'].astype(float)
-            volumes = recent_data['成交量'].astype(float)
-            
-            # 数据验证：过滤无效数据
-            valid_mask = (prices > 0) & (volumes > 0) & np.isfinite(prices) & np.isfinite(volumes)
-            prices = prices[valid_mask]
-            volumes = volumes[valid_mask]
-            
-            if len(prices) == 0:
-                return 0, 0
-            
-            # 计算低于当前价的成交量（获利盘）
-            profit_volume = volumes[prices < current_price].sum()
-            # 计算高于当前价的成交量（套牢盘）
-            loss_volume = volumes[prices > current_price].sum()
-            
-            total_volume = volumes.sum()
-            
-            if total_volume > 0:
-                profit_ratio = (profit_volume / total_volume) * 100
-                loss_ratio = (loss_volume / total_volume) * 100
-                # 边界检查
-                profit_ratio = max(0.0, min(100.0, profit_ratio))
-                loss_ratio = max(0.0, min(100.0, loss_ratio))
-                return profit_ratio, loss_ratio
-            
+            dist = (chips or ChipEngine.from_hist(hist_data)).window(window)
+            return dist.profit_loss(current_price)
         except Exception as e:
             print(f"计算获利盘失败: {e}")
         
@@ -953,96 +1119,14 @@ class ChipHealthAnalyzer:
             print(f"计算换手率失败: {e}")
             return 0
     
-    def _identify_peak_type(self, hist_data, window=60):
+    def _identify_peak_type(self, hist_data, window=60, chips=None):
         """识别筹码峰型：单峰/双峰/多峰 - 改进版（增加强度判断）"""
         if hist_data is None or hist_data.empty:
             return '未知'
         
         try:
-            # 使用指定周期数据
-            recent_data = hist_data.tail(window)
-            prices = recent_data['收盘'].astype(float).values
-            volumes = recent_data['成交量'].astype(float).values
-            
-            # 数据验证
-            valid_mask = (prices > 0) & (volumes > 0) & np.isfinite(prices) & np.isfinite(volumes)
-            prices = prices[valid_mask]
-            volumes = volumes[valid_mask]
-            
-            if len(prices) < 10:
-                return '数据不足'
-            
-            # 将价格分成10个区间，统计每个区间的成交量
-            price_min, price_max = prices.min(), prices.max()
-            if price_max <= price_min:
-                return '价格无波动'
-            
-            bins = np.linspace(price_min, price_max, 11)
-            volume_distribution = []
-            
-            for i in range(len(bins) - 1):
-                bin_mask = (prices >= bins[i]) & (prices < bins[i+1])
-                bin_volume = volumes[bin_mask].sum()
-                volume_distribution.append(bin_volume)
-            
-            # 平滑处理，减少噪声
-            if len(volume_distribution) >= 3:
-                smoothed = []
-                for i in range(len(volume_distribution)):
-                    if i == 0:
-                        smoothed.append((volume_distribution[i] + volume_distribution[i+1]) / 2)
-                    elif i == len(volume_distribution) - 1:
-                        smoothed.append((volume_distribution[i-1] + volume_distribution[i]) / 2)
-                    else:
-                        smoothed.append((volume_distribution[i-1] + volume_distribution[i] + volume_distribution[i+1]) / 3)
-                volume_distribution = smoothed
-            
-            avg_volume = np.mean(volume_distribution)
-            if avg_volume == 0:
-                return '无有效数据'
-            
-            # 找出峰值（局部最大值）并计算峰强度
-            peaks = []
-            peak_strengths = []
-            for i in range(1, len(volume_distribution) - 1):
-                if volume_distribution[i] > volume_distribution[i-1] and \
-                   volume_distribution[i] > volume_distribution[i+1]:
-                    if volume_distribution[i] > avg_volume * 0.8:
-                        peaks.append(i)
-                        # 计算峰强度：峰值相对于平均值的比例
-                        strength = volume_distribution[i] / avg_volume
-                        peak_strengths.append(strength)
-            
-            # 根据峰值数量和强度判断类型
-            if len(peaks) == 0:
-                return '分散型（无明显峰）'
-            elif len(peaks) == 1:
-                # 检查峰的位置和强度
-                peak_pos = peaks[0]
-                peak_strength = peak_strengths[0]
-                
-                if peak_pos < 3:
-                    if peak_strength > 2.0:
-                        return '底部单峰密集 ⭐⭐⭐⭐⭐'  # 强峰
-                    else:
-                        return '底部单峰（弱）'
-                elif peak_pos > 7:
-                    if peak_strength > 2.0:
-                        return '高位单峰密集 [WARN]'  # 强峰
-                    else:
-                        return '高位单峰（弱）[WARN]'
-                else:
-                    return '中位单峰'
-            elif len(peaks) == 2:
-                # 判断双峰强度
-                avg_strength = np.mean(peak_strengths)
-                if avg_strength > 1.5:
-                    return '双峰分布（可能洗盘中）'
-                else:
-                    return '双峰分布（弱）'
-            else:
-                return '多峰林立（散户博弈）[WARN]'
-                
+            dist = (chips or ChipEngine.from_hist(hist_data)).window(window)
+            return dist.peak_type()
         except Exception as e:
             print(f"识别峰型失败: {e}")
             return '未知'
@@ -1053,93 +1137,22 @@ class ChipHealthAnalyzer:
             return False
         
         try:
-            # 数据量验证
-            if len(hist_data) < 20:
-                return False
-            
-            # 对比近20日和指定长周期的低位筹码比例
-            data_long = hist_data.tail(long_window)
-            data_20d = hist_data.tail(20)
-            
-            # 找出长周期内的最低价区域（底部20%价格区间）
-            prices_long = data_long['收盘'].astype(float).values
-            volumes_long = data_long['成交量'].astype(float).values
-            price_min = prices_long.min()
-            price_20pct = price_min + (current_price - price_min) * 0.2
-            
-            # 计算底部区域的筹码量
-            bottom_volume_long = volumes_long[prices_long <= price_20pct].sum()
-            total_volume_long = volumes_long.sum()
-            
-            # 计算近20日在底部区域的成交量
-            prices_20d = data_20d['收盘'].astype(float).values
-            volumes_20d = data_20d['成交量'].astype(float).values
-            bottom_volume_20d = volumes_20d[prices_20d <= price_20pct].sum()
-            total_volume_20d = volumes_20d.sum()
-            
-            if total_volume_long == 0 or total_volume_20d == 0:
-                return False
-            
-            # 如果底部筹码占比在长周期和20日中保持稳定或增加，说明锁定
-            bottom_ratio_long = bottom_volume_long / total_volume_long
-            bottom_ratio_20d = bottom_volume_20d / total_volume_20d
-            
-            # 逻辑：如果股价上涨但底部成交量占比下降不多，说明筹码锁定
-            if bottom_ratio_long > 0.15 and bottom_ratio_20d > bottom_ratio_long * 0.7:
-                return True
-            
-            return False
+            prices = hist_data['收盘'].astype(float).values
+            volumes = hist_data['成交量'].astype(float).values
+            return bottom_locked(prices, volumes, current_price, long_window)
             
         except Exception as e:
             print(f"检测底部锁定失败: {e}")
             return False
     
-    def _calculate_hhi_and_gini(self, hist_data):
-        """计算HHI（赫芬达尔指数）和基尼系数 - 改进版"""
+    def _calculate_hhi_and_gini(self, hist_data, chips=None):
+        """计算HHI（赫芬达尔指数）和基尼系数 - 改进版（60日，19个价格区间）"""
         if hist_data is None or hist_data.empty:
             return 0, 0
         
         try:
-            recent_data = hist_data.tail(60)
-            prices = recent_data['收盘'].astype(float).values
-            volumes = recent_data['成交量'].astype(float).values
-            
-            # 数据验证
-            valid_mask = (prices > 0) & (volumes > 0) & np.isfinite(prices) & np.isfinite(volumes)
-            prices = prices[valid_mask]
-            volumes = volumes[valid_mask]
-            
-            if len(prices) < 10:
-                return 0, 0
-            
-            # 计算每个价格区间的筹码份额
-            price_ranges = np.linspace(prices.min(), prices.max(), 20)
-            chip_shares = []
-            
-            for i in range(len(price_ranges) - 1):
-                mask = (prices >= price_ranges[i]) & (prices < price_ranges[i+1])
-                chip_shares.append(volumes[mask].sum())
-            
-            total_chips = sum(chip_shares)
-            if total_chips == 0:
-                return 0, 0
-            
-            # 归一化
-            chip_shares = [s / total_chips for s in chip_shares if s > 0]
-            
-            # 计算HHI（赫芬达尔指数）
-            hhi = sum(s**2 for s in chip_shares)
-            
-            # 计算基尼系数
-            chip_shares_sorted = sorted(chip_shares)
-            n = len(chip_shares_sorted)
-            gini = 0
-            if n > 0:
-                cumsum = np.cumsum(chip_shares_sorted)
-                gini = (2 * sum((i+1) * chip_shares_sorted[i] for i in range(n))) / (n * sum(chip_shares_sorted)) - (n + 1) / n
-            
-            return float(hhi), float(gini)
-            
+            dist = (chips or ChipEngine.from_hist(hist_data)).window(60)
+            return dist.hhi_gini()
         except Exception as e:
             print(f"计算HHI和基尼系数失败: {e}")
             return 0, 0
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+当日分析缓存的追加日志 - 替代每只股票一次的整文件 json.dump
+
+原来 save_stock_to_cache 每分析完一只股票就把整个 daily_cache 以 indent=2 重写一遍，
+3000+ 只股票的批量分析里 I/O 是 O(n²)。这里改成：
+  1. 快照文件（原 stock_analysis_cache.json，格式不变：date / timestamp / stocks）
+  2. 追加日志 stock_analysis_cache.json.journal，每条结果一行 JSON
+  3. 按条数或时间间隔批量 flush，日志条数达到阈值时压缩（写新快照 + 清空日志）
+
+崩溃安全：
+  快照通过临时文件 + os.replace 原子替换；日志只追加，加载时逐行解析，
+  最后一行写了一半（进程被杀）会被跳过，之前的记录全部恢复；
+  下次追加前若日志不以换行结尾，先补一个换行，新记录不会接在残行后面一起损坏。
+
+使用方法：
+    journal = DailyCacheJournal(cache_file)
+    stocks = journal.load()                      # 快照 + 日志重放（仅当日）
+    journal.append(ticker, data, stocks)         # 追加一条，按阈值自动 flush / 压缩
+    journal.compact(stocks)                      # 批量结束时写完整快照
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# flush 条件：缓冲条数达到 FLUSH_EVERY，或距上次 flush 超过 FLUSH_INTERVAL 秒（先到为准）
+FLUSH_EVERY = 20
+FLUSH_INTERVAL = 5.0
+# 日志累计条数达到 COMPACT_EVERY 时写一次完整快照并清空日志
+COMPACT_EVERY = 1000
+
+
+class DailyCacheJournal:
+    """当日股票分析缓存：JSON 快照 + JSONL 追加日志"""
+
+    def __init__(self, cache_file, flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL,
+                 compact_every=COMPACT_EVERY):
+        self.cache_file = cache_file
+        self.journal_file = cache_file + '.journal'
+        self.flush_every = max(1, int(flush_every))
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self._buffer = []
+        self._journal_count = 0
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today():
+        return datetime.now().strftime('%Y-%m-%d')
+
+    # ------------------------------------------------------------------
+    # 加载
+    # ------------------------------------------------------------------
+    def load(self, today=None):
+        """读取快照并重放日志，只保留当日数据"""
+        today = today or self._today()
+        stocks = {}
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    cache_data = json.load(f)
+                if cache_data.get('date') == today:
+                    stocks = cache_data.get('stocks', {}) or {}
+            except Exception as e:
+                print(f"读取缓存快照失败: {e}")
+
+        replayed = 0
+        bad = 0
+        if os.path.exists(self.journal_file):
+            try:
+                with open(self.journal_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            rec = json.loads(line)
+                        except ValueError:
+                            bad += 1  # 崩溃时写了一半的行
+                            continue
+                        if rec.get('date') != today:
+                            continue
+                        stocks[rec['ticker']] = rec['data']
+                        replayed += 1
+            except Exception as e:
+                print(f"读取缓存日志失败: {e}")
+            self._journal_count = replayed + bad
+            if replayed or bad:
+                print(f"缓存日志重放：{replayed}条" + (f"，跳过损坏行{bad}条" if bad else ""))
+        return stocks
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def append(self, ticker, data, stocks=None):
+        """追加一条分析结果；stocks 为完整的内存缓存，用于达到阈值时压缩"""
+        line = json.dumps({'date': self._today(), 'ticker': ticker, 'data': data},
+                          ensure_ascii=False, default=str)
+        with self._lock:
+            self._buffer.append(line)
+            if (len(self._buffer) >= self.flush_every
+                    or time.time() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+        if (stocks is not None and self.compact_every
+                and self._journal_count >= self.compact_every):
+            self.compact(stocks)
+
+    def flush(self):
+        """把缓冲中的记录写入日志"""
+        with self._lock:
+            self._flush_locked()
+
+    def _ends_with_newline(self):
+        """日志为空/不存在，或最后一个字节是换行"""
+        try:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return True
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) == b'\n'
+        except FileNotFoundError:
+            return True
+
+    def _flush_locked(self):
+        self._last_flush = time.time()
+        if not self._buffer:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.journal_file) or '.', exist_ok=True)
+            # 上次崩溃留下的残行没有换行：先补上，残行单独被跳过
+            prefix = '' if self._ends_with_newline() else '\n'
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(prefix + '\n'.join(self._buffer) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_count += len(self._buffer)
+            self._buffer = []
+        except Exception as e:
+            print(f"写入缓存日志失败: {e}")
+
+    def compact(self, stocks):
+        """写完整快照（原子替换）并清空日志"""
+        with self._lock:
+            # 在锁内浅拷贝：已进入缓冲的记录一定已写入 stocks，不会随缓冲一起丢失
+            cache_data = {
+                'date': self._today(),
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'stocks': dict(stocks),
+            }
+            tmp = self.cache_file + '.tmp'
+            try:
+                os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(cache_data, f, ensure_ascii=False, indent=2, default=str)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.cache_file)
+            except Exception as e:
+                # 快照失败时保留日志，下次加载仍可恢复
+                print(f"保存缓存失败: {e}")
+                self._flush_locked()
+                return False
+            # 快照已包含全部数据，缓冲与日志都可以丢弃
+            self._buffer = []
+            try:
+                open(self.journal_file, 'w', encoding='utf-8').close()
+            except Exception as e:
+                print(f"清空缓存日志失败: {e}")
+            self._journal_count = 0
+            self._last_flush = time.time()
+        return True
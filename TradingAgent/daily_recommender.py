@@ -1097,7 +1097,7 @@ def run_daily_recommendation() -> Optional[Dict]:
         codes_to_load = [s.get('code', '') for s in top_candidates]
         logger.info(f"[步骤1.5] 加载 {len(codes_to_load)} 只候选股的K线数据...")
         if _real_feature_calc.load_data(codes=codes_to_load):
-            logger.info(f"  K线加载成功: {len(_real_feature_calc.kline)} 只")
+            logger.info(f"  K线加载成功: {_real_feature_calc.loaded_count()} 只")
             _real_feature_calc._deferred_load = False
         else:
             logger.warning("  K线加载失败，将回退到映射模式")
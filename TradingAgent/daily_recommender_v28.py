@@ -49,6 +49,8 @@ except ImportError as e:
     print(f"  [WARN] LLM模块不可用: {e}")
     LLM_AVAILABLE = False
 
+from panel_engine import percentile_rank_map
+
 # V2 筛选器集成
 try:
     from stock_screener_v2 import StockScreenerV2, SectorRotator, MoneyFlowFilter
@@ -76,6 +78,7 @@ HIGH_BETA_KEYWORDS = ['半导体', '芯片', '新能源', '光伏', '锂电', '
                       '保险', '房地产', '钢铁', '煤炭', '有色']
 
 MAX_SAME_INDUSTRY = 1  # V28: 同行业最多1只
+USE_SECTOR_TABLE = True  # 板块热度查预计算的 (行业 × 日期) 表（sector_aggregates），失败时回退逐只计算
 RECOMMEND_COUNT = 3
 
 # 名称映射文件
@@ -907,7 +910,15 @@ def score_all_stocks(kline, index_df, scores, date, risk, weights_config, debug=
     # 使用检测到的risk，不是传入的（传入的可能是旧的）
     risk = risk_detected
 
-    sector_info = identify_hot_sectors(kline, scores, date)
+    sector_info = None
+    if USE_SECTOR_TABLE:
+        try:
+            from sector_aggregates import hot_sectors_for
+            sector_info = hot_sectors_for(kline, scores, date)
+        except Exception as e:
+            print(f"  [WARN] 板块表不可用，逐只计算板块热度: {e}")
+    if sector_info is None:
+        sector_info = identify_hot_sectors(kline, scores, date)
 
     # 选择权重
     if risk <= 2:
@@ -919,9 +930,6 @@ def score_all_stocks(kline, index_df, scores, date, risk, weights_config, debug=
 
     min_score = weights_config.get('min_score_threshold', 55)
 
-    # Precompute industry peer returns
-    industry_peers = defaultdict(list)
-
     # Phase 1: Filter tradeable stocks & compute industry returns
     stock_cache = {}
     skip_stats = defaultdict(int)
@@ -973,7 +981,6 @@ def score_all_stocks(kline, index_df, scores, date, risk, weights_config, debug=
 
         # 计算5日涨幅用于行业peer比较
         ret5 = (c[-1] - c[-6]) / c[-6] * 100 if len(c) >= 6 else 0
-        industry_peers[industry].append((code, ret5))
 
         v = hist['volume'].values
         hi = hist['high'].values if 'high' in hist.columns else c
@@ -1001,10 +1008,16 @@ def score_all_stocks(kline, index_df, scores, date, risk, weights_config, debug=
             'last_pct': last_pct,
             'extra_score': extra_score,
             'ret20': ret20,
+            'ret5': ret5,
             'market_cap': market_cap_yi,
             'close': c[-1],  # 收盘价
         }
 
+    # 行业内相对强度：一次排序算出全部股票的组内百分位（等价于逐只调用 relative_strength_rank）
+    rs_rank = percentile_rank_map(stock_cache.keys(),
+                                  [cache['ret5'] for cache in stock_cache.values()],
+                                  [cache['industry'] for cache in stock_cache.values()])
+
     # Phase 2: Compute sub-scores
     results = []
     for code, cache in stock_cache.items():
@@ -1018,8 +1031,7 @@ def score_all_stocks(kline, index_df, scores, date, risk, weights_config, debug=
         sector_heat_val = sector_info['all_heat'].get(industry, 0)
         sector_s = max(0, min(100, (sector_heat_val + 5) * 10))
 
-        peer_data = industry_peers.get(industry, [])
-        rs_s = relative_strength_rank(code, c, industry, peer_data)
+        rs_s = rs_rank[code]
 
         vol_s = calc_volume_health(c, v)
 
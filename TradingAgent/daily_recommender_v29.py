@@ -22,6 +22,8 @@ import numpy as np
 from datetime import datetime, timedelta
 from collections import defaultdict
 
+from panel_engine import percentile_rank_map
+
 logging.basicConfig(level=logging.INFO, format='[%(name)s] %(message)s')
 logger = logging.getLogger('V29')
 print = functools.partial(print, flush=True)
@@ -770,6 +772,12 @@ def score_v29(klines_dict, names_dict, sectors_dict, index_records, debug=False)
         })
     
     print(f"  赛道分布: {', '.join(f'{t}({len(v)})' for t, v in sorted(track_groups.items(), key=lambda x: -len(x[1])))}")
+
+    # 赛道动量每个赛道只算一次；同赛道相对强度一次排序得到全部股票的组内百分位（不含自身）
+    track_momentum = {t: score_sector_momentum(t, track_groups) for t in track_groups}
+    rs_rank = percentile_rank_map(stock_data.keys(),
+                                  [sd['ret5'] for sd in stock_data.values()],
+                                  [sd['track'] for sd in stock_data.values()], min_peers=1)
     
     # 3. 计算各维度评分
     results = []
@@ -783,11 +791,8 @@ def score_v29(klines_dict, names_dict, sectors_dict, index_records, debug=False)
         # 7维评分
         trend_s = score_trend(closes)
         money_s = score_money_flow(closes, volumes, highs, lows, turns)
-        sector_s = score_sector_momentum(track, track_groups)
-        
-        # 同赛道peer returns
-        peer_returns = [s['ret5'] for s in track_groups.get(track, []) if s['code'] != code]
-        rs_s = score_relative_strength(code, closes, peer_returns)
+        sector_s = track_momentum[track]
+        rs_s = rs_rank[code]
         tech_s = score_technical_signal(closes, volumes, rsi, ma20, ma60)
         vol_s = score_volume_health(closes, volumes)
         
@@ -3,7 +3,7 @@
 """
 回测数据加载器 - 自动检测最新数据文件
 """
-import json, os, glob
+import json, os, sys, glob
 import pandas as pd
 import numpy as np
 from collections import defaultdict
@@ -12,6 +12,8 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 KLINE_CACHE = os.path.join(DATA_DIR, 'kline_cache')
 
+sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
+
 
 def find_latest_kline():
     """找到最新的K线数据文件"""
@@ -42,6 +44,16 @@ def find_latest_index():
     return None
 
 
+def _load_raw_kline(kline_file):
+    """读取 K 线 JSON，并重放尚未压缩的增量段（kline_delta）"""
+    try:
+        from kline_delta import load_kline_json
+    except ImportError:
+        with open(kline_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return load_kline_json(kline_file)
+
+
 def load_kline(kline_file=None):
     """加载K线数据"""
     if kline_file is None:
@@ -49,9 +61,20 @@ def load_kline(kline_file=None):
     if kline_file is None:
         raise FileNotFoundError("No K-line data found in kline_cache/")
 
+    # 列式存储与源JSON一致时直接内存映射打开，免去整文件 json.load
+    try:
+        from kline_store import open_kline_store
+        store = open_kline_store(source=kline_file)
+    except ImportError:
+        store = None
+    if store is not None:
+        print(f"  Loading K-line: {os.path.basename(store.store_dir)} (mmap)")
+        kline = store.frames()
+        print(f"  Stocks loaded: {len(kline)}")
+        return kline, kline_file
+
     print(f"  Loading K-line: {os.path.basename(kline_file)}")
-    with open(kline_file, 'r', encoding='utf-8') as f:
-        raw = json.load(f)
+    raw = _load_raw_kline(kline_file)
 
     kline = {}
     for code, records in raw.items():
@@ -17,20 +17,43 @@ import pandas as pd
 from datetime import datetime, timedelta
 from collections import defaultdict
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'TradingShared'))
+
+USE_BETA_MATRIX = True   # Beta/相对强度优先查全市场矩阵 (TradingShared/beta_matrix.py)
 
 # ---------------------------------------------------------------------------
 # 安全阀：加载财务与状态数据，用于前置过滤
 # ---------------------------------------------------------------------------
 
+def _load_from_data_store(comp_file):
+    """综合数据存储 (stock_data_store) 存在时只读出基础信息和财务数据，否则返回 None"""
+    try:
+        from stock_data_store import open_stock_data_store, store_path_for
+        if not os.path.exists(store_path_for(comp_file)):
+            return None
+        store = open_stock_data_store(comp_file, migrate=False)
+        data = store.load_all(kinds=('basic', 'financial', 'industry', 'meta'))
+        return {code: d for code, d in data.items()
+                if 'financial_data' in d or 'basic_info' in d} or None
+    except Exception as e:
+        print(f'[WARN] 读取综合数据存储失败，改读分片文件: {e}')
+        return None
+
+
 def load_comprehensive_data(data_dir):
     """
-    加载 comprehensive_stock_data（主文件 + part 分片），
+    加载 comprehensive_stock_data（优先综合数据存储，否则主文件 + part 分片），
     返回 {code: stock_data_dict} 的合并字典。
     """
+    comp_file = os.path.join(data_dir, 'comprehensive_stock_data.json')
+    # 0. 综合数据存储（save_data 只写存储，分片文件可能已过期）
+    stored = _load_from_data_store(comp_file)
+    if stored:
+        return stored
+
     all_data = {}
 
     # 1. 主文件
-    comp_file = os.path.join(data_dir, 'comprehensive_stock_data.json')
     if os.path.exists(comp_file):
         try:
             with open(comp_file, 'r', encoding='utf-8') as f:
@@ -415,9 +438,9 @@ def load_kline_data(data_dir):
     
     kline = {}
     if os.path.exists(kline_file):
-        with open(kline_file, 'r', encoding='utf-8') as f:
-            raw = json.load(f)
-        for code, records in raw.items():
+        # 进程内共享缓存：同一进程里其他模块已加载过该文件时不再重复解析
+        from kline_cache import get_kline_cache
+        for code, records in get_kline_cache(kline_file).items():
             df = pd.DataFrame(records)
             df['date'] = pd.to_datetime(df['date']).dt.tz_localize(None)
             df = df.sort_values('date')
@@ -604,10 +627,36 @@ def calc_stock_features(df):
     return f
 
 
+_beta_matrix = None
+
+
+def get_beta_matrix():
+    """Open the market-wide beta/RS matrix once per process (None when unavailable)"""
+    global _beta_matrix
+    if _beta_matrix is None:
+        _beta_matrix = False
+        if USE_BETA_MATRIX:
+            try:
+                from beta_matrix import open_beta_matrix
+                _beta_matrix = open_beta_matrix(verbose=False) or False
+            except ImportError:
+                pass
+    return _beta_matrix or None
+
+
 def compute_beta_and_rs(kline, index_df, code):
     """Compute beta and relative strength for a stock vs index"""
     if index_df is None or code not in kline:
         return 1.0, 0.0, 0.0
+
+    # Date-aligned lookup as of the latest index date; the matrix must cover that date
+    matrix = get_beta_matrix()
+    if matrix is not None and len(index_df):
+        as_of = np.datetime64(index_df['date'].iloc[-1], 'D')
+        if matrix.dates[-1] >= as_of:
+            looked_up = matrix.beta_rs(code, as_of)
+            if looked_up is not None:
+                return looked_up
     
     idx_closes = index_df['close'].values
     idx_n = len(idx_closes)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数组化快速评估 - evaluate_v28 / evaluate_wf 的 Optuna 加速版
+
+每个 Optuna trial 都要把 daily_data 里成千上万个 stock dict 重新加权、排序、
+按行业上限/冷却期挑选，纯 Python 循环是 trial 的主要耗时。
+
+这里把 daily_data 一次性打包成数组（每个交易日一块连续的 子分数 × 股票 矩阵），
+每个 trial 只做：
+  1. 逐列向量化加权求和（按原表达式的运算顺序，一列一次）
+  2. argpartition 取前 K 名候选（并列值整体纳入，保持稳定排序），不足再扩展
+  3. 行业上限、冷却期用整数编码数组处理
+
+逐位一致：
+  原代码在 Python 标量上运算，子分数可能是 Python float / np.float32 / np.float64 混合，
+  numpy 2 (NEP 50) 与 numpy 1.x 的标量提升规则也不同。打包时记录每个值的「类型」，
+  运算时按同样的规则决定该元素用 float32 还是 float64 计算，比较同理，
+  因此加权分、排序、选股和 beat_idx 与原 Python 循环逐位一致。
+  遇到无法用数组复现的情况（分数含 NaN、同一天 float32 与其他类型混合排序）
+  当天退回 Python 排序，结果仍然一致。
+
+使用方法：
+    from fast_evaluator import pack_days
+    packed = pack_days(daily_data, NUM_KEYS, flags=FLAGS)   # 只打包一次
+    evaluate_wf(packed, params)                              # 各 evaluate 函数识别 PackedDays
+"""
+
+import numpy as np
+
+NEP50 = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+# 值的类型：Python 标量（NEP 50 下为弱类型）/ np.float32 / np.float64 及其他 numpy 数值
+KIND_PY, KIND_F32, KIND_F64 = 0, 1, 2
+_KINDS = {float: KIND_PY, int: KIND_PY, bool: KIND_PY,
+          np.float32: KIND_F32, np.float64: KIND_F64}
+
+NS_PER_DAY = 86400 * 10 ** 9
+
+# 前 K 名候选的默认规模（挑选时不够会自动扩展到全体）
+TOP_K = 32
+
+
+def _kind_of(v):
+    k = _KINDS.get(type(v))
+    if k is not None:
+        return k
+    if isinstance(v, np.generic):
+        return KIND_F32 if getattr(v, 'dtype', None) == np.float32 else KIND_F64
+    return KIND_PY
+
+
+# ============================================================================
+# 与标量运算逐位一致的逐元素运算
+# ============================================================================
+def _result_kind(ka, kb):
+    if NEP50:
+        # Python 标量是弱类型：py∘f32 → f32，任何∘f64 → f64
+        return np.maximum(ka, kb)
+    # numpy 1.x 纯标量运算：Python float 视为 float64，只有 f32∘f32 保持 float32
+    return np.where(np.asarray(ka) == kb, ka, KIND_F64)
+
+
+def _scalar_kind(k):
+    """0 维的类型统一成 int，便于走整列同类型的快速分支"""
+    if type(k) is int or (isinstance(k, np.ndarray) and k.ndim > 0):
+        return k
+    return int(k)
+
+
+def _as32(x):
+    return x.astype(np.float32) if isinstance(x, np.ndarray) else np.float32(x)
+
+
+def binop(fn, a, ka, b, kb):
+    """fn(a, b)，a/b 为 float64 数组或 Python 标量，ka/kb 为对应的类型（数组或整数）"""
+    ka, kb = _scalar_kind(ka), _scalar_kind(kb)
+    if type(ka) is int and type(kb) is int:
+        # 整列类型相同（最常见）：整列一种精度
+        k = max(ka, kb) if NEP50 else (ka if ka == kb else KIND_F64)
+        if k != KIND_F32:
+            return fn(a, b), k
+        return np.asarray(fn(_as32(a), _as32(b)), dtype=np.float64), k
+    # 元素类型不一：先整列 float64，再把 float32 元素按 float32 重算
+    k = np.asarray(_result_kind(ka, kb), dtype=np.int8)
+    out = np.asarray(fn(np.asarray(a, dtype=np.float64), b), dtype=np.float64)
+    m = k == KIND_F32
+    if m.any():
+        a32 = a[m].astype(np.float32) if isinstance(a, np.ndarray) else np.float32(a)
+        b32 = b[m].astype(np.float32) if isinstance(b, np.ndarray) else np.float32(b)
+        out[m] = fn(a32, b32)
+    if k.shape != out.shape:
+        k = np.broadcast_to(k, out.shape)
+    return out, k
+
+
+def compare(fn, a, ka, thr):
+    """fn(a, thr)，thr 为 Python 标量；NEP 50 下 float32 元素用 float32(thr) 比较"""
+    ka = _scalar_kind(ka)
+    if type(ka) is int:
+        if NEP50 and ka == KIND_F32:
+            return fn(a.astype(np.float32), np.float32(thr))
+        return fn(a, thr)
+    out = fn(a, thr)
+    if NEP50:
+        m = ka == KIND_F32
+        if m.any():
+            out = np.array(out, dtype=bool)
+            out[m] = fn(a[m].astype(np.float32), np.float32(thr))
+    return out
+
+
+class Scores:
+    """一列分数 + 每个元素的类型；运算符语义与逐个 Python 标量运算相同
+
+    与 Python 标量（权重、阈值）运算时标量视为 Python 类型，
+    比较返回 bool 数组，where 系列对应原代码中的 `if cond: score += x`。
+    """
+    __slots__ = ('v', 'k')
+
+    def __init__(self, v, k):
+        self.v = v
+        self.k = k
+
+    @staticmethod
+    def _unpack(x):
+        if isinstance(x, Scores):
+            return x.v, x.k
+        return x, KIND_PY
+
+    def _op(self, fn, other, reflected=False):
+        b, kb = self._unpack(other)
+        if reflected:
+            return Scores(*binop(fn, b, kb, self.v, self.k))
+        return Scores(*binop(fn, self.v, self.k, b, kb))
+
+    def __add__(self, other):
+        return self._op(np.add, other)
+
+    def __radd__(self, other):
+        return self._op(np.add, other, True)
+
+    def __sub__(self, other):
+        return self._op(np.subtract, other)
+
+    def __mul__(self, other):
+        return self._op(np.multiply, other)
+
+    def __rmul__(self, other):
+        return self._op(np.multiply, other, True)
+
+    def __truediv__(self, other):
+        return self._op(np.true_divide, other)
+
+    def __abs__(self):
+        return Scores(np.abs(self.v), self.k)
+
+    def __lt__(self, thr):
+        return compare(np.less, self.v, self.k, thr)
+
+    def __le__(self, thr):
+        return compare(np.less_equal, self.v, self.k, thr)
+
+    def __gt__(self, thr):
+        return compare(np.greater, self.v, self.k, thr)
+
+    def __ge__(self, thr):
+        return compare(np.greater_equal, self.v, self.k, thr)
+
+    def where(self, mask, other):
+        """mask 处取 other，其余保持"""
+        o = other if isinstance(other, Scores) else Scores(*self._unpack(other))
+        if type(o.k) is int and type(self.k) is int and o.k == self.k:
+            k = self.k
+        else:
+            k = np.where(mask, o.k, self.k).astype(np.int8)
+        return Scores(np.where(mask, o.v, self.v), k)
+
+    def add_where(self, mask, x):
+        return self.where(mask, self + x) if mask.any() else self
+
+    def sub_where(self, mask, x):
+        return self.where(mask, self - x) if mask.any() else self
+
+    def mul_where(self, mask, x):
+        return self.where(mask, self * x) if mask.any() else self
+
+
+def materialize(vals, kinds):
+    """还原成原始类型的 Python/numpy 标量（用于退回 Python 排序）"""
+    kinds = np.broadcast_to(kinds, vals.shape)
+    return [np.float32(v) if k == KIND_F32 else (np.float64(v) if k == KIND_F64 else v)
+            for v, k in zip(vals.tolist(), kinds.tolist())]
+
+
+# ============================================================================
+# 排序：与 list.sort(key=score, reverse=True) 相同的顺序
+# ============================================================================
+class Ranking:
+    """按分数降序、并列保持原顺序的惰性排名
+
+    先用 argpartition 取前 k 名（与第 k 名并列的全部纳入），只对这部分排序；
+    迭代超出时再排序剩余部分，拼起来就是完整的稳定降序。
+    monotone=True 表示分数严格按降序排列，「低于阈值」之后可以直接 break。
+    """
+
+    def __init__(self, scores, k=TOP_K):
+        vals, kinds = scores.v, scores.k
+        self.vals = vals
+        n = len(vals)
+        # NEP 50 下 float32 与其他类型比较会把对方舍入到 float32，混合时退回 Python 排序
+        is32 = np.asarray(kinds) == KIND_F32
+        mixed = NEP50 and is32.any() and not is32.all()
+        self.monotone = not (mixed or np.isnan(vals).any())
+        if not self.monotone:
+            objs = materialize(vals, kinds)
+            self.head = np.array(sorted(range(n), key=objs.__getitem__, reverse=True), dtype=np.int64)
+            self.rest = np.zeros(0, dtype=np.int64)
+        elif n <= k:
+            self.head = np.argsort(-vals, kind='stable')
+            self.rest = np.zeros(0, dtype=np.int64)
+        else:
+            kth = vals[np.argpartition(vals, n - k)[n - k]]
+            top = np.flatnonzero(vals >= kth)
+            self.head = top[np.argsort(-vals[top], kind='stable')]
+            self.rest = None
+            self._kth = kth
+
+    def _tail(self):
+        if self.rest is None:
+            low = np.flatnonzero(self.vals < self._kth)
+            self.rest = low[np.argsort(-self.vals[low], kind='stable')]
+        return self.rest
+
+    def __iter__(self):
+        for i in self.head.tolist():
+            yield i
+        for i in self._tail().tolist():
+            yield i
+
+
+# ============================================================================
+# 打包
+# ============================================================================
+class PackedDay:
+    """一个交易日：子分数矩阵 (K × n)、各列类型（整列相同时为标量）、标志位、整数编码"""
+    __slots__ = ('meta', 'n', 'keys', 'mat', 'kinds', 'flags', 'code_id', 'ind_id',
+                 'ret', 'has_ret')
+
+    def col(self, key):
+        i = self.keys[key]
+        return Scores(self.mat[i], self.kinds[i])
+
+
+class PackedDays:
+    """打包后的 daily_data；evaluate 函数遇到此类型时走数组路径"""
+
+    def __init__(self, days, codes, industries):
+        self.days = days
+        self.codes = codes
+        self.industries = industries
+
+    def __len__(self):
+        return len(self.days)
+
+    def __add__(self, other):
+        """与 list 相加语义一致（A + B 拼接期间）"""
+        if not isinstance(other, PackedDays) or other.codes is not self.codes:
+            raise TypeError('只能拼接同一次 pack_days 打包的数据')
+        return PackedDays(self.days + other.days, self.codes, self.industries)
+
+
+def pack_days(daily_data, num_keys, defaults=None, flags=None, codebook=None):
+    """把 daily_data 打包成 PackedDays（打包一次，所有 trial 复用）
+
+    Args:
+        num_keys: 参与运算/比较的数值字段
+        defaults: {字段: 缺省值}，对应原代码中的 s.get(key, default)
+        flags: {名称: fn(stock) -> bool}，如 trend_dir == 'strong_down'
+        codebook: (codes, industries) 编码表，多个期间共用时传入同一个，便于拼接
+    """
+    defaults = defaults or {}
+    flags = flags or {}
+    if codebook is None:
+        codebook = ({}, {})
+    code_map, ind_map = codebook
+    keys = {k: i for i, k in enumerate(num_keys)}
+
+    days = []
+    for dd in daily_data:
+        stocks = dd['stocks']
+        n = len(stocks)
+        day = PackedDay()
+        day.meta = {k: v for k, v in dd.items() if k != 'stocks'}
+        day.n = n
+        day.keys = keys
+        day.mat = np.empty((len(num_keys), n), dtype=np.float64)
+        day.kinds = []
+        for key, i in keys.items():
+            if key in defaults:
+                d = defaults[key]
+                raw = [s.get(key, d) for s in stocks]
+            else:
+                raw = [s[key] for s in stocks]
+            kinds = np.fromiter((_kind_of(v) for v in raw), dtype=np.int8, count=n)
+            uniform = n > 0 and (kinds == kinds[0]).all()
+            day.kinds.append(int(kinds[0]) if uniform else kinds)
+            day.mat[i] = [np.nan if v is None else v for v in raw]
+        day.flags = {name: np.fromiter((bool(fn(s)) for s in stocks), dtype=bool, count=n)
+                     for name, fn in flags.items()}
+        day.code_id = np.fromiter((code_map.setdefault(s['code'], len(code_map)) for s in stocks),
+                                  dtype=np.int64, count=n)
+        day.ind_id = np.fromiter((ind_map.setdefault(s['industry'], len(ind_map)) for s in stocks),
+                                 dtype=np.int64, count=n)
+        rets = [s['stock_return'] for s in stocks]
+        day.has_ret = np.fromiter((r is not None for r in rets), dtype=bool, count=n)
+        day.ret = rets
+        days.append(day)
+    return PackedDays(days, code_map, ind_map)
+
+
+def ret_mean(day, selected):
+    """np.mean(非 None 的 stock_return)，与原实现相同的求和顺序"""
+    rets = [day.ret[i] for i in selected if day.ret[i] is not None]
+    if not rets:
+        return None
+    return np.mean(rets)
+
+
+# ============================================================================
+# 冷却期（整数编码）
+# ============================================================================
+class CooldownArray:
+    """CooldownTracker 的数组版：按 code_id 记录上次推荐日期（ns）"""
+
+    def __init__(self, cooldown_days):
+        self.cooldown_days = cooldown_days
+        self.last_ns = np.zeros(0, dtype=np.int64)
+        self.seen = np.zeros(0, dtype=bool)
+
+    def _grow(self, ids):
+        need = int(ids.max()) + 1 if len(ids) else 0
+        if need > len(self.seen):
+            size = max(need, 2 * len(self.seen))
+            self.last_ns = np.concatenate([self.last_ns, np.zeros(size - len(self.last_ns), np.int64)])
+            self.seen = np.concatenate([self.seen, np.zeros(size - len(self.seen), bool)])
+
+    def days_since(self, ids, date_ns):
+        self._grow(ids)
+        return (date_ns - self.last_ns[ids]) // NS_PER_DAY, self.seen[ids]
+
+    def cooled(self, ids, date_ns):
+        """is_cooled_down"""
+        ds, seen = self.days_since(ids, date_ns)
+        return ~seen | (ds >= self.cooldown_days)
+
+    def penalty(self, ids, date_ns):
+        """get_freshness_penalty"""
+        ds, seen = self.days_since(ids, date_ns)
+        active = seen & (ds < self.cooldown_days)
+        return np.where(active, (self.cooldown_days - ds) / self.cooldown_days * 10, 0.0)
+
+    def mark(self, ids, date_ns):
+        ids = np.asarray(ids, dtype=np.int64)
+        self._grow(ids)
+        self.last_ns[ids] = date_ns
+        self.seen[ids] = True
+
+
+def date_ns(date):
+    """pd.Timestamp / datetime → ns 整数（与 Timestamp 相减后 .days 的取整一致）"""
+    return int(np.datetime64(date, 'ns').astype(np.int64))
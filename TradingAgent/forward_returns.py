@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+远期收益表 — get_stock_return / get_index_return 的预计算版
+
+backtest_v22~v28 的 get_stock_return(df, date) / get_index_return(index_df, date)
+每次调用都做一次 df[df['date'] >= date] 掩码再取 .iloc[0] / .iloc[1]，
+precompute 每天对每只股票调用一次，另外每天还要为校验交易日调用一次指数版本。
+这里把收益一次算成 (股票 × 交易日) 表，之后按 (代码, 日期) 查表：
+
+  1. K线按日期对齐到同一条交易日轴（面板 / 列式存储 / DataFrame 字典均可），缺失为 NaN
+  2. 每个交易日 g 的 T+h 收益 = 第 g+h 个交易日当天或之后第一根K线的收盘价 / 第 g 日收盘价 − 1
+     （停牌时顺延到复牌日卖出）；第 g 日本身停牌（买不进）或之后再无K线时为 NaN
+  3. 查询日期不是交易日时取之后第一个交易日（与 df['date'] >= date 一致）；
+     before=True 取之前最后一个交易日（"昨收 → 当日" 收益）
+  4. 每个周期的矩阵按需计算并缓存，T+1/T+2/T+3/T+5 共用同一份对齐后的收盘价
+
+与旧函数的差异：股票在查询日停牌时旧实现会顺延到复牌日买入，这里记为 NaN（不可交易）；
+其余情况 T+1 收益与旧实现逐位一致。
+
+使用方法：
+    from forward_returns import get_forward_returns, index_return, to_optional
+    table = get_forward_returns(panel)            # 或 {code: DataFrame}，同一数据只算一次
+    table.get('600000', '2026-03-02', horizon=3)  # float，缺失为 NaN
+    day_ret = table.day_returns(test_date)        # {code: T+1收益或None}
+    index_return(index_df, test_date)             # 指数 T+1 收益或 None
+"""
+
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+HORIZONS = (1, 2, 3, 5)
+
+
+def _to_day(date):
+    """任意日期表示 → datetime64[D]"""
+    if isinstance(date, np.datetime64):
+        return date.astype('datetime64[D]')
+    return np.datetime64(pd.Timestamp(date).normalize().date(), 'D')
+
+
+def to_optional(value):
+    """NaN → None，其余转 float（兼容旧函数返回 None 的调用方）"""
+    value = float(value)
+    return None if value != value else value
+
+
+def forward_return_matrix(close, horizon):
+    """按日期对齐的收盘价 (股票数 × 交易日数) → T+horizon 收益(%)，规则见模块说明"""
+    close = np.asarray(close, dtype=np.float64)
+    S, G = close.shape
+    out = np.full((S, G), np.nan)
+    if horizon >= G:
+        return out
+    valid = np.isfinite(close)
+    # nxt[:, g] = g 列及之后第一根K线所在列，没有则为 G
+    nxt = np.where(valid, np.arange(G), G)
+    nxt = np.minimum.accumulate(nxt[:, ::-1], axis=1)[:, ::-1]
+
+    exit_col = nxt[:, horizon:]
+    buy = close[:, :G - horizon]
+    sell = np.take_along_axis(close, np.minimum(exit_col, G - 1), axis=1)
+    ok = (exit_col < G) & valid[:, :G - horizon] & (buy != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret = (sell - buy) / buy * 100
+    out[:, :G - horizon] = np.where(ok, ret, np.nan)
+    return out
+
+
+class ForwardReturns:
+    """(股票 × 交易日) 远期收益表，按 (代码, 日期, 周期) 查询"""
+
+    def __init__(self, codes, dates, close):
+        self.codes = list(codes)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.close = np.asarray(close, dtype=np.float64)
+        self.index = {c: i for i, c in enumerate(self.codes)}
+        self._mats = {}
+
+    @classmethod
+    def from_panel(cls, panel):
+        """从 panel_engine.KlinePanel 构建：按 count_before 把左对齐的K线放回日期轴"""
+        S, G = len(panel.codes), len(panel.dates)
+        cb = panel.count_before
+        traded = cb[:, 1:] > cb[:, :-1]               # dates[g] 当天有K线
+        pos = np.minimum(cb[:, :G], max(panel.width - 1, 0)).astype(np.int64)
+        close = np.full((S, G), np.nan)
+        if S and G and panel.width:
+            close = np.where(traded, np.take_along_axis(panel.values['close'], pos, axis=1), np.nan)
+        dates = panel.dates.astype('datetime64[ns]').astype('datetime64[D]')
+        return cls(panel.codes, dates, close)
+
+    @classmethod
+    def from_frames(cls, frames):
+        """从 {code: DataFrame[date, close]} 构建，日期轴为全部K线日期的并集"""
+        codes = list(frames)
+        stock_dates = [frames[c]['date'].values.astype('datetime64[D]') for c in codes]
+        dates = np.unique(np.concatenate(stock_dates)) if codes else np.zeros(0, dtype='datetime64[D]')
+        close = np.full((len(codes), len(dates)), np.nan)
+        for i, (code, d) in enumerate(zip(codes, stock_dates)):
+            values = pd.to_numeric(frames[code]['close'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            close[i, np.searchsorted(dates, d)] = values
+        return cls(codes, dates, close)
+
+    @classmethod
+    def from_store(cls, store):
+        """从 kline_store.KlineStore 构建（收盘价矩阵本身已按日期对齐）"""
+        return cls(store.codes, store.dates, store.matrix('close'))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def matrix(self, horizon=1):
+        """T+horizon 收益矩阵 (股票数 × 交易日数)，首次访问时计算"""
+        mat = self._mats.get(horizon)
+        if mat is None:
+            mat = forward_return_matrix(self.close, horizon)
+            self._mats[horizon] = mat
+        return mat
+
+    def column(self, date, before=False):
+        """date 当日或之后第一个交易日（before=True：之前最后一个交易日）的列号，越界返回 None"""
+        g = int(np.searchsorted(self.dates, _to_day(date), side='left'))
+        if before:
+            g -= 1
+        return g if 0 <= g < len(self.dates) else None
+
+    def get(self, code, date, horizon=1, before=False):
+        """单只股票的 T+horizon 收益(%)，缺失为 NaN"""
+        i = self.index.get(code)
+        g = self.column(date, before=before)
+        if i is None or g is None:
+            return np.nan
+        return float(self.matrix(horizon)[i, g])
+
+    def day(self, date, horizon=1, rows=None, before=False):
+        """某日全部（或 rows 指定的）股票的 T+horizon 收益数组，缺失为 NaN"""
+        g = self.column(date, before=before)
+        n = len(self.codes) if rows is None else len(rows)
+        if g is None:
+            return np.full(n, np.nan)
+        col = self.matrix(horizon)[:, g]
+        return col if rows is None else col[rows]
+
+    def day_returns(self, date, horizon=1, before=False):
+        """{code: 收益或 None}，供逐只循环的旧 precompute 路径使用"""
+        values = self.day(date, horizon, before=before).tolist()
+        return {code: (None if v != v else v) for code, v in zip(self.codes, values)}
+
+
+# ============================================================================
+# 进程内缓存：同一份数据只构建一次
+# ============================================================================
+# 面板缓存在 panel._cache；列式存储按弱引用缓存（存储释放后自动清除）；
+# DataFrame / {code: DataFrame} 按 id 缓存，不持有源对象，只保留最近 MAX_FRAME_TABLES 份
+MAX_FRAME_TABLES = 4
+_STORE_TABLES = weakref.WeakKeyDictionary()
+_FRAME_TABLES = OrderedDict()  # id(source) -> (弱引用或 None, 签名, ForwardReturns)
+
+
+def _frames_signature(frames):
+    """(股票数, 总行数, 最后日期)：追加或删减K线后签名随之变化"""
+    if isinstance(frames, pd.DataFrame):
+        frames = {'index': frames}
+    rows, last = 0, None
+    for df in frames.values():
+        n = len(df)
+        rows += n
+        if n:
+            day = _to_day(df['date'].iat[-1])
+            last = day if last is None or day > last else last
+    return len(frames), rows, last
+
+
+def _cached(source, build):
+    """按对象 id 缓存，签名不一致（数据有追加）或对象已被替换时重建"""
+    key = id(source)
+    sig = _frames_signature(source)
+    hit = _FRAME_TABLES.get(key)
+    if hit is not None:
+        ref, hit_sig, table = hit
+        if hit_sig == sig and (ref is None or ref() is source):
+            _FRAME_TABLES.move_to_end(key)
+            return table
+    table = build(source)
+    try:
+        ref = weakref.ref(source)
+    except TypeError:  # dict 不支持弱引用，仅靠签名判断
+        ref = None
+    _FRAME_TABLES[key] = (ref, sig, table)
+    _FRAME_TABLES.move_to_end(key)
+    while len(_FRAME_TABLES) > MAX_FRAME_TABLES:
+        _FRAME_TABLES.popitem(last=False)
+    return table
+
+
+def get_forward_returns(source):
+    """KlinePanel / KlineStore / {code: DataFrame} → ForwardReturns（同一数据只构建一次）"""
+    if hasattr(source, 'count_before'):
+        table = source._cache.get('forward_returns')
+        if table is None:
+            table = ForwardReturns.from_panel(source)
+            source._cache['forward_returns'] = table
+        return table
+    if hasattr(source, 'matrix'):
+        table = _STORE_TABLES.get(source)
+        if table is None:
+            table = ForwardReturns.from_store(source)
+            _STORE_TABLES[source] = table
+        return table
+    return _cached(source, ForwardReturns.from_frames)
+
+
+def index_forward_returns(index_df):
+    """指数 DataFrame[date, close] 的远期收益表（单行，代码为 'index'）"""
+    return _cached(index_df, lambda df: ForwardReturns.from_frames({'index': df}))
+
+
+def index_return(index_df, date, horizon=1, before=False):
+    """指数 T+horizon 收益(%)，无数据返回 None；与 get_index_return(index_df, date) 语义一致"""
+    if index_df is None or len(index_df) == 0:
+        return None
+    return to_optional(index_forward_returns(index_df).get('index', date, horizon, before=before))
@@ -256,6 +256,16 @@ def get_real_industry(stock_code, stock_data, comprehensive_data=None):
     if stock_code in code_industry_map:
         return code_industry_map[stock_code]
 
+    # 方法3.5: 板块倒排索引（东方财富行业板块成分，与热门板块加分共用，每日刷新）
+    try:
+        from sector_membership import get_sector_index
+        industries = get_sector_index().industries_of(stock_code)
+        if industries:
+            method_used = 'sector_index'
+            return sorted(industries)[0]
+    except Exception:
+        pass
+
     # 方法4: 使用 akshare 实时查询（最后手段）
     try:
         import akshare as ak
@@ -554,6 +564,15 @@ if __name__ == '__main__':
             for name, change in top_sectors:
                 print(f'  {name}: {change:+.2f}%' if isinstance(change, float) else f'  {name}: {change}')
         
+        # 筹码面：一次性批量计算全部股票（K线列式存储 + 矩阵运算），循环内查表
+        chip_table = None
+        if analyzer.chip_analyzer:
+            try:
+                print('\n[INFO] 正在批量计算筹码健康度...')
+                chip_table = analyzer.chip_analyzer.analyze_batch(safe_codes)
+            except Exception as e:
+                print(f'[WARN] 批量筹码分析失败，改为逐只计算: {e}')
+        
         # 重新计算每只股票的基础评分
         print('\n' + '='*60)
         print('开始重新计算评分（基于缓存数据）...')
@@ -591,7 +610,10 @@ if __name__ == '__main__':
                 
                 # 2. 筹码面评分
                 chip_score = 5.0
-                if analyzer.chip_analyzer:
+                if chip_table is not None and code in chip_table.index:
+                    if chip_table.at[code, 'health_score'] > 0:
+                        chip_score = float(chip_table.at[code, 'health_score'])
+                elif analyzer.chip_analyzer:
                     try:
                         chip_result = analyzer.chip_analyzer.analyze_stock(code)
                         if not chip_result.get('error') and chip_result.get('health_score', 0) > 0:
@@ -313,6 +313,12 @@ class HotSectorTracker:
             })
 
         self.cache.set(cache_key, stocks)
+        # 顺带写入板块倒排索引，供热门板块加分 / 行业查询共用
+        try:
+            from sector_membership import get_sector_index
+            get_sector_index().record(sector_type, sector_name, [s['code'] for s in stocks], save=True)
+        except Exception as e:
+            logger.warning(f"板块索引写入失败: {e}")
         return stocks
 
     # ───────────────────────────────────────────
@@ -25,6 +25,8 @@ _SHARED_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..
 if _SHARED_DIR not in sys.path:
     sys.path.insert(0, _SHARED_DIR)
 
+from llm_cache import get_llm_cache
+
 
 def _load_config():
     """延迟加载config，避免循环导入"""
@@ -113,16 +115,21 @@ def _get_providers():
 class LLMClient:
     """统一LLM客户端，自动fallback"""
 
-    def __init__(self, timeout: int = 30, max_retries: int = 1):
+    def __init__(self, timeout: int = 30, max_retries: int = 1, use_cache: bool = True):
         self.timeout = timeout
         self.max_retries = max_retries
+        self.use_cache = use_cache
         self._last_provider = None
 
     def chat(self, system_prompt: str, user_prompt: str,
-             temperature: float = 0.3, max_tokens: int = 2000) -> Optional[str]:
+             temperature: float = 0.3, max_tokens: int = 2000,
+             use_cache: Optional[bool] = None) -> Optional[str]:
         """
         发送对话请求，自动 fallback
 
+        Args:
+            use_cache: 是否使用本地响应缓存，默认取实例设置；False 时强制请求并覆盖缓存
+
         Returns:
             LLM 响应文本，失败返回 None
         """
@@ -133,12 +140,22 @@ class LLMClient:
 
         providers = _get_providers()
 
+        cache = get_llm_cache()
+        keys = {p['name']: cache.key(p['name'], p['model'], system_prompt, user_prompt, temperature, max_tokens)
+                for p in providers}
+        if self.use_cache if use_cache is None else use_cache:
+            hit_key, cached = cache.get_any(keys.values())
+            if cached is not None:
+                self._last_provider = next(name for name, k in keys.items() if k == hit_key)
+                return cached
+
         for provider in providers:
             for attempt in range(self.max_retries):
                 try:
                     result = self._call_openai(provider, messages, temperature, max_tokens)
                     if result:
                         self._last_provider = provider['name']
+                        cache.put(keys[provider['name']], result, provider['name'], provider['model'])
                         return result
                 except requests.exceptions.Timeout:
                     logger.warning(f"[{provider['name']}] 超时 (attempt {attempt+1})")
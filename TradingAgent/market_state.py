@@ -16,9 +16,11 @@
 
 import json
 import os
+import sys
 import numpy as np
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
 DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 KLINE_CACHE = os.path.join(DATA_DIR, 'kline_cache')
 
@@ -209,18 +211,41 @@ def detect_market_state(index_data=None):
     }
 
 
-def calc_beta(stock_closes: list, index_closes: list, window: int = 20) -> float:
+def _matrix_value(code, date, name):
+    """从全市场 Beta 矩阵 (TradingShared/beta_matrix.py) 查 date 当日（含）的值，查不到返回 None"""
+    if code is None:
+        return None
+    try:
+        from beta_matrix import open_beta_matrix
+        matrix = open_beta_matrix(verbose=False)
+    except ImportError:
+        return None
+    if matrix is None:
+        return None
+    values = matrix.get(code, date)
+    if values is None or name not in values:
+        return None
+    return values[name]
+
+
+def calc_beta(stock_closes: list, index_closes: list, window: int = 20,
+              code: str = None, date=None) -> float:
     """计算个股相对指数的Beta值
     
     Args:
         stock_closes: 个股收盘价列表（从旧到新）
         index_closes: 指数收盘价列表（从旧到新）
         window: 计算窗口（天数）
+        code/date: 给出股票代码时优先查全市场矩阵（按日期对齐，date 为空取最新交易日）
     
     Returns:
         beta值，默认1.0
     """
     import numpy as np
+    if window == 20:
+        beta = _matrix_value(code, date, 'beta')
+        if beta is not None:
+            return round(beta, 3) if np.isfinite(beta) else 1.0
     try:
         if len(stock_closes) < window + 1 or len(index_closes) < window + 1:
             return 1.0
@@ -242,12 +267,18 @@ def calc_beta(stock_closes: list, index_closes: list, window: int = 20) -> float
         return 1.0
 
 
-def calc_relative_strength(stock_closes: list, index_closes: list, days: int = 20) -> float:
+def calc_relative_strength(stock_closes: list, index_closes: list, days: int = 20,
+                           code: str = None, date=None) -> float:
     """计算相对强度（个股涨幅 - 指数涨幅）
     
+    code/date 同 calc_beta，days 为 3/5/20 时优先查全市场矩阵
+    
     Returns:
         相对强度百分比，正值表示跑赢指数
     """
+    rs = _matrix_value(code, date, f'rs{days}')
+    if rs is not None:
+        return round(rs, 2) if np.isfinite(rs) else 0.0
     try:
         if len(stock_closes) < days + 1 or len(index_closes) < days + 1:
             return 0.0
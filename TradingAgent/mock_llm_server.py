@@ -0,0 +1,155 @@
+"""
+本地 mock LLM 服务 - 测试 Agent 辩论并发调度
+==============================================
+OpenAI 兼容的 /v1/chat/completions 接口，每个请求固定延迟后返回：
+  - 研究经理裁决（system 中含 rating）→ 评级 JSON
+  - 投资组合经理决策（system 中含 final_decision）→ 决策 JSON
+  - 其他 → 一段固定文本
+
+用法:
+    python mock_llm_server.py serve --port 8765 --latency 0.5
+    python agent_debate.py --mock-llm http://127.0.0.1:8765 --result-json xxx.json
+
+    python mock_llm_server.py bench --stocks 4 --latency 0.2   # 串行 vs 并发耗时对比
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+JUDGE_REPLY = {"rating": "增持", "confidence": 0.6, "summary": "mock 裁决", "key_points": ["a", "b", "c"]}
+PM_REPLY = {
+    "final_decision": "增持", "position_size": "标准", "target_return_pct": 6, "stop_loss_pct": 3,
+    "time_horizon": "短线(1-5天)", "key_risk": "mock 风险", "rationale": "mock 决策",
+}
+
+
+def mock_provider(url: str, name: str = 'MockLLM') -> dict:
+    """指向 mock 服务的 provider 配置（格式同 llm.base_client._get_providers）"""
+    return {
+        'name': name,
+        'api_key': 'mock',
+        'api_url': url.rstrip('/') + '/v1/chat/completions',
+        'model': 'mock',
+        'type': 'openai',
+        'verify_ssl': False,
+    }
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.5
+    stats = {'requests': 0, 'in_flight': 0, 'max_in_flight': 0}
+    stats_lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        system = next((m.get('content', '') for m in body.get('messages', []) if m.get('role') == 'system'), '')
+
+        cls = type(self)
+        with cls.stats_lock:
+            cls.stats['requests'] += 1
+            cls.stats['in_flight'] += 1
+            cls.stats['max_in_flight'] = max(cls.stats['max_in_flight'], cls.stats['in_flight'])
+        try:
+            time.sleep(cls.latency)
+        finally:
+            with cls.stats_lock:
+                cls.stats['in_flight'] -= 1
+
+        if 'final_decision' in system:
+            content = json.dumps(PM_REPLY, ensure_ascii=False)
+        elif 'rating' in system:
+            content = json.dumps(JUDGE_REPLY, ensure_ascii=False)
+        else:
+            content = "mock 发言：" + system[:20]
+        data = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': content}}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int = 0, latency: float = 0.5):
+    """后台线程启动 mock 服务，返回 (server, url)；port=0 时随机端口"""
+    handler = type('Handler', (MockLLMHandler,), {
+        'latency': latency,
+        'stats': {'requests': 0, 'in_flight': 0, 'max_in_flight': 0},
+        'stats_lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _fake_stock(i: int) -> dict:
+    return {
+        'code': f"60000{i}", 'name': f"测试{i}", 'industry': '测试行业', 'final_score': 55 + i,
+        'scores': {'trend': 60, 'money_flow': 6, 'sector': 50, 'relative_strength': 55,
+                   'volume_health': 50, 'risk_adjustment': 0},
+        'trend_direction': 'up', 'ret_20d': 5.0, 'market_cap_yi': 80, 'buy_price': 10.0,
+        'divergence': {'bullish': 1, 'bearish': 0},
+    }
+
+
+def bench(stocks: int = 4, latency: float = 0.2, debate_rounds: int = 3, risk_rounds: int = 2,
+          provider_concurrency: int = 8):
+    """同一 mock 服务上对比串行与并发辩论的端到端耗时"""
+    from agent_debate import AgentDebateSystem, summarize_stage_latency
+
+    server, url = start_server(latency=latency)
+    recs = [_fake_stock(i) for i in range(stocks)]
+    market = {'regime': 'range', 'risk': 3}
+    try:
+        for concurrent in (False, True):
+            server.RequestHandlerClass.stats.update(requests=0, max_in_flight=0)
+            system = AgentDebateSystem(debate_rounds=debate_rounds, risk_rounds=risk_rounds, verbose=False,
+                                       concurrent=concurrent, provider_concurrency=provider_concurrency,
+                                       providers=[mock_provider(url)], use_cache=False)
+            t0 = time.time()
+            results = system.debate_candidates(recs, market, top_n=stocks)
+            elapsed = time.time() - t0
+            stats = server.RequestHandlerClass.stats
+            errors = sum(1 for r in results if 'error' in r)
+            print(f"{'并发' if concurrent else '串行'}: {elapsed:.2f}s | 请求 {stats['requests']} | "
+                  f"最大在途 {stats['max_in_flight']} | 失败 {errors}")
+            print("  分阶段 (平均/最大): " + " | ".join(summarize_stage_latency(results)))
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 mock LLM 服务')
+    sub = parser.add_subparsers(dest='cmd')
+    p_serve = sub.add_parser('serve', help='启动 mock 服务')
+    p_serve.add_argument('--port', type=int, default=8765)
+    p_serve.add_argument('--latency', type=float, default=0.5, help='每个请求的模拟耗时（秒）')
+    p_bench = sub.add_parser('bench', help='串行 vs 并发辩论耗时对比')
+    p_bench.add_argument('--stocks', type=int, default=4)
+    p_bench.add_argument('--latency', type=float, default=0.2)
+    p_bench.add_argument('--provider-concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.cmd == 'serve':
+        server, url = start_server(args.port, args.latency)
+        print(f"mock LLM 服务: {url}/v1/chat/completions (延迟 {args.latency}s)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif args.cmd == 'bench':
+        bench(args.stocks, args.latency, provider_concurrency=args.provider_concurrency)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -51,6 +51,11 @@ except ImportError:
     GEMINI_API_URL = ""
     GEMINI_MODEL_NAME = ""
 
+from llm_cache import get_llm_cache
+
+# batch_analyze 默认走抓取/分析两级流水线（news_pipeline），多只股票打包进一个 LLM 提示词
+USE_NEWS_PIPELINE = True
+
 
 class NewsAnalyzer:
     """个股新闻情绪分析器
@@ -63,21 +68,25 @@ class NewsAnalyzer:
         model_name: 使用的模型名称
         request_delay: 请求间隔时间（秒）
         max_retries: 最大重试次数
+        use_cache: 是否使用本地LLM响应缓存（同一批新闻重复分析时直接命中）
     """
 
-    def __init__(self, api_key: str = None, api_url: str = None, model_name: str = None):
+    def __init__(self, api_key: str = None, api_url: str = None, model_name: str = None,
+                 use_cache: bool = True):
         """初始化新闻分析器
 
         Args:
             api_key: DeepSeek API密钥，默认从配置文件读取
             api_url: DeepSeek API地址，默认从配置文件读取
             model_name: 模型名称，默认从配置文件读取
+            use_cache: 是否使用本地LLM响应缓存，默认启用
         """
         self.api_key = api_key or DEEPSEEK_API_KEY
         self.api_url = api_url or DEEPSEEK_API_URL
         self.model_name = model_name or DEEPSEEK_MODEL_NAME
         self.request_delay = 1.0  # 请求间隔1秒
         self.max_retries = 2  # 最大重试2次
+        self.use_cache = use_cache
 
         # 多API fallback链: 智谱 → DeepSeek → Gemini
         self._api_fallbacks = []
@@ -280,10 +289,11 @@ class NewsAnalyzer:
             print(f"[东方财富API] 获取新闻失败: {e}")
             return []
 
-    def _call_deepseek_api(self, prompt: str, retry_count: int = 0) -> Optional[Dict]:
+    def _call_deepseek_api(self, prompt: str, retry_count: int = 0, parser=None) -> Optional[Dict]:
         """调用LLM API (带多provider fallback)
 
         按顺序尝试: 主API → DeepSeek → Gemini → 智谱备选
+        parser: 响应解析函数 (content, provider_name) → 结果，默认 _parse_llm_response
         """
         import requests
 
@@ -304,9 +314,16 @@ class NewsAnalyzer:
             {"role": "user", "content": prompt},
         ]
 
+        # 本地缓存：fallback 链上任一 provider 曾成功分析过同一提示词即直接返回
+        if self.use_cache:
+            keys = [self._cache_key(api_conf, messages) for api_conf in apis_to_try]
+            hit_key, cached = get_llm_cache().get_any(keys)
+            if cached is not None:
+                return (parser or self._parse_llm_response)(cached, apis_to_try[keys.index(hit_key)]['name'])
+
         for api_conf in apis_to_try:
             try:
-                result = self._call_single_api(api_conf, messages)
+                result = self._call_single_api(api_conf, messages, parser)
                 if result:
                     return result
             except Exception as e:
@@ -316,15 +333,31 @@ class NewsAnalyzer:
         print(f"[LLM] 所有API均失败，返回中性评分")
         return None
 
-    def _call_single_api(self, api_conf: dict, messages: list) -> Optional[Dict]:
+    def _cache_key(self, api_conf: dict, messages: list) -> str:
+        """LLM 缓存键: (provider, model, system, user, temperature, max_tokens)"""
+        system_msg = next((m['content'] for m in messages if m['role'] == 'system'), '')
+        user_msg = next((m['content'] for m in messages if m['role'] == 'user'), '')
+        return get_llm_cache().key(api_conf['name'], api_conf.get('model', ''), system_msg, user_msg,
+                                   AI_TEMPERATURE, AI_MAX_TOKENS)
+
+    def _cache_response(self, api_conf: dict, messages: list, content: str, parsed):
+        """只缓存解析成功的响应"""
+        if isinstance(parsed, dict) and parsed.get('reason') == 'LLM响应格式异常':
+            return
+        if content and parsed:
+            get_llm_cache().put(self._cache_key(api_conf, messages), content,
+                                api_conf['name'], api_conf.get('model', ''))
+
+    def _call_single_api(self, api_conf: dict, messages: list, parser=None) -> Optional[Dict]:
         """调用单个API provider"""
         import requests
 
         name = api_conf['name']
         api_type = api_conf.get('type', 'openai')
+        parser = parser or self._parse_llm_response
 
         if api_type == 'gemini':
-            return self._call_gemini_api(api_conf, messages)
+            return self._call_gemini_api(api_conf, messages, parser)
 
         # OpenAI兼容格式 (智谱/DeepSeek/千问等)
         headers = {
@@ -348,7 +381,9 @@ class NewsAnalyzer:
         if response.status_code == 200:
             result = response.json()
             content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-            return self._parse_llm_response(content, name)
+            parsed = parser(content, name)
+            self._cache_response(api_conf, messages, content, parsed)
+            return parsed
         elif response.status_code == 429:
             print(f"[{name}] 限流(429)，切换下一个")
             return None
@@ -356,10 +391,12 @@ class NewsAnalyzer:
             print(f"[{name}] API请求失败: {response.status_code} - {response.text[:150]}")
             return None
 
-    def _call_gemini_api(self, api_conf: dict, messages: list) -> Optional[Dict]:
+    def _call_gemini_api(self, api_conf: dict, messages: list, parser=None) -> Optional[Dict]:
         """调用Gemini API (原生格式)"""
         import requests
 
+        parser = parser or self._parse_llm_response
+
         # 提取system和user消息
         system_msg = ""
         user_msg = ""
@@ -386,7 +423,9 @@ class NewsAnalyzer:
         if response.status_code == 200:
             result = response.json()
             content = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-            return self._parse_llm_response(content, 'Gemini')
+            parsed = parser(content, 'Gemini')
+            self._cache_response(api_conf, messages, content, parsed)
+            return parsed
         else:
             print(f"[Gemini] API请求失败: {response.status_code} - {response.text[:150]}")
             return None
@@ -547,16 +586,24 @@ class NewsAnalyzer:
         except Exception:
             return {'blocked': False}
 
-    def batch_analyze(self, stocks: List[Dict], days: int = 7) -> List[Dict]:
+    def batch_analyze(self, stocks: List[Dict], days: int = 7, pipelined: bool = None) -> List[Dict]:
         """批量分析多只股票的新闻情绪
 
         Args:
             stocks: 股票列表，每只股票包含 {code, name, ...}
             days: 获取最近几天的新闻
+            pipelined: 是否使用并发流水线（默认 USE_NEWS_PIPELINE），False 时逐只串行分析
 
         Returns:
             带sentiment_score的股票列表
         """
+        if USE_NEWS_PIPELINE if pipelined is None else pipelined:
+            # 流水线实例随分析器保留，其新闻缓存在多次调用间复用
+            if getattr(self, '_news_pipeline', None) is None:
+                from news_pipeline import NewsSentimentPipeline
+                self._news_pipeline = NewsSentimentPipeline(self)
+            return self._news_pipeline.run(stocks, days)
+
         results = []
         total = len(stocks)
 
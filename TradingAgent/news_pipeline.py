@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+新闻情绪流水线 - NewsAnalyzer.batch_analyze 的并发批量版本
+
+原 batch_analyze 逐只股票串行：抓新闻 → 一次 LLM 调用 → sleep(request_delay)。
+这里拆成两级流水线，中间用有界队列连接：
+
+    股票列表 ──▶ [抓取] N 个线程, 令牌桶限速 ──▶ 有界队列 ──▶ [分析] M 个线程, 令牌桶限速
+                   │ 进程内新闻缓存 (TTL)                          │ 每次凑满 PACK_SIZE 只股票
+                   │ 按 URL / 内容哈希去重                         │ 打包成一个提示词，返回逐股 JSON 数组
+                   └ 无新闻的股票直接给中性评分，不进分析队列        └ 响应里缺失的股票单独重试一次
+
+抓取函数和 LLM 调用都可以替换为桩函数，便于离线测试：
+    pipeline = NewsSentimentPipeline(fetcher=lambda code, name, days, count: [...],
+                                     llm_call=lambda prompt: [{'code': ..., 'score': ...}])
+    results = pipeline.run(stocks)
+
+输出与 batch_analyze 相同：输入股票 dict 的副本，附加
+sentiment_score / sentiment / sentiment_reason / news_count。
+"""
+
+import hashlib
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'TradingShared', 'api'))
+from kline_fetch_engine import TokenBucket
+
+FETCH_WORKERS = 4       # 同时抓取新闻的线程数
+ANALYZE_WORKERS = 2     # 同时在途的 LLM 请求数
+FETCH_RATE = 4.0        # 新闻接口每秒请求数
+LLM_RATE = 1.0          # LLM 每秒请求数（原串行版每次调用后 sleep 1 秒）
+PACK_SIZE = 5           # 每个 LLM 提示词打包的股票数
+PACK_WAIT = 0.5         # 凑批时等待下一只股票的最长秒数
+QUEUE_SIZE = 32         # 抓取 → 分析队列容量
+NEWS_PER_STOCK = 10     # 每只股票最多取的新闻条数
+NEWS_CACHE_TTL = 3600   # 进程内新闻缓存有效期（秒）
+
+_STOP = object()
+
+
+def news_fingerprint(news: Dict) -> str:
+    """新闻去重键：优先 URL，否则为 标题+日期+内容前100字 的哈希"""
+    url = str(news.get('url') or '').strip()
+    if url:
+        return url
+    text = f"{news.get('title', '')}|{news.get('date', '')}|{str(news.get('content', ''))[:100]}"
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def dedupe_news(news_list: List[Dict]) -> List[Dict]:
+    """按 news_fingerprint 去重，保留首次出现的顺序"""
+    seen = set()
+    out = []
+    for news in news_list:
+        key = news_fingerprint(news)
+        if key not in seen:
+            seen.add(key)
+            out.append(news)
+    return out
+
+
+def _clean_code(code) -> str:
+    return str(code).split('.')[0].strip()
+
+
+def format_news(news_list: List[Dict], limit: int = NEWS_PER_STOCK) -> str:
+    """新闻摘要（与 NewsAnalyzer.analyze_sentiment 相同格式）"""
+    summary = ""
+    for i, news in enumerate(news_list[:limit], 1):
+        summary += f"\n{i}. 标题: {news.get('title', '无标题')}"
+        if news.get('content'):
+            summary += f"\n   内容: {news['content'][:100]}..."
+    return summary
+
+
+def build_packed_prompt(batch: List[Dict]) -> str:
+    """多只股票的新闻打包成一个提示词，要求返回逐股 JSON 数组"""
+    sections = []
+    for item in batch:
+        sections.append(f"【{_clean_code(item['code'])} {item['name']}】{format_news(item['news'])}")
+    body = "\n\n".join(sections)
+    return f"""请分别分析以下{len(batch)}只股票的新闻，判断每只股票短期股价影响（1-3个交易日）。
+
+{body}
+
+请返回JSON数组，每只股票一项，顺序与上面一致：
+[
+    {{"code": "股票代码", "sentiment": "利好/利空/中性", "score": 数字（0-10）, "reason": "简要分析理由（50字以内）"}}
+]
+评分标准：
+  - 8-10分：强利好，可能大幅上涨
+  - 6-8分：利好，可能上涨
+  - 4-6分：中性，影响有限
+  - 2-4分：利空，可能下跌
+  - 0-2分：强利空，可能大幅下跌
+
+注意：
+1. 每只股票只依据其自身的新闻，综合考虑整体影响
+2. 区分新闻的重要性和时效性
+3. 考虑市场情绪和预期差
+4. 只返回JSON数组，不要其他内容"""
+
+
+def parse_packed_response(content: str, provider_name: str = '') -> Optional[List[Dict]]:
+    """解析打包提示词的响应，返回 [{code, sentiment, score, reason}, ...]；失败返回 None"""
+    if not content:
+        return None
+    data = None
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        match = re.search(r'\[.*\]', content, re.DOTALL)
+        if match:
+            try:
+                data = json.loads(match.group())
+            except json.JSONDecodeError:
+                data = None
+    if isinstance(data, dict):
+        data = data.get('results') or data.get('data')
+    if not isinstance(data, list):
+        print(f"[{provider_name or 'LLM'}] 批量响应解析失败: {content[:100]}")
+        return None
+    return [item for item in data if isinstance(item, dict)]
+
+
+def _sentiment_fields(result: Optional[Dict], news_count: int, reason: str = "分析完成") -> Dict:
+    """LLM 结果 → 输出字段（评分校验与 analyze_sentiment 一致）"""
+    if not result:
+        return {'sentiment_score': 5.0, 'sentiment': '中性', 'sentiment_reason': reason, 'news_count': news_count}
+    score = result.get('score', 5.0)
+    if isinstance(score, str):
+        try:
+            score = float(score)
+        except ValueError:
+            score = 5.0
+    if not isinstance(score, (int, float)) or score < 0 or score > 10:
+        score = 5.0
+    return {
+        'sentiment_score': float(score),
+        'sentiment': result.get('sentiment', '中性'),
+        'sentiment_reason': result.get('reason', '分析完成'),
+        'news_count': news_count,
+    }
+
+
+class NewsSentimentPipeline:
+    """抓取 / 分析两级流水线
+
+    参数:
+        analyzer: NewsAnalyzer 实例（默认抓取函数和 LLM 调用来自它），可为 None（此时须提供两个桩函数）
+        fetcher: fetcher(code, name, days=, count=) → 新闻列表
+        llm_call: llm_call(prompt) → parse_packed_response 格式的列表或 None
+    """
+
+    def __init__(self, analyzer=None, fetcher: Callable = None, llm_call: Callable = None,
+                 fetch_workers: int = FETCH_WORKERS, analyze_workers: int = ANALYZE_WORKERS,
+                 fetch_rate: float = FETCH_RATE, llm_rate: float = LLM_RATE,
+                 pack_size: int = PACK_SIZE, pack_wait: float = PACK_WAIT,
+                 queue_size: int = QUEUE_SIZE, news_cache_ttl: float = NEWS_CACHE_TTL,
+                 verbose: bool = True):
+        if analyzer is None and (fetcher is None or llm_call is None):
+            from news_analyzer import NewsAnalyzer
+            analyzer = NewsAnalyzer()
+        self.analyzer = analyzer
+        self.fetcher = fetcher or analyzer.fetch_stock_news
+        self.llm_call = llm_call or (lambda prompt: analyzer._call_deepseek_api(prompt, parser=parse_packed_response))
+        # 与 analyze_sentiment 一致：未配置主 API 密钥时直接给中性评分
+        self.llm_ready = llm_call is not None or bool(getattr(analyzer, 'api_key', None))
+        self.fetch_workers = max(1, fetch_workers)
+        self.analyze_workers = max(1, analyze_workers)
+        self.fetch_bucket = TokenBucket(fetch_rate, burst=max(1, self.fetch_workers))
+        self.llm_bucket = TokenBucket(llm_rate, burst=max(1, self.analyze_workers))
+        self.pack_size = max(1, pack_size)
+        self.pack_wait = pack_wait
+        self.queue_size = queue_size
+        self.news_cache_ttl = news_cache_ttl
+        self.verbose = verbose
+        self._news_cache = {}    # (code, days) → (抓取时间, 去重后的新闻)
+        self._cache_lock = threading.Lock()
+        self.stats = {}
+
+    def _log(self, msg: str):
+        if self.verbose:
+            print(msg, flush=True)
+
+    def _count(self, key: str, n: int = 1):
+        with self._cache_lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    # ------------------------------------------------------------------
+    # 抓取
+    # ------------------------------------------------------------------
+    def get_news(self, code: str, name: str, days: int = 7) -> List[Dict]:
+        """带进程内缓存的新闻抓取（去重后）"""
+        key = (_clean_code(code), days)
+        with self._cache_lock:
+            entry = self._news_cache.get(key)
+        if entry and time.time() - entry[0] <= self.news_cache_ttl:
+            self._count('news_cache_hits')
+            return entry[1]
+        self.fetch_bucket.acquire()
+        try:
+            raw = self.fetcher(code, name, days=days, count=NEWS_PER_STOCK) or []
+        except Exception as e:
+            print(f"[新闻流水线] 抓取失败 {name}({code}): {e}")
+            raw = []
+        news = dedupe_news(raw)
+        self._count('fetched')
+        self._count('duplicates_removed', len(raw) - len(news))
+        with self._cache_lock:
+            self._news_cache[key] = (time.time(), news)
+        return news
+
+    def _fetch_worker(self, inbox, outbox, results, days):
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                return
+            idx, stock, code, name = item
+            news = self.get_news(code, name, days)
+            if not news:
+                results[idx] = _sentiment_fields(None, 0, "无近期新闻")
+                continue
+            outbox.put({'idx': idx, 'code': code, 'name': name, 'news': news})
+
+    # ------------------------------------------------------------------
+    # 分析
+    # ------------------------------------------------------------------
+    def _call_packed(self, batch: List[Dict]) -> Dict[int, Dict]:
+        """一个打包提示词 → {idx: LLM 结果}"""
+        self.llm_bucket.acquire()
+        self._count('llm_calls')
+        try:
+            parsed = self.llm_call(build_packed_prompt(batch)) or []
+        except Exception as e:
+            print(f"[新闻流水线] LLM 调用失败: {e}")
+            parsed = []
+        by_code = {_clean_code(r.get('code', '')): r for r in parsed}
+        by_name = {str(r.get('name', '')): r for r in parsed if r.get('name')}
+        out = {}
+        for pos, item in enumerate(batch):
+            result = by_code.get(_clean_code(item['code'])) or by_name.get(item['name'])
+            if result is None and len(parsed) == len(batch) and not parsed[pos].get('code'):
+                result = parsed[pos]  # 未回填代码时按顺序对应
+            if result is not None:
+                out[item['idx']] = result
+        return out
+
+    def _analyze_batch(self, batch: List[Dict], results):
+        if not self.llm_ready:
+            for item in batch:
+                results[item['idx']] = _sentiment_fields(None, len(item['news']), "API密钥未配置")
+            return
+        found = self._call_packed(batch)
+        self._count('packed_stocks', len(batch))
+        for item in batch:
+            result = found.get(item['idx'])
+            if result is None:
+                # 批量响应里缺这只股票：单独重试一次
+                self._count('single_retries')
+                result = self._call_packed([item]).get(item['idx'])
+            results[item['idx']] = _sentiment_fields(result, len(item['news']), "API调用失败")
+
+    def _analyze_worker(self, inbox, results):
+        done = False
+        while not done:
+            item = inbox.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            while len(batch) < self.pack_size:
+                try:
+                    nxt = inbox.get(timeout=self.pack_wait)
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    done = True
+                    break
+                batch.append(nxt)
+            self._analyze_batch(batch, results)
+            self._log(f"[新闻流水线] 已分析 {sum(1 for r in results if r is not None)}/{len(results)}")
+
+    # ------------------------------------------------------------------
+    # 入口
+    # ------------------------------------------------------------------
+    def run(self, stocks: List[Dict], days: int = 7) -> List[Dict]:
+        """批量分析（输出格式与 NewsAnalyzer.batch_analyze 相同，保持输入顺序）"""
+        jobs = []
+        for stock in stocks:
+            code = stock.get('code', stock.get('symbol', ''))
+            name = stock.get('name', '')
+            if not code or not name:
+                print(f"[批量分析] 跳过无效股票: {stock}")
+                continue
+            jobs.append((stock, code, name))
+
+        self.stats = {'stocks': len(jobs)}
+        results = [None] * len(jobs)
+        t0 = time.time()
+        self._log(f"\n[新闻流水线] 开始分析 {len(jobs)} 只股票 (抓取 {self.fetch_workers} 线程, "
+                  f"分析 {self.analyze_workers} 线程, 每批 {self.pack_size} 只)")
+
+        inbox = queue.Queue()
+        for idx, (stock, code, name) in enumerate(jobs):
+            inbox.put((idx, stock, code, name))
+        analyze_q = queue.Queue(maxsize=self.queue_size)
+
+        fetchers = [threading.Thread(target=self._fetch_worker, args=(inbox, analyze_q, results, days), daemon=True)
+                    for _ in range(self.fetch_workers)]
+        analyzers = [threading.Thread(target=self._analyze_worker, args=(analyze_q, results), daemon=True)
+                     for _ in range(self.analyze_workers)]
+        for t in fetchers + analyzers:
+            t.start()
+        for _ in fetchers:
+            inbox.put(_STOP)
+        for t in fetchers:
+            t.join()
+        self.stats['fetch_seconds'] = round(time.time() - t0, 2)
+        for _ in analyzers:
+            analyze_q.put(_STOP)
+        for t in analyzers:
+            t.join()
+        self.stats['total_seconds'] = round(time.time() - t0, 2)
+
+        out = []
+        for (stock, _, _), fields in zip(jobs, results):
+            merged = stock.copy()
+            merged.update(fields or _sentiment_fields(None, 0, "API调用失败"))
+            out.append(merged)
+        self._log(f"[新闻流水线] 完成！{len(out)} 只股票, LLM 调用 {self.stats.get('llm_calls', 0)} 次, "
+                  f"耗时 {self.stats['total_seconds']:.1f}s (抓取阶段 {self.stats['fetch_seconds']:.1f}s)")
+        return out
+
+
+def bench(n: int = 100, fetch_latency: float = 0.3, llm_latency: float = 1.0):
+    """桩函数对比：串行（原 batch_analyze 的调用次数和间隔）vs 流水线"""
+    import random
+
+    def fetcher(code, name, days, count):
+        time.sleep(fetch_latency)
+        items = [{'title': f"{name} 公告{i}", 'content': '内容', 'date': '2026-01-01',
+                  'url': f"http://news/{code}/{i % 3}"} for i in range(5)]
+        return items
+
+    def llm_call(prompt):
+        time.sleep(llm_latency)
+        codes = re.findall(r'【(\d{6}) ', prompt)
+        return [{'code': c, 'sentiment': '中性', 'score': round(random.uniform(3, 7), 1), 'reason': 'stub'}
+                for c in codes]
+
+    stocks = [{'code': f"{600000 + i:06d}", 'name': f"股票{i}"} for i in range(n)]
+    serial = n * (fetch_latency + llm_latency + 1.0)
+    pipeline = NewsSentimentPipeline(fetcher=fetcher, llm_call=llm_call, verbose=False)
+    results = pipeline.run(stocks)
+    print(f"串行估算: {serial:.0f}s | 流水线: {pipeline.stats['total_seconds']:.1f}s | "
+          f"LLM 调用 {pipeline.stats.get('llm_calls', 0)} 次 | 去重 {pipeline.stats.get('duplicates_removed', 0)} 条 | "
+          f"结果 {len(results)} 只")
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,745 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+面板计算引擎 — 向量化 precompute_v25~v28 / precompute_period
+
+旧的 precompute 每个交易日、每只股票都要做一次 df[df['date'] < test_date] 掩码，
+复杂度 O(天数 × 股票数 × K线行数)，是回测耗时的大头。
+
+面板引擎的做法：
+  1. 把所有股票的K线左对齐成 (股票数 × 最长K线数) 的矩阵，只做一次
+  2. 所有子分数按「历史长度 n」计算成 (股票数 × (最长K线数+1)) 矩阵：
+     第 n 列 = 只用该股票前 n 根K线算出的结果，等价于原来对 hist 调用一次打分函数
+  3. 每个交易日只需算出每只股票在该日之前有几根K线（positions），
+     再按 (股票, n) 取值即可
+
+因为按股票自身的K线序号而不是日历日对齐，停牌缺口的语义与原实现完全一致
+（c[-6] 仍然是该股票倒数第6根K线）。
+
+覆盖的子分数（逻辑与 backtest_v25~v28 中同名函数一致）：
+  multi_timeframe_trend_score / money_flow_score / calc_volume_health /
+  detect_divergence / relative_strength_rank / identify_hot_sectors /
+  count_recent_limit_ups / compute_stock_volatility
+
+V24 的 calc_features 特征集不同，precompute_period 只复用面板的位置索引（df.iloc[:n] 代替日期掩码）
+和行业3日涨幅（sector_avg_return）。次日收益统一查 forward_returns 的 (股票 × 交易日) 远期收益表，
+查询日停牌的股票记为 None（不再顺延到复牌日买入）。
+
+板块热度默认不再逐日分组：sector_aggregates 对整个面板一次算出 (行业 × 日期) 表并落盘，
+precompute_panel 每天只按日期查表（USE_SECTOR_TABLE）。
+
+数值说明：面板统一用 float64 计算。K线本身是 float64 时，除板块热度外结果与旧循环逐位一致；
+USE_SECTOR_TABLE=True 时板块均值按 bincount 顺序求和，sector_s 与逐日 np.mean 有 1e-13 量级
+（实测最大约 3e-14）的舍入差异，USE_SECTOR_TABLE=False 时仍逐位一致。
+旧路径在 float32 的 DataFrame 上累加，极少数恰好落在阈值边界上（如 MA5 斜率正好为 ±1%）的比较
+可能因舍入不同而翻转。compare_daily_data() 可用来抽查两条路径的差异。
+
+使用方法：
+    from panel_engine import build_panel, precompute_panel
+    panel = build_panel(kline)                # 只对齐一次，多个区间复用
+    daily_data = precompute_panel(panel, scores, valid_dates, day_fn, ...)
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from numpy.lib.stride_tricks import sliding_window_view
+
+from forward_returns import get_forward_returns
+
+PANEL_FIELDS = ('close', 'volume', 'high', 'low', 'turn')
+UNKNOWN_INDUSTRIES = ('unknown', '未知', '')
+
+# precompute_panel 的板块热度读预计算的 (行业 × 日期) 表（sector_aggregates），False 时逐日分组计算
+USE_SECTOR_TABLE = True
+
+# 分块计算 OBV 窗口时每块的股票数（控制 3D 临时数组内存）
+_CHUNK_ROWS = 256
+
+
+# ============================================================================
+# 与 Python 内置 max/min 语义一致的逐元素版本（NaN 处理与原函数相同）
+# ============================================================================
+def _pymax(a, b):
+    """max(a, b)：只有 b > a 才取 b"""
+    return np.where(b > a, b, a)
+
+
+def _pymin(a, b):
+    """min(a, b)：只有 b < a 才取 b"""
+    return np.where(b < a, b, a)
+
+
+def _pyclip(x, lo, hi):
+    """max(lo, min(hi, x))"""
+    return _pymax(lo, _pymin(hi, x))
+
+
+# ============================================================================
+# 按历史长度 n 索引的滚动运算
+#   输入 X: (S, L) 左对齐K线矩阵
+#   输出 H: (S, L+1)，H[:, n] 对应只看前 n 根K线时的值
+# ============================================================================
+def _at(X, k):
+    """H[:, n] = c[-k]，即 X[:, n-k]"""
+    S, L = X.shape
+    out = np.full((S, L + 1), np.nan)
+    if k <= L:
+        out[:, k:] = X[:, :L + 1 - k]
+    return out
+
+
+def _place(vals, w, lag, L):
+    """把窗口结果 vals[:, k]（窗口覆盖 k..k+w-1）放到 H[:, k+w-1+lag]"""
+    out = np.full((vals.shape[0], L + 1), np.nan)
+    start = w - 1 + lag
+    m = min(vals.shape[1], L + 1 - start)
+    if m > 0:
+        out[:, start:start + m] = vals[:, :m]
+    return out
+
+
+def _rolling(X, w, func, lag=1):
+    """H[:, n] = func(最后一个元素为 c[-lag] 的 w 长窗口)"""
+    S, L = X.shape
+    if L < w:
+        return np.full((S, L + 1), np.nan)
+    return _place(func(sliding_window_view(X, w, axis=1), axis=-1), w, lag, L)
+
+
+def _by_stride(H_sub, step, L):
+    """c[::step] 子序列按其长度索引的 H_sub 映射回日线历史长度 n（子序列长度 = ceil(n/step)）"""
+    m = (np.arange(L + 1) + step - 1) // step
+    m = np.minimum(m, H_sub.shape[1] - 1)
+    return H_sub[:, m]
+
+
+def _diff_pct(X):
+    """逐根涨跌幅 (c[t]-c[t-1])/c[t-1]*100，第0根为 NaN"""
+    out = np.full(X.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[:, 1:] = (X[:, 1:] - X[:, :-1]) / X[:, :-1] * 100
+    return out
+
+
+def group_percentile_rank(values, groups, min_peers=2):
+    """组内百分位（不含自身）：组内严格小于自身的个数 / 同组其他股票数 × 100
+
+    与 relative_strength_rank 一致：同组其他股票不足 min_peers 只时为 50，自身为 NaN 时为 0
+    （V29 的 score_relative_strength 只要求有同组股票，即 min_peers=1）。
+    一次排序完成全部分组，复杂度 O(N log N)，不再为每只股票重建 peer 列表。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+    n = len(values)
+    if n == 0:
+        return np.zeros(0)
+    order = np.lexsort((values, groups))
+    g = groups[order]
+    v = values[order]
+    pos = np.arange(n)
+    new_group = np.r_[True, g[1:] != g[:-1]]
+    group_start = np.maximum.accumulate(np.where(new_group, pos, 0))
+    new_run = new_group | np.r_[True, v[1:] != v[:-1]]
+    run_start = np.maximum.accumulate(np.where(new_run, pos, 0))
+    less = np.empty(n)
+    less[order] = run_start - group_start
+
+    peers = np.bincount(groups)[groups] - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rank = less / peers * 100
+    rank = np.where(np.isnan(values), 0.0, rank)
+    return np.where(peers >= min_peers, rank, 50.0)
+
+
+def percentile_rank_map(keys, values, labels, min_peers=2):
+    """按字符串分组的 group_percentile_rank，返回 {key: 组内百分位}
+
+    keys 须唯一（同一只股票只出现一次），labels 为每个 key 的行业/赛道名。
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    groups, _ = encode_labels(list(labels))
+    ranks = group_percentile_rank(values, groups, min_peers=min_peers)
+    return dict(zip(keys, ranks.tolist()))
+
+
+# ============================================================================
+# K线面板
+# ============================================================================
+class KlinePanel:
+    """全市场K线左对齐矩阵 + 每个交易日的历史长度索引"""
+
+    def __init__(self, kline, fields=PANEL_FIELDS):
+        """kline: {code: DataFrame}，DataFrame 需按 date 升序（各回测的加载函数已保证）"""
+        self.codes = list(kline.keys())
+        S = len(self.codes)
+        self.lengths = np.array([len(df) for df in kline.values()], dtype=np.int64)
+        L = int(self.lengths.max()) if S else 0
+        self.values = {f: np.full((S, L), np.nan) for f in fields}
+        self.has = {f: np.zeros(S, dtype=bool) for f in fields}
+
+        stock_dates = []
+        for i, df in enumerate(kline.values()):
+            n = len(df)
+            stock_dates.append(df['date'].values.astype('datetime64[ns]').astype(np.int64))
+            for f in fields:
+                if f in df.columns:
+                    self.values[f][i, :n] = df[f].to_numpy(dtype=np.float64, na_value=np.nan)
+                    self.has[f][i] = True
+        self._init_dates(stock_dates)
+        self._cache = {}
+
+    @classmethod
+    def from_store(cls, store, codes=None, min_days=0, fields=PANEL_FIELDS):
+        """直接从 kline_store 构建，跳过逐只 DataFrame"""
+        if codes is None:
+            codes = store.codes
+        rows = []
+        for code in codes:
+            arr = store.arrays(code, fields=fields)
+            if arr is not None and len(arr['date']) >= max(min_days, 1):
+                rows.append((code, arr))
+
+        self = cls.__new__(cls)
+        self.codes = [code for code, _ in rows]
+        S = len(rows)
+        self.lengths = np.array([len(a['date']) for _, a in rows], dtype=np.int64)
+        L = int(self.lengths.max()) if S else 0
+        self.values = {f: np.full((S, L), np.nan) for f in fields}
+        self.has = {f: np.zeros(S, dtype=bool) for f in fields}
+        stock_dates = []
+        for i, (_, arr) in enumerate(rows):
+            n = len(arr['date'])
+            stock_dates.append(arr['date'].astype('datetime64[ns]').astype(np.int64))
+            for f in fields:
+                if f in arr:
+                    self.values[f][i, :n] = arr[f]
+                    self.has[f][i] = True
+        self._init_dates(stock_dates)
+        self._cache = {}
+        return self
+
+    def _init_dates(self, stock_dates):
+        self.dates = (np.unique(np.concatenate(stock_dates)) if stock_dates
+                      else np.zeros(0, dtype=np.int64))
+        G = len(self.dates)
+        # count_before[i, g] = 股票 i 在 dates[g] 之前的K线数；最后一列为总长度
+        self.count_before = np.empty((len(stock_dates), G + 1), dtype=np.int32)
+        for i, d in enumerate(stock_dates):
+            self.count_before[i, :G] = np.searchsorted(d, self.dates, side='left')
+            self.count_before[i, G] = len(d)
+        self.index = {c: i for i, c in enumerate(self.codes)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def width(self):
+        return self.values['close'].shape[1]
+
+    def positions(self, date):
+        """每只股票在 date 之前（不含当日）的K线根数，等价于 len(df[df['date'] < date])"""
+        key = np.datetime64(pd.Timestamp(date), 'ns').astype(np.int64)
+        g = int(np.searchsorted(self.dates, key, side='left'))
+        return self.count_before[:, g].astype(np.int64)
+
+    def field(self, name):
+        """字段矩阵；缺失的 high/low 回退为 close，与原实现一致"""
+        X = self.values[name]
+        if name in ('high', 'low'):
+            X = np.where(self.has[name][:, None], X, self.values['close'])
+        return X
+
+    # ------------------------------------------------------------------
+    # 子分数（整块面板一次算完并缓存）
+    # ------------------------------------------------------------------
+    def subscores(self):
+        """V25~V28 共用的子分数与过滤特征，全部按历史长度 n 索引"""
+        if 'sub' in self._cache:
+            return self._cache['sub']
+        C = self.values['close']
+        V = self.values['volume']
+        HI = self.field('high')
+        LO = self.field('low')
+        S, L = C.shape
+        n_idx = np.arange(L + 1)[None, :]
+
+        c1, c2 = _at(C, 1), _at(C, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            last_pct = (c1 - c2) / c2 * 100
+        sector = self.sector_inputs()
+
+        out = {
+            'ret5': sector['ret5'],
+            'last_pct': last_pct,
+            'trend_s': self._trend_score(C, c1, n_idx),
+            'money_s': self._money_flow(C, V, HI, LO, c1, c2, n_idx) * 10,
+            'vol_s': self._volume_health(C, V),
+            'vol_ratio': sector['vol_ratio'],
+        }
+        out['bull'], out['bear'], out['div_strength'] = self._divergence(C, V)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rets = np.full(C.shape, np.nan)
+            rets[:, 1:] = (C[:, 1:] - C[:, :-1]) / C[:, :-1] * 100
+        out['stock_vol'] = np.where(n_idx >= 11, _rolling(rets, 10, np.std), 0.8)
+        self._cache['sub'] = out
+        return out
+
+    def sector_inputs(self):
+        """板块热度只需要的两项：5日涨幅 ret5 与量比 vol_ratio（按历史长度 n 索引）"""
+        if 'sector' in self._cache:
+            return self._cache['sector']
+        C = self.values['close']
+        V = self.values['volume']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c6 = _at(C, 6)
+            ret5 = (_at(C, 1) - c6) / c6 * 100
+        out = {
+            'ret5': ret5,
+            'vol_ratio': _rolling(V, 5, np.mean) / _pymax(_rolling(V, 10, np.mean, lag=6), 1),
+        }
+        self._cache['sector'] = out
+        return out
+
+    def limit_up_counts(self, threshold):
+        """count_recent_limit_ups(c, lookback=5, threshold)"""
+        key = ('limit_ups', threshold)
+        if key not in self._cache:
+            P = _diff_pct(self.values['close'])
+            self._cache[key] = _rolling((P > threshold).astype(np.float64), 5, np.sum)
+        return self._cache[key]
+
+    def _trend_score(self, C, c1, n_idx):
+        """multi_timeframe_trend_score 的面板版，返回 0~100 分"""
+        S, L = C.shape
+        ma5 = _rolling(C, 5, np.mean)
+        ma10 = _rolling(C, 10, np.mean)
+        ma20 = _rolling(C, 20, np.mean)
+        daily = np.select(
+            [(c1 > ma5) & (ma5 > ma10) & (ma10 > ma20),
+             (c1 > ma5) & (ma5 > ma10),
+             c1 > ma5,
+             (c1 < ma5) & (ma5 < ma10) & (ma10 < ma20),
+             (c1 < ma5) & (ma5 < ma10),
+             c1 < ma5],
+            [40, 30, 15, -40, -30, -15], 0).astype(np.float64)
+        prev5 = _rolling(C, 5, np.mean, lag=2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (ma5 - prev5) / _pymax(prev5, 0.01) * 100
+        daily = daily + np.select([slope > 1, slope > 0, slope < -1, slope < 0],
+                                  [15, 8, -15, -8], 0)
+
+        W = C[:, ::5]
+        w_last = _by_stride(_at(W, 1), 5, L)
+        wma5 = _by_stride(_rolling(W, 5, np.mean), 5, L)
+        wma10 = _by_stride(_rolling(W, 10, np.mean), 5, L)
+        wprev = _by_stride(_rolling(W, 5, np.mean, lag=2), 5, L)
+        weekly = np.select(
+            [(w_last > wma5) & (wma5 > wma10),
+             w_last > wma5,
+             (w_last < wma5) & (wma5 < wma10),
+             w_last < wma5],
+            [40, 20, -40, -20], 0).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wslope = (wma5 - wprev) / _pymax(wprev, 0.01) * 100
+        weekly = weekly + _pyclip(wslope * 10, -15, 15)
+        weekly = np.where(n_idx >= 60, weekly, 0.0)
+
+        M = C[:, ::20]
+        m_last = _by_stride(_at(M, 1), 20, L)
+        mma5 = _by_stride(_rolling(M, 5, np.mean), 20, L)
+        m3 = _by_stride(_at(M, 3), 20, L)
+        monthly = np.where(m_last > mma5, 30.0, -30.0) + np.where(m_last > m3, 20.0, -20.0)
+        monthly = np.where(n_idx >= 120, monthly, 0.0)
+
+        score = daily * 0.4 + weekly * 0.4 + monthly * 0.2
+        score = _pyclip((score + 100) / 2, 0, 100)
+        return np.where(n_idx >= 20, score, 50.0)
+
+    def _money_flow(self, C, V, HI, LO, c1, c2, n_idx):
+        """money_flow_score 的面板版，返回 0~10 分"""
+        S, L = C.shape
+        Cp = np.full(C.shape, np.nan)
+        Cp[:, 1:] = C[:, :-1]
+        up = C > Cp
+        dn = C <= Cp
+        with np.errstate(divide='ignore', invalid='ignore'):
+            up_sum = _rolling(np.where(up, V, 0.0), 10, np.sum)
+            up_cnt = _rolling(up.astype(np.float64), 10, np.sum)
+            dn_sum = _rolling(np.where(dn, V, 0.0), 10, np.sum)
+            dn_cnt = _rolling(dn.astype(np.float64), 10, np.sum)
+            avg_up = np.where(up_cnt > 0, up_sum / up_cnt, 1.0)
+            avg_dn = np.where(dn_cnt > 0, dn_sum / dn_cnt, 1.0)
+            vol_ratio = avg_up / _pymax(avg_dn, 1)
+        score = 5.0 + np.select([vol_ratio > 2.0, vol_ratio > 1.5, vol_ratio < 0.7, vol_ratio < 0.5],
+                                [2.0, 1.0, -1.5, -2.5], 0.0)
+
+        # OBV(近20根)：新高 +1.5，低于4根前 -1.0
+        SV = np.where(C > Cp, V, np.where(C < Cp, -V, 0.0))
+        obv_high = np.zeros((S, L + 1), dtype=bool)
+        obv_drop = np.zeros((S, L + 1), dtype=bool)
+        if L >= 19:
+            for r0 in range(0, S, _CHUNK_ROWS):
+                cs = np.cumsum(sliding_window_view(SV[r0:r0 + _CHUNK_ROWS], 19, axis=1), axis=-1)
+                last = cs[..., -1]
+                high = last == np.maximum(cs.max(axis=-1), 0)
+                drop = last < cs[..., 14]
+                obv_high[r0:r0 + _CHUNK_ROWS] = _place(high.astype(np.float64), 19, 1, L) == 1
+                obv_drop[r0:r0 + _CHUNK_ROWS] = _place(drop.astype(np.float64), 19, 1, L) == 1
+        score = score + np.where(obv_high, 1.5, 0.0)
+        score = score + np.where(obv_drop, -1.0, 0.0)
+
+        # 近3根K线影线形态
+        with np.errstate(divide='ignore', invalid='ignore'):
+            body = np.abs(C - Cp)
+            upper = HI - _pymax(C, Cp)
+            lower = _pymin(C, Cp) - LO
+            total = _pymax(HI - LO, 0.01)
+            wick = np.where(up, np.where((body + lower) / total > 0.7, 0.3, 0.0),
+                            np.where((body + upper) / total > 0.7, -0.3, 0.0))
+        for k in (3, 2, 1):
+            score = score + _at(wick, k)
+
+        # 换手率突变
+        if self.has['turn'].any():
+            T = self.values['turn']
+            ne1 = np.zeros((S, L + 1))
+            ne1[:, 1:] = np.cumsum(T != 1, axis=1)
+            active = (n_idx >= 10) & self.has['turn'][:, None] & (ne1 > 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = _at(T, 1) / _pymax(_rolling(T, 5, np.mean, lag=2), 0.1)
+            rising, falling = c1 > c2, c1 < c2
+            turn_adj = np.select([(ratio > 2.0) & rising, (ratio > 1.5) & rising,
+                                  (ratio > 2.0) & falling, ratio < 0.5],
+                                 [1.5, 0.5, -2.0, -0.5], 0.0)
+            score = score + np.where(active, turn_adj, 0.0)
+
+        score = _pyclip(score, 0, 10)
+        return np.where(n_idx >= 10, score, 5.0)
+
+    def _volume_health(self, C, V):
+        """calc_volume_health 的面板版，返回 0~100 分"""
+        S, L = C.shape
+        n_idx = np.arange(L + 1)[None, :]
+        Cp = np.full(C.shape, np.nan)
+        Vp = np.full(V.shape, np.nan)
+        Cp[:, 1:], Vp[:, 1:] = C[:, :-1], V[:, :-1]
+        step = np.select([(C > Cp) & (V > Vp), (C < Cp) & (V < Vp),
+                          (C > Cp) & (V < Vp), (C < Cp) & (V > Vp)],
+                         [3.0, 2.0, -1.0, -3.0], 0.0)
+        score = 50 + _rolling(step, 5, np.sum)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cv = _rolling(V, 10, np.std) / _pymax(_rolling(V, 10, np.mean), 1)
+        score = score + np.select([cv < 0.3, cv > 0.8], [5.0, -5.0], 0.0)
+        return np.where(n_idx >= 10, _pyclip(score, 0, 100), 50.0)
+
+    def _divergence(self, C, V, lookback=20):
+        """detect_divergence 的面板版，返回 (bullish, bearish, strength)"""
+        S, L = C.shape
+        bull = np.zeros((S, L + 1), dtype=bool)
+        bear = np.zeros((S, L + 1), dtype=bool)
+        strength = np.zeros((S, L + 1))
+        if L < lookback:
+            return bull, bear, strength
+        Cp = np.full(C.shape, np.nan)
+        Cp[:, 1:] = C[:, :-1]
+        SV = np.where(C > Cp, V, np.where(C < Cp, -V, 0.0))
+        SV[:, 0] = 0.0
+        OBV = np.cumsum(SV, axis=1)
+
+        cw = sliding_window_view(C, lookback, axis=1)
+        ow = sliding_window_view(OBV, lookback, axis=1)
+        pmin = np.argmin(cw, axis=-1)
+        pmax = np.argmax(cw, axis=-1)
+        at_min = np.take_along_axis(ow, pmin[..., None], axis=-1)[..., 0]
+        at_max = np.take_along_axis(ow, pmax[..., None], axis=-1)[..., 0]
+        obv_min = ow.min(axis=-1)
+        obv_max = ow.max(axis=-1)
+
+        is_bull = (pmin >= lookback - 5) & (at_min > obv_min * 1.1)
+        is_bear = (pmax >= lookback - 5) & (at_max < obv_max * 0.9)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s_bull = _pymin(1.0, (at_min - obv_min) / _pymax(np.abs(obv_min), 1))
+            s_bear = _pymin(1.0, (obv_max - at_max) / _pymax(np.abs(obv_max), 1))
+        s = np.where(is_bear, s_bear, np.where(is_bull, s_bull, 0.0))
+
+        bull = _place(is_bull.astype(np.float64), lookback, 1, L) == 1
+        bear = _place(is_bear.astype(np.float64), lookback, 1, L) == 1
+        strength = np.nan_to_num(_place(s, lookback, 1, L), nan=0.0)
+        strength = np.where(bull | bear, strength, 0.0)
+        return bull, bear, strength
+
+    # ------------------------------------------------------------------
+    # 板块热度（identify_hot_sectors 的按日分组版）
+    # ------------------------------------------------------------------
+    def hot_sectors(self, pos, sector_codes, sector_names, lookback=5):
+        """sector_codes: 每只股票的行业编号（-1 表示无评分或未知行业，不参与统计）"""
+        sub = self.subscores()
+        rows = np.arange(len(self.codes))
+        n_groups = len(sector_names)
+        ok = (sector_codes >= 0) & (pos >= lookback + 1)
+        g = sector_codes[ok]
+        ret = sub['ret5'][rows[ok], pos[ok]]
+
+        cnt = np.bincount(g, minlength=n_groups)
+        ret_mean = _group_means(g, ret, n_groups)
+        pos_cnt = np.bincount(g, weights=(ret > 0).astype(np.float64), minlength=n_groups)
+
+        vok = ok & (pos >= 15)
+        gv = sector_codes[vok]
+        vr = sub['vol_ratio'][rows[vok], pos[vok]]
+        vcnt = np.bincount(gv, minlength=n_groups)
+        vmean = _group_means(gv, vr, n_groups)
+
+        # 按首次出现顺序输出，与原实现的 dict 顺序一致
+        first_seen = {}
+        for k in g.tolist():
+            if k not in first_seen:
+                first_seen[k] = len(first_seen)
+
+        sector_heat = {}
+        for k in first_seen:
+            if cnt[k] < 3:
+                continue
+            avg_ret = float(ret_mean[k])
+            positive_rate = pos_cnt[k] / cnt[k]
+            vr_k = float(vmean[k]) if vcnt[k] >= 2 else 1.0
+            sector_heat[sector_names[k]] = (avg_ret * 0.4
+                                            + positive_rate * 5 * 0.3
+                                            + (vr_k - 1.0) * 3 * 0.3)
+
+        sorted_sectors = sorted(sector_heat.items(), key=lambda x: x[1], reverse=True)
+        total_heat = sum(max(h, 0) for _, h in sorted_sectors[:10])
+        top1_heat = sorted_sectors[0][1] if sorted_sectors else 0
+        return {
+            'hot': sorted_sectors[:8],
+            'all_heat': sector_heat,
+            'sector_concentration': top1_heat / max(total_heat, 0.01) if total_heat > 0 else 0,
+        }
+
+    def sector_avg_return(self, pos, sector_codes, sector_names, lookback=3, min_count=3):
+        """行业近 lookback 日平均涨幅（V24 的 dynamic_sector_heat）"""
+        rows = np.arange(len(self.codes))
+        ok = (sector_codes >= 0) & (pos >= lookback + 1)
+        C = self.values['close']
+        r, p = rows[ok], pos[ok]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = (C[r, p - 1] - C[r, p - 1 - lookback]) / C[r, p - 1 - lookback] * 100
+        g = sector_codes[ok]
+        cnt = np.bincount(g, minlength=len(sector_names))
+        mean = _group_means(g, ret, len(sector_names))
+        return {sector_names[k]: float(mean[k])
+                for k in dict.fromkeys(g.tolist()) if cnt[k] >= min_count}
+
+
+def _group_means(g, x, n_groups):
+    """按组求 np.mean，组内保持原顺序（与对 list 调用 np.mean 的结果逐位一致）"""
+    out = np.full(n_groups, np.nan)
+    if len(g) == 0:
+        return out
+    order = np.argsort(g, kind='stable')
+    gs, xs = g[order], x[order]
+    bounds = np.flatnonzero(np.r_[True, gs[1:] != gs[:-1], True])
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        out[gs[a]] = np.mean(xs[a:b])
+    return out
+
+
+def build_panel(kline):
+    """构建面板并打印规模/耗时，供各回测 main() 调用"""
+    t0 = time.time()
+    panel = KlinePanel(kline)
+    print(f"  Panel: {len(panel)} stocks x {panel.width} bars, "
+          f"{len(panel.dates)} dates ({time.time() - t0:.1f}s)")
+    return panel
+
+
+def encode_labels(labels):
+    """字符串标签 → (编号数组, 名称列表)；None 编为 -1"""
+    names, index = [], {}
+    codes = np.empty(len(labels), dtype=np.int64)
+    for i, lab in enumerate(labels):
+        if lab is None:
+            codes[i] = -1
+            continue
+        k = index.get(lab)
+        if k is None:
+            k = index[lab] = len(names)
+            names.append(lab)
+        codes[i] = k
+    return codes, names
+
+
+# ============================================================================
+# 通用 precompute
+# ============================================================================
+def precompute_panel(panel, scores, valid_dates, day_fn, tradeable_fn,
+                     classify_fn, profile='v26', with_extra=True, with_stock_vol=False,
+                     limit_up_threshold=15.0, ipo_min_days=30,
+                     sector_exclude=UNKNOWN_INDUSTRIES, log_every=10):
+    """用面板生成与 precompute_v25~v28 相同结构的 daily_data
+
+    Args:
+        panel: KlinePanel
+        scores: 静态评分 {code: {'name', 'industry', 'tech', ...}}
+        valid_dates: 交易日列表（已过滤掉无次日指数收益的日期）
+        day_fn: day_fn(test_date, sector_info) → 当日市场字段 dict，须含 'risk'
+        tradeable_fn: tradeable_fn(code, static) → bool
+        classify_fn: classify_fn(industry) → (is_defensive, is_high_beta)
+        profile: 'v25' = 只过滤 |昨日涨跌幅|>9.5；
+                 'v26' = IPO + 昨日涨幅>阈值 + 近5日多次涨停（V26~V28）
+        with_extra: 是否输出 extra_s（V26 起）
+        with_stock_vol: 是否输出 stock_vol（V27）
+        sector_exclude: 不参与板块热度统计的行业名（V25 只排除 'unknown'）
+    """
+    sub = panel.subscores()
+    limit_ups = panel.limit_up_counts(limit_up_threshold)
+    S = len(panel)
+    rows_all = np.arange(S)
+
+    statics = [scores.get(code) for code in panel.codes]
+    names = [s.get('name', '') if s else '' for s in statics]
+    industries = [s.get('industry', 'unknown') if s else 'unknown' for s in statics]
+    peer_codes, _ = encode_labels(industries)
+    sector_labels = [s.get('industry', 'unknown') if s else None for s in statics]
+    sector_labels = [lab if lab not in sector_exclude else None for lab in sector_labels]
+    sector_codes, sector_names = encode_labels(sector_labels)
+    tradeable = np.array([tradeable_fn(code, s) for code, s in zip(panel.codes, statics)], dtype=bool)
+    flags = [classify_fn(ind) for ind in industries]
+    is_def = np.array([f[0] for f in flags], dtype=bool)
+    is_hb = np.array([f[1] for f in flags], dtype=bool)
+    extra = [(s.get('tech', 5.0) * 5 + s.get('fund', 5.0) * 3 + s.get('chip', 5.0) * 2
+              + s.get('sector', 5.0) * 3) / 13 * 10 if s else 50 for s in statics]
+
+    sector_table = None
+    if USE_SECTOR_TABLE:
+        from sector_aggregates import get_sector_aggregates
+        sector_table = get_sector_aggregates(panel, sector_codes, sector_names)
+
+    fwd_table = get_forward_returns(panel)
+    daily_data = []
+    for day_idx, test_date in enumerate(valid_dates):
+        pos = panel.positions(test_date)
+        if sector_table is not None:
+            sector_info = sector_table.hot_sectors(test_date)
+        else:
+            sector_info = panel.hot_sectors(pos, sector_codes, sector_names)
+        day = day_fn(test_date, sector_info)
+        risk = day['risk']
+
+        debug_skip = defaultdict(int)
+        keep = tradeable.copy()
+        debug_skip['pt_st'] = int((~tradeable).sum())
+        checks = [('no_future', pos >= panel.lengths), ('short_hist', pos < 20)]
+        last_pct = sub['last_pct'][rows_all, pos]
+        if profile == 'v25':
+            checks.append(('limit_move', np.abs(last_pct) > 9.5))
+        else:
+            checks += [('ipo', panel.lengths < ipo_min_days),
+                       ('limit_up_yesterday', last_pct > limit_up_threshold),
+                       ('multi_limit_up', limit_ups[rows_all, pos] >= 2)]
+        for label, bad in checks:
+            hit = keep & bad
+            debug_skip[label] = int(hit.sum())
+            keep &= ~bad
+
+        r = np.flatnonzero(keep)
+        p = pos[r]
+        ret5 = sub['ret5'][r, p]
+        rs = group_percentile_rank(ret5, peer_codes[r])
+        heat = np.array([sector_info['all_heat'].get(industries[i], 0) for i in r.tolist()],
+                        dtype=np.float64)
+        sector_s = _pyclip((heat + 5) * 10, 0, 100)
+        if risk >= 4:
+            risk_adj = np.where(is_def[r], 80, np.where(is_hb[r], 20, 40))
+        elif risk <= 2:
+            risk_adj = np.where(is_hb[r], 70, np.where(is_def[r], 40, 55))
+        else:
+            risk_adj = np.full(len(r), 55)
+        trend = sub['trend_s'][r, p]
+        direction = np.select([trend >= 75, trend >= 55, trend >= 45, trend >= 25],
+                              ['strong_up', 'up', 'neutral', 'down'], 'strong_down')
+        stock_ret = [None if v != v else v for v in fwd_table.day(test_date, 1, rows=r).tolist()]
+
+        cols = {
+            'trend_s': trend.tolist(),
+            'money_s': sub['money_s'][r, p].tolist(),
+            'sector_s': sector_s.tolist(),
+            'rs_s': rs.tolist(),
+            'vol_s': sub['vol_s'][r, p].tolist(),
+            'risk_adj': risk_adj.tolist(),
+            'trend_dir': direction.tolist(),
+            'div_bullish': sub['bull'][r, p].tolist(),
+            'div_bearish': sub['bear'][r, p].tolist(),
+            'div_strength': sub['div_strength'][r, p].tolist(),
+        }
+        stock_vol = sub['stock_vol'][r, p].tolist() if with_stock_vol else None
+
+        stock_scores = []
+        for j, i in enumerate(r.tolist()):
+            s = {
+                'code': panel.codes[i],
+                'name': names[i],
+                'industry': industries[i],
+                'trend_s': cols['trend_s'][j],
+                'money_s': cols['money_s'][j],
+                'sector_s': cols['sector_s'][j],
+                'rs_s': cols['rs_s'][j],
+                'vol_s': cols['vol_s'][j],
+                'risk_adj': cols['risk_adj'][j],
+            }
+            if with_extra:
+                s['extra_s'] = extra[i]
+            s.update({
+                'trend_dir': cols['trend_dir'][j],
+                'div_bullish': cols['div_bullish'][j],
+                'div_bearish': cols['div_bearish'][j],
+                'div_strength': cols['div_strength'][j],
+                'stock_return': stock_ret[j],
+            })
+            if with_stock_vol:
+                s['stock_vol'] = stock_vol[j]
+            stock_scores.append(s)
+
+        day['test_date'] = test_date
+        day['stocks'] = stock_scores
+        daily_data.append(day)
+
+        if log_every and (day_idx + 1) % log_every == 0:
+            skip_str = ', '.join(f'{k}={v}' for k, v in sorted(debug_skip.items()) if v > 0)
+            print(f"    {day_idx + 1}/{len(valid_dates)} days "
+                  f"({len(stock_scores)} scored, skips: {skip_str}) [panel]")
+
+    return daily_data
+
+
+def compare_daily_data(a, b, keys=('trend_s', 'money_s', 'sector_s', 'rs_s', 'vol_s',
+                                   'risk_adj', 'div_strength', 'stock_return'), tol=1e-4):
+    """抽查两份 daily_data（如旧路径 vs 面板）是否一致，返回差异统计"""
+    report = {'days': 0, 'stocks': 0, 'missing': 0, 'mismatch': defaultdict(int), 'max_diff': {}}
+    for da, db in zip(a, b):
+        report['days'] += 1
+        mb = {s['code']: s for s in db['stocks']}
+        for sa in da['stocks']:
+            sb = mb.get(sa['code'])
+            if sb is None:
+                report['missing'] += 1
+                continue
+            report['stocks'] += 1
+            for k in keys:
+                va, vb = sa.get(k), sb.get(k)
+                if va is None or vb is None:
+                    if va is not vb:
+                        report['mismatch'][k] += 1
+                    continue
+                d = abs(float(va) - float(vb))
+                if d > tol:
+                    report['mismatch'][k] += 1
+                report['max_diff'][k] = max(report['max_diff'].get(k, 0.0), d)
+        report['missing'] += max(0, len(db['stocks']) - len(da['stocks']))
+    report['mismatch'] = dict(report['mismatch'])
+    return report
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行 Optuna 优化 - 多进程共享预计算数据
+
+单进程 study.optimize 在 900~1200 秒超时内能跑的 trial 数有限。
+这里把 trial 分发到进程池：
+  1. 预计算好的 daily_data 只序列化一次，放进 multiprocessing.shared_memory：
+     其中的 numpy 数值数组（如 fast_evaluator 打包后的子分数矩阵）原样拷进共享内存，
+     worker 直接在共享内存上建只读 ndarray 视图，所有进程共用同一份；
+     其余 Python 对象（dict/list）每个 worker 启动时反序列化一次，仍是各自的私有副本，
+     因此数据量大时应在主进程先打包成数组再传入
+  2. 各 worker 通过本地存储协调同一个 study：默认 Optuna journal 文件，
+     也可以传 sqlite:///xxx.db
+  3. MaxTrialsCallback 控制全局 trial 总数（并发下可能多出几个），每个 worker 各自受 timeout 约束，
+     因此同样的超时下 trial 数随核数近似线性增长
+  4. 任一 worker 异常退出时抛出 RuntimeError（不把部分结果当作成功）；
+     结束后 study 复制到内存存储返回，默认的 journal 文件随即删除，目录中残留的旧 journal 只保留最近几份
+
+约定：
+  make_objective(data) -> objective(trial) 必须是模块级函数（子进程按引用导入），
+  objective 里把最终参数写进 trial.set_user_attr('params', ...)，
+  主进程结束后从 study.best_trial.user_attrs 取回。
+
+使用方法：
+    from parallel_optuna import optimize_parallel, default_n_jobs
+    study = optimize_parallel(_make_objective, {'train': ..., 'valid': ...},
+                              n_trials=300, timeout=900, n_jobs=default_n_jobs(),
+                              study_name='v24_unified_wf')
+    best = study.best_trial.user_attrs['params']
+"""
+
+import io
+import os
+import pickle
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STUDY_DIR = os.path.join(BASE_DIR, 'backtest_results', 'optuna_studies')
+
+# 环境变量 OPTUNA_N_JOBS 可覆盖默认并发数（1 = 原来的单进程模式）
+N_JOBS_ENV = 'OPTUNA_N_JOBS'
+
+# 不小于此字节数的数值数组放进共享内存，由各 worker 共用
+MIN_SHARED_BYTES = 4096
+_ALIGN = 64
+# STUDY_DIR 中最多保留的 journal 数（失败运行留下的，按修改时间淘汰）
+MAX_JOURNAL_FILES = 10
+
+
+def default_n_jobs(max_jobs=8):
+    """默认并发数：环境变量优先，否则 CPU 核数-1（上限 max_jobs，避免每个 worker 一份数据撑爆内存）"""
+    env = os.environ.get(N_JOBS_ENV)
+    if env:
+        try:
+            return max(1, int(env))
+        except ValueError:
+            pass
+    return max(1, min(max_jobs, (os.cpu_count() or 1) - 1))
+
+
+# ============================================================================
+# 共享内存中的只读数据
+# ============================================================================
+class _ArrayPickler(pickle.Pickler):
+    """序列化时把较大的数值数组替换成编号，数组本身另行拷进共享内存"""
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays = []
+
+    def persistent_id(self, obj):
+        if (type(obj) is np.ndarray and obj.dtype.kind in 'biufcmM'
+                and obj.nbytes >= MIN_SHARED_BYTES):
+            self.arrays.append(obj)
+            return len(self.arrays) - 1, obj.shape, obj.dtype.str
+        return None
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    """反序列化时把数组编号换成共享内存上的只读视图"""
+
+    def __init__(self, file, buf, offsets):
+        super().__init__(file)
+        self.buf = buf
+        self.offsets = offsets
+
+    def persistent_load(self, pid):
+        k, shape, dtype = pid
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.buf, offset=self.offsets[k])
+        arr.flags.writeable = False
+        return arr
+
+
+class SharedPayload:
+    """把可 pickle 的对象放进一块共享内存，供子进程按名字读取
+
+    布局：[pickle 字节流][按 64 字节对齐的各数组数据]，数组在 pickle 中只是编号。
+    """
+
+    def __init__(self, obj):
+        f = io.BytesIO()
+        pickler = _ArrayPickler(f)
+        pickler.dump(obj)
+        blob = f.getbuffer()
+        self.size = len(blob)
+        self.offsets = []
+        pos = self.size
+        for arr in pickler.arrays:
+            pos = (pos + _ALIGN - 1) // _ALIGN * _ALIGN
+            self.offsets.append(pos)
+            pos += arr.nbytes
+        self.nbytes = pos
+        self.array_bytes = pos - self.size
+        self.shm = shared_memory.SharedMemory(create=True, size=max(pos, 1))
+        self.shm.buf[:self.size] = blob
+        for arr, off in zip(pickler.arrays, self.offsets):
+            view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=self.shm.buf, offset=off)
+            view[...] = arr
+            del view
+        self.name = self.shm.name
+        del blob, f
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# worker 进程中映射的共享内存（数组视图引用它，进程存活期间保持打开）
+_ATTACHED = []
+
+
+def load_shared(name, size, offsets=()):
+    """子进程：映射共享内存，反序列化对象结构，数值数组为共享内存上的只读视图（每个 worker 只做一次）"""
+    shm = shared_memory.SharedMemory(name=name)
+    obj = _ArrayUnpickler(io.BytesIO(shm.buf[:size]), shm.buf, list(offsets)).load()
+    if offsets:
+        _ATTACHED.append(shm)
+    else:
+        shm.close()
+    return obj
+
+
+# ============================================================================
+# 存储
+# ============================================================================
+def _make_storage(spec):
+    """spec: 'sqlite:///...' / 其他 RDB URL，或 journal 文件路径"""
+    import optuna
+    if '://' in spec:
+        return optuna.storages.RDBStorage(spec, engine_kwargs={'connect_args': {'timeout': 60}}
+                                          if spec.startswith('sqlite') else None)
+    try:
+        from optuna.storages.journal import JournalFileBackend, JournalFileOpenLock
+        backend = JournalFileBackend(spec, lock_obj=JournalFileOpenLock(spec))
+    except ImportError:  # optuna < 4.0
+        from optuna.storages import JournalFileStorage, JournalFileOpenLock
+        backend = JournalFileStorage(spec, lock_obj=JournalFileOpenLock(spec))
+    return optuna.storages.JournalStorage(backend)
+
+
+def _default_storage_spec(study_name):
+    os.makedirs(STUDY_DIR, exist_ok=True)
+    return os.path.join(STUDY_DIR, f'{study_name}.journal')
+
+
+def _remove_journal(path):
+    """删除 journal 及其锁文件"""
+    for p in (path, path + '.lock'):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"  [Parallel] 删除 {p} 失败: {e}")
+
+
+def _prune_journals(directory=STUDY_DIR, keep=MAX_JOURNAL_FILES):
+    """只保留最近 keep 份 journal（失败的运行会留下 journal 供排查）"""
+    try:
+        files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.journal')]
+    except OSError:
+        return
+    files.sort(key=os.path.getmtime, reverse=True)
+    for path in files[keep:]:
+        _remove_journal(path)
+
+
+# ============================================================================
+# Worker
+# ============================================================================
+def _worker(make_objective, shm_name, shm_size, shm_offsets, study_name, storage_spec,
+            n_trials, timeout, seed, worker_id):
+    import optuna
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    t0 = time.time()
+    data = load_shared(shm_name, shm_size, shm_offsets)
+    objective = make_objective(data)
+    sampler = optuna.samplers.TPESampler(seed=seed, constant_liar=True)
+    study = optuna.load_study(study_name=study_name, storage=_make_storage(storage_spec),
+                              sampler=sampler)
+    # 数据加载时间也计入超时，保证所有 worker 与单进程模式同一时间窗口结束
+    remaining = None if timeout is None else max(1.0, timeout - (time.time() - t0))
+    done = [0]
+
+    def _count(study_, trial_):
+        done[0] += 1
+
+    study.optimize(objective, timeout=remaining, show_progress_bar=False,
+                   callbacks=[optuna.study.MaxTrialsCallback(n_trials, states=None), _count])
+    return worker_id, done[0]
+
+
+# ============================================================================
+# 入口
+# ============================================================================
+def optimize_parallel(make_objective, data, n_trials, timeout=None, n_jobs=None,
+                      study_name=None, storage=None, direction='maximize', seed=None):
+    """并行运行一个 Optuna study，返回加载好的 study
+
+    Args:
+        make_objective: 模块级函数，make_objective(data) -> objective(trial)
+        data: 只读的预计算数据（会放进共享内存）
+        n_trials: 全部 worker 合计的 trial 上限
+        timeout: 每个 worker 的超时秒数（与单进程模式相同的时间窗口）
+        n_jobs: 进程数，None 取 default_n_jobs()，1 = 进程内单线程运行
+        study_name: study 名前缀（实际名称附加时间戳）
+        storage: 'sqlite:///path.db' 或 journal 文件路径，None = backtest_results/optuna_studies 下的 journal
+                 （None 时结束后 study 复制到内存、journal 删除；传入的存储保持不动）
+        seed: 采样种子，各 worker 依次 +1
+
+    Raises:
+        RuntimeError: 有 worker 异常退出（journal 保留供排查）
+    """
+    import optuna
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    if n_jobs is None:
+        n_jobs = default_n_jobs()
+
+    if n_jobs <= 1:
+        sampler = optuna.samplers.TPESampler(seed=seed) if seed is not None else None
+        study = optuna.create_study(direction=direction, sampler=sampler)
+        study.optimize(make_objective(data), n_trials=n_trials, timeout=timeout,
+                       show_progress_bar=False)
+        return study
+
+    # 每次运行独立的 study，避免复用旧 journal 中的 trial
+    study_name = f"{study_name or 'study'}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    storage_spec = storage or _default_storage_spec(study_name)
+    optuna.create_study(study_name=study_name, storage=_make_storage(storage_spec),
+                        direction=direction)
+
+    print(f"  [Parallel] {n_jobs} workers, study={study_name}, storage={storage_spec}")
+    t0 = time.time()
+    base_seed = seed if seed is not None else int(time.time()) % 100000
+    failures = []
+    with SharedPayload(data) as payload:
+        print(f"  [Parallel] shared daily_data: {payload.nbytes / 1024 / 1024:.1f}MB "
+              f"({len(payload.offsets)} arrays, {payload.array_bytes / 1024 / 1024:.1f}MB shared read-only)")
+        with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+            futures = [ex.submit(_worker, make_objective, payload.name, payload.size, payload.offsets,
+                                 study_name, storage_spec, n_trials, timeout,
+                                 base_seed + i, i)
+                       for i in range(n_jobs)]
+            for fut in as_completed(futures):
+                try:
+                    worker_id, done = fut.result()
+                    print(f"  [Parallel] worker {worker_id} finished {done} trials")
+                except Exception as e:
+                    print(f"  [Parallel] worker failed: {e!r}")
+                    failures.append(e)
+
+    if failures:
+        raise RuntimeError(f"{len(failures)}/{n_jobs} 个 worker 异常退出，study={study_name}, "
+                           f"storage={storage_spec}: {failures[0]!r}") from failures[0]
+
+    study = optuna.load_study(study_name=study_name, storage=_make_storage(storage_spec))
+    n_done = len(study.get_trials(deepcopy=False,
+                                  states=(optuna.trial.TrialState.COMPLETE,)))
+    print(f"  [Parallel] {n_done} trials completed in {time.time() - t0:.0f}s")
+
+    if storage is None:
+        # 结果复制到内存存储后删除默认 journal，调用方照常读取 best_trial / user_attrs
+        memory = optuna.storages.InMemoryStorage()
+        optuna.copy_study(from_study_name=study_name, from_storage=study._storage,
+                          to_storage=memory)
+        study = optuna.load_study(study_name=study_name, storage=memory)
+        _remove_journal(storage_spec)
+        _prune_journals()
+    return study
+
+
+def best_user_attrs(study):
+    """study 中最优 trial 的 user_attrs；没有完成的 trial 时返回 None"""
+    try:
+        best = study.best_trial
+    except ValueError:
+        return None
+    return dict(best.user_attrs, value=best.value, number=best.number)
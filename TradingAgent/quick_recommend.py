@@ -76,10 +76,31 @@ def load_latest_scores(data_dir):
         return json.load(f), latest_file
 
 
+def _load_from_data_store(comp_file):
+    """综合数据存储存在时只读出基础信息和财务数据，否则返回 None"""
+    shared_dir = os.path.dirname(os.path.dirname(os.path.abspath(comp_file)))
+    if shared_dir not in sys.path:
+        sys.path.insert(0, shared_dir)
+    try:
+        from stock_data_store import open_stock_data_store, store_path_for
+        if not os.path.exists(store_path_for(comp_file)):
+            return None
+        store = open_stock_data_store(comp_file, migrate=False)
+        data = store.load_all(kinds=('basic', 'financial', 'industry', 'meta'))
+        return {code: d for code, d in data.items()
+                if 'financial_data' in d or 'basic_info' in d} or None
+    except Exception:
+        return None
+
+
 def load_comprehensive_data(data_dir):
     """加载 comprehensive_stock_data 合并字典。"""
-    all_data = {}
     comp_file = os.path.join(data_dir, 'comprehensive_stock_data.json')
+    stored = _load_from_data_store(comp_file)
+    if stored:
+        return stored
+
+    all_data = {}
     if os.path.exists(comp_file):
         try:
             with open(comp_file, 'r', encoding='utf-8') as f:
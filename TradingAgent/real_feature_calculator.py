@@ -12,6 +12,10 @@ Real Feature Calculator — 方案A核心模块
 用真实K线数据计算 RSI、MA偏离度、连涨天数、波动率等特征，
 与回测保持100%一致。
 
+K线窗口：与 _load_kline 一致，少量（≤FULL_HISTORY_MAX_CODES）指定代码按完整历史计算，
+全市场时只看最近 FEATURE_BARS 根。streak、max_dd_10d、consistency 依赖窗口首根K线/窗口长度，
+指标状态路径按同样规则取值（全市场时只用最近40根，不用状态中的完整历史量），结果与旧加载方式一致。
+
 使用方法：
     from real_feature_calculator import RealFeatureCalculator
     calc = RealFeatureCalculator()
@@ -34,6 +38,14 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 KLINE_CACHE = os.path.join(DATA_DIR, 'kline_cache')
 
+sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
+
+BAR_FIELDS = ('close', 'volume', 'high', 'low', 'turn', 'pctChg')
+FEATURE_BARS = 40   # 特征只用最近40根K线（与全量加载时保留的条数一致）
+FULL_HISTORY_MAX_CODES = 100  # 指定代码不超过此数时按完整历史计算，否则只看最近 FEATURE_BARS 根
+USE_INDICATOR_STATE = True   # 优先从指标状态 (TradingShared/indicator_state.py) 取最近K线
+USE_BETA_MATRIX = True       # Beta/相对强度优先查全市场矩阵 (TradingShared/beta_matrix.py)
+
 # 防御型/高Beta行业关键词（与回测一致）
 DEFENSIVE_KEYWORDS = [
     '电力', '水务', '燃气', '公用', '银行', '医药', '食品', '饮料',
@@ -69,19 +81,33 @@ def normalize_code(code: str) -> str:
 # ============================================================================
 def calc_features(df, target_date):
     """计算K线特征 — 与回测完全一致"""
-    hist = df[df['date'] < target_date].copy()
+    hist = df[df['date'] < target_date]
     if len(hist) < 20:
         return None
+    return calc_features_from_bars({col: hist[col].values for col in BAR_FIELDS if col in hist.columns})
 
-    c = hist['close'].values
-    v = hist['volume'].values
-    h = hist['high'].values if 'high' in hist.columns else c
-    lo = hist['low'].values if 'low' in hist.columns else c
-    turn = hist['turn'].values if 'turn' in hist.columns else np.ones(len(c))
-    pct = hist['pctChg'].values if 'pctChg' in hist.columns else np.zeros(len(c))
+
+def calc_features_from_bars(bars, history=None):
+    """由 {field: ndarray} 计算特征（字段缺失时的处理与 DataFrame 缺列相同）
+
+    供指标状态 (indicator_state.IndicatorState.window) 直接调用，不再构建、过滤 DataFrame。
+    streak、max_dd_10d 与 consistency 的最后一项依赖完整历史（首根K线），bars 只是最近一段时
+    由 history = IndicatorState.history(code) 给出 {'first_close', 'streak'}。
+    """
+    c = bars['close']
+    if len(c) < 20:
+        return None
+    v = bars['volume']
+    has_high = 'high' in bars
+    has_low = 'low' in bars
+    h = bars['high'] if has_high else c
+    lo = bars['low'] if has_low else c
+    turn = bars['turn'] if 'turn' in bars else np.ones(len(c))
+    pct = bars['pctChg'] if 'pctChg' in bars else np.zeros(len(c))
 
     n = len(c)
     f = {}
+    first_close = history['first_close'] if history is not None else c[0]
 
     f['r1'] = (c[-1] - c[-2]) / c[-2] * 100 if n >= 2 else 0
     f['r3'] = (c[-1] - c[-4]) / c[-4] * 100 if n >= 4 else 0
@@ -161,14 +187,17 @@ def calc_features(df, target_date):
     f['price_pos'] = (c[-1] - np.min(c[-w20:])) / max(np.max(c[-w20:]) - np.min(c[-w20:]), 0.01) * 100
 
     # 连涨/连跌天数
-    streak = 0
-    for i in range(n-1, 0, -1):
-        if c[i] > c[i-1]:
-            streak = streak + 1 if streak >= 0 else 1
-        elif c[i] < c[i-1]:
-            streak = streak - 1 if streak <= 0 else -1
-        else:
-            break
+    if history is not None:
+        streak = history['streak']
+    else:
+        streak = 0
+        for i in range(n-1, 0, -1):
+            if c[i] > c[i-1]:
+                streak = streak + 1 if streak >= 0 else 1
+            elif c[i] < c[i-1]:
+                streak = streak - 1 if streak <= 0 else -1
+            else:
+                break
     f['streak'] = streak
 
     # 均值回归
@@ -184,9 +213,10 @@ def calc_features(df, target_date):
         peak = c[-10]
         max_dd = 0
         for i in range(-9, 1):
-            if c[i] > peak:
-                peak = c[i]
-            dd = (c[i] - peak) / peak * 100
+            ci = c[i] if i < 0 else first_close
+            if ci > peak:
+                peak = ci
+            dd = (ci - peak) / peak * 100
             if dd < max_dd:
                 max_dd = dd
         f['max_dd_10d'] = max_dd
@@ -201,7 +231,7 @@ def calc_features(df, target_date):
     f['consistency'] = 0
     if n >= 5:
         for i in range(-4, 0):
-            if c[i+1] > c[i]:
+            if (c[i+1] if i < -1 else first_close) > c[i]:
                 f['consistency'] += 1
 
     # === V22 新增特征（与 backtest_v22_honest.py 完全一致） ===
@@ -220,7 +250,7 @@ def calc_features(df, target_date):
         f['bb_upper_dist'] = 5.0
 
     # 2. ATR ratio (ATR14 / ATR28，与backtest一致)
-    if n >= 28 and 'high' in df.columns:
+    if n >= 28 and has_high:
         trs14 = []
         for i in range(-14, 0):
             tr = max(h[i] - lo[i], abs(h[i] - c[i-1]), abs(lo[i] - c[i-1]))
@@ -248,8 +278,8 @@ def calc_features(df, target_date):
 
     # 4. 支撑位距离 (与backtest一致: 相对20日高低范围的位置)
     if n >= 20:
-        low_20d = np.min(lo[-20:]) if 'low' in df.columns else np.min(c[-20:])
-        high_20d = np.max(h[-20:]) if 'high' in df.columns else np.max(c[-20:])
+        low_20d = np.min(lo[-20:]) if has_low else np.min(c[-20:])
+        high_20d = np.max(h[-20:]) if has_high else np.max(c[-20:])
         range_20d = high_20d - low_20d
         if range_20d > 0.01:
             f['support_dist'] = (c[-1] - low_20d) / range_20d
@@ -306,8 +336,12 @@ class RealFeatureCalculator:
     """真实特征计算器 — 用K线数据替代估算映射"""
 
     def __init__(self):
-        self.kline = None      # {code: DataFrame}
+        self.kline = None      # {code: DataFrame}，指标状态可用时按需加载
+        self.state = None      # indicator_state.IndicatorState
+        self._codes = None
+        self._full_history = False  # 是否按完整历史计算 streak 等依赖首根K线的特征
         self.index_df = None   # 指数DataFrame
+        self.beta_matrix = None  # beta_matrix.BetaMatrix，按日期对齐的 Beta/相对强度
         self.scores = None     # 静态评分 {code: {tech, fund, chip, sector, name, industry}}
         self._loaded = False
 
@@ -321,12 +355,19 @@ class RealFeatureCalculator:
             return True
 
         try:
-            # 1. 加载K线
-            self.kline = self._load_kline(codes=codes)
-            if not self.kline:
-                logger.error("K线数据加载失败")
-                return False
-            logger.info(f"K线数据加载成功: {len(self.kline)} 只股票")
+            # 1. 加载K线：指标状态可用时直接取每只股票的最近K线，不构建 DataFrame
+            self._codes = codes
+            self._full_history = bool(codes) and len(codes) <= FULL_HISTORY_MAX_CODES
+            if USE_INDICATOR_STATE:
+                self.state = self._open_state()
+            if self.state is not None:
+                logger.info(f"指标状态加载成功: {len(self.state)} 只股票")
+            else:
+                self.kline = self._load_kline(codes=codes)
+                if not self.kline:
+                    logger.error("K线数据加载失败")
+                    return False
+                logger.info(f"K线数据加载成功: {len(self.kline)} 只股票")
 
             # 2. 加载指数
             self.index_df = self._load_index()
@@ -334,6 +375,8 @@ class RealFeatureCalculator:
                 logger.warning("指数数据加载失败，Beta和相对强度将使用默认值")
             else:
                 logger.info(f"指数数据加载成功: {len(self.index_df)} 天")
+            if USE_BETA_MATRIX:
+                self.beta_matrix = self._open_beta_matrix()
 
             # 3. 加载静态评分
             self.scores = self._load_scores()
@@ -348,6 +391,47 @@ class RealFeatureCalculator:
             traceback.print_exc()
             return False
 
+    def loaded_count(self):
+        """可计算特征的股票数"""
+        if self.state is not None:
+            return len(self.state)
+        return len(self.kline or {})
+
+    def _open_state(self):
+        """打开并同步指标状态，不可用时返回 None"""
+        try:
+            from indicator_state import open_indicator_state
+        except ImportError:
+            return None
+        return open_indicator_state()
+
+    def _open_beta_matrix(self):
+        """打开（必要时增量更新）Beta 矩阵，不可用时返回 None"""
+        try:
+            from beta_matrix import open_beta_matrix
+        except ImportError:
+            return None
+        return open_beta_matrix(verbose=False)
+
+    def _get_bars(self, code, target_date):
+        """目标日之前的K线 (bars, history)
+
+        状态的最后一根K线早于目标日时取状态中最近 FEATURE_BARS 根K线；只有按完整历史计算时
+        才附带历史量（首根收盘价、不受窗口限制的连涨天数），全市场时与旧加载方式一样只看这 40 根。
+        目标日落在已有K线之内（回看历史日期）或股票不在状态中时改用K线 DataFrame。
+        """
+        if self.state is not None:
+            history = self.state.history(code, before=target_date)
+            if history is not None:
+                return self.state.window(code, FEATURE_BARS), (history if self._full_history else None)
+        if self.kline is None:
+            self.kline = self._load_kline(codes=self._codes)
+        df = self.kline.get(code)
+        if df is None:
+            return None, None
+        hist = df[df['date'] < target_date]
+        return {col: hist[col].values for col in BAR_FIELDS if col in hist.columns}, None
+
     def _load_kline(self, codes=None):
         """加载K线数据
         
@@ -384,7 +468,20 @@ class RealFeatureCalculator:
             code_set = {normalize_code(c) for c in codes}
 
         # 如果指定了少量codes且文件大，尝试用ijson流式解析
-        use_ijson = code_set and len(code_set) <= 100 and fsize > 10
+        use_ijson = code_set and len(code_set) <= FULL_HISTORY_MAX_CODES and fsize > 10
+
+        # 列式存储可用时按行读取，不再解析整个JSON
+        try:
+            from kline_store import open_kline_store
+            store = open_kline_store(source=kline_file)
+        except ImportError:
+            store = None
+        if store is not None:
+            targets = code_set if code_set else store.codes
+            # 与下面两条路径保持一致：少量指定代码保留全量历史，否则只保留最近40条
+            kline = store.frames(targets, tail=None if use_ijson else 40)
+            logger.info(f"  列式存储加载: {len(kline)}/{len(targets)} 只")
+            return kline
         
         if use_ijson:
             try:
@@ -544,6 +641,30 @@ class RealFeatureCalculator:
 
         return idx_rets_20, idx_ret_5d, idx_ret_3d
 
+    def _beta_rs_from_bars(self, s_closes, target_date):
+        """逐只计算 (beta, 5日相对强度, 3日相对强度)，按位置与指数对齐（矩阵不可用时使用）"""
+        idx_rets_20, idx_ret_5d, idx_ret_3d = self._get_index_info(target_date)
+        s_n = len(s_closes)
+
+        beta = 1.0
+        if idx_rets_20 is not None and s_n >= 23:
+            s_rets_20 = np.diff(s_closes[-21:]) / s_closes[-21:-1] * 100
+            sr_len = min(len(s_rets_20), len(idx_rets_20))
+            if sr_len >= 10:
+                s_r = s_rets_20[-sr_len:]
+                i_r = idx_rets_20[-sr_len:]
+                idx_var = np.var(i_r)
+                if idx_var > 0.001:
+                    beta = np.cov(s_r, i_r)[0, 1] / idx_var
+
+        rel_str = 0.0
+        rel_str_3d = 0.0
+        if s_n >= 6:
+            rel_str = (s_closes[-1] - s_closes[-6]) / s_closes[-6] * 100 - idx_ret_5d
+        if s_n >= 4:
+            rel_str_3d = (s_closes[-1] - s_closes[-4]) / s_closes[-4] * 100 - idx_ret_3d
+        return beta, rel_str, rel_str_3d
+
     def compute_real_subscores(self, code: str, target_date=None, 
                                 stock_data: Dict = None) -> Optional[Dict]:
         """计算单只股票的真实子分数
@@ -569,14 +690,14 @@ class RealFeatureCalculator:
         else:
             target_date = pd.Timestamp(target_date)
 
-        # 获取K线数据
-        df = self.kline.get(code)
-        if df is None or len(df) < 20:
-            logger.debug(f"  {code}: K线数据不足({len(df) if df is not None else 0}天)")
+        # 获取目标日之前的K线
+        bars, history = self._get_bars(code, target_date)
+        if bars is None or len(bars['close']) < 20:
+            logger.debug(f"  {code}: K线数据不足({len(bars['close']) if bars is not None else 0}天)")
             return None
 
         # 计算特征
-        feats = calc_features(df, target_date)
+        feats = calc_features_from_bars(bars, history)
         if feats is None:
             return None
 
@@ -585,31 +706,16 @@ class RealFeatureCalculator:
             logger.debug(f"  {code}: 涨停/跌停，跳过")
             return None
 
-        # 计算Beta
-        idx_rets_20, idx_ret_5d, idx_ret_3d = self._get_index_info(target_date)
-
-        stock_hist = df[df['date'] < target_date]
-        s_closes = stock_hist['close'].values
-        s_n = len(s_closes)
-
-        beta = 1.0
-        if idx_rets_20 is not None and s_n >= 23:
-            s_rets_20 = np.diff(s_closes[-21:]) / s_closes[-21:-1] * 100
-            sr_len = min(len(s_rets_20), len(idx_rets_20))
-            if sr_len >= 10:
-                s_r = s_rets_20[-sr_len:]
-                i_r = idx_rets_20[-sr_len:]
-                idx_var = np.var(i_r)
-                if idx_var > 0.001:
-                    beta = np.cov(s_r, i_r)[0, 1] / idx_var
+        s_n = len(bars['close'])
 
-        # 相对强度
-        rel_str = 0.0
-        rel_str_3d = 0.0
-        if s_n >= 6:
-            rel_str = (s_closes[-1] - s_closes[-6]) / s_closes[-6] * 100 - idx_ret_5d
-        if s_n >= 4:
-            rel_str_3d = (s_closes[-1] - s_closes[-4]) / s_closes[-4] * 100 - idx_ret_3d
+        # Beta 与相对强度：矩阵按日期对齐，取目标日之前最后一个交易日
+        looked_up = None
+        if self.beta_matrix is not None:
+            looked_up = self.beta_matrix.beta_rs(code, target_date, before=True)
+        if looked_up is not None:
+            beta, rel_str, rel_str_3d = looked_up
+        else:
+            beta, rel_str, rel_str_3d = self._beta_rs_from_bars(bars['close'], target_date)
 
         feats['beta_20d'] = beta
         feats['rel_strength_5d'] = rel_str
@@ -734,7 +840,7 @@ class RealFeatureCalculator:
 
         # OBV trend score (与backtest完全一致)
         obv_acc = f.get('obv_accel', 0)
-        avg_v = np.mean(stock_hist['volume'].values[-10:]) if s_n >= 10 else 1
+        avg_v = np.mean(bars['volume'][-10:]) if s_n >= 10 else 1
         obv_norm = obv_acc / max(avg_v, 1) * 100
         if obv_norm > 10: obv_s = 3.5
         elif obv_norm > 0: obv_s = 2.5
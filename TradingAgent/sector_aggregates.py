@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+板块聚合表 — identify_hot_sectors 的全区间预计算版
+
+identify_hot_sectors 每个交易日都要遍历全部股票、做 df[df['date'] < date] 掩码，
+再按行业求 5 日涨幅均值、上涨比例和量比。这里把同样的统计一次算成 (行业 × 日期) 表：
+  1. 复用面板的 ret5 / vol_ratio（按历史长度 n 索引）和 count_before（每日历史长度）
+  2. 以 行业编号 × 列数 + 日期列 为分组键，np.bincount 一次得到全部 (行业, 日期) 的
+     样本数、收益和、上涨数、量比和，按日期列分块控制临时数组内存
+  3. 表落盘到 kline_cache/sector_agg/<签名>.npz，签名覆盖股票集合、K线长度、
+     最后一根K线和行业映射，数据或映射变化后自动重建
+  4. hot_sectors(date) 只做一次 searchsorted + 按列取值，与股票数无关
+
+列语义与 KlinePanel.count_before 相同：第 g 列 = dates[g] 之前（不含当日）的全部K线，
+最后一列为全部K线。热度公式、样本数门槛（收益 ≥3、量比 ≥2）与 identify_hot_sectors 一致；
+均值按 bincount 顺序求和，与逐日 np.mean 只有 1e-12 量级的舍入差异。
+
+实盘单日查询用 hot_sectors_for()：不建全区间表，逐只 searchsorted 取最近 15 根K线汇总。
+另提供 sector_return_snapshot()：sector_rotation K线兜底用的各板块最新 5/10/20 日平均涨幅。
+
+使用方法：
+    from sector_aggregates import get_sector_aggregates, hot_sectors_for
+    table = get_sector_aggregates(panel, sector_codes, sector_names)
+    info = table.hot_sectors('2026-03-02')     # {'hot', 'all_heat', 'sector_concentration'}
+    info = hot_sectors_for(kline, scores, date)  # 实盘单日快照，直接从 {code: DataFrame} 计算
+"""
+
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from panel_engine import UNKNOWN_INDUSTRIES, encode_labels
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SECTOR_AGG_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data', 'kline_cache', 'sector_agg')
+TABLE_VERSION = 1
+MAX_TABLE_FILES = 8           # 目录中最多保留的表文件数（按修改时间淘汰）
+HOT_TOP_N = 8
+MIN_RET_COUNT = 3             # 行业至少 3 只股票有 5 日涨幅才计算热度
+MIN_VOL_COUNT = 2             # 至少 2 只股票有量比才取均值，否则按 1.0
+
+# 每块处理的日期列数（控制 股票数 × 块宽 的临时数组内存）
+_COL_CHUNK = 128
+
+_ARRAYS = ('count', 'avg_ret', 'positive_rate', 'vol_count', 'vol_ratio', 'heat')
+
+
+def sector_heat(avg_ret, positive_rate, vol_ratio):
+    """identify_hot_sectors 的热度公式（可广播）"""
+    return avg_ret * 0.4 + positive_rate * 5 * 0.3 + (vol_ratio - 1.0) * 3 * 0.3
+
+
+def _hot_result(heat, top_n=HOT_TOP_N):
+    """{行业: 热度} → identify_hot_sectors 结构的结果（附 sector_concentration）"""
+    sorted_sectors = sorted(heat.items(), key=lambda x: x[1], reverse=True)
+    total_heat = sum(max(h, 0) for _, h in sorted_sectors[:10])
+    top1_heat = sorted_sectors[0][1] if sorted_sectors else 0
+    return {
+        'hot': sorted_sectors[:top_n],
+        'all_heat': heat,
+        'sector_concentration': top1_heat / max(total_heat, 0.01) if total_heat > 0 else 0,
+    }
+
+
+class SectorAggregates:
+    """(行业 × 日期列) 聚合表，按日期 O(1) 查询"""
+
+    def __init__(self, names, dates, arrays, signature=None):
+        self.names = list(names)
+        self.dates = np.asarray(dates, dtype=np.int64)     # datetime64[ns] 的 int64，与面板一致
+        for key in _ARRAYS:
+            setattr(self, key, arrays[key])
+        self.signature = signature
+        self.index = {name: k for k, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def column(self, date):
+        """date 之前（不含当日）对应的列，等价于 KlinePanel.positions 的日期下标"""
+        key = np.datetime64(pd.Timestamp(date), 'ns').astype(np.int64)
+        return int(np.searchsorted(self.dates, key, side='left'))
+
+    def all_heat(self, date):
+        """{行业: 热度}，只含样本数达到门槛的行业"""
+        g = self.column(date)
+        ok = np.flatnonzero(self.count[:, g] >= MIN_RET_COUNT)
+        return dict(zip([self.names[k] for k in ok], self.heat[ok, g].tolist()))
+
+    def heat_of(self, industry, date, default=0):
+        k = self.index.get(industry)
+        if k is None:
+            return default
+        g = self.column(date)
+        return float(self.heat[k, g]) if self.count[k, g] >= MIN_RET_COUNT else default
+
+    def hot_sectors(self, date, top_n=HOT_TOP_N):
+        """与 identify_hot_sectors / KlinePanel.hot_sectors 结构相同的结果"""
+        return _hot_result(self.all_heat(date), top_n)
+
+    def frame(self, date):
+        """某日各行业的明细统计 DataFrame（调试/报表用）"""
+        g = self.column(date)
+        return pd.DataFrame({
+            'industry': self.names,
+            'count': self.count[:, g],
+            'avg_ret': self.avg_ret[:, g],
+            'positive_rate': self.positive_rate[:, g],
+            'vol_count': self.vol_count[:, g],
+            'vol_ratio': self.vol_ratio[:, g],
+            'heat': self.heat[:, g],
+        })
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+    def save(self, path):
+        tmp = path + '.tmp.npz'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(tmp, version=TABLE_VERSION, names=np.array(self.names, dtype=str),
+                 dates=self.dates, **{key: getattr(self, key) for key in _ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, signature=None):
+        with np.load(path) as data:
+            if int(data['version']) != TABLE_VERSION:
+                raise ValueError(f"不支持的板块表版本: {int(data['version'])}")
+            return cls(data['names'].tolist(), data['dates'],
+                       {key: data[key] for key in _ARRAYS}, signature=signature)
+
+
+# ============================================================================
+# 构建
+# ============================================================================
+def build_sector_aggregates(panel, sector_codes, sector_names, lookback=5):
+    """从面板一次算出全部 (行业, 日期列) 的板块统计
+
+    sector_codes: 每只股票的行业编号（-1 表示无评分或未知行业，不参与统计）
+    """
+    inputs = panel.sector_inputs()
+    ret5, vol_ratio = inputs['ret5'], inputs['vol_ratio']
+    P = panel.count_before
+    S, W = P.shape
+    n_groups = len(sector_names)
+    sector_codes = np.asarray(sector_codes, dtype=np.int64)
+    member = sector_codes >= 0
+
+    count = np.zeros((n_groups, W), dtype=np.int32)
+    ret_sum = np.zeros((n_groups, W))
+    pos_count = np.zeros((n_groups, W), dtype=np.int32)
+    vol_count = np.zeros((n_groups, W), dtype=np.int32)
+    vol_sum = np.zeros((n_groups, W))
+
+    rows = np.arange(S)[:, None]
+    for c0 in range(0, W, _COL_CHUNK):
+        c1 = min(c0 + _COL_CHUNK, W)
+        width = c1 - c0
+        pos = P[:, c0:c1].astype(np.int64)
+        key = sector_codes[:, None] * width + np.arange(width)[None, :]
+        size = n_groups * width
+
+        ok = member[:, None] & (pos >= lookback + 1)
+        k = key[ok]
+        ret = ret5[rows, pos][ok]
+        count[:, c0:c1] = np.bincount(k, minlength=size).reshape(n_groups, width)
+        ret_sum[:, c0:c1] = np.bincount(k, weights=ret, minlength=size).reshape(n_groups, width)
+        pos_count[:, c0:c1] = np.bincount(k[ret > 0], minlength=size).reshape(n_groups, width)
+
+        vok = ok & (pos >= 15)
+        kv = key[vok]
+        vol_count[:, c0:c1] = np.bincount(kv, minlength=size).reshape(n_groups, width)
+        vol_sum[:, c0:c1] = np.bincount(kv, weights=vol_ratio[rows, pos][vok],
+                                        minlength=size).reshape(n_groups, width)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_ret = np.where(count > 0, ret_sum / count, np.nan)
+        positive_rate = np.where(count > 0, pos_count / count, np.nan)
+        vr = np.where(vol_count >= MIN_VOL_COUNT, vol_sum / vol_count, 1.0)
+    heat = np.where(count >= MIN_RET_COUNT, sector_heat(avg_ret, positive_rate, vr), np.nan)
+    return SectorAggregates(sector_names, panel.dates, {
+        'count': count,
+        'avg_ret': avg_ret,
+        'positive_rate': positive_rate,
+        'vol_count': vol_count,
+        'vol_ratio': vr,
+        'heat': heat,
+    })
+
+
+def panel_signature(panel, sector_codes, sector_names, lookback=5):
+    """股票集合 + 每只K线长度 + 日期轴 + 最后一根K线 + 行业映射 的摘要"""
+    S = len(panel)
+    rows = np.arange(S)
+    last = np.maximum(panel.lengths - 1, 0)
+    h = hashlib.sha1()
+    h.update(f"v{TABLE_VERSION}|lb{lookback}|".encode('utf-8'))
+    h.update('\n'.join(panel.codes).encode('utf-8'))
+    h.update(panel.lengths.astype(np.int64).tobytes())
+    h.update(panel.dates.tobytes())
+    if S and panel.values['close'].shape[1]:
+        for field in ('close', 'volume'):
+            h.update(np.ascontiguousarray(panel.values[field][rows, last]).tobytes())
+        h.update(np.float64(np.nansum(panel.values['close'])).tobytes())
+    h.update(np.asarray(sector_codes, dtype=np.int64).tobytes())
+    h.update('\n'.join(sector_names).encode('utf-8'))
+    return h.hexdigest()[:20]
+
+
+def _prune(directory, keep=MAX_TABLE_FILES):
+    try:
+        files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.npz')]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for path in files[keep:]:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def get_sector_aggregates(panel, sector_codes, sector_names, lookback=5,
+                          cache_dir=SECTOR_AGG_DIR, verbose=True):
+    """按签名读取落盘的板块表，没有则构建并保存；同一面板在进程内只算一次"""
+    signature = panel_signature(panel, sector_codes, sector_names, lookback)
+    cache_key = ('sector_table', signature)
+    table = panel._cache.get(cache_key)
+    if table is not None:
+        return table
+
+    path = os.path.join(cache_dir, f'{signature}.npz') if cache_dir else None
+    t0 = time.time()
+    if path and os.path.exists(path):
+        try:
+            table = SectorAggregates.load(path, signature=signature)
+        except Exception as e:
+            print(f"  [板块表] 读取失败，重新构建: {e}")
+    if table is None:
+        table = build_sector_aggregates(panel, sector_codes, sector_names, lookback)
+        table.signature = signature
+        if path:
+            try:
+                table.save(path)
+                _prune(cache_dir)
+            except Exception as e:
+                print(f"  [板块表] 保存失败: {e}")
+        if verbose:
+            print(f"  Sector table: {len(table)} industries x {table.heat.shape[1]} dates "
+                  f"({time.time() - t0:.1f}s)")
+    panel._cache[cache_key] = table
+    return table
+
+
+def sector_labels(codes, scores, exclude=UNKNOWN_INDUSTRIES):
+    """评分表 → (行业编号, 行业名)；无评分或行业在 exclude 中的编为 -1"""
+    labels = []
+    for code in codes:
+        static = scores.get(code)
+        industry = static.get('industry', 'unknown') if static else None
+        labels.append(industry if industry is not None and industry not in exclude else None)
+    return encode_labels(labels)
+
+
+def _date_values(df):
+    """K线日期列 → datetime64[ns] 数组（已是时间类型时不复制）"""
+    values = df['date'].values
+    if values.dtype.kind != 'M':
+        values = pd.to_datetime(df['date']).values
+    return values.astype('datetime64[ns]', copy=False)
+
+
+def hot_sectors_for(kline, scores, date, lookback=5, exclude=UNKNOWN_INDUSTRIES, top_n=HOT_TOP_N):
+    """identify_hot_sectors(kline, scores, date) 的单日快照版，供实盘推荐直接调用
+
+    实盘只查一个日期，不对齐面板、不建全区间表：每只股票 searchsorted 定位 date 之前的最后一根K线，
+    只取最近 15 根算 5 日涨幅和量比，再按行业汇总。与 identify_hot_sectors 逐位一致。
+    """
+    key = np.datetime64(pd.Timestamp(date), 'ns')
+    sector_returns = {}
+    sector_volumes = {}
+    for code, df in kline.items():
+        static = scores.get(code)
+        if not static:
+            continue
+        industry = static.get('industry', 'unknown')
+        if industry in exclude:
+            continue
+        n = int(np.searchsorted(_date_values(df), key, side='left'))
+        if n < lookback + 1:
+            continue
+        c = df['close'].values
+        ret = (c[n - 1] - c[n - lookback - 1]) / c[n - lookback - 1] * 100
+        sector_returns.setdefault(industry, []).append(ret)
+        if n >= 15:
+            v = df['volume'].values[n - 15:n]
+            sector_volumes.setdefault(industry, []).append(np.mean(v[-5:]) / max(np.mean(v[:10]), 1))
+
+    heat = {}
+    for industry, rets in sector_returns.items():
+        if len(rets) < MIN_RET_COUNT:
+            continue
+        vrs = sector_volumes.get(industry, [])
+        vr = float(np.mean(vrs)) if len(vrs) >= MIN_VOL_COUNT else 1.0
+        positive_rate = sum(1 for r in rets if r > 0) / len(rets)
+        heat[industry] = sector_heat(float(np.mean(rets)), positive_rate, vr)
+    return _hot_result(heat, top_n)
+
+
+# ============================================================================
+# 板块最新涨幅快照（sector_rotation 的K线兜底）
+# ============================================================================
+def sector_return_snapshot(close, stock_sector, horizons=(5, 10, 20)):
+    """按板块汇总每只股票最近 h 日涨幅的均值
+
+    Args:
+        close: (股票数 × 交易日数) 收盘价矩阵，缺失（停牌/未上市）为 NaN
+        stock_sector: 每行所属板块名
+    Returns:
+        [{'sector', 'ret_<h>d': 均值或 None, 'stock_count'}]，按板块首次出现顺序；
+        涨幅取最近第 h+1 根有效K线为基准（基准价 <= 0 记 0），只统计K线数 > h 的股票
+    """
+    close = np.asarray(close, dtype=np.float64)
+    labels, names = encode_labels(list(stock_sector))
+    n_groups = len(names)
+    valid = np.isfinite(close)
+    n_bars = valid.sum(axis=1)
+    rank = np.cumsum(valid, axis=1)          # 第 j 列及之前的有效K线数
+    rows = np.arange(close.shape[0])
+
+    def nth_from_end(k):
+        """每行倒数第 k 根有效K线（不足时为 NaN）"""
+        target = n_bars - k + 1
+        hit = valid & (rank == target[:, None])
+        col = hit.argmax(axis=1)
+        return np.where(n_bars >= k, close[rows, col], np.nan)
+
+    out = [{'sector': name} for name in names]
+    last = nth_from_end(1)
+    for h in horizons:
+        base = nth_from_end(h + 1)
+        ok = n_bars >= h + 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = np.where(base > 0, (last - base) / base * 100, 0.0)
+        cnt = np.bincount(labels[ok], minlength=n_groups)
+        tot = np.bincount(labels[ok], weights=ret[ok], minlength=n_groups)
+        for k, item in enumerate(out):
+            item[f'ret_{h}d'] = float(tot[k] / cnt[k]) if cnt[k] else None
+    for item, n in zip(out, np.bincount(labels, minlength=n_groups).tolist()):
+        item['stock_count'] = n
+    return out
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+板块成分倒排索引 - 股票 → {概念板块, 行业板块}
+
+热门板块加分原来对每只股票逐个遍历前 20 热门概念 + 前 20 热门行业，
+每个板块都调用一次 ak.stock_board_*_cons_em 下载成分股再做 list 查找，
+一批股票里同样的成分表被重复下载上百次。这里：
+  1. 按板块保存成分股代码（东方财富口径），每个板块各自记录抓取时间，超过 TTL 才重新下载
+  2. 加载时构建倒排索引 code → {'concepts': set, 'industries': set}，单只股票查询 O(1)
+  3. 持久化到 sector_cache/sector_membership.json（临时文件 + os.replace 原子替换）
+
+HotSectorTracker.fetch_sector_constituents 抓到的成分股会顺带写入索引；
+GUI 热门板块加分、generate_mainboard_scores.get_real_industry、
+stock_screener_v2.SectorRotator.is_in_hot_sector 共用同一个索引。
+
+使用方法：
+    index = get_sector_index()
+    index.ensure(['半导体', '光伏设备'], 'industry')     # 只下载缺失/过期的板块
+    index.concepts_of('600000'), index.industries_of('600000')
+
+    python sector_membership.py build          # 全量构建全部行业+概念板块（每日一次即可）
+    python sector_membership.py info 600519
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sector_cache', 'sector_membership.json')
+INDEX_TTL = 24 * 3600       # 板块成分股有效期（秒），成分调整频率远低于一天
+SECTOR_TYPES = ('industry', 'concept')
+
+_EMPTY = frozenset()
+
+
+def normalize_code(code):
+    """'sh600000' / '600000.SH' / 600000 → '600000'"""
+    digits = re.sub(r'\D', '', str(code))
+    return digits[-6:].zfill(6) if digits else ''
+
+
+def fetch_constituent_codes(sector_name, sector_type):
+    """用 akshare 下载板块成分股代码，失败返回 None"""
+    try:
+        import akshare as ak
+        func = ak.stock_board_industry_cons_em if sector_type == 'industry' else ak.stock_board_concept_cons_em
+        df = func(symbol=sector_name)
+        if df is None or df.empty:
+            return None
+        return [str(c) for c in df['代码']]
+    except Exception as e:
+        print(f"[板块索引] 获取 {sector_type}/{sector_name} 成分股失败: {e}")
+        return None
+
+
+class SectorMembershipIndex:
+    """板块成分股 + 股票 → 板块倒排索引（线程安全）"""
+
+    def __init__(self, index_file=INDEX_FILE, ttl=INDEX_TTL, fetcher=fetch_constituent_codes):
+        self.index_file = index_file
+        self.ttl = ttl
+        self.fetcher = fetcher
+        # {'industry': {板块名: {'ts': 抓取时间, 'codes': [...]}}, 'concept': {...}}
+        self.sectors = {t: {} for t in SECTOR_TYPES}
+        # {'industry': {code: set(板块名)}, 'concept': {...}}
+        self.members = {t: {} for t in SECTOR_TYPES}
+        self._lock = threading.RLock()
+        self._dirty = False
+        self.load()
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+    def load(self):
+        if not os.path.exists(self.index_file):
+            return False
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[板块索引] 加载失败，忽略: {e}")
+            return False
+        with self._lock:
+            for t in SECTOR_TYPES:
+                for name, entry in (data.get(t) or {}).items():
+                    self._set(t, name, entry.get('codes', []), entry.get('ts', 0))
+            self._dirty = False
+        return True
+
+    def save(self):
+        """写入索引文件（无变化时跳过）"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            payload = {t: self.sectors[t] for t in SECTOR_TYPES}
+            payload['saved_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            tmp = self.index_file + '.tmp'
+            try:
+                os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False)
+                os.replace(tmp, self.index_file)
+                self._dirty = False
+                return True
+            except Exception as e:
+                print(f"[板块索引] 保存失败: {e}")
+                return False
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+    def _set(self, sector_type, sector_name, codes, ts):
+        members = self.members[sector_type]
+        old = self.sectors[sector_type].get(sector_name)
+        if old:
+            for code in old['codes']:
+                names = members.get(code)
+                if names:
+                    names.discard(sector_name)
+        codes = sorted({normalize_code(c) for c in codes if normalize_code(c)})
+        self.sectors[sector_type][sector_name] = {'ts': ts, 'codes': codes}
+        for code in codes:
+            members.setdefault(code, set()).add(sector_name)
+
+    def record(self, sector_type, sector_name, codes, save=False):
+        """写入一个板块的成分股（来自任意数据源），可选立即保存"""
+        with self._lock:
+            self._set(sector_type, sector_name, codes, time.time())
+            self._dirty = True
+        if save:
+            self.save()
+
+    def is_fresh(self, sector_type, sector_name):
+        entry = self.sectors[sector_type].get(sector_name)
+        return bool(entry) and time.time() - entry['ts'] <= self.ttl
+
+    def ensure(self, sector_names, sector_type, save=True):
+        """确保这些板块的成分股在索引中且未过期；只下载缺失/过期的板块，返回下载个数
+
+        下载失败的板块保留旧数据（过期也比没有好）。
+        """
+        fetched = 0
+        for name in sector_names:
+            if not name or self.is_fresh(sector_type, name):
+                continue
+            codes = self.fetcher(name, sector_type)
+            if codes is None:
+                continue
+            self.record(sector_type, name, codes)
+            fetched += 1
+        if fetched and save:
+            self.save()
+        return fetched
+
+    def build(self, sector_names=None, progress_every=50):
+        """全量构建：sector_names 为 {'industry': [...], 'concept': [...]}，默认取东方财富全部板块"""
+        if sector_names is None:
+            sector_names = fetch_all_sector_names()
+        total = sum(len(v) for v in sector_names.values())
+        done = 0
+        t0 = time.time()
+        for sector_type, names in sector_names.items():
+            for name in names:
+                self.ensure([name], sector_type, save=False)
+                done += 1
+                if progress_every and done % progress_every == 0:
+                    print(f"[板块索引] {done}/{total} ({time.time() - t0:.0f}s)")
+                    self.save()
+        self.save()
+        return done
+
+    # ------------------------------------------------------------------
+    # 查询（O(1)）
+    # ------------------------------------------------------------------
+    def concepts_of(self, code):
+        return self.members['concept'].get(normalize_code(code), _EMPTY)
+
+    def industries_of(self, code):
+        return self.members['industry'].get(normalize_code(code), _EMPTY)
+
+    def sectors_of(self, code):
+        """{'concepts': set, 'industries': set}"""
+        return {'concepts': self.concepts_of(code), 'industries': self.industries_of(code)}
+
+    def __contains__(self, code):
+        code = normalize_code(code)
+        return code in self.members['concept'] or code in self.members['industry']
+
+    def __len__(self):
+        return len(set(self.members['concept']) | set(self.members['industry']))
+
+
+def fetch_all_sector_names():
+    """东方财富全部行业/概念板块名称"""
+    names = {t: [] for t in SECTOR_TYPES}
+    try:
+        import akshare as ak
+        for sector_type, func in (('industry', ak.stock_board_industry_name_em),
+                                  ('concept', ak.stock_board_concept_name_em)):
+            try:
+                df = func()
+                names[sector_type] = [str(n) for n in df['板块名称']]
+            except Exception as e:
+                print(f"[板块索引] 获取{sector_type}板块列表失败: {e}")
+    except ImportError:
+        print("[板块索引] akshare 不可用")
+    return names
+
+
+def hot_rank_bonus(sector_names, hot_names, max_bonus=2.5, top_n=20):
+    """股票所属板块在热门列表中的最高排名及加分 (rank, bonus)；不在前 top_n 时返回 (None, 0)
+
+    加分规则与 GUI 热门板块评分一致：(21 - rank) / 20 * max_bonus。
+    """
+    for rank, name in enumerate(hot_names[:top_n], 1):
+        if name in sector_names:
+            return rank, (21 - rank) / 20 * max_bonus
+    return None, 0
+
+
+_shared_index = None
+_shared_lock = threading.Lock()
+
+
+def get_sector_index():
+    """进程内共享的索引实例（首次调用时从文件加载）"""
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = SectorMembershipIndex()
+        return _shared_index
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='板块成分倒排索引')
+    sub = parser.add_subparsers(dest='cmd')
+    sub.add_parser('build', help='全量构建全部行业+概念板块')
+    p_info = sub.add_parser('info', help='查看索引概况或某只股票所属板块')
+    p_info.add_argument('code', nargs='?')
+    args = parser.parse_args()
+
+    index = get_sector_index()
+    if args.cmd == 'build':
+        t0 = time.time()
+        n = index.build()
+        print(f"[板块索引] 完成: {n} 个板块, {len(index)} 只股票 ({time.time() - t0:.0f}s)")
+    elif args.cmd == 'info':
+        if args.code:
+            s = index.sectors_of(args.code)
+            print(f"{args.code} 行业: {sorted(s['industries'])}")
+            print(f"{args.code} 概念: {sorted(s['concepts'])}")
+        else:
+            print(f"行业板块 {len(index.sectors['industry'])} 个, 概念板块 {len(index.sectors['concept'])} 个, "
+                  f"股票 {len(index)} 只")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
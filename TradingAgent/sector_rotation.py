@@ -29,6 +29,7 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
 # ── 禁用代理 ──
@@ -45,6 +46,9 @@ SECTOR_CACHE_DIR = DATA_DIR / "sector_cache"
 RANKING_CACHE = SECTOR_CACHE_DIR / "sector_ranking_cache.json"
 MAPPING_CACHE = SECTOR_CACHE_DIR / "sector_mapping.json"
 KLINE_CACHE_DIR = DATA_DIR / "kline_cache"
+KLINE_STORE_DIR = KLINE_CACHE_DIR / "kline_store"
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'TradingShared'))
 
 # ── 内存缓存 ──
 _cache = {
@@ -147,6 +151,15 @@ def _fetch_ak_board_industry() -> Optional[pd.DataFrame]:
 # 3. K线缓存兜底计算
 # =========================================================================
 
+def _open_kline_store(source: Path):
+    """打开与 source 一致的K线列式存储，不可用时返回 None"""
+    try:
+        from kline_store import open_kline_store
+    except ImportError:
+        return None
+    return open_kline_store(store_dir=str(KLINE_STORE_DIR), source=str(source))
+
+
 def _calc_from_kline_cache() -> Optional[List[Dict]]:
     """
     从K线缓存按行业分组计算板块涨幅。
@@ -169,37 +182,59 @@ def _calc_from_kline_cache() -> Optional[List[Dict]]:
         if not kline_files:
             return None
 
-        kline_data = json.loads(kline_files[-1].read_text(encoding='utf-8'))
         logger.info(f"[sector_rotation] 从K线缓存计算板块涨幅，共 {len(stock_to_sector)} 只股票映射")
 
-        # 按板块分组
-        sector_stocks: Dict[str, List] = {}
-        for code, sector in stock_to_sector.items():
-            if code in kline_data:
-                sector_stocks.setdefault(sector, []).append(kline_data[code])
-
-        # 计算每个板块的平均涨幅
+        # 按板块分组（优先列式存储：一次取出收盘价矩阵，按板块编号分组归约）
         ranking = []
-        for sector, stocks in sector_stocks.items():
-            rets_5d, rets_10d, rets_20d = [], [], []
-            for s in stocks:
-                closes = s.get('closes', s.get('close', []))
-                if isinstance(closes, list) and len(closes) >= 6:
-                    rets_5d.append((closes[-1] - closes[-6]) / closes[-6] * 100 if closes[-6] > 0 else 0)
-                if isinstance(closes, list) and len(closes) >= 11:
-                    rets_10d.append((closes[-1] - closes[-11]) / closes[-11] * 100 if closes[-11] > 0 else 0)
-                if isinstance(closes, list) and len(closes) >= 21:
-                    rets_20d.append((closes[-1] - closes[-21]) / closes[-21] * 100 if closes[-21] > 0 else 0)
-
-            if rets_5d:
-                ranking.append({
-                    'sector': sector,
-                    'ret_5d': round(sum(rets_5d) / len(rets_5d), 2),
-                    'ret_10d': round(sum(rets_10d) / len(rets_10d), 2) if rets_10d else None,
-                    'ret_20d': round(sum(rets_20d) / len(rets_20d), 2) if rets_20d else None,
-                    'stock_count': len(stocks),
+        store = _open_kline_store(kline_files[-1])
+        if store is not None:
+            from sector_aggregates import sector_return_snapshot
+
+            rows, sectors = [], []
+            for code, sector in stock_to_sector.items():
+                i = store.row(code)
+                if i is not None and store.has[i, store.fields.index('close')]:
+                    rows.append(i)
+                    sectors.append(sector)
+            close = store.matrix('close')[np.asarray(rows, dtype=np.int64)] if rows else np.zeros((0, 0))
+            for item in sector_return_snapshot(close, sectors):
+                if item['ret_5d'] is None:
+                    continue
+                item.update({
+                    'ret_5d': round(item['ret_5d'], 2),
+                    'ret_10d': round(item['ret_10d'], 2) if item['ret_10d'] is not None else None,
+                    'ret_20d': round(item['ret_20d'], 2) if item['ret_20d'] is not None else None,
                     'data_source': 'kline_cache',
                 })
+                ranking.append(item)
+        else:
+            sector_stocks: Dict[str, List] = {}
+            kline_data = json.loads(kline_files[-1].read_text(encoding='utf-8'))
+            for code, sector in stock_to_sector.items():
+                if code in kline_data:
+                    sector_stocks.setdefault(sector, []).append(kline_data[code])
+
+            # 计算每个板块的平均涨幅
+            for sector, stocks in sector_stocks.items():
+                rets_5d, rets_10d, rets_20d = [], [], []
+                for s in stocks:
+                    closes = s.get('closes', s.get('close', []))
+                    if isinstance(closes, list) and len(closes) >= 6:
+                        rets_5d.append((closes[-1] - closes[-6]) / closes[-6] * 100 if closes[-6] > 0 else 0)
+                    if isinstance(closes, list) and len(closes) >= 11:
+                        rets_10d.append((closes[-1] - closes[-11]) / closes[-11] * 100 if closes[-11] > 0 else 0)
+                    if isinstance(closes, list) and len(closes) >= 21:
+                        rets_20d.append((closes[-1] - closes[-21]) / closes[-21] * 100 if closes[-21] > 0 else 0)
+
+                if rets_5d:
+                    ranking.append({
+                        'sector': sector,
+                        'ret_5d': round(sum(rets_5d) / len(rets_5d), 2),
+                        'ret_10d': round(sum(rets_10d) / len(rets_10d), 2) if rets_10d else None,
+                        'ret_20d': round(sum(rets_20d) / len(rets_20d), 2) if rets_20d else None,
+                        'stock_count': len(stocks),
+                        'data_source': 'kline_cache',
+                    })
 
         # 排序
         ranking.sort(key=lambda x: x.get('ret_5d', -999), reverse=True)
@@ -49,6 +49,9 @@ try:
     from config import MAX_MARKET_CAP
 except ImportError:
     MAX_MARKET_CAP = 100e8
+from kline_cache import get_kline_cache
+
+KLINE_FILE = os.path.join(os.path.dirname(__file__), '..', 'TradingShared', 'data', 'kline_cache', 'kline_full_latest.json')
 
 
 # ═══════════════════════════════════════════════════════════
@@ -153,6 +156,18 @@ class SectorRotator:
         if industry and industry not in ['未知', '', '未分类', None]:
             tags.add(industry)
         
+        # 板块倒排索引：股票是某个热点板块的成分股即命中（精确匹配，O(1) 查询）
+        code = stock.get('code', '')
+        if code:
+            try:
+                from sector_membership import get_sector_index
+                sectors = get_sector_index().sectors_of(code)
+                if any(sector_name in sectors['industries'] or sector_name in sectors['concepts']
+                       for sector_name, _ in hot_sectors):
+                    return True
+            except Exception:
+                pass
+        
         # 从名称中提取行业关键词
         for kw in ['银行', '证券', '保险', '医药', '白酒', '新能源', '光伏', '芯片', 
                    '半导体', '人工智能', '军工', '钢铁', '煤炭', '化工', '地产', '汽车',
@@ -202,14 +217,14 @@ class MoneyFlowFilter:
     def __init__(self):
         self._flow_cache = {}
         
-    def check_money_flow(self, stock_code: str, kline_data: List[Dict], 
+    def check_money_flow(self, stock_code: str, kline_data: Optional[List[Dict]] = None,
                      in_hot_sector: bool = True) -> Tuple[bool, float]:
         """
         检查资金流向是否合格
         
         Args:
             stock_code: 股票代码
-            kline_data: K线数据列表
+            kline_data: K线数据列表（为 None 时从进程内共享K线缓存读取）
             in_hot_sector: 是否在热点板块（在热点板块则放宽过滤）
             
         Returns:
@@ -221,6 +236,8 @@ class MoneyFlowFilter:
         - 热点板块股票：只要不是明显出货形态，都可以通过
         - 非热点板块：必须有明确资金流入信号
         """
+        if kline_data is None:
+            kline_data = get_kline_cache(KLINE_FILE).records(stock_code)
         if not kline_data or len(kline_data) < 10:
             return in_hot_sector, 0.0
         
@@ -332,14 +349,14 @@ class ThesisEvaluator:
     5. 风险可控（无明显利空）
     """
     
-    def evaluate(self, stock: Dict, kline_data: List[Dict], 
+    def evaluate(self, stock: Dict, kline_data: Optional[List[Dict]],
                  hot_sectors: List[Tuple[str, float]]) -> Dict:
         """
         评估股票的投资论点质量
         
         Args:
             stock: 股票基本信息
-            kline_data: K线数据
+            kline_data: K线数据（为 None 时按 stock['code'] 从进程内共享K线缓存读取）
             hot_sectors: 热点板块列表
             
         Returns:
@@ -367,6 +384,8 @@ class ThesisEvaluator:
             'risks': [],
         }
         
+        if kline_data is None and stock.get('code'):
+            kline_data = get_kline_cache(KLINE_FILE).records(stock['code'])
         if not kline_data or len(kline_data) < 20:
             return result
         
@@ -753,8 +772,6 @@ class StockScreenerV2:
         # 热点板块
         self.hot_sectors = []
         
-        # K线数据
-        self._kline_cache = {}
         self._stock_scores = {}
         
     def screen(self, top_n: int = 50) -> List[Dict]:
@@ -898,36 +915,11 @@ class StockScreenerV2:
             self._stock_scores = {}
     
     def _load_kline(self, code: str) -> List[Dict]:
-        """加载K线数据"""
-        if code in self._kline_cache:
-            return self._kline_cache[code]
-        
+        """加载K线数据（进程内共享缓存，整个筛选过程只打开一次K线源）"""
         try:
-            # 尝试从合并文件加载
-            kline_dir = os.path.join(
-                os.path.dirname(__file__), '..', 'TradingShared', 'data', 'kline_cache'
-            )
-            kline_file = os.path.join(kline_dir, 'kline_full_latest.json')
-            
-            if os.path.exists(kline_file):
-                with open(kline_file, 'r', encoding='utf-8') as f:
-                    kline_full = json.load(f)
-                
-                actual_key = code
-                if code not in kline_full:
-                    if code.startswith(('6', '9')):
-                        actual_key = f'sh{code}'
-                    else:
-                        actual_key = f'sz{code}'
-                
-                if actual_key in kline_full:
-                    data = kline_full[actual_key]
-                    if isinstance(data, list):
-                        self._kline_cache[code] = data
-                        return data
+            return get_kline_cache(KLINE_FILE).records(code)
         except Exception as e:
             logger.debug(f"加载K线失败 {code}: {e}")
-        
         return []
 
 
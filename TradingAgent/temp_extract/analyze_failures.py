@@ -19,6 +19,9 @@ SHARED_DIR = os.path.join(BASE_DIR, '..', 'TradingShared')
 DATA_DIR = os.path.join(SHARED_DIR, 'data')
 KLINE_CACHE = os.path.join(DATA_DIR, 'kline_cache')
 
+sys.path.insert(0, os.path.join(BASE_DIR, '..'))
+from forward_returns import get_forward_returns, index_return
+
 # 回测配置
 EVAL_START = '2026-03-01'
 EVAL_END = '2026-04-24'
@@ -305,6 +308,7 @@ def analyze_failures():
     
     stock_recent_perf = defaultdict(list)
     results = []
+    fwd_table = get_forward_returns(kline)
     
     for test_date in valid_dates:
         regime, momentum, vol_state, risk = detect_market_state(index_df, test_date)
@@ -389,21 +393,17 @@ def analyze_failures():
         if not selected:
             continue
         
-        # 指数收益
-        idx_hist = index_df[index_df['date'] < test_date]
-        idx_day = index_df[index_df['date'] >= test_date]
-        if len(idx_hist) == 0 or len(idx_day) == 0:
+        # 指数收益（昨收 → 当日收盘）
+        idx_ret = index_return(index_df, test_date, before=True)
+        if idx_ret is None:
             continue
-        idx_ret = (float(idx_day.iloc[0]['close']) - float(idx_hist.iloc[-1]['close'])) / float(idx_hist.iloc[-1]['close']) * 100
         
-        # 股票收益
+        # 股票收益（前一交易日停牌的股票无收益，跳过）
         stock_rets = []
         for s in selected:
             code = s['code']
-            s_hist = kline[code][kline[code]['date'] < test_date]
-            s_day = kline[code][kline[code]['date'] >= test_date]
-            if len(s_hist) > 0 and len(s_day) > 0:
-                sr = (float(s_day.iloc[0]['close']) - float(s_hist.iloc[-1]['close'])) / float(s_hist.iloc[-1]['close']) * 100
+            sr = fwd_table.get(code, test_date, 1, before=True)
+            if sr == sr:
                 stock_rets.append({
                     'code': code,
                     'name': s['name'],
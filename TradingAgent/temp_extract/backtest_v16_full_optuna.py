@@ -33,6 +33,9 @@ RESULT_DIR = os.path.join(BASE_DIR, 'backtest_results')
 SHARED_DATA_DIR = os.path.join(BASE_DIR, '..', 'TradingShared', 'data')
 
 sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
+sys.path.insert(0, os.path.join(BASE_DIR, '..'))
+
+from parallel_optuna import optimize_parallel, best_user_attrs
 
 # ============================================================================
 # Config
@@ -928,12 +931,8 @@ def evaluate_baseline(daily_data):
 # ============================================================================
 # Phase 2: Optimize R2 (momentum)
 # ============================================================================
-def optimize_r2(daily_data, n_trials=N_TRIALS_PER_PHASE):
-    import optuna
-    optuna.logging.set_verbosity(optuna.logging.WARNING)
-    
-    print(f"\n[Phase 1] Optimizing R2 (momentum) - {n_trials} trials")
-    
+def _make_r2_objective(daily_data):
+    """构造 optimize_r2 的目标函数（模块级，供并行 worker 按引用调用）"""
     WEIGHT_KEYS = ['w_momentum', 'w_trend', 'w_consistency', 'w_vol', 'w_rsi',
                    'w_static', 'w_defense', 'w_sector', 'w_low_vol', 'w_rel_str', 'w_rel_str_3d']
     WEIGHT_DEFAULTS = [0.25, 0.20, 0.05, 0.10, 0.05, 0.15, 0.05, 0.10, 0.05, 0.0, 0.0]
@@ -955,7 +954,7 @@ def optimize_r2(daily_data, n_trials=N_TRIALS_PER_PHASE):
         'penalty_turn_spike': (0.2, 1.0), 'penalty_below_ma5': (0.2, 1.0),
     }
     
-    best_global = {'score': -1, 'params': None}
+    best_global = {'score': -1}
     
     def objective(trial):
         # Weights
@@ -1027,30 +1026,36 @@ def optimize_r2(daily_data, n_trials=N_TRIALS_PER_PHASE):
                     beat_count += 1
         
         beat_pct = beat_count / total if total > 0 else 0
+        trial.set_user_attr('params', params)
         
         if beat_pct > best_global['score']:
             best_global['score'] = beat_pct
-            best_global['params'] = dict(params)
             print(f"    [Trial {trial.number}] R2 best: {beat_pct*100:.0f}% ({beat_count}/{total})")
         
         return beat_pct
     
-    study = optuna.create_study(direction='maximize')
-    study.optimize(objective, n_trials=n_trials, timeout=TIMEOUT_PER_PHASE, show_progress_bar=False)
+    return objective
+
+
+def optimize_r2(daily_data, n_trials=N_TRIALS_PER_PHASE, n_jobs=None):
+    """n_jobs > 1 时 trial 分发到进程池（见 parallel_optuna），None 取 OPTUNA_N_JOBS / CPU 核数"""
+    print(f"\n[Phase 1] Optimizing R2 (momentum) - {n_trials} trials")
+    
+    study = optimize_parallel(_make_r2_objective, daily_data, n_trials=n_trials,
+                              timeout=TIMEOUT_PER_PHASE, n_jobs=n_jobs, study_name='v16_r2')
+    best = best_user_attrs(study)
+    if best is None:
+        return None, -1
     
-    print(f"  R2 best: {best_global['score']*100:.0f}%")
-    return best_global['params'], best_global['score']
+    print(f"  R2 best: {best['value']*100:.0f}%")
+    return best['params'], best['value']
 
 
 # ============================================================================
 # Phase 3: Optimize R4/5 (defense)
 # ============================================================================
-def optimize_r45(daily_data, n_trials=N_TRIALS_PER_PHASE):
-    import optuna
-    optuna.logging.set_verbosity(optuna.logging.WARNING)
-    
-    print(f"\n[Phase 2] Optimizing R4/5 (defense) - {n_trials} trials")
-    
+def _make_r45_objective(daily_data):
+    """构造 optimize_r45 的目标函数（模块级，供并行 worker 按引用调用）"""
     WEIGHT_KEYS = ['w_momentum', 'w_trend', 'w_mr', 'w_vol', 'w_rsi',
                    'w_static', 'w_defense', 'w_sector', 'w_low_vol', 'w_rel_str', 'w_rel_str_3d', 'w_beta']
     WEIGHT_DEFAULTS = [0.02, 0.03, 0.12, 0.03, 0.08, 0.12, 0.10, 0.02, 0.05, 0.18, 0.12, 0.10]
@@ -1074,7 +1079,7 @@ def optimize_r45(daily_data, n_trials=N_TRIALS_PER_PHASE):
         'boost_streak_relstr': (0.8, 1.5),
     }
     
-    best_global = {'score': -1, 'params': None}
+    best_global = {'score': -1}
     
     def objective(trial):
         raw = []
@@ -1153,32 +1158,40 @@ def optimize_r45(daily_data, n_trials=N_TRIALS_PER_PHASE):
                     beat_count += 1
         
         beat_pct = beat_count / total if total > 0 else 0
+        trial.set_user_attr('params', params)
         
         if beat_pct > best_global['score']:
             best_global['score'] = beat_pct
-            best_global['params'] = dict(params)
             print(f"    [Trial {trial.number}] R4/5 best: {beat_pct*100:.0f}% ({beat_count}/{total})")
         
         return beat_pct
     
-    study = optuna.create_study(direction='maximize')
-    study.optimize(objective, n_trials=n_trials, timeout=TIMEOUT_PER_PHASE, show_progress_bar=False)
+    return objective
+
+
+def optimize_r45(daily_data, n_trials=N_TRIALS_PER_PHASE, n_jobs=None):
+    """n_jobs > 1 时 trial 分发到进程池（见 parallel_optuna），None 取 OPTUNA_N_JOBS / CPU 核数"""
+    print(f"\n[Phase 2] Optimizing R4/5 (defense) - {n_trials} trials")
     
-    print(f"  R4/5 best: {best_global['score']*100:.0f}%")
-    return best_global['params'], best_global['score']
+    study = optimize_parallel(_make_r45_objective, daily_data, n_trials=n_trials,
+                              timeout=TIMEOUT_PER_PHASE, n_jobs=n_jobs, study_name='v16_r45')
+    best = best_user_attrs(study)
+    if best is None:
+        return None, -1
+    
+    print(f"  R4/5 best: {best['value']*100:.0f}%")
+    return best['params'], best['value']
 
 
 # ============================================================================
 # Phase 4: Joint fine-tune all params together
 # ============================================================================
-def joint_finetune(daily_data, r2_params, r3_params, r45_params, n_trials=300):
-    """Joint fine-tuning with narrow ranges around best params."""
-    import optuna
-    optuna.logging.set_verbosity(optuna.logging.WARNING)
-    
-    print(f"\n[Phase 3] Joint fine-tuning all params - {n_trials} trials")
+def _make_joint_objective(data):
+    """构造 joint_finetune 的目标函数（模块级，供并行 worker 按引用调用）"""
+    daily_data = data['daily_data']
+    r2_params, r3_params, r45_params = data['r2'], data['r3'], data['r45']
     
-    best_global = {'composite': -1, 'params': None}
+    best_global = {'composite': -1}
     
     # Get the parameter sets
     param_sets = {
@@ -1230,9 +1243,10 @@ def joint_finetune(daily_data, r2_params, r3_params, r45_params, n_trials=300):
             risk_beats.get(5, 0) * 0.15
         )
         
+        trial.set_user_attr('params', {'r2': r2_ft, 'r3': r3_ft, 'r45': r45_ft})
+        
         if composite > best_global['composite']:
             best_global['composite'] = composite
-            best_global['params'] = {'r2': r2_ft, 'r3': r3_ft, 'r45': r45_ft}
             print(f"    [Trial {trial.number}] composite={composite:.3f} "
                   f"overall={overall*100:.1f}% "
                   f"R2={risk_beats.get(2,0)*100:.0f}% "
@@ -1242,11 +1256,22 @@ def joint_finetune(daily_data, r2_params, r3_params, r45_params, n_trials=300):
         
         return composite
     
-    study = optuna.create_study(direction='maximize')
-    study.optimize(objective, n_trials=n_trials, timeout=1200, show_progress_bar=False)
+    return objective
+
+
+def joint_finetune(daily_data, r2_params, r3_params, r45_params, n_trials=300, n_jobs=None):
+    """Joint fine-tuning with narrow ranges around best params.
+
+    n_jobs > 1 时 trial 分发到进程池（见 parallel_optuna），None 取 OPTUNA_N_JOBS / CPU 核数
+    """
+    print(f"\n[Phase 3] Joint fine-tuning all params - {n_trials} trials")
     
-    if best_global['params']:
-        return best_global['params']['r2'], best_global['params']['r3'], best_global['params']['r45'], best_global['composite']
+    data = {'daily_data': daily_data, 'r2': r2_params, 'r3': r3_params, 'r45': r45_params}
+    study = optimize_parallel(_make_joint_objective, data, n_trials=n_trials,
+                              timeout=1200, n_jobs=n_jobs, study_name='v16_joint')
+    best = best_user_attrs(study)
+    if best:
+        return best['params']['r2'], best['params']['r3'], best['params']['r45'], best['value']
     return r2_params, r3_params, r45_params, 0
 
 
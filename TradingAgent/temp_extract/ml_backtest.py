@@ -26,12 +26,14 @@ BASE_DIR = r'D:\GitHub\TradingAgents\TradingAgent'
 DATA_DIR = r'D:\GitHub\TradingAgents\TradingShared\data'
 KLINE_CACHE = os.path.join(DATA_DIR, 'kline_cache')
 RESULT_DIR = os.path.join(BASE_DIR, 'backtest_results')
+sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
 
 MODEL_FILE = os.path.join(DATA_DIR, 'ml_model_best.txt')
 
 EVAL_START = '2026-03-01'
 EVAL_END = '2026-04-24'
 FEATURE_MIN_DAYS = 30
+USE_BETA_MATRIX = True   # look up beta/RS in a date-aligned matrix (TradingShared/beta_matrix.py)
 
 # Industry keywords
 DEFENSIVE_KEYWORDS = [
@@ -580,6 +582,11 @@ def run_ml_backtest_v2():
 
     idx_close_list = [(d, float(idx_close[d])) for d in idx_dates]
     idx_date_to_pos = {d: i for i, d in enumerate(idx_dates)}
+    beta_mat = None
+    if USE_BETA_MATRIX:
+        from beta_matrix import build_from_series
+        beta_mat = build_from_series({code: (kd['dates'], kd['close']) for code, kd in kline.items()},
+                                     idx_dates, [idx_close[d] for d in idx_dates])
 
     eval_dates = [d for d in idx_dates if EVAL_START <= d <= EVAL_END]
     print(f"\n  Eval dates: {len(eval_dates)} ({eval_dates[0]} ~ {eval_dates[-1]})")
@@ -609,8 +616,9 @@ def run_ml_backtest_v2():
         else:
             regime = 'range'
 
-        idx_closes_up_to = np.array(
-            [float(idx_close[d]) for d in idx_dates[:date_idx + 1]], dtype=np.float32)
+        if beta_mat is None:
+            idx_closes_up_to = np.array(
+                [float(idx_close[d]) for d in idx_dates[:date_idx + 1]], dtype=np.float32)
         idx_next_ret = idx_return.get(date)
         if idx_next_ret is None:
             continue
@@ -649,10 +657,13 @@ def run_ml_backtest_v2():
 
             stock_closes = kd['close'][:pos + 1]
             n_sc = pos + 1
-            n_idx = min(n_sc, len(idx_closes_up_to))
+            n_idx = min(n_sc, date_idx + 1)
             if n_idx >= 21:
-                beta, rs5, rs3 = calc_beta_relstrength(
-                    stock_closes, idx_closes_up_to[-n_idx:], n_idx)
+                if beta_mat is not None:
+                    beta, rs5, rs3 = beta_mat.beta_rs(code, col=date_idx, ols=True)
+                else:
+                    beta, rs5, rs3 = calc_beta_relstrength(
+                        stock_closes, idx_closes_up_to[-n_idx:], n_idx)
                 features['beta_20d'] = beta
                 features['rel_strength_5d'] = rs5
                 features['rel_strength_3d'] = rs3
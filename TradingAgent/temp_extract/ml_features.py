@@ -31,6 +31,11 @@ BASE_DIR = r'D:\GitHub\TradingAgents\TradingAgent'
 DATA_DIR = r'D:\GitHub\TradingAgents\TradingShared\data'
 KLINE_CACHE = os.path.join(DATA_DIR, 'kline_cache')
 OUTPUT_FILE = os.path.join(DATA_DIR, 'ml_train_dataset.npz')
+sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
+
+# Beta / relative strength: look up a date-aligned matrix built once (TradingShared/beta_matrix.py)
+# instead of np.cov per (stock, date); False falls back to calc_beta_relstrength
+USE_BETA_MATRIX = True
 
 # ============================================================================
 # Date ranges
@@ -616,6 +621,12 @@ def build_dataset():
     idx_close_array_dict = {}  # date -> cumulative close array up to that date
     # Build a mapping for fast lookup
     idx_date_to_pos = {d: i for i, d in enumerate(idx_dates_sorted)}
+    beta_mat = None
+    if USE_BETA_MATRIX:
+        from beta_matrix import build_from_series
+        beta_mat = build_from_series({code: (kd['dates'], kd['close']) for code, kd in kline.items()},
+                                     idx_dates_sorted, [idx_close[d] for d in idx_dates_sorted])
+        print(f"  Beta matrix: {len(beta_mat)} stocks x {len(beta_mat.dates)} dates")
 
     # --- Define feature names ---
     TECH_FEATURES = [
@@ -712,7 +723,8 @@ def build_dataset():
         risk_level, regime_oh, momentum, vol_oh = detect_market_state(idx_close_list, date_idx)
 
         # Index close array up to this date (for beta/rel strength)
-        idx_closes_up_to = np.array([float(idx_close[d]) for d in idx_dates_sorted[:date_idx + 1]], dtype=np.float32)
+        if beta_mat is None:
+            idx_closes_up_to = np.array([float(idx_close[d]) for d in idx_dates_sorted[:date_idx + 1]], dtype=np.float32)
 
         # Check next-day index return
         idx_next_ret = idx_return.get(date)
@@ -756,11 +768,15 @@ def build_dataset():
             # Compute beta and relative strength
             stock_closes = kd['close'][:pos + 1]
             n_sc = pos + 1
-            n_idx = min(n_sc, len(idx_closes_up_to))
+            n_idx = min(n_sc, date_idx + 1)
             if n_idx >= 21:
-                beta, rs5, rs3 = calc_beta_relstrength(
-                    stock_closes, idx_closes_up_to[-n_idx:], n_idx
-                )
+                if beta_mat is not None:
+                    # OLS beta (ddof-consistent), same convention as calc_beta_relstrength
+                    beta, rs5, rs3 = beta_mat.beta_rs(code, col=date_idx, ols=True)
+                else:
+                    beta, rs5, rs3 = calc_beta_relstrength(
+                        stock_closes, idx_closes_up_to[-n_idx:], n_idx
+                    )
                 features['beta_20d'] = beta
                 features['rel_strength_5d'] = rs5
                 features['rel_strength_3d'] = rs3
@@ -4,6 +4,7 @@
 """
 import json
 import os
+import sys
 import glob
 import re
 from datetime import datetime
@@ -48,8 +49,37 @@ def load_index_data():
         index_map[d] = item['close']
     return index_map
 
+def _daily_close_map(stock_data):
+    """股票数据中的日K线 -> {YYYY-MM-DD: close}，没有日K线返回 None"""
+    kline_data = stock_data.get('kline_data') or {}
+    if 'daily' not in kline_data:
+        return None
+    return {normalize_date(entry['date']): entry['close'] for entry in kline_data['daily']}
+
+def _load_kline_from_store():
+    """综合数据存储 (stock_data_store) 中的日K线，存储不存在时返回 None"""
+    sys.path.insert(0, os.path.dirname(DATA_DIR))
+    try:
+        from stock_data_store import open_stock_data_store, store_path_for
+        comp_file = os.path.join(DATA_DIR, 'comprehensive_stock_data.json')
+        if not os.path.exists(store_path_for(comp_file)):
+            return None
+        store = open_stock_data_store(comp_file, migrate=False)
+        stock_kline = {}
+        for code, stock_data in store.load_all(kinds=('kline',)).items():
+            kline_map = _daily_close_map(stock_data)
+            if kline_map is not None:
+                stock_kline[code] = kline_map
+        return stock_kline
+    except Exception as e:
+        print(f"Warning: Failed to read stock data store, falling back to part files: {e}")
+        return None
+
 def load_kline_data():
-    """从分片文件加载所有K线数据"""
+    """加载所有K线数据：优先综合数据存储（分片文件可能已过期），否则读分片文件"""
+    stock_kline = _load_kline_from_store()
+    if stock_kline is not None:
+        return stock_kline
     stock_kline = {}  # code -> {YYYY-MM-DD -> close}
     
     part_files = sorted(glob.glob(os.path.join(DATA_DIR, 'comprehensive_stock_data_part_*.json')))
@@ -59,12 +89,8 @@ def load_kline_data():
                 data = json.load(f)
             stocks = data.get('stocks', {})
             for code, stock_data in stocks.items():
-                if 'kline_data' in stock_data and 'daily' in stock_data['kline_data']:
-                    daily = stock_data['kline_data']['daily']
-                    kline_map = {}
-                    for entry in daily:
-                        d = normalize_date(entry['date'])
-                        kline_map[d] = entry['close']
+                kline_map = _daily_close_map(stock_data)
+                if kline_map is not None:
                     stock_kline[code] = kline_map
         except Exception as e:
             print(f"Warning: Failed to load {os.path.basename(pf)}: {e}")
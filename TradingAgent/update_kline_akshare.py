@@ -1,6 +1,7 @@
 """
 使用AKShare更新K线缓存（Choice API token过期的备选方案）
 批量获取缺失的K线数据并合并到现有缓存
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import json
 import os
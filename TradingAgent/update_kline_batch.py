@@ -1,5 +1,6 @@
 """
 K线批量更新 - 优先使用 Choice API，失败自动 fallback 到腾讯接口
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import json
 import os
@@ -20,6 +21,12 @@ TRADING_SHARED = r"D:\GitHub\TradingAgents\TradingShared"
 API_DIR = os.path.join(TRADING_SHARED, "api")
 CACHE_PATH = os.path.join(TRADING_SHARED, 'data', 'kline_cache', 'kline_full_latest.json')
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'TradingShared', 'api'))
+from kline_fetch_engine import KlineFetchEngine, FetchJob, merge_new_rows
+
+# fallback 并发抓取：腾讯失败的股票再交给新浪，各源限速见 kline_fetch_engine.SOURCE_LIMITS
+FALLBACK_SOURCES = ('tencent', 'sina')
+
 
 # ============================================================
 # 日期工具
@@ -389,31 +396,11 @@ def update_with_tencent(cache, needs_update, target_date):
 
     KLINE_COUNT = 15
     SAVE_INTERVAL = 300
-    DELAY = 0.05
 
     t0 = time.time()
+    processed = 0
 
-    for idx, code in enumerate(needs_update):
-        klines = get_kline_tencent(code, KLINE_COUNT)
-
-        if klines:
-            existing = cache[code]
-            existing_dates = {r['date'] for r in existing}
-            added = 0
-            for rec in klines:
-                if rec['date'] not in existing_dates:
-                    existing.append(rec)
-                    existing_dates.add(rec['date'])
-                    added += 1
-
-            if added > 0:
-                existing.sort(key=lambda x: x['date'])
-                total_new_records += added
-            updated_keys.append(code)
-        else:
-            failed_keys.append(code)
-
-        processed = idx + 1
+    def after_one():
         if processed % 200 == 0:
             elapsed = time.time() - t0
             rate = processed / elapsed if elapsed > 0 else 0
@@ -428,7 +415,25 @@ def update_with_tencent(cache, needs_update, target_date):
             with open(CACHE_PATH, 'w', encoding='utf-8') as f:
                 json.dump(cache, f, ensure_ascii=False)
 
-        time.sleep(DELAY)
+    def on_result(job, klines, source):
+        nonlocal total_new_records, processed
+        if klines:
+            total_new_records += merge_new_rows(cache[job.code], klines)
+            updated_keys.append(job.code)
+        else:
+            failed_keys.append(job.code)
+        processed += 1
+        after_one()
+
+    def on_failure(job, error):
+        nonlocal processed
+        failed_keys.append(job.code)
+        processed += 1
+        after_one()
+
+    engine = KlineFetchEngine(sources=FALLBACK_SOURCES)
+    engine.run([FetchJob(code, count=KLINE_COUNT) for code in needs_update],
+               on_result, on_failure, progress_every=0)
 
     print(f"[腾讯] 完成: 更新 {len(updated_keys)} 只, 失败 {len(failed_keys)} 只, 新增 {total_new_records} 条")
     return updated_keys, failed_keys
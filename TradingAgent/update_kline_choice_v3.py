@@ -1,5 +1,6 @@
 """
 Choice API K线增量更新 v3 - 一次性处理所有需要更新的股票
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import json, os, sys, time
 from datetime import datetime
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 """
 动态K线缓存更新 - 自动计算需要补充的日期范围
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import json, os, sys, time
 from datetime import datetime, timedelta
@@ -1,4 +1,6 @@
-"""Final pass: update remaining stocks with larger window"""
+"""Final pass: update remaining stocks with larger window
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
+"""
 import json, os, time
 os.environ['HTTP_PROXY'] = ''
 os.environ['HTTPS_PROXY'] = ''
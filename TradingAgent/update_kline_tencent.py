@@ -3,6 +3,7 @@
 Choice API token过期 + push2his被拦截的备选方案
 腾讯接口: web.ifzq.gtimg.cn
 格式: [date, open, close, high, low, volume]
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import json
 import os
@@ -15,6 +16,12 @@ TARGET_DATE = '2026-05-06'
 
 import requests
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'TradingShared', 'api'))
+from kline_fetch_engine import KlineFetchEngine, FetchJob, merge_new_rows
+
+# 并发抓取：腾讯失败的股票回退新浪，各源限速见 kline_fetch_engine.SOURCE_LIMITS
+FETCH_SOURCES = ('tencent', 'sina')
+
 
 def get_kline_tencent(code, count=10):
     """从腾讯获取K线数据
@@ -106,8 +113,7 @@ def main():
     # 每只股票获取最近10条日线就够了（覆盖4/25-5/6约6个交易日）
     KLINE_COUNT = 10
     SAVE_INTERVAL = 300
-    DELAY = 0.05  # 50ms per request = 20 req/s, should be fine
-    
+
     total_updated = 0
     total_new_records = 0
     total_failed = 0
@@ -115,32 +121,27 @@ def main():
     failed_codes = []
 
     t0 = time.time()
-    
-    for code in needs_update:
-        klines = get_kline_tencent(code, KLINE_COUNT)
-        
+
+    def on_result(job, klines, source):
+        nonlocal total_updated, total_new_records, total_failed, processed
         if klines:
             # 合并到缓存
-            existing = cache[code]
-            existing_dates = {r['date'] for r in existing}
-            added = 0
-            for rec in klines:
-                if rec['date'] not in existing_dates:
-                    existing.append(rec)
-                    existing_dates.add(rec['date'])
-                    added += 1
-            
-            if added > 0:
-                existing.sort(key=lambda x: x['date'])
-                total_new_records += added
-            
+            total_new_records += merge_new_rows(cache[job.code], klines)
             total_updated += 1
         else:
             total_failed += 1
-            failed_codes.append(code)
-        
+            failed_codes.append(job.code)
         processed += 1
-        
+        after_one()
+
+    def on_failure(job, error):
+        nonlocal total_failed, processed
+        total_failed += 1
+        failed_codes.append(job.code)
+        processed += 1
+        after_one()
+
+    def after_one():
         # 进度输出
         if processed % 200 == 0:
             elapsed = time.time() - t0
@@ -156,7 +157,9 @@ def main():
             with open(CACHE_PATH, 'w', encoding='utf-8') as f:
                 json.dump(cache, f, ensure_ascii=False)
 
-        time.sleep(DELAY)
+    engine = KlineFetchEngine(sources=FETCH_SOURCES)
+    engine.run([FetchJob(code, count=KLINE_COUNT) for code in needs_update],
+               on_result, on_failure, progress_every=0)
 
     # ── 4. 最终保存 ──
     print(f"\n[2] 保存最终结果...")
@@ -1,5 +1,6 @@
 """
 更新K线缓存 - 用Tushare (不受东方财富代理限制)
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import os, json, time, sys
 os.environ['HTTP_PROXY'] = ''
@@ -24,6 +24,8 @@ import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+
 # 禁用代理
 for k in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 'ALL_PROXY', 'all_proxy']:
     os.environ[k] = ''
@@ -46,6 +48,7 @@ REC_DIR = os.path.join(BASE_DIR, 'recommendation_history')
 VER_DIR = os.path.join(REC_DIR, 'verification_history')
 SUMMARY_PATH = os.path.join(REC_DIR, 'verification_summary_v3.json')
 KLINE_CACHE = os.path.join(BASE_DIR, '..', 'TradingShared', 'data', 'kline_cache')
+sys.path.insert(0, os.path.join(BASE_DIR, '..', 'TradingShared'))
 
 logging.basicConfig(
     level=logging.INFO,
@@ -63,6 +66,7 @@ T3_WINDOW = 3
 _kline_cache = {}       # code -> {date_str: close}
 _index_cache_local = {} # date_str -> close
 _trading_days = []      # sorted list of trading day strings
+_forward_tables = {}    # 'stock' / 'index' -> forward_returns.ForwardReturns
 
 
 def load_local_kline():
@@ -74,19 +78,13 @@ def load_local_kline():
         if os.path.exists(fp):
             logger.info(f"加载本地K线: {fname}")
             try:
-                with open(fp, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                # 进程内共享K线缓存（列式存储可用时直接内存映射读取）
+                from kline_cache import get_kline_cache
+                cache = get_kline_cache(fp)
                 count = 0
-                for code, klines in data.items():
-                    if not isinstance(klines, list):
-                        continue
-                    _kline_cache[code] = {}
-                    for k in klines:
-                        d = str(k.get('date', ''))[:10]
-                        c = float(k.get('close', 0))
-                        if d and c > 0:
-                            _kline_cache[code][d] = c
-                            count += 1
+                for code in cache.codes():
+                    _kline_cache[code] = cache.close_map(code)
+                    count += len(_kline_cache[code])
                 logger.info(f"  加载 {len(_kline_cache)} 只股票, {count} 条K线")
             except Exception as e:
                 logger.warning(f"  加载失败: {e}")
@@ -198,6 +196,36 @@ def get_index_close(date_str: str) -> Optional[float]:
     return None
 
 
+def get_local_forward_tables():
+    """本地K线/指数缓存 → (个股远期收益表, 指数远期收益表)，按交易日历对齐，只构建一次
+
+    T+k 收益 = 第 k 个交易日收盘价相对推荐日收盘价的涨幅。
+    """
+    if not _forward_tables and _trading_days:
+        from forward_returns import ForwardReturns
+        axis = np.array(_trading_days, dtype='datetime64[D]')
+        day_pos = {d: j for j, d in enumerate(_trading_days)}
+        codes = list(_kline_cache)
+        close = np.full((len(codes), len(axis)), np.nan)
+        for i, code in enumerate(codes):
+            for d, c in _kline_cache[code].items():
+                j = day_pos.get(d)
+                if j is not None:
+                    close[i, j] = c
+        idx_close = np.array([_index_cache_local[d] for d in _trading_days], dtype=np.float64)
+        _forward_tables['stock'] = ForwardReturns(codes, axis, close)
+        _forward_tables['index'] = ForwardReturns(['index'], axis, idx_close[None, :])
+    return _forward_tables.get('stock'), _forward_tables.get('index')
+
+
+def _table_return(table, key, date_str: str, horizon: int) -> Optional[float]:
+    """查远期收益表（保留2位小数），查不到返回 None"""
+    if table is None or key is None:
+        return None
+    value = table.get(key, date_str, horizon)
+    return round(value, 2) if value == value else None
+
+
 # ============================================================================
 # T+3 窗口验证核心逻辑
 # ============================================================================
@@ -265,9 +293,18 @@ def verify_stock_t3(code: str, name: str, rec_date: str) -> Dict:
     win = False
     win_day = None
     
+    # 本地数据查远期收益表；当天本地无K线（停牌/缺数据）时仍逐日取收盘价（含网络兜底），不顺延到复牌日
+    stock_table, index_table = get_local_forward_tables()
+    cached_code = _find_cached_code(code)
     for i, day in enumerate(next_days):
-        s_ret = calc_daily_return(code, day, base_close)
-        i_ret = calc_index_daily_return(day, idx_base_close)
+        s_ret = None
+        if cached_code and day in _kline_cache[cached_code]:
+            s_ret = _table_return(stock_table, cached_code, actual_rec_date, i + 1)
+        if s_ret is None:
+            s_ret = calc_daily_return(code, day, base_close)
+        i_ret = _table_return(index_table, 'index', actual_rec_date, i + 1)
+        if i_ret is None:
+            i_ret = calc_index_daily_return(day, idx_base_close)
         
         day_result = {
             'day_offset': i + 1,
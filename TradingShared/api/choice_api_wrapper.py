@@ -1,15 +1,22 @@
-"""Choice API包装器 - 通过独立进程避免调试器环境污染"""
+"""Choice API包装器 - 通过独立进程避免调试器环境污染
+
+默认通过常驻工作进程（choice_daemon.py，登录一次、socket 长度前缀帧通信）发送请求；
+守护进程不可用时回退到每次启动一个 choice_worker.py 进程的旧方式。
+"""
 import json
 import os
 import subprocess
 import tempfile
 from datetime import datetime, timedelta
 
+USE_DAEMON = True   # 优先使用常驻工作进程
+
 
 class ChoiceAPIWrapper:
     """Choice API包装器，使用独立Python进程避免环境污染"""
     
-    def __init__(self, python_exe=r"C:\veighna_studio\python.exe", timeout=300, use_batch=True, use_powershell=True):
+    def __init__(self, python_exe=r"C:\veighna_studio\python.exe", timeout=300, use_batch=True, use_powershell=True,
+                 use_daemon=USE_DAEMON, fake_sdk=False):
         """
         初始化
         
@@ -18,11 +25,16 @@ class ChoiceAPIWrapper:
             timeout: 超时时间（秒）
             use_batch: 是否使用批处理文件作为中介（更彻底的隔离）
             use_powershell: 是否使用PowerShell Start-Process（最彻底隔离）
+            use_daemon: 是否优先使用常驻工作进程（choice_daemon.py）
+            fake_sdk: 守护进程使用 choice_fake_sdk 替身（无 Choice SDK 的环境下测试）
         """
         self.python_exe = python_exe
         self.timeout = timeout
         self.use_batch = use_batch
         self.use_powershell = use_powershell
+        self.use_daemon = use_daemon
+        self.fake_sdk = fake_sdk
+        self._daemon = None
         self.worker_script = os.path.join(
             os.path.dirname(os.path.abspath(__file__)),
             "choice_worker.py"
@@ -32,6 +44,29 @@ class ChoiceAPIWrapper:
         if not os.path.exists(self.worker_script):
             raise FileNotFoundError(f"Choice worker脚本不存在: {self.worker_script}")
     
+    def _get_daemon(self):
+        """常驻工作进程客户端；python_exe 不存在时用当前解释器"""
+        if self._daemon is None:
+            import sys
+            api_dir = os.path.dirname(os.path.abspath(__file__))
+            if api_dir not in sys.path:
+                sys.path.insert(0, api_dir)
+            from choice_daemon import ChoiceDaemonClient
+            python_exe = self.python_exe if os.path.exists(self.python_exe) else None
+            self._daemon = ChoiceDaemonClient(python_exe=python_exe, fake=self.fake_sdk, timeout=self.timeout)
+        return self._daemon
+
+    def _call_daemon(self, cmd, **args):
+        """通过常驻工作进程调用；守护进程无法启动时返回 None 并在本实例中停用"""
+        try:
+            client = self._get_daemon()
+            client.connect()
+        except Exception as e:
+            print(f"[Choice] 常驻工作进程不可用，改用独立进程: {type(e).__name__}: {e}")
+            self.use_daemon = False
+            return None
+        return client.call(cmd, **args)
+
     def _call_worker(self, *args):
         """
         调用worker进程
@@ -42,6 +77,16 @@ class ChoiceAPIWrapper:
         返回:
             dict: JSON解析后的结果
         """
+        if self.use_daemon:
+            command, params = args[0], args[1:]
+            if command == "kline":
+                keys = ("stock_code", "start_date", "end_date", "indicators")
+            else:
+                keys = ("stock_codes",)
+            result = self._call_daemon(command, **dict(zip(keys, params)))
+            if result is not None:
+                return result
+
         try:
             # 准备干净的环境 - 移除所有可能影响Choice SDK的环境变量
             env = os.environ.copy()
@@ -342,6 +387,44 @@ Start-Process -FilePath '{self.python_exe}' -ArgumentList {args_list} -NoNewWind
         
         return self._call_worker("quote", codes_str)
     
+    def csd(self, codes, indicators, start_date, end_date, options=""):
+        """
+        批量序列数据（c.csd），仅常驻工作进程支持
+
+        参数:
+            codes: 代码列表或逗号分隔字符串
+            indicators: 指标，逗号分隔
+
+        返回:
+            dict: {"success", "codes", "dates", "indicators", "data": {code: [[指标1序列], ...]}}
+        """
+        if isinstance(codes, list):
+            codes = ",".join(codes)
+        result = self._call_daemon("csd", codes=codes, indicators=indicators,
+                                   start_date=start_date, end_date=end_date, options=options)
+        return result if result is not None else {"success": False, "error": "Choice常驻工作进程不可用"}
+
+    def css(self, codes, indicators, options=""):
+        """
+        批量截面数据（c.css），仅常驻工作进程支持
+
+        返回:
+            dict: {"success", "codes", "indicators", "data": {code: [指标值, ...]}}
+        """
+        if isinstance(codes, list):
+            codes = ",".join(codes)
+        result = self._call_daemon("css", codes=codes, indicators=indicators, options=options)
+        return result if result is not None else {"success": False, "error": "Choice常驻工作进程不可用"}
+
+    def close(self, shutdown_daemon=False):
+        """断开与常驻工作进程的连接（shutdown_daemon=True 时同时让其退出）"""
+        if self._daemon is not None:
+            if shutdown_daemon:
+                self._daemon.shutdown()
+            else:
+                self._daemon.close()
+            self._daemon = None
+
     def test_connection(self):
         """
         测试Choice连接
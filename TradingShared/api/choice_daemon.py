@@ -0,0 +1,559 @@
+"""Choice 常驻工作进程 - 登录一次，通过本地 socket 持续服务 csd / css / 实时行情请求
+
+ChoiceAPIWrapper 原先每个请求启动一个新的 Python 解释器运行 choice_worker.py：
+每次都要付出解释器启动、导入 EmQuantAPI、完整 c.start 登录的开销，结果还要从 stdout
+的 ===CHOICE_JSON_START=== 标记中截取。这里改为一个常驻进程：
+
+协议（127.0.0.1 TCP，长度前缀帧）：
+    帧 = 4 字节大端长度 + UTF-8 JSON
+    请求 {"id": 1, "cmd": "csd", "args": {...}}
+    响应 {"id": 1, "result": {...}}       result 与 choice_worker 的返回字典格式相同
+
+  - 一个连接上可以同时有多个未完成请求，响应按完成顺序返回，用 id 对应
+  - SDK 调用在 SDK_THREADS 个线程中并发执行
+  - SDK 调用抛异常，或返回未登录/会话过期的错误码（RELOGIN_ERROR_CODES / RELOGIN_ERROR_KEYWORDS）时
+    重新登录并重试一次；连续 MAX_LOGIN_FAILURES 次登录失败则进程退出，
+    客户端下次调用时自动重新拉起
+  - 端口和进程号写入 DAEMON_STATE_FILE，客户端据此连接；空闲 IDLE_TIMEOUT 秒后自动退出
+
+命令：ping / kline / quote / csd / css / shutdown
+
+用法：
+    python choice_daemon.py              # 真实 SDK（Windows + EmQuantAPI）
+    python choice_daemon.py --fake       # choice_fake_sdk 替身，Linux 上测试协议
+
+    from choice_daemon import ChoiceDaemonClient
+    client = ChoiceDaemonClient()
+    client.call('csd', codes='000001.SZ,600000.SH', indicators='CLOSE',
+                start_date='2026-05-01', end_date='2026-05-08')
+"""
+import argparse
+import itertools
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+_api_dir = os.path.dirname(os.path.abspath(__file__))
+_parent_dir = os.path.dirname(_api_dir)
+for _p in (_api_dir, _parent_dir):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+from choice_worker import fetch_kline, fetch_quote, login_choice
+
+HOST = '127.0.0.1'
+DAEMON_STATE_FILE = os.path.join(_parent_dir, 'data', 'choice_daemon.json')
+SDK_THREADS = 4               # 并发 SDK 调用数；SDK 出现并发问题时改为 1
+MAX_LOGIN_FAILURES = 3        # 连续登录失败次数上限，超过后进程退出等待客户端重启
+IDLE_TIMEOUT = 30 * 60        # 无连接、无请求超过该秒数后退出
+START_TIMEOUT = 60            # 客户端等待守护进程就绪的秒数
+MAX_FRAME = 256 * 1024 * 1024
+
+# SDK 返回这些错误码（或错误信息含下列关键字）说明登录状态已失效，需要重新登录后重试，
+# 而不是当作普通数据错误返回给客户端
+RELOGIN_ERROR_CODES = {10001012}
+RELOGIN_ERROR_KEYWORDS = ('not logged in', 'login', 'token', 'session', '未登录', '登录', '令牌', '会话')
+
+_HEADER = struct.Struct('>I')
+
+
+# ============================================================================
+# 帧协议
+# ============================================================================
+def send_frame(sock, obj):
+    """发送一个长度前缀的 JSON 帧"""
+    payload = json.dumps(obj, ensure_ascii=False, default=str).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def recv_frame(sock):
+    """接收一个帧，连接关闭时返回 None"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"帧过大: {size} 字节")
+    payload = _recv_exact(sock, size)
+    if payload is None:
+        return None
+    return json.loads(payload.decode('utf-8'))
+
+
+def clean_worker_env():
+    """去掉会影响 Choice SDK 的 Python / 调试器环境变量"""
+    env = os.environ.copy()
+    for key in ['PYTHONPATH', 'PYTHONSTARTUP', 'PYTHONHOME',
+                'VIRTUAL_ENV', 'CONDA_DEFAULT_ENV', 'CONDA_PREFIX']:
+        env.pop(key, None)
+    for key in [k for k in env.keys() if 'DEBUG' in k.upper() or 'PYDEV' in k.upper()]:
+        del env[key]
+    return env
+
+
+# ============================================================================
+# 服务端
+# ============================================================================
+def _as_list(value):
+    return value if isinstance(value, list) else list(value)
+
+
+def _csd_result(data):
+    if data.ErrorCode != 0:
+        return {"success": False, "error": f"数据获取失败: {data.ErrorMsg}", "error_code": data.ErrorCode}
+    return {
+        "success": True,
+        "codes": _as_list(getattr(data, 'Codes', [])),
+        "dates": _as_list(getattr(data, 'Dates', [])),
+        "indicators": _as_list(getattr(data, 'Indicators', [])),
+        "data": dict(getattr(data, 'Data', {}) or {}),
+    }
+
+
+def _needs_relogin(result):
+    """结果是否为未登录/会话过期错误（而不是普通的数据错误）"""
+    if not isinstance(result, dict) or result.get('success', True):
+        return False
+    if result.get('error_code') in RELOGIN_ERROR_CODES:
+        return True
+    message = str(result.get('error', '')).lower()
+    return 'error_code' in result and any(k in message for k in RELOGIN_ERROR_KEYWORDS)
+
+
+class ChoiceDaemon:
+    """常驻进程服务端：持有一个已登录的 SDK 对象，处理来自本地连接的请求"""
+
+    def __init__(self, sdk, host=HOST, port=0, threads=SDK_THREADS, idle_timeout=IDLE_TIMEOUT):
+        self.sdk = sdk
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='choice-sdk')
+        self.idle_timeout = idle_timeout
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(16)
+        self.address = self.server.getsockname()
+        self.stats = {'served': 0, 'errors': 0, 'logins': 0, 'relogins': 0}
+        self._login_lock = threading.Lock()
+        self._generation = 0           # 每次成功登录 +1，避免多个线程重复重登
+        self._login_failures = 0
+        self._stop = threading.Event()
+        self.exit_code = 0
+        self._connections = 0
+        self._last_active = time.time()
+        self._state_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 登录
+    # ------------------------------------------------------------------
+    def login(self):
+        """登录 SDK，返回是否成功；连续失败过多时停止服务"""
+        with self._login_lock:
+            return self._login_locked()
+
+    def _login_locked(self):
+        error = login_choice(self.sdk)
+        if error is None:
+            self._generation += 1
+            self._login_failures = 0
+            self.stats['logins'] += 1
+            return True
+        self._login_failures += 1
+        print(f"[choice_daemon] 登录失败({self._login_failures}/{MAX_LOGIN_FAILURES}): {error.get('error')}")
+        if self._login_failures >= MAX_LOGIN_FAILURES:
+            self.stop(exit_code=3)
+        return False
+
+    def _relogin(self, generation):
+        with self._login_lock:
+            if generation != self._generation:
+                return True   # 其他线程已经重新登录
+            self.stats['relogins'] += 1
+            try:
+                self.sdk.stop()
+            except Exception:
+                pass
+            return self._login_locked()
+
+    def _with_sdk(self, fn):
+        """执行一次 SDK 调用；抛异常或登录失效时重新登录并重试一次"""
+        generation = self._generation
+        try:
+            result = fn(self.sdk)
+            if not _needs_relogin(result):
+                return result
+            print(f"[choice_daemon] 登录状态失效，重新登录: {result.get('error_code')} {result.get('error')}")
+            if not self._relogin(generation):
+                return dict(result, hint="Choice 重新登录失败")
+        except Exception as e:
+            print(f"[choice_daemon] SDK调用异常，重新登录: {type(e).__name__}: {e}")
+            if not self._relogin(generation):
+                return {"success": False, "error": f"{type(e).__name__}: {e}", "hint": "Choice 重新登录失败"}
+        try:
+            return fn(self.sdk)
+        except Exception as e:
+            return {"success": False, "error": f"{type(e).__name__}: {e}"}
+
+    # ------------------------------------------------------------------
+    # 请求处理
+    # ------------------------------------------------------------------
+    def dispatch(self, cmd, args):
+        if cmd == 'ping':
+            return {"success": True, "pid": os.getpid(), **self.stats}
+        if cmd == 'kline':
+            params = (args['stock_code'], args['start_date'], args['end_date'],
+                      args.get('indicators', "OPEN,HIGH,LOW,CLOSE,VOLUME"))
+            return self._with_sdk(lambda c: fetch_kline(c, *params))
+        if cmd == 'quote':
+            codes = args['stock_codes']
+            return self._with_sdk(lambda c: fetch_quote(c, codes))
+        if cmd == 'csd':
+            params = (args['codes'], args['indicators'], args['start_date'], args['end_date'], args.get('options', ""))
+            return self._with_sdk(lambda c: _csd_result(c.csd(*params)))
+        if cmd == 'css':
+            params = (args['codes'], args['indicators'], args.get('options', ""))
+            return self._with_sdk(lambda c: _csd_result(c.css(*params)))
+        return {"success": False, "error": f"未知命令: {cmd}"}
+
+    def _run_request(self, request):
+        try:
+            result = self.dispatch(request.get('cmd'), request.get('args') or {})
+        except KeyError as e:
+            result = {"success": False, "error": f"缺少参数: {e}"}
+        except Exception as e:
+            result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+        with self._state_lock:
+            self.stats['served'] += 1
+            if not result.get('success'):
+                self.stats['errors'] += 1
+            self._last_active = time.time()
+        return result
+
+    def _serve_connection(self, conn):
+        send_lock = threading.Lock()
+
+        def reply(request_id, future):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+            try:
+                with send_lock:
+                    send_frame(conn, {"id": request_id, "result": result})
+            except OSError:
+                pass   # 客户端已断开
+
+        try:
+            while not self._stop.is_set():
+                request = recv_frame(conn)
+                if request is None:
+                    break
+                request_id = request.get('id')
+                if request.get('cmd') == 'shutdown':
+                    with send_lock:
+                        send_frame(conn, {"id": request_id, "result": {"success": True}})
+                    self.stop()
+                    break
+                future = self.pool.submit(self._run_request, request)
+                future.add_done_callback(lambda f, rid=request_id: reply(rid, f))
+        except (OSError, ValueError) as e:
+            print(f"[choice_daemon] 连接异常: {e}")
+        finally:
+            with self._state_lock:
+                self._connections -= 1
+                self._last_active = time.time()
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def stop(self, exit_code=None):
+        if exit_code is not None:
+            self.exit_code = exit_code
+        self._stop.set()
+
+    def serve_forever(self):
+        """接受连接直到 shutdown / 空闲超时 / 登录失败过多"""
+        self.server.settimeout(1.0)
+        try:
+            while not self._stop.is_set():
+                try:
+                    conn, _ = self.server.accept()
+                except socket.timeout:
+                    with self._state_lock:
+                        idle = self._connections == 0 and time.time() - self._last_active > self.idle_timeout
+                    if idle:
+                        print(f"[choice_daemon] 空闲超过 {self.idle_timeout}s，退出")
+                        break
+                    continue
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with self._state_lock:
+                    self._connections += 1
+                    self._last_active = time.time()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.server.close()
+            self.pool.shutdown(wait=False)
+            try:
+                self.sdk.stop()
+            except Exception:
+                pass
+        return self.exit_code
+
+
+def _write_state(path, address, fake):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'host': address[0], 'port': address[1], 'pid': os.getpid(), 'fake': fake,
+                   'started': time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+    os.replace(tmp, path)
+
+
+def _read_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ============================================================================
+# 客户端
+# ============================================================================
+class ChoiceDaemonClient:
+    """守护进程客户端：连接不上时自动拉起守护进程；线程安全，可在多个线程中并发调用"""
+
+    def __init__(self, python_exe=None, fake=False, timeout=300, spawn=True, state_file=DAEMON_STATE_FILE):
+        """
+        参数:
+            python_exe: 启动守护进程用的 Python 解释器，默认当前解释器
+            fake: 使用 choice_fake_sdk 替身（Linux 上测试）
+            timeout: 单个请求超时（秒）
+            spawn: 连接不上时是否自动启动守护进程
+            state_file: 守护进程写入端口号的文件
+        """
+        self.python_exe = python_exe or sys.executable
+        self.fake = fake
+        self.timeout = timeout
+        self.spawn = spawn
+        self.state_file = state_file
+        self._sock = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()        # 连接建立 / 拆除
+        self._send_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 连接管理
+    # ------------------------------------------------------------------
+    def _try_connect(self):
+        state = _read_state(self.state_file)
+        if not state or bool(state.get('fake')) != self.fake:
+            return None
+        try:
+            sock = socket.create_connection((state['host'], state['port']), timeout=5)
+        except OSError:
+            return None
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _spawn_daemon(self):
+        cmd = [self.python_exe, os.path.abspath(__file__)]
+        if self.fake:
+            cmd.append('--fake')
+        cmd += ['--state-file', self.state_file]
+        kwargs = {}
+        if sys.platform == 'win32':
+            # DETACHED_PROCESS + CREATE_NEW_PROCESS_GROUP，与调用方的调试器环境完全隔离
+            kwargs['creationflags'] = 0x00000008 | 0x00000200
+        else:
+            kwargs['start_new_session'] = True
+        try:
+            os.remove(self.state_file)
+        except OSError:
+            pass
+        subprocess.Popen(cmd, cwd=_api_dir, env=clean_worker_env(), stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+        deadline = time.time() + START_TIMEOUT
+        while time.time() < deadline:
+            sock = self._try_connect()
+            if sock is not None:
+                return sock
+            time.sleep(0.2)
+        raise ConnectionError(f"Choice守护进程 {START_TIMEOUT}s 内未就绪")
+
+    def connect(self):
+        """连接守护进程（必要时启动），失败时抛出 ConnectionError"""
+        self._ensure_connected()
+
+    def _ensure_connected(self):
+        with self._lock:
+            if self._sock is not None:
+                return self._sock
+            sock = self._try_connect()
+            if sock is None:
+                if not self.spawn:
+                    raise ConnectionError("Choice守护进程未运行")
+                sock = self._spawn_daemon()
+            self._sock = sock
+            threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+            return sock
+
+    def _read_loop(self, sock):
+        error = ConnectionError("Choice守护进程连接已断开")
+        try:
+            while True:
+                frame = recv_frame(sock)
+                if frame is None:
+                    break
+                future = self._pending.pop(frame.get('id'), None)
+                if future is not None:
+                    future.set_result(frame.get('result'))
+        except (OSError, ValueError) as e:
+            error = ConnectionError(f"Choice守护进程连接异常: {e}")
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending = [(rid, f) for rid, f in list(self._pending.items()) if getattr(f, '_sock', None) is sock]
+            for rid, f in pending:
+                self._pending.pop(rid, None)
+                f.set_exception(error)
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------
+    # 请求
+    # ------------------------------------------------------------------
+    def submit(self, cmd, **args):
+        """发送请求，返回 Future（结果为 worker 格式的字典）"""
+        sock = self._ensure_connected()
+        request_id = next(self._ids)
+        future = Future()
+        future._sock = sock
+        self._pending[request_id] = future
+        try:
+            with self._send_lock:
+                send_frame(sock, {"id": request_id, "cmd": cmd, "args": args})
+        except OSError as e:
+            self._pending.pop(request_id, None)
+            with self._lock:
+                if self._sock is sock:
+                    self._sock = None
+            raise ConnectionError(f"发送失败: {e}")
+        return future
+
+    def call(self, cmd, **args):
+        """同步调用；连接断开（守护进程崩溃/重启）时重连并重试一次"""
+        for attempt in range(2):
+            try:
+                return self.submit(cmd, **args).result(timeout=self.timeout)
+            except ConnectionError as e:
+                if attempt == 0:
+                    continue
+                return {"success": False, "error": str(e)}
+            except FutureTimeout:
+                return {"success": False, "error": f"Choice守护进程请求超时 ({self.timeout}秒)"}
+
+    def call_many(self, requests):
+        """流水线批量调用：[(cmd, args), ...] 全部发出后再等待，返回结果列表（顺序与请求相同）"""
+        futures = []
+        for cmd, args in requests:
+            try:
+                futures.append(self.submit(cmd, **args))
+            except ConnectionError as e:
+                futures.append(e)
+        results = []
+        for (cmd, args), f in zip(requests, futures):
+            try:
+                if isinstance(f, Exception):
+                    raise f
+                results.append(f.result(timeout=self.timeout))
+            except ConnectionError:
+                results.append(self.call(cmd, **args))
+            except FutureTimeout:
+                results.append({"success": False, "error": f"Choice守护进程请求超时 ({self.timeout}秒)"})
+        return results
+
+    def ping(self):
+        return self.call('ping')
+
+    def shutdown(self):
+        """请求守护进程退出"""
+        try:
+            sock = self._try_connect()
+            if sock is None:
+                return False
+            send_frame(sock, {"id": 0, "cmd": "shutdown", "args": {}})
+            recv_frame(sock)
+            sock.close()
+            return True
+        except OSError:
+            return False
+        finally:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+                sock.close()
+            except OSError:
+                pass
+
+
+# ============================================================================
+# 入口
+# ============================================================================
+def main():
+    parser = argparse.ArgumentParser(description='Choice 常驻工作进程')
+    parser.add_argument('--fake', action='store_true', help='使用 choice_fake_sdk 替身')
+    parser.add_argument('--port', type=int, default=0, help='监听端口，默认随机')
+    parser.add_argument('--threads', type=int, default=SDK_THREADS)
+    parser.add_argument('--idle-timeout', type=int, default=IDLE_TIMEOUT)
+    parser.add_argument('--state-file', default=DAEMON_STATE_FILE)
+    args = parser.parse_args()
+
+    if args.fake:
+        from choice_fake_sdk import c
+    else:
+        from EmQuantAPI import c
+
+    daemon = ChoiceDaemon(c, port=args.port, threads=args.threads, idle_timeout=args.idle_timeout)
+    if not daemon.login():
+        sys.exit(3)
+    _write_state(args.state_file, daemon.address, args.fake)
+    print(f"[choice_daemon] 就绪 {daemon.address[0]}:{daemon.address[1]} pid={os.getpid()}")
+    code = daemon.serve_forever()
+    state = _read_state(args.state_file)
+    if state and state.get('pid') == os.getpid():
+        try:
+            os.remove(args.state_file)
+        except OSError:
+            pass
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Choice SDK 的进程内替身 - 在没有 EmQuantAPI 的机器（Linux/CI）上测试 choice_daemon 协议
+
+只实现 choice_daemon / choice_worker 用到的接口：start / stop / csd / css，
+返回对象的字段（ErrorCode / ErrorMsg / Codes / Dates / Indicators / Data）与真实 SDK 一致，
+数据由代码和日期确定性生成，同一请求多次调用结果相同。
+
+    python choice_daemon.py --fake      # 用替身启动守护进程
+"""
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+
+class FakeResult:
+    """模拟 EmQuantAPI 的返回对象"""
+
+    def __init__(self, error_code=0, error_msg="success", codes=None, dates=None, indicators=None, data=None):
+        self.ErrorCode = error_code
+        self.ErrorMsg = error_msg
+        self.Codes = codes or []
+        self.Dates = dates or []
+        self.Indicators = indicators or []
+        self.Data = data or {}
+
+
+def _split(value):
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value).split(',') if v.strip()]
+
+
+def _trade_dates(start_date, end_date):
+    day = datetime.strptime(start_date[:10], "%Y-%m-%d")
+    end = datetime.strptime(end_date[:10], "%Y-%m-%d")
+    dates = []
+    while day <= end:
+        if day.weekday() < 5:
+            dates.append(day.strftime("%Y/%m/%d"))
+        day += timedelta(days=1)
+    return dates
+
+
+def _value(code, indicator, date=''):
+    """由 (代码, 指标, 日期) 确定性生成的数值"""
+    seed = zlib.crc32(f"{code}|{indicator}|{date}".encode('utf-8'))
+    base = 5 + zlib.crc32(code.encode('utf-8')) % 50
+    if indicator in ('VOLUME', 'AMOUNT', 'VOLUMEAMOUNT'):
+        return float(100000 + seed % 10000000)
+    if indicator in ('CHANGE', 'CHANGEPCT', 'PCTCHG'):
+        return round((seed % 2001 - 1000) / 100, 2)
+    if indicator == 'TURN':
+        return round(seed % 1000 / 100, 2)
+    if indicator == 'NAME':
+        return f"股票{code[:6]}"
+    return round(base * (1 + (seed % 2001 - 1000) / 10000), 2)
+
+
+class FakeChoice:
+    """EmQuantAPI.c 的替身
+
+    参数:
+        latency: 每次 csd/css 调用的模拟耗时（秒）
+        fail_after: 成功调用这么多次后抛出一次 OSError（模拟 SDK 掉线），None 表示不失败
+        expire_after: 成功调用这么多次后会话过期（不抛异常，返回未登录错误码），None 表示不过期
+    """
+
+    def __init__(self, latency=0.0, fail_after=None, expire_after=None):
+        self.latency = latency
+        self.fail_after = fail_after
+        self.expire_after = expire_after
+        self.logged_in = False
+        self.start_calls = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def start(self, options="", *args, **kwargs):
+        with self._lock:
+            self.start_calls += 1
+            self.logged_in = True
+        return FakeResult(0, "success")
+
+    def stop(self, *args, **kwargs):
+        with self._lock:
+            self.logged_in = False
+        return FakeResult(0, "success")
+
+    def _enter(self):
+        with self._lock:
+            if not self.logged_in:
+                return FakeResult(10001012, "not logged in")
+            if self.expire_after is not None and self.calls >= self.expire_after:
+                self.calls = 0
+                self.logged_in = False
+                return FakeResult(10001012, "not logged in")
+            self.calls += 1
+            if self.fail_after is not None and self.calls > self.fail_after:
+                self.calls = 0
+                self.logged_in = False
+                raise OSError("fake SDK connection lost")
+        if self.latency:
+            time.sleep(self.latency)
+        return None
+
+    def csd(self, codes, indicators, start_date, end_date, options=""):
+        error = self._enter()
+        if error:
+            return error
+        codes, indicators = _split(codes), [i.upper() for i in _split(indicators)]
+        dates = _trade_dates(start_date, end_date)
+        data = {code: [[_value(code, ind, d) for d in dates] for ind in indicators] for code in codes}
+        return FakeResult(codes=codes, dates=dates, indicators=indicators, data=data)
+
+    def css(self, codes, indicators, options=""):
+        error = self._enter()
+        if error:
+            return error
+        codes, indicators = _split(codes), [i.upper() for i in _split(indicators)]
+        data = {code: [_value(code, ind) for ind in indicators] for code in codes}
+        return FakeResult(codes=codes, indicators=indicators, data=data)
+
+
+c = FakeChoice()
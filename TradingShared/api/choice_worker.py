@@ -11,6 +11,149 @@ if _parent_dir not in sys.path:
     sys.path.insert(0, _parent_dir)
 
 
+def login_choice(c, max_retries=3):
+    """
+    登录 Choice（c.start），带重试
+
+    参数:
+        c: EmQuantAPI.c（或测试用的 choice_fake_sdk.FakeChoice）
+        max_retries: 最大尝试次数
+
+    返回:
+        None 表示成功；失败时返回错误字典
+    """
+    import time
+
+    from config import CHOICE_USERNAME, CHOICE_PASSWORD
+    result = None
+
+    for attempt in range(max_retries):
+        try:
+            result = c.start(f"USERNAME={CHOICE_USERNAME},PASSWORD={CHOICE_PASSWORD}")
+
+            # 检查是否成功
+            if result.ErrorCode == 0:
+                break  # 成功则跳出
+            elif "online" in result.ErrorMsg.lower():
+                # 已经在线，也算成功
+                break
+            else:
+                # 其他错误
+                if attempt < max_retries - 1:
+                    time.sleep(1)
+                    continue
+
+        except KeyError as e:
+            # KeyError说明SDK初始化不完整
+            # 尝试重置SDK状态后重试
+            if attempt < max_retries - 1:
+                try:
+                    # 强制重置SDK的初始化标志
+                    c._c__InitSucceed = False
+                    c._c__QuantFuncDict = {}
+                except:
+                    pass
+                time.sleep(1)
+                continue
+            else:
+                # 最后一次尝试也失败
+                import traceback
+                return {
+                    "success": False,
+                    "error": f"KeyError: {str(e)}",
+                    "python_exe": sys.executable,
+                    "traceback": traceback.format_exc(),
+                    "hint": "Choice SDK内部状态损坏，通常是因为重复初始化。请重启应用程序。"
+                }
+        except OSError as e:
+            if attempt < max_retries - 1:
+                # 等待一下再重试
+                time.sleep(1)
+                continue
+            else:
+                # 最后一次尝试也失败
+                import traceback
+                return {
+                    "success": False,
+                    "error": f"OSError (尝试{max_retries}次后失败): {str(e)}",
+                    "python_exe": sys.executable,
+                    "traceback": traceback.format_exc(),
+                    "hint": "可能有其他进程正在使用Choice SDK，请关闭其他进程后重试"
+                }
+    if result.ErrorCode != 0:
+        return {
+            "success": False,
+            "error": f"Choice初始化失败: {result.ErrorMsg}",
+            "error_code": result.ErrorCode
+        }
+    return None
+
+
+def fetch_kline(c, stock_code, start_date, end_date, indicators="OPEN,HIGH,LOW,CLOSE,VOLUME"):
+    """已登录状态下获取单只股票K线，返回格式同 get_kline_data"""
+    data = c.csd(stock_code, indicators, start_date, end_date, "")
+
+    if data.ErrorCode != 0:
+        return {
+            "success": False,
+            "error": f"数据获取失败: {data.ErrorMsg}",
+            "error_code": data.ErrorCode
+        }
+
+    # 解析数据
+    result_data = {
+        "success": True,
+        "stock_code": stock_code,
+        "dates": data.Dates if hasattr(data, 'Dates') else [],
+        "indicators": data.Indicators if hasattr(data, 'Indicators') else [],
+        "data": {}
+    }
+
+    # Choice返回的Data格式: {stock_code: [[open], [high], [low], [close], [volume]]}
+    if hasattr(data, 'Data') and isinstance(data.Data, dict):
+        stock_data = data.Data.get(stock_code, [])
+        if stock_data and result_data["indicators"]:
+            # 将数据按指标重组
+            for i, indicator in enumerate(result_data["indicators"]):
+                if i < len(stock_data):
+                    result_data["data"][indicator] = stock_data[i]
+
+    return result_data
+
+
+def fetch_quote(c, stock_codes):
+    """已登录状态下获取实时行情，返回格式同 get_realtime_quote"""
+    # 转换为字符串
+    if isinstance(stock_codes, list):
+        codes_str = ",".join(stock_codes)
+    else:
+        codes_str = stock_codes
+
+    # 获取实时行情
+    indicators = "LASTPRICE,OPEN,HIGH,LOW,VOLUME,AMOUNT,CHANGE,CHANGEPCT"
+    data = c.css(codes_str, indicators, "")
+
+    if data.ErrorCode != 0:
+        return {
+            "success": False,
+            "error": f"行情获取失败: {data.ErrorMsg}",
+            "error_code": data.ErrorCode
+        }
+
+    # 解析数据
+    result_data = {
+        "success": True,
+        "codes": data.Codes if hasattr(data, 'Codes') else [],
+        "data": {}
+    }
+
+    if hasattr(data, 'Data') and isinstance(data.Data, dict):
+        for indicator, values in data.Data.items():
+            result_data["data"][indicator] = values
+
+    return result_data
+
+
 def get_kline_data(stock_code, start_date, end_date, indicators="OPEN,HIGH,LOW,CLOSE,VOLUME"):
     """
     获取K线数据
@@ -25,107 +168,12 @@ def get_kline_data(stock_code, start_date, end_date, indicators="OPEN,HIGH,LOW,C
         JSON格式的数据字典
     """
     try:
-        # 初始化前先检查是否已初始化，避免KeyError
-        # Choice SDK不支持重复调用c.start()
-        import time
-
+        # Choice SDK不支持重复调用c.start()，登录失败时 login_choice 负责重试与重置
         from EmQuantAPI import c
-        from config import CHOICE_USERNAME, CHOICE_PASSWORD
-        max_retries = 3
-        last_error = None
-        
-        for attempt in range(max_retries):
-            try:
-                result = c.start(f"USERNAME={CHOICE_USERNAME},PASSWORD={CHOICE_PASSWORD}")
-                
-                # 检查是否成功
-                if result.ErrorCode == 0:
-                    break  # 成功则跳出
-                elif "online" in result.ErrorMsg.lower():
-                    # 已经在线，也算成功
-                    break
-                else:
-                    # 其他错误
-                    if attempt < max_retries - 1:
-                        time.sleep(1)
-                        continue
-                    
-            except KeyError as e:
-                # KeyError说明SDK初始化不完整
-                # 尝试重置SDK状态后重试
-                if attempt < max_retries - 1:
-                    try:
-                        # 强制重置SDK的初始化标志
-                        c._c__InitSucceed = False
-                        c._c__QuantFuncDict = {}
-                    except:
-                        pass
-                    time.sleep(1)
-                    continue
-                else:
-                    # 最后一次尝试也失败
-                    import sys
-                    import traceback
-                    return {
-                        "success": False,
-                        "error": f"KeyError: {str(e)}",
-                        "python_exe": sys.executable,
-                        "traceback": traceback.format_exc(),
-                        "hint": "Choice SDK内部状态损坏，通常是因为重复初始化。请重启应用程序。"
-                    }
-            except OSError as e:
-                last_error = e
-                if attempt < max_retries - 1:
-                    # 等待一下再重试
-                    time.sleep(1)
-                    continue
-                else:
-                    # 最后一次尝试也失败
-                    import sys
-                    import traceback
-                    return {
-                        "success": False,
-                        "error": f"OSError (尝试{max_retries}次后失败): {str(e)}",
-                        "python_exe": sys.executable,
-                        "traceback": traceback.format_exc(),
-                        "hint": "可能有其他进程正在使用Choice SDK，请关闭其他进程后重试"
-                    }
-        if result.ErrorCode != 0:
-            return {
-                "success": False,
-                "error": f"Choice初始化失败: {result.ErrorMsg}",
-                "error_code": result.ErrorCode
-            }
-        
-        # 获取数据
-        data = c.csd(stock_code, indicators, start_date, end_date, "")
-        
-        if data.ErrorCode != 0:
-            return {
-                "success": False,
-                "error": f"数据获取失败: {data.ErrorMsg}",
-                "error_code": data.ErrorCode
-            }
-        
-        # 解析数据
-        result_data = {
-            "success": True,
-            "stock_code": stock_code,
-            "dates": data.Dates if hasattr(data, 'Dates') else [],
-            "indicators": data.Indicators if hasattr(data, 'Indicators') else [],
-            "data": {}
-        }
-        
-        # Choice返回的Data格式: {stock_code: [[open], [high], [low], [close], [volume]]}
-        if hasattr(data, 'Data') and isinstance(data.Data, dict):
-            stock_data = data.Data.get(stock_code, [])
-            if stock_data and result_data["indicators"]:
-                # 将数据按指标重组
-                for i, indicator in enumerate(result_data["indicators"]):
-                    if i < len(stock_data):
-                        result_data["data"][indicator] = stock_data[i]
-        
-        return result_data
+        error = login_choice(c)
+        if error:
+            return error
+        return fetch_kline(c, stock_code, start_date, end_date, indicators)
         
     except Exception as e:
         return {
@@ -154,35 +202,7 @@ def get_realtime_quote(stock_codes):
                 "success": False,
                 "error": f"Choice初始化失败: {result.ErrorMsg}"
             }
-        
-        # 转换为字符串
-        if isinstance(stock_codes, list):
-            codes_str = ",".join(stock_codes)
-        else:
-            codes_str = stock_codes
-        
-        # 获取实时行情
-        indicators = "LASTPRICE,OPEN,HIGH,LOW,VOLUME,AMOUNT,CHANGE,CHANGEPCT"
-        data = c.css(codes_str, indicators, "")
-        
-        if data.ErrorCode != 0:
-            return {
-                "success": False,
-                "error": f"行情获取失败: {data.ErrorMsg}"
-            }
-        
-        # 解析数据
-        result_data = {
-            "success": True,
-            "codes": data.Codes if hasattr(data, 'Codes') else [],
-            "data": {}
-        }
-        
-        if hasattr(data, 'Data') and isinstance(data.Data, dict):
-            for indicator, values in data.Data.items():
-                result_data["data"][indicator] = values
-        
-        return result_data
+        return fetch_quote(c, stock_codes)
         
     except Exception as e:
         return {
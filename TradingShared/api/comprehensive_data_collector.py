@@ -142,6 +142,23 @@ except ImportError:
         STOCK_STATUS_CHECKER_AVAILABLE = False
         print("[WARN] 股票状态检测器未找到")
 
+# 综合数据存储（SQLite，每只股票每类数据一条记录，替代分卷 JSON）
+try:
+    from TradingShared.stock_data_store import open_stock_data_store
+    STOCK_DATA_STORE_AVAILABLE = True
+except ImportError:
+    try:
+        import sys
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from stock_data_store import open_stock_data_store
+        STOCK_DATA_STORE_AVAILABLE = True
+    except ImportError:
+        STOCK_DATA_STORE_AVAILABLE = False
+        print("[WARN] 综合数据存储模块未找到，使用分卷 JSON")
+
+# True: save_data / load_existing_data 读写 SQLite 存储；False: 沿用 comprehensive_stock_data_part_N.json
+USE_STOCK_DATA_STORE = True
+
 # Choice金融终端
 try:
     from config import (CHOICE_PASSWORD, CHOICE_USERNAME, ENABLE_CHOICE,
@@ -270,6 +287,14 @@ class ComprehensiveDataCollector:
             print(f"[WARN] 路径定位失败: {e}")
             self.output_file = os.path.abspath('data/comprehensive_stock_data.json')
         
+        # 综合数据存储（首次打开时自动导入已有分卷）
+        self.data_store = None
+        if USE_STOCK_DATA_STORE and STOCK_DATA_STORE_AVAILABLE:
+            try:
+                self.data_store = open_stock_data_store(self.output_file)
+            except Exception as e:
+                print(f"[WARN] 打开综合数据存储失败，使用分卷 JSON: {e}")
+
         # 批量K线数据采集相关配置（基于测试优化）
         self.batch_kline_cache = {}  # 缓存批量获取的K线数据
         self.kline_batch_size = 15   # 每次批量获取15只股票（100%成功率）
@@ -3950,30 +3975,20 @@ class ComprehensiveDataCollector:
         print(f"[INFO] 开始股票有效性预检: {len(codes)} 只股票...")
         
         try:
-            # 批量检测股票状态
-            status_results = self.status_checker.batch_check_stocks(codes)
+            # 批量检测股票状态（列式状态表一次分类全部代码）
+            unique_codes = list(dict.fromkeys(codes))
+            statuses = self.status_checker.classify(unique_codes)
+            code_array = np.array(unique_codes, dtype=object)
             
             # 分类结果
             categorized = {
-                'valid_codes': [],
-                'delisted': [],
-                'invalid': [],
-                'suspended': [],
-                'st': []
+                'valid_codes': code_array[statuses == 'active'].tolist(),
+                'delisted': code_array[statuses == 'delisted'].tolist(),
+                'invalid': code_array[statuses == 'invalid'].tolist(),
+                'suspended': code_array[statuses == 'suspended'].tolist(),
+                'st': code_array[statuses == 'st'].tolist()
             }
             
-            for code, info in status_results.items():
-                if info['status'] == 'active':
-                    categorized['valid_codes'].append(code)
-                elif info['status'] == 'delisted':
-                    categorized['delisted'].append(code)
-                elif info['status'] == 'invalid':
-                    categorized['invalid'].append(code)
-                elif info['status'] == 'suspended':
-                    categorized['suspended'].append(code)
-                elif info['status'] == 'st':
-                    categorized['st'].append(code)
-            
             # 报告结果
             print(f"[SUCCESS] 股票预检完成:")
             print(f"  OK 有效活跃: {len(categorized['valid_codes'])} 只")
@@ -4384,15 +4399,69 @@ class ComprehensiveDataCollector:
         return results
     
     def save_data(self, data: Dict[str, Any], filename: Optional[str] = None) -> None:
-        """保存数据到JSON文件 - 分卷存储模式 (每卷最多200只股票)"""
-        # 忽略传入的 filename，使用分卷逻辑
-        base_filename = self.output_file # data/comprehensive_stock_data.json
-        base_dir = os.path.dirname(base_filename)
-        base_name = os.path.basename(base_filename).replace('.json', '')
-        index_file = os.path.join(base_dir, 'stock_file_index.json')
-        
-        # 确保目录存在
+        """保存数据 - 默认写入综合数据存储（一个事务批量 upsert，只写出现的字段），否则分卷 JSON"""
+        # 忽略传入的 filename
+        base_dir = os.path.dirname(self.output_file) # data/comprehensive_stock_data.json
         os.makedirs(base_dir, exist_ok=True)
+
+        # 清理待保存数据
+        cleaned_data = DateTimeEncoder.clean_data_for_json(data)
+        self._trim_kline_history(cleaned_data)
+
+        saved = False
+        if self.data_store is not None:
+            try:
+                count = self.data_store.upsert(cleaned_data, encoder=DateTimeEncoder)
+                self._register_store_codes(base_dir, cleaned_data)
+                print(f"[SUCCESS] 数据已保存到 {os.path.basename(self.data_store.path)} ({count} 只股票)")
+                saved = True
+            except Exception as e:
+                print(f"[ERROR] 写入综合数据存储失败，改存分卷 JSON: {e}")
+        if not saved:
+            self._save_json_parts(cleaned_data, base_dir)
+
+        # 更新K线状态文件（因为全部数据包含K线）
+        self._update_kline_status_file(base_dir, cleaned_data)
+
+    @staticmethod
+    def _trim_kline_history(cleaned_data: Dict[str, Any]) -> None:
+        """自动清理过期的K线数据：每只股票最多保留最近80天"""
+        for stock_info in cleaned_data.values():
+            if isinstance(stock_info, dict) and 'kline_data' in stock_info:
+                kline_obj = stock_info['kline_data']
+                if isinstance(kline_obj, dict) and 'daily' in kline_obj:
+                    daily_list = kline_obj['daily']
+                    if isinstance(daily_list, list) and len(daily_list) > 80:
+                        # 截断到最近的80天（硬上限）
+                        kline_obj['daily'] = daily_list[-80:]
+                        kline_obj['data_points'] = len(kline_obj['daily'])
+                        kline_obj['update_time'] = datetime.now().isoformat()
+
+    def _register_store_codes(self, base_dir: str, cleaned_data: Dict[str, Any]) -> None:
+        """stock_file_index.json 仍被用作股票列表：只在出现新股票时追加（指向存储文件）"""
+        index_file = os.path.join(base_dir, 'stock_file_index.json')
+        stock_index = {}
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    stock_index = json.load(f)
+            except Exception:
+                pass
+        new_codes = [code for code in cleaned_data if code not in stock_index]
+        if not new_codes:
+            return
+        store_name = os.path.basename(self.data_store.path)
+        stock_index.update({code: store_name for code in new_codes})
+        try:
+            with open(index_file, 'w', encoding='utf-8') as f:
+                json.dump(stock_index, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"[WARN] 保存索引失败: {e}")
+
+    def _save_json_parts(self, cleaned_data: Dict[str, Any], base_dir: str) -> None:
+        """分卷存储模式 (每卷最多200只股票)"""
+        base_name = os.path.basename(self.output_file).replace('.json', '')
+        index_file = os.path.join(base_dir, 'stock_file_index.json')
         
         # 加载索引
         stock_index = {}
@@ -4403,9 +4472,6 @@ class ComprehensiveDataCollector:
             except:
                 pass
         
-        # 清理待保存数据
-        cleaned_data = DateTimeEncoder.clean_data_for_json(data)
-        
         # 按目标文件分组待保存的数据
         files_to_update = {} # filename -> {code: data}
         
@@ -4436,21 +4502,10 @@ class ComprehensiveDataCollector:
             
         # 分配数据到文件
         for code, stock_info in cleaned_data.items():
-            # 自动清理过期的K线数据：保留总计60天的数据，删除超过80天以外的数据
-            if isinstance(stock_info, dict) and 'kline_data' in stock_info:
-                kline_obj = stock_info['kline_data']
-                if isinstance(kline_obj, dict) and 'daily' in kline_obj:
-                    daily_list = kline_obj['daily']
-                    if isinstance(daily_list, list) and len(daily_list) > 80:
-                        # 截断到最近的80天（硬上限）
-                        kline_obj['daily'] = daily_list[-80:]
-                        kline_obj['data_points'] = len(kline_obj['daily'])
-                        kline_obj['update_time'] = datetime.now().isoformat()
-            
             target_file = None
             
-            # 1. 检查是否已存在于某个文件中 (更新)
-            if code in stock_index:
+            # 1. 检查是否已存在于某个分卷中 (更新；指向存储文件的索引项按新增处理)
+            if code in stock_index and '_part_' in stock_index[code]:
                 # 索引中存储的是相对路径或文件名，我们需要确保它是完整的路径
                 indexed_file = stock_index[code]
                 # 如果索引只存了文件名
@@ -4531,15 +4586,12 @@ class ComprehensiveDataCollector:
                 json.dump(stock_index, f, ensure_ascii=False, indent=2)
         except Exception as e:
             print(f"[WARN] 保存索引失败: {e}")
-        
-        # 更新K线状态文件（因为全部数据包含K线）
-        self._update_kline_status_file(base_dir, cleaned_data)
     
     def update_kline_data_only(self, batch_size: int = 20, total_batches: int = None, stock_type: str = "主板", progress_callback=None, exclude_st: bool = True):
         """只更新K线数据和技术指标（高效模式）"""
         
-        # 首先加载本地已有数据，只更新本地存在的股票
-        existing_data = self.load_existing_data()
+        # 首先加载本地已有数据，只更新本地存在的股票（只需要K线、行业和顶层字段）
+        existing_data = self.load_existing_data(kinds=('kline', 'industry', 'meta'))
         
         if not existing_data:
             msg = "错误：本地没有数据！请先使用'获取全部数据'功能采集数据。"
@@ -4865,8 +4917,8 @@ class ComprehensiveDataCollector:
                                 if code in batch_industry_data:
                                     existing_data[code]['industry_concept'] = batch_industry_data[code]
                 
-                # 批次保存
-                self.save_data(existing_data)
+                # 批次保存（只写本批次的股票）
+                self.save_data({code: existing_data[code] for code in batch_codes if code in existing_data})
                 
                 if progress_callback:
                     detail_info = f"{current_batch_info} 完成 - 已保存 {len(batch_kline_data)} 只K线数据"
@@ -4893,12 +4945,25 @@ class ComprehensiveDataCollector:
         
         print(f"\n[SUCCESS] 所有批次K线数据更新完成！")
     
-    def load_existing_data(self):
-        """加载现有数据 - 支持分卷加载"""
+    def load_existing_data(self, kinds=None):
+        """加载现有数据 - 优先读综合数据存储，否则分卷加载
+
+        kinds: 只读取这些数据类别（见 stock_data_store.FIELD_KINDS，如 ('kline', 'industry', 'meta')），
+               None 为全部；分卷 JSON 模式下忽略。
+        """
         import glob
         import json
         import os
 
+        if self.data_store is not None:
+            try:
+                if len(self.data_store) > 0:
+                    all_data = self.data_store.load_all(kinds=kinds)
+                    print(f"[INFO] 从 {os.path.basename(self.data_store.path)} 加载现有数据: 共 {len(all_data)} 只股票")
+                    return all_data
+            except Exception as e:
+                print(f"[WARN] 读取综合数据存储失败，改读分卷: {e}")
+
         # 确定数据目录
         data_dir = os.path.dirname(os.path.abspath(self.output_file))
         base_name = os.path.basename(self.output_file).replace('.json', '')
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+K线并发抓取引擎 - 多数据源、按源限速
+
+各增量更新脚本原来逐只股票串行请求，每次请求后固定 time.sleep(SLEEP_REQ)，
+每批之后再 sleep(SLEEP_BATCH)，5000 只股票的耗时由往返延迟决定。
+
+这里改成：
+  1. 每个数据源一组工作线程（同时在途 N 个请求），各自一个令牌桶限速
+     （腾讯 / 新浪 / BaoStock 分别配置，BaoStock 会话非线程安全，固定单线程）
+  2. 请求失败按指数退避重试，仍失败则交给下一个数据源
+  3. 结果通过队列回到调用线程，on_result 回调里直接合并进K线缓存（无需加锁）
+
+数据源地址可覆盖（base_urls），便于对本地桩服务器测试。
+
+使用方法：
+    from kline_fetch_engine import KlineFetchEngine, FetchJob, merge_new_rows
+
+    engine = KlineFetchEngine(sources=('tencent', 'sina'))
+    jobs = [FetchJob(code, start='2026-05-01') for code in codes]
+
+    def on_result(job, rows, source):
+        if rows:
+            merge_new_rows(cache[job.code], rows)
+
+    stats = engine.run(jobs, on_result)
+"""
+
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import requests
+
+# 添加 TradingShared 到路径：K线合并逻辑与增量段（kline_delta）共用
+tradingshared_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if tradingshared_root not in sys.path:
+    sys.path.insert(0, tradingshared_root)
+
+from kline_delta import merge_new_rows
+
+# 各数据源默认配置：rate = 每秒令牌数，burst = 桶容量，workers = 同时在途请求数
+SOURCE_LIMITS = {
+    'tencent': {'rate': 20.0, 'burst': 20, 'workers': 8},
+    'sina': {'rate': 5.0, 'burst': 5, 'workers': 4},
+    'baostock': {'rate': 10.0, 'burst': 10, 'workers': 1},
+}
+
+DEFAULT_BASE_URLS = {
+    'tencent': 'http://web.ifzq.gtimg.cn/appstock/app/fqkline/get',
+    'sina': 'http://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData',
+}
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5   # 第 n 次重试前等待 BACKOFF_BASE * 2**n 秒（带随机抖动）
+BACKOFF_MAX = 8.0
+REQUEST_TIMEOUT = 10
+
+# 一个抓取任务：start/end 为日期范围（'YYYY-MM-DD'），count 为只取最近 N 条（二选一）
+FetchJob = namedtuple('FetchJob', ['code', 'start', 'end', 'count'])
+FetchJob.__new__.__defaults__ = (None, None, None)
+
+
+class FetchError(Exception):
+    """可重试的抓取错误（网络异常、非 200、限流）"""
+
+
+# ============================================================================
+# 令牌桶
+# ============================================================================
+class TokenBucket:
+    """线程安全令牌桶：acquire() 阻塞到有令牌为止"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1.0):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# ============================================================================
+# 代码格式
+# ============================================================================
+def to_market_code(code):
+    """600000 / 600000.SH / sh600000 → sh600000（腾讯、新浪通用格式）"""
+    code = str(code).strip()
+    lower = code.lower()
+    if lower.startswith(('sh', 'sz', 'bj')) and not lower.startswith(('sh.', 'sz.', 'bj.')):
+        return lower
+    if lower.startswith(('sh.', 'sz.', 'bj.')):
+        return lower[:2] + lower[3:]
+    if '.' in code:
+        pure, exchange = code.split('.', 1)
+        exchange = exchange.lower()
+        if exchange == 'ss':
+            exchange = 'sh'
+        return f'{exchange}{pure}'
+    if code.startswith(('600', '601', '603', '605', '688', '689', '900')) or code.startswith('6'):
+        return f'sh{code}'
+    if code.startswith(('4', '8', '92')):
+        return f'bj{code}'
+    return f'sz{code}'
+
+
+# ============================================================================
+# 各数据源
+# ============================================================================
+def _new_session(referer):
+    session = requests.Session()
+    session.trust_env = False
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Referer': referer,
+    })
+    return session
+
+
+def _check_response(resp):
+    if resp.status_code == 429 or resp.status_code >= 500:
+        raise FetchError(f'HTTP {resp.status_code}')
+    if resp.status_code != 200:
+        return False
+    return True
+
+
+def fetch_tencent(session, job, base_url=DEFAULT_BASE_URLS['tencent']):
+    """腾讯前复权日线；返回 [{'date','open','high','low','close','volume'}]，无数据返回 []"""
+    tc = to_market_code(job.code)
+    if job.count:
+        param = f'{tc},day,,,{job.count},qfq'
+    else:
+        end = job.end or datetime.now().strftime('%Y-%m-%d')
+        param = f'{tc},day,{job.start or ""},{end},320,qfq'
+    try:
+        resp = session.get(base_url, params={'_var': 'kline_day', 'param': param,
+                                             'r': str(time.time())}, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        raise FetchError(str(e))
+    if not _check_response(resp):
+        return []
+
+    text = resp.text.strip()
+    if '=' in text[:40]:
+        text = text.split('=', 1)[1].strip()
+    if text.endswith(';'):
+        text = text[:-1]
+    try:
+        data = json.loads(text)
+    except ValueError:
+        raise FetchError('响应不是合法 JSON')
+    if data.get('code') not in (0, None):
+        return []
+
+    sd = (data.get('data') or {}).get(tc, {}) or {}
+    klines = sd.get('qfqday', []) or sd.get('day', [])
+    rows = []
+    for k in klines:
+        try:
+            # [date, open, close, high, low, volume]
+            rows.append({
+                'date': k[0],
+                'open': float(k[1]),
+                'high': float(k[3]),
+                'low': float(k[4]),
+                'close': float(k[2]),
+                'volume': float(k[5]),
+            })
+        except (IndexError, ValueError, TypeError):
+            continue
+    if job.start:
+        rows = [r for r in rows if r['date'] >= job.start]
+    return rows
+
+
+def fetch_sina(session, job, base_url=DEFAULT_BASE_URLS['sina']):
+    """新浪日线（只能取最近 datalen 条，按 start 过滤）"""
+    if job.count:
+        datalen = job.count
+    elif job.start:
+        days = (datetime.now() - datetime.strptime(job.start, '%Y-%m-%d')).days
+        datalen = max(5, days + 5)
+    else:
+        datalen = 320
+    try:
+        resp = session.get(base_url, params={'symbol': to_market_code(job.code), 'scale': '240',
+                                             'ma': 'no', 'datalen': str(datalen)},
+                           timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        raise FetchError(str(e))
+    if not _check_response(resp):
+        return []
+    try:
+        data = resp.json()
+    except ValueError:
+        raise FetchError('响应不是合法 JSON')
+    if not isinstance(data, list):
+        return []
+
+    rows = []
+    for k in data:
+        try:
+            rows.append({
+                'date': str(k['day'])[:10],
+                'open': float(k['open']),
+                'high': float(k['high']),
+                'low': float(k['low']),
+                'close': float(k['close']),
+                'volume': float(k['volume']),
+            })
+        except (KeyError, ValueError, TypeError):
+            continue
+    if job.start:
+        rows = [r for r in rows if r['date'] >= job.start]
+    if job.end:
+        rows = [r for r in rows if r['date'] <= job.end]
+    return rows
+
+
+class _BaoStockSession:
+    """BaoStock 登录会话（模块级单例，只在 baostock 工作线程中使用）"""
+
+    def __init__(self):
+        import baostock as bs
+        self.bs = bs
+        lg = bs.login()
+        if lg.error_code != '0':
+            raise FetchError(f'BaoStock 登录失败: {lg.error_msg}')
+
+    def close(self):
+        try:
+            self.bs.logout()
+        except Exception:
+            pass
+
+
+def fetch_baostock(session, job, base_url=None):
+    """BaoStock 前复权日线"""
+    mc = to_market_code(job.code)
+    bs_code = f'{mc[:2]}.{mc[2:]}'
+    end = job.end or datetime.now().strftime('%Y-%m-%d')
+    start = job.start or (datetime.now() - timedelta(days=(job.count or 10) * 2 + 10)).strftime('%Y-%m-%d')
+    rs = session.bs.query_history_k_data_plus(bs_code, 'date,open,high,low,close,volume',
+                                              start_date=start, end_date=end,
+                                              frequency='d', adjustflag='2')
+    if rs.error_code != '0':
+        raise FetchError(rs.error_msg)
+    rows = []
+    while rs.next():
+        d, o, h, l, c, v = rs.get_row_data()
+        try:
+            rows.append({'date': d, 'open': float(o), 'high': float(h), 'low': float(l),
+                         'close': float(c), 'volume': float(v)})
+        except ValueError:
+            continue
+    if job.count:
+        rows = rows[-job.count:]
+    return rows
+
+
+FETCHERS = {
+    'tencent': (fetch_tencent, lambda: _new_session('http://stockapp.finance.qq.com/')),
+    'sina': (fetch_sina, lambda: _new_session('http://finance.sina.com.cn')),
+    'baostock': (fetch_baostock, _BaoStockSession),
+}
+
+
+# ============================================================================
+# 引擎
+# ============================================================================
+class KlineFetchEngine:
+    """多数据源并发抓取；sources 的顺序即回退顺序"""
+
+    def __init__(self, sources=('tencent',), limits=None, base_urls=None,
+                 max_retries=MAX_RETRIES, backoff=BACKOFF_BASE, fetchers=None):
+        self.sources = list(sources)
+        self.limits = {s: dict(SOURCE_LIMITS.get(s, {'rate': 5.0, 'burst': 5, 'workers': 2}),
+                               **((limits or {}).get(s, {})))
+                       for s in self.sources}
+        self.base_urls = dict(DEFAULT_BASE_URLS, **(base_urls or {}))
+        self.fetchers = dict(FETCHERS, **(fetchers or {}))
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def _fetch_with_retry(self, source, session, bucket, job):
+        fetch, _ = self.fetchers[source]
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                return fetch(session, job, self.base_urls.get(source))
+            except FetchError:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(BACKOFF_MAX, self.backoff * (2 ** attempt))
+                time.sleep(delay * (0.5 + random.random()))
+
+    def _worker(self, idx, source, bucket, inbox, results):
+        _, make_session = self.fetchers[source]
+        try:
+            session = make_session()
+        except Exception as e:
+            print(f"[{source}] 会话初始化失败: {e}")
+            session = None
+        try:
+            while True:
+                job = inbox[idx].get()
+                if job is None:
+                    return
+                if session is None:
+                    results.put(('fail', job, source, 'no session'))
+                    continue
+                try:
+                    rows = self._fetch_with_retry(source, session, bucket, job)
+                    results.put(('ok', job, source, rows))
+                except Exception as e:
+                    results.put(('fail', job, source, str(e)))
+        finally:
+            if session is not None and hasattr(session, 'close'):
+                session.close()
+
+    def run(self, jobs, on_result, on_failure=None, progress_every=200):
+        """抓取全部任务；on_result(job, rows, source) 在调用线程中按到达顺序执行
+
+        rows 为 [] 表示数据源正常返回但没有数据（不会回退到其他源）。
+        全部数据源都失败的任务调用 on_failure(job, error)。
+        返回统计 {'ok', 'failed', 'by_source', 'elapsed'}。
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return {'ok': 0, 'failed': 0, 'by_source': {}, 'elapsed': 0.0}
+
+        inbox = [queue.Queue() for _ in self.sources]
+        results = queue.Queue()
+        threads = []
+        for idx, source in enumerate(self.sources):
+            lim = self.limits[source]
+            bucket = TokenBucket(lim['rate'], lim.get('burst'))
+            for _ in range(max(1, int(lim.get('workers', 1)))):
+                t = threading.Thread(target=self._worker, args=(idx, source, bucket, inbox, results),
+                                     daemon=True)
+                t.start()
+                threads.append((idx, t))
+
+        for job in jobs:
+            inbox[0].put(job)
+
+        t0 = time.time()
+        pending = len(jobs)
+        done = ok = failed = 0
+        by_source = {s: 0 for s in self.sources}
+        try:
+            while pending:
+                status, job, source, payload = results.get()
+                if status == 'ok':
+                    pending -= 1
+                    ok += 1
+                    by_source[source] += 1
+                    on_result(job, payload, source)
+                else:
+                    nxt = self.sources.index(source) + 1
+                    if nxt < len(self.sources):
+                        inbox[nxt].put(job)  # 交给下一个数据源
+                        continue
+                    pending -= 1
+                    failed += 1
+                    if on_failure is not None:
+                        on_failure(job, payload)
+                done += 1
+                if progress_every and done % progress_every == 0:
+                    elapsed = time.time() - t0
+                    rate = done / elapsed if elapsed > 0 else 0
+                    eta = (len(jobs) - done) / rate if rate > 0 else 0
+                    print(f"  [抓取] {done}/{len(jobs)} | 成功 {ok} 失败 {failed} | "
+                          f"{rate:.0f}/s | ETA {eta:.0f}s", flush=True)
+        finally:
+            for idx, _ in threads:
+                inbox[idx].put(None)
+            for _, t in threads:
+                t.join(timeout=REQUEST_TIMEOUT)
+
+        return {'ok': ok, 'failed': failed, 'by_source': by_source, 'elapsed': time.time() - t0}
@@ -6,9 +6,11 @@
 
 import json
 import os
+import re
 import time
 from datetime import date, datetime
 
+import numpy as np
 import pandas as pd
 
 try:
@@ -16,6 +18,29 @@ try:
 except ImportError:
     ts = None
 
+ST_KEYWORDS = ['ST', '*ST', 'ST*', 'S*ST', 'SST', '退']
+STATUS_FLAG_COLUMNS = ('is_st', 'is_suspended', 'is_delisted', 'is_listed')
+
+
+def clean_codes(codes):
+    """批量去掉代码后缀: '600000.SH' → '600000'"""
+    return pd.Series(list(codes), dtype=object).astype(str).str.split('.').str[0].values
+
+
+def st_name_mask(names, keywords=ST_KEYWORDS):
+    """名称中含 ST/退 等关键字的布尔掩码（不区分大小写）"""
+    pattern = '|'.join(re.escape(kw) for kw in keywords)
+    return pd.Series(names).astype(str).str.upper().str.contains(pattern, regex=True).values
+
+
+def zero_volume_mask(volumes):
+    """成交量为 0 / None / '' / '-' 的布尔掩码（与逐行 `vol in [0, None, '', '-']` 同口径）"""
+    raw = pd.Series(volumes)
+    values = raw.values
+    if raw.dtype == object:
+        return raw.isin([0, '', '-']).values | (values == None)  # noqa: E711
+    return values == 0
+
 class StockStatusChecker:
     def __init__(self, tushare_token=None):
         if tushare_token is None:
@@ -52,6 +77,7 @@ class StockStatusChecker:
         self.suspended_stocks = set()
         self.delisted_stocks = set()
         self.listed_stocks = set()  # 新增：记录所有在市股票
+        self.table = self._table_from_sets()  # 列式状态表，索引为 6 位代码
         self.last_update_date = None
         
         # 缓存文件路径
@@ -60,40 +86,142 @@ class StockStatusChecker:
         self._load_cache()
 
     def _load_cache(self):
-        """从文件加载状态缓存"""
+        """从文件加载状态缓存（列式状态表；兼容旧版集合格式）"""
         if os.path.exists(self.cache_file):
             try:
                 with open(self.cache_file, 'r', encoding='utf-8') as f:
                     cache_data = json.load(f)
                 
                 if cache_data.get('date') == date.today().isoformat():
-                    self.st_stocks = set(cache_data.get('st_stocks', []))
-                    self.suspended_stocks = set(cache_data.get('suspended_stocks', []))
-                    self.delisted_stocks = set(cache_data.get('delisted_stocks', []))
-                    self.listed_stocks = set(cache_data.get('listed_stocks', []))
+                    if 'table' in cache_data:
+                        self._set_table(pd.DataFrame(cache_data['table']))
+                    else:
+                        self.st_stocks = set(cache_data.get('st_stocks', []))
+                        self.suspended_stocks = set(cache_data.get('suspended_stocks', []))
+                        self.delisted_stocks = set(cache_data.get('delisted_stocks', []))
+                        self.listed_stocks = set(cache_data.get('listed_stocks', []))
+                        self._set_table(self._table_from_sets())
                     self.last_update_date = cache_data.get('date')
                     # print(f"[INFO] 已从缓存加载股票状态: ST={len(self.st_stocks)}, 停牌={len(self.suspended_stocks)}")
             except Exception as e:
                 print(f"[WARN] 加载股票状态缓存失败: {e}")
 
     def _save_cache(self):
-        """保存状态到文件缓存"""
+        """保存状态表到文件缓存（按列存储，附日期戳）"""
         try:
             os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            table = self.table
+            columns = {
+                'code': table.index.tolist(),
+                'is_st': table['is_st'].tolist(),
+                'is_suspended': table['is_suspended'].tolist(),
+                'is_delisted': table['is_delisted'].tolist(),
+                'is_listed': table['is_listed'].tolist(),
+                'list_date': table['list_date'].where(table['list_date'].notna(), None).tolist(),
+                'last_trade_date': table['last_trade_date'].where(table['last_trade_date'].notna(), None).tolist(),
+            }
+            # 旧版集合字段保留：quick_recommend / export_recommendations 等脚本直接读取 st_stocks 等键
             cache_data = {
                 'date': self.last_update_date,
                 'st_stocks': list(self.st_stocks),
                 'suspended_stocks': list(self.suspended_stocks),
                 'delisted_stocks': list(self.delisted_stocks),
-                'listed_stocks': list(self.listed_stocks)
+                'listed_stocks': list(self.listed_stocks),
+                'table': columns,
             }
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            tmp = self.cache_file + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(cache_data, f, ensure_ascii=False)
+            os.replace(tmp, self.cache_file)
         except Exception as e:
             print(f"[WARN] 保存股票状态缓存失败: {e}")
 
+    # ------------------------------------------------------------------
+    # 列式状态表
+    # ------------------------------------------------------------------
+    def _table_from_sets(self, list_dates=None, last_trade_dates=None):
+        """由各状态集合拼出列式状态表（索引为 6 位代码）"""
+        codes = pd.Index(sorted(self.listed_stocks | self.st_stocks | self.suspended_stocks | self.delisted_stocks),
+                         dtype=object, name='code')
+        table = pd.DataFrame(index=codes)
+        table['is_st'] = codes.isin(list(self.st_stocks))
+        table['is_suspended'] = codes.isin(list(self.suspended_stocks))
+        table['is_delisted'] = codes.isin(list(self.delisted_stocks))
+        table['is_listed'] = codes.isin(list(self.listed_stocks))
+        table['list_date'] = (list_dates if list_dates is not None else pd.Series(dtype=object)).reindex(codes)
+        table['last_trade_date'] = (last_trade_dates if last_trade_dates is not None else pd.Series(dtype=object)).reindex(codes)
+        return table
+
+    def _set_table(self, table):
+        """设置状态表，并同步单只查询用的集合"""
+        if 'code' in table.columns:
+            table = table.set_index(table['code'].astype(str)).drop(columns='code')
+        for col in STATUS_FLAG_COLUMNS:
+            table[col] = table[col].fillna(False).astype(bool) if col in table.columns else False
+        for col in ('list_date', 'last_trade_date'):
+            if col not in table.columns:
+                table[col] = None
+        table.index.name = 'code'
+        self.table = table
+        index = table.index
+        self.st_stocks = set(index[table['is_st'].values])
+        self.suspended_stocks = set(index[table['is_suspended'].values])
+        self.delisted_stocks = set(index[table['is_delisted'].values])
+        self.listed_stocks = set(index[table['is_listed'].values])
+
+    def status_arrays(self, codes):
+        """批量查询状态，返回与 codes 等长的布尔数组字典
+
+        键: is_st / is_suspended / is_delisted / is_invalid；
+        is_delisted 与 is_delisted() 同口径：在退市列表中，或在市列表已加载但代码不在其中。
+        """
+        self.update_status()
+        clean = pd.Index(clean_codes(codes))
+        table = self.table
+        pos = table.index.get_indexer(clean)
+        found = pos >= 0
+        safe = np.where(found, pos, 0)
+
+        def gather(col):
+            if len(table) == 0:
+                return np.zeros(len(clean), dtype=bool)
+            return table[col].values.astype(bool)[safe] & found
+
+        is_delisted = gather('is_delisted')
+        if self.listed_stocks:
+            is_delisted |= ~gather('is_listed')
+        is_invalid = ~(np.asarray(clean.str.len()) == 6) | ~np.asarray(clean.str.isdigit(), dtype=bool)
+        return {
+            'is_st': gather('is_st'),
+            'is_suspended': gather('is_suspended'),
+            'is_delisted': is_delisted,
+            'is_invalid': is_invalid,
+        }
+
+    def mask(self, codes, exclude_st=True, exclude_suspended=True):
+        """批量过滤掩码：True 表示保留（与 filter_codes 同口径，退市/无效始终排除）"""
+        flags = self.status_arrays(codes)
+        keep = ~flags['is_delisted']
+        if exclude_st:
+            keep &= ~flags['is_st']
+        if exclude_suspended:
+            keep &= ~flags['is_suspended']
+        return keep
+
+    def classify(self, codes):
+        """批量状态分类，返回与 codes 等长的字符串数组
+
+        优先级与 check_single_stock 一致: delisted > suspended > st > invalid > active
+        """
+        flags = self.status_arrays(codes)
+        return np.select(
+            [flags['is_delisted'], flags['is_suspended'], flags['is_st'], flags['is_invalid']],
+            ['delisted', 'suspended', 'st', 'invalid'],
+            default='active',
+        )
+
     def update_status(self, force=False):
-        """更新 ST、停牌和退市股票列表"""
+        """更新 ST、停牌和退市股票列表（向量化构建列式状态表）"""
         today = date.today().isoformat()
         if not force and self.last_update_date == today and (self.st_stocks or self.suspended_stocks):
             return True
@@ -105,6 +233,8 @@ class StockStatusChecker:
         self.suspended_stocks = set()
         self.delisted_stocks = set()
         self.listed_stocks = set()
+        list_dates = pd.Series(dtype=object)
+        last_trade_dates = pd.Series(dtype=object)
         
         # 1. 优先使用 AKShare 获取全市场快照 (最快且包含 ST 和 实时停牌信息)
         ak_success = False
@@ -115,7 +245,7 @@ class StockStatusChecker:
             try:
                 df_all = ak.stock_info_a_code_name()
                 if not df_all.empty:
-                    self.listed_stocks = set(df_all['code'].tolist())
+                    self.listed_stocks = set(df_all['code'].astype(str))
                     print(f"[INFO] AKShare 获取到 {len(self.listed_stocks)} 只在市股票")
             except Exception as e:
                 print(f"[WARN] AKShare 获取全量列表失败: {e}")
@@ -123,22 +253,18 @@ class StockStatusChecker:
             print("[INFO] 正在通过 AKShare 获取实时快照...")
             df_spot = ak.stock_zh_a_spot_em()
             if not df_spot.empty:
-                st_keywords = ['ST', '*ST', 'ST*', 'S*ST', 'SST', '退']
-                for _, row in df_spot.iterrows():
-                    code = str(row['代码'])
-                    name = str(row['名称'])
-                    
-                    # 记录在市股票
-                    self.listed_stocks.add(code)
-                    
-                    # 识别 ST
-                    if any(kw in name.upper() for kw in st_keywords):
-                        self.st_stocks.add(code)
-                    
-                    # 识别停牌 (成交量为0且在交易时间内)
-                    vol = row.get('成交量')
-                    if vol in [0, None, '', '-']:
-                        self.suspended_stocks.add(code)
+                codes = df_spot['代码'].astype(str)
+                # 记录在市股票
+                self.listed_stocks.update(codes)
+                # 识别 ST
+                st_mask = st_name_mask(df_spot['名称'])
+                self.st_stocks.update(codes[st_mask])
+                # 识别停牌 (成交量为0/缺失)
+                sus_mask = zero_volume_mask(df_spot['成交量'])
+                self.suspended_stocks.update(codes[sus_mask])
+                # 有成交的股票最后交易日即今日
+                last_trade_dates = pd.Series(today, index=codes[~sus_mask].values, dtype=object)
+                last_trade_dates = last_trade_dates[~last_trade_dates.index.duplicated()]
                 
                 print(f"[INFO] AKShare 识别完成: {len(self.st_stocks)} 只 ST, {len(self.suspended_stocks)} 只疑似停牌")
                 ak_success = True
@@ -152,9 +278,10 @@ class StockStatusChecker:
                 # 获取上市中 (L)、暂停上市 (P) 和退市 (D)
                 for status in ['L', 'P', 'D']:
                     try:
-                        df = self.pro.stock_basic(exchange='', list_status=status, fields='ts_code,symbol,name')
+                        df = self.pro.stock_basic(exchange='', list_status=status, fields='ts_code,symbol,name,list_date')
                         if not df.empty:
-                            codes = set(df['symbol'].tolist())
+                            symbols = df['symbol'].astype(str)
+                            codes = set(symbols)
                             if status == 'D':
                                 self.delisted_stocks.update(codes)
                             elif status == 'P':
@@ -163,10 +290,12 @@ class StockStatusChecker:
                                 self.listed_stocks.update(codes)
                             
                             # 补充 ST 识别
-                            st_keywords = ['ST', '*ST', 'ST*', 'S*ST', 'SST', '退']
-                            for _, row in df.iterrows():
-                                if any(kw in str(row['name']).upper() for kw in st_keywords):
-                                    self.st_stocks.add(row['symbol'])
+                            self.st_stocks.update(symbols[st_name_mask(df['name'])])
+                            # 上市日期 (YYYYMMDD → YYYY-MM-DD)
+                            if 'list_date' in df.columns:
+                                dates = pd.to_datetime(df['list_date'], format='%Y%m%d', errors='coerce').dt.strftime('%Y-%m-%d')
+                                dates = pd.Series(dates.values, index=symbols.values).dropna()
+                                list_dates = pd.concat([list_dates, dates])
                     except:
                         continue
                 
@@ -175,9 +304,7 @@ class StockStatusChecker:
                     trade_date = datetime.now().strftime('%Y%m%d')
                     df_suspend = self.pro.suspend_d(suspend_type='S', trade_date=trade_date)
                     if not df_suspend.empty:
-                        for _, row in df_suspend.iterrows():
-                            code = row['ts_code'].split('.')[0]
-                            self.suspended_stocks.add(code)
+                        self.suspended_stocks.update(df_suspend['ts_code'].astype(str).str.split('.').str[0])
                 except:
                     pass
                     
@@ -194,6 +321,8 @@ class StockStatusChecker:
             except Exception:
                 pass
 
+        list_dates = list_dates[~list_dates.index.duplicated()]
+        self._set_table(self._table_from_sets(list_dates, last_trade_dates))
         self.last_update_date = today
         # 只要有一种方式成功获取了数据，或者缓存中有数据，就返回 True
         success = ak_success or bool(self.st_stocks or self.suspended_stocks or self.listed_stocks)
@@ -204,15 +333,13 @@ class StockStatusChecker:
             # 如果彻底失败，为了不影响后续分析，我们假设所有 6 位数字代码都是有效的
             print("[WARN] 无法获取实时股票状态列表，将进入宽容模式（假设所有6位代码有效）")
             success = True # 强制返回 True 避免上层报错
+        return success
+
     def batch_check_stocks(self, codes):
         """批量检查股票状态，返回分类结果 (对接 ComprehensiveDataCollector)"""
-        self.update_status()
-        
-        results = {}
-        for code in codes:
-            results[code] = self.check_single_stock(code)
-            
-        return results
+        codes = list(codes)
+        statuses = self.classify(codes)
+        return {code: {'status': status} for code, status in zip(codes, statuses.tolist())}
 
     def check_single_stock(self, code):
         """检查单只股票状态"""
@@ -256,33 +383,18 @@ class StockStatusChecker:
 
     def filter_codes(self, codes, exclude_st=True, exclude_suspended=True):
         """过滤股票代码列表"""
-        # 确保状态已更新
-        self.update_status()
+        codes = list(codes)
+        flags = self.status_arrays(codes)
         
-        filtered = []
-        st_count = 0
-        suspend_count = 0
-        delisted_count = 0
+        # 1. 首先排除退市/无效股票 (无论设置如何都排除)
+        delisted = flags['is_delisted']
+        # 2. 根据设置排除 ST 和 停牌
+        st = ~delisted & flags['is_st'] if exclude_st else np.zeros(len(codes), dtype=bool)
+        suspended = ~delisted & ~st & flags['is_suspended'] if exclude_suspended else np.zeros(len(codes), dtype=bool)
+        keep = ~(delisted | st | suspended)
+        filtered = [code for code, k in zip(codes, keep.tolist()) if k]
         
-        for code in codes:
-            # 1. 首先排除退市/无效股票 (无论设置如何都排除)
-            if self.is_delisted(code):
-                delisted_count += 1
-                continue
-                
-            # 2. 根据设置排除 ST 和 停牌
-            is_st = self.is_st(code)
-            is_sus = self.is_suspended(code)
-            
-            if exclude_st and is_st:
-                st_count += 1
-                continue
-            if exclude_suspended and is_sus:
-                suspend_count += 1
-                continue
-                
-            filtered.append(code)
-            
+        delisted_count, st_count, suspend_count = int(delisted.sum()), int(st.sum()), int(suspended.sum())
         if st_count > 0 or suspend_count > 0 or delisted_count > 0:
             print(f"[INFO] 过滤完成: 排除 {delisted_count} 只退市/无效, {st_count} 只 ST, {suspend_count} 只停牌. 剩余 {len(filtered)} 只.")
             
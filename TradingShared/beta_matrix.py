@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全市场滚动 Beta / 相对强度矩阵
+
+market_state.calc_beta、export_recommendations.compute_beta_and_rs、
+real_feature_calculator.compute_real_subscores 和 temp_extract 的 calc_beta_relstrength
+都是逐只股票取最近 21 根收盘价做 np.cov，且按位置（倒数第 k 根）与指数对齐，
+股票停牌时会把不同日期的收益配成一对。这里把同样的量一次算成 (股票 × 交易日) 矩阵：
+
+  1. 股票收盘价取列式K线存储的交易日轴，上证指数按日期对齐到同一条轴
+  2. 日收益只在股票与指数当日、前一日都有收盘价时成对计入（停牌、复牌跳空不配对）
+  3. 对 n、Σs、Σi、Σs·i、Σi²、Σs² 做累计和，相减得到每列结尾的 WINDOW 日窗口和，
+     一次向量化算出全部 (股票, 日期) 的协方差、方差，按股票分块控制临时数组内存
+  4. 相对强度 = 股票 k 日涨幅 − 指数 k 日涨幅（按日期，停牌日沿用最后收盘价）
+  5. 结果落盘到 kline_cache/beta_matrix.npz；K线每日追加新交易日时只重算新增列
+     （往前多取 WINDOW 列作窗口），历史收盘价被改写（复权）的股票整行重算
+
+数组：
+    beta       样本协方差 (ddof=1) / 指数方差 (ddof=0)，与线上各处 np.cov / np.var 的口径一致
+    n_obs      窗口内成对收益数；OLS 口径 beta × (n−1)/n 由 get(..., ols=True) 换算
+    resid_vol  对指数回归的残差日波动率（%，ddof=0）
+    rs3/rs5/rs20  3/5/20 日相对强度（%）
+成对收益少于 MIN_OBS 或指数方差 ≤ MIN_INDEX_VAR 时 beta 为 NaN，查询时按 1.0 处理。
+
+使用方法：
+    from beta_matrix import open_beta_matrix
+    bm = open_beta_matrix()                        # 不可用时返回 None
+    bm.get('600000', '2026-03-02')                 # {'beta', 'resid_vol', 'rs3', ...}
+    bm.beta_rs('600000', target, before=True)      # (beta, rs5, rs3)，目标日之前最后一个交易日
+
+命令行：
+    python beta_matrix.py [--rebuild]
+"""
+
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from kline_store import KLINE_CACHE, normalize_code, normalize_date, open_kline_store
+
+MATRIX_FILE = os.path.join(KLINE_CACHE, 'beta_matrix.npz')
+INDEX_PATTERNS = ('index_latest.json', 'index_full_*.json', 'index_6m_*.json')
+MATRIX_VERSION = 1
+
+WINDOW = 20               # Beta 窗口（成对日收益数）
+RS_DAYS = (3, 5, 20)      # 相对强度周期
+MIN_OBS = 10              # 窗口内至少 10 对收益才计算 Beta
+MIN_INDEX_VAR = 0.001     # 指数日收益方差（%²）下限，与 calc_beta 一致
+_ROW_CHUNK = 512
+
+_ARRAYS = ('beta', 'n_obs', 'resid_vol') + tuple(f'rs{k}' for k in RS_DAYS)
+
+
+# ============================================================================
+# 指数
+# ============================================================================
+def find_index_file(kline_cache=KLINE_CACHE):
+    """按 index_latest / index_full_* / index_6m_* 的顺序取最新的指数文件"""
+    for pattern in INDEX_PATTERNS:
+        files = sorted(glob.glob(os.path.join(kline_cache, pattern)), key=os.path.getmtime, reverse=True)
+        if files:
+            return files[0]
+    return None
+
+
+def load_index_close(index_file=None):
+    """读取指数 JSON（{'date': {'0': ...}, 'close': {...}}），返回 (dates datetime64[D], close float64)"""
+    index_file = index_file or find_index_file()
+    if not index_file or not os.path.exists(index_file):
+        return None
+    with open(index_file, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+
+    dates, closes = [], []
+    for key, ts in raw.get('date', {}).items():
+        try:
+            d = np.datetime64(normalize_date(ts), 'D')
+            c = float(raw['close'][key])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if np.isfinite(c) and c > 0:
+            dates.append(d)
+            closes.append(c)
+    if not dates:
+        return None
+    dates = np.array(dates, dtype='datetime64[D]')
+    closes = np.array(closes, dtype=np.float64)
+    order = np.argsort(dates, kind='stable')
+    return dates[order], closes[order]
+
+
+def align_index(dates, index_dates, index_close):
+    """指数收盘价对齐到交易日轴，指数缺失的日期为 NaN"""
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    index_dates = np.asarray(index_dates, dtype='datetime64[D]')
+    out = np.full(len(dates), np.nan)
+    if len(index_dates) == 0:
+        return out
+    pos = np.searchsorted(index_dates, dates)
+    pos_c = np.minimum(pos, len(index_dates) - 1)
+    hit = index_dates[pos_c] == dates
+    out[hit] = np.asarray(index_close, dtype=np.float64)[pos_c[hit]]
+    return out
+
+
+# ============================================================================
+# 计算
+# ============================================================================
+def _ffill(values, seed):
+    """沿列向前填充 NaN；第 0 列之前的值取 seed（每行一个）"""
+    n_cols = values.shape[-1]
+    pos = np.where(np.isfinite(values), np.arange(n_cols), -1)
+    np.maximum.accumulate(pos, axis=-1, out=pos)
+    out = np.take_along_axis(values, np.maximum(pos, 0), axis=-1)
+    return np.where(pos >= 0, out, seed[..., None])
+
+
+def _last_valid(values):
+    """每行最后一个有效值（全为 NaN 时为 NaN）"""
+    if values.shape[-1] == 0:
+        return np.full(values.shape[:-1], np.nan)
+    return _ffill(values, np.full(values.shape[:-1], np.nan))[..., -1]
+
+
+def _window_sum(cs, window):
+    """累计和 → 每列结尾的 window 列窗口和（cs 第 0 列为起点 0）"""
+    out = cs[..., 1:].copy()
+    out[..., window:] -= cs[..., 1:-window]
+    return out
+
+
+def compute_block(close, index_close, seed_close=None, seed_index=np.nan,
+                  window=WINDOW, rs_days=RS_DAYS):
+    """计算一段连续交易日上的全部数组
+
+    Args:
+        close: (股票数 × 列数) 收盘价，缺失为 NaN
+        index_close: (列数,) 对齐后的指数收盘价
+        seed_close / seed_index: 这段之前最后一个有效收盘价（相对强度向前填充用）
+    Returns:
+        {数组名: (股票数 × 列数)}；前 max(window, max(rs_days)) 列只含本段内的数据，
+        增量更新时由调用方丢弃
+    """
+    close = np.asarray(close, dtype=np.float64)
+    idx = np.asarray(index_close, dtype=np.float64)
+    n_rows, n_cols = close.shape
+    if seed_close is None:
+        seed_close = np.full(n_rows, np.nan)
+    seed_close = np.asarray(seed_close, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        i_ret = np.full(n_cols, np.nan)
+        i_ret[1:] = (idx[1:] - idx[:-1]) / idx[:-1] * 100
+        idx_ff = _ffill(idx[None, :], np.array([seed_index], dtype=np.float64))[0]
+
+    out = {
+        'beta': np.full((n_rows, n_cols), np.nan, dtype=np.float32),
+        'n_obs': np.zeros((n_rows, n_cols), dtype=np.int16),
+        'resid_vol': np.full((n_rows, n_cols), np.nan, dtype=np.float32),
+    }
+    for k in rs_days:
+        out[f'rs{k}'] = np.full((n_rows, n_cols), np.nan, dtype=np.float32)
+
+    zero = np.zeros((1, 1))
+    for r0 in range(0, n_rows, _ROW_CHUNK):
+        r1 = min(r0 + _ROW_CHUNK, n_rows)
+        c = np.where(close[r0:r1] > 0, close[r0:r1], np.nan)
+        rows = r1 - r0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s_ret = np.full((rows, n_cols), np.nan)
+            s_ret[:, 1:] = (c[:, 1:] - c[:, :-1]) / c[:, :-1] * 100
+        pair = np.isfinite(s_ret) & np.isfinite(i_ret)[None, :]
+        s = np.where(pair, s_ret, 0.0)
+        i = np.where(pair, i_ret[None, :], 0.0)
+
+        def wsum(x):
+            cs = np.concatenate([np.broadcast_to(zero, (rows, 1)), np.cumsum(x, axis=1)], axis=1)
+            return _window_sum(cs, window)
+
+        n = wsum(pair.astype(np.float64))
+        s_sum, i_sum = wsum(s), wsum(i)
+        si_sum, ii_sum, ss_sum = wsum(s * i), wsum(i * i), wsum(s * s)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s_mean = s_sum / n
+            i_mean = i_sum / n
+            cov0 = si_sum / n - s_mean * i_mean
+            var_i0 = np.maximum(ii_sum / n - i_mean * i_mean, 0.0)
+            var_s0 = np.maximum(ss_sum / n - s_mean * s_mean, 0.0)
+            ok = (n >= MIN_OBS) & (var_i0 > MIN_INDEX_VAR)
+            beta = cov0 * n / (n - 1) / var_i0
+            resid = np.sqrt(np.maximum(var_s0 - cov0 * cov0 / var_i0, 0.0))
+        out['beta'][r0:r1] = np.where(ok, beta, np.nan)
+        out['resid_vol'][r0:r1] = np.where(ok, resid, np.nan)
+        out['n_obs'][r0:r1] = np.rint(n).astype(np.int16)
+
+        c_ff = _ffill(c, seed_close[r0:r1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k in rs_days:
+                rs = np.full((rows, n_cols), np.nan)
+                s_k = (c_ff[:, k:] - c_ff[:, :-k]) / c_ff[:, :-k] * 100
+                i_k = (idx_ff[k:] - idx_ff[:-k]) / idx_ff[:-k] * 100
+                rs[:, k:] = s_k - i_k[None, :]
+                out[f'rs{k}'][r0:r1] = rs
+    return out
+
+
+def _row_sums(close):
+    """每行收盘价之和，用来发现被改写（复权）的历史"""
+    return np.nansum(np.asarray(close, dtype=np.float64), axis=1)
+
+
+def build_beta_matrix(codes, dates, close, index_close, window=WINDOW):
+    """全量构建；close 为 (股票数 × 交易日数)，index_close 已对齐到 dates"""
+    close = np.asarray(close, dtype=np.float64)
+    index_close = np.asarray(index_close, dtype=np.float64)
+    arrays = compute_block(close, index_close, window=window)
+    return BetaMatrix(codes, dates, arrays, index_close, _row_sums(close), window=window)
+
+
+def update_beta_matrix(matrix, codes, dates, close, index_close):
+    """在旧矩阵基础上增量更新，只重算新增的交易日列
+
+    股票列表、窗口变化或旧日期轴不是新轴的前缀、已有列上的指数不一致时全量重建；
+    已有列上收盘价之和变化的股票整行重算，其余股票只算新增列。
+    """
+    codes = list(codes)
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    index_close = np.asarray(index_close, dtype=np.float64)
+    d0 = len(matrix.dates)
+    if (list(matrix.codes) != codes or d0 > len(dates) or d0 == 0
+            or not np.array_equal(matrix.dates, dates[:d0])
+            or not np.allclose(matrix.index_close, index_close[:d0], rtol=0, atol=1e-6, equal_nan=True)):
+        return build_beta_matrix(codes, dates, close, index_close, window=matrix.window)
+
+    window = matrix.window
+    old_close = np.asarray(close[:, :d0], dtype=np.float64)
+    sums = _row_sums(old_close)
+    changed = ~np.isclose(sums, matrix.row_sums, rtol=1e-9, atol=1e-6)
+    if d0 == len(dates) and not changed.any():
+        return matrix
+
+    arrays = {}
+    for name in _ARRAYS:
+        old = matrix.arrays[name]
+        grown = np.empty((len(codes), len(dates)), dtype=old.dtype)
+        grown[:, :d0] = old
+        arrays[name] = grown
+
+    if d0 < len(dates):
+        # 往前多取一个窗口的列；相对强度的向前填充从更早的最后收盘价开始
+        start = max(0, d0 - max(window, max(RS_DAYS)))
+        block = np.asarray(close[:, start:], dtype=np.float64)
+        seed_close = _last_valid(old_close[:, :start])
+        seed_index = _last_valid(index_close[None, :start])[0]
+        part = compute_block(block, index_close[start:], seed_close, seed_index, window=window)
+        for name in _ARRAYS:
+            arrays[name][:, d0:] = part[name][:, d0 - start:]
+
+    rows = np.flatnonzero(changed)
+    if len(rows):
+        part = compute_block(np.asarray(close[rows], dtype=np.float64), index_close, window=window)
+        for name in _ARRAYS:
+            arrays[name][rows] = part[name]
+    return BetaMatrix(codes, dates, arrays, index_close, _row_sums(close), window=window)
+
+
+def build_from_series(series, axis_dates, index_close, window=WINDOW):
+    """从 {code: (日期列表, 收盘价数组)} 构建，日期轴为 axis_dates（不在轴上的K线忽略）"""
+    axis = np.array([normalize_date(d) for d in axis_dates], dtype='datetime64[D]')
+    codes = list(series)
+    close = np.full((len(codes), len(axis)), np.nan)
+    for r, code in enumerate(codes):
+        d, c = series[code]
+        d = np.array([normalize_date(x) for x in d], dtype='datetime64[D]')
+        pos = np.searchsorted(axis, d)
+        pos_c = np.minimum(pos, len(axis) - 1)
+        hit = axis[pos_c] == d
+        close[r, pos_c[hit]] = np.asarray(c, dtype=np.float64)[hit]
+    return build_beta_matrix(codes, axis, close, index_close, window=window)
+
+
+# ============================================================================
+# 查询
+# ============================================================================
+class BetaMatrix:
+    """(股票 × 交易日) 的 Beta / 残差波动率 / 相对强度，按 (代码, 日期) 查询"""
+
+    def __init__(self, codes, dates, arrays, index_close, row_sums, window=WINDOW):
+        self.codes = list(codes)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.arrays = arrays
+        self.index_close = np.asarray(index_close, dtype=np.float64)
+        self.row_sums = np.asarray(row_sums, dtype=np.float64)
+        self.window = window
+        self.index = {normalize_code(c): i for i, c in enumerate(self.codes)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return normalize_code(code) in self.index
+
+    def row(self, code):
+        return self.index.get(normalize_code(code))
+
+    def column(self, date=None, before=False):
+        """date 当日（before=True 时为之前）最后一个交易日的列号；早于日期轴时返回 None"""
+        if date is None:
+            return len(self.dates) - 1 if len(self.dates) else None
+        if isinstance(date, np.datetime64):
+            d = date.astype('datetime64[D]')
+        else:
+            d = np.datetime64(normalize_date(date), 'D')
+        col = int(np.searchsorted(self.dates, d, side='left' if before else 'right')) - 1
+        return col if col >= 0 else None
+
+    def get(self, code, date=None, before=False, col=None, ols=False):
+        """单只股票在某日的全部数组值 {'date', 'beta', 'n_obs', 'resid_vol', 'rs3', ...}
+
+        缺失值为 NaN；股票不在矩阵中或日期早于日期轴时返回 None。
+        ols=True 时 beta 换算为 协方差/方差 同口径（ddof 一致）的回归系数。
+        """
+        r = self.row(code)
+        if col is None:
+            col = self.column(date, before=before)
+        if r is None or col is None:
+            return None
+        out = {'date': str(self.dates[col])}
+        for name in _ARRAYS:
+            out[name] = float(self.arrays[name][r, col])
+        out['n_obs'] = int(out['n_obs'])
+        if ols and out['n_obs'] > 0:
+            out['beta'] *= (out['n_obs'] - 1) / out['n_obs']
+        return out
+
+    def beta_rs(self, code, date=None, before=False, col=None, ols=False):
+        """(beta, rs5, rs3)，缺失时分别按 1.0 / 0.0 / 0.0；查不到返回 None"""
+        v = self.get(code, date, before=before, col=col, ols=ols)
+        if v is None:
+            return None
+        beta = v['beta'] if np.isfinite(v['beta']) else 1.0
+        rs5 = v['rs5'] if np.isfinite(v['rs5']) else 0.0
+        rs3 = v['rs3'] if np.isfinite(v['rs3']) else 0.0
+        return beta, rs5, rs3
+
+    def save(self, path, signature=''):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, version=MATRIX_VERSION, window=self.window, signature=signature,
+                 codes=np.array(self.codes, dtype=str), dates=self.dates,
+                 index_close=self.index_close, row_sums=self.row_sums, **self.arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['version']) != MATRIX_VERSION:
+                raise ValueError(f"矩阵版本不符: {int(data['version'])}")
+            matrix = cls(data['codes'].tolist(), data['dates'],
+                         {name: data[name] for name in _ARRAYS},
+                         data['index_close'], data['row_sums'], window=int(data['window']))
+            matrix.signature = str(data['signature'])
+        return matrix
+
+
+def store_signature(store, index_file):
+    """K线存储与指数文件的摘要；相同则落盘矩阵可直接使用"""
+    parts = [str(MATRIX_VERSION), str(WINDOW), str(len(store.codes)), store.date_strs[-1] if store.date_strs else '',
+             str(store.meta.get('built_at')), json.dumps(store.meta.get('deltas', {}), sort_keys=True)]
+    if index_file and os.path.exists(index_file):
+        st = os.stat(index_file)
+        parts += [os.path.basename(index_file), str(st.st_size), str(st.st_mtime)]
+    return '|'.join(parts)
+
+
+_MATRIX = {}
+
+
+def open_beta_matrix(store=None, index_file=None, path=MATRIX_FILE, rebuild=False, verbose=True):
+    """打开（必要时增量更新或构建）Beta 矩阵；K线存储或指数不可用时返回 None
+
+    同一进程内缓存：未显式传入 store/index_file 时直接复用已打开的矩阵，多个模块调用只加载一次。
+    """
+    if store is None and index_file is None and not rebuild and path in _MATRIX:
+        return _MATRIX[path]
+    try:
+        if store is None:
+            store = open_kline_store()
+        index_file = index_file or find_index_file()
+        if store is None or index_file is None:
+            return None
+        signature = store_signature(store, index_file)
+        cached = _MATRIX.get(path)
+        if cached is not None and cached.signature == signature and not rebuild:
+            return cached
+
+        matrix = None
+        if not rebuild and os.path.exists(path):
+            try:
+                matrix = BetaMatrix.load(path)
+            except Exception as e:
+                print(f"[beta_matrix] 读取失败，重新构建: {e}")
+        if matrix is None or matrix.signature != signature:
+            loaded = load_index_close(index_file)
+            if loaded is None:
+                return None
+            t0 = time.time()
+            index_close = align_index(store.dates, *loaded)
+            close = store.matrix('close')
+            if matrix is None or matrix.window != WINDOW:
+                matrix = build_beta_matrix(store.codes, store.dates, close, index_close)
+                action = '构建'
+            else:
+                matrix = update_beta_matrix(matrix, store.codes, store.dates, close, index_close)
+                action = '更新'
+            matrix.signature = signature
+            try:
+                matrix.save(path, signature)
+            except Exception as e:
+                print(f"[beta_matrix] 保存失败: {e}")
+            if verbose:
+                print(f"[beta_matrix] {action}: {len(matrix)} 只 × {len(matrix.dates)} 日 "
+                      f"({time.time() - t0:.1f}s)")
+        _MATRIX[path] = matrix
+        return matrix
+    except Exception as e:
+        print(f"[beta_matrix] 打开失败: {e}")
+        return None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='构建/更新全市场 Beta 与相对强度矩阵')
+    parser.add_argument('--rebuild', action='store_true', help='忽略已有矩阵，全量重建')
+    args = parser.parse_args()
+    matrix = open_beta_matrix(rebuild=args.rebuild)
+    if matrix is None:
+        print('K线存储或指数数据不可用')
+        return
+    col = matrix.column()
+    beta = matrix.arrays['beta'][:, col]
+    print(f"最新交易日 {matrix.dates[col]}: {np.isfinite(beta).sum()}/{len(matrix)} 只有 Beta，"
+          f"中位数 {np.nanmedian(beta):.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+指标增量状态 - 每只股票保存固定长度的最近K线 + MACD 递推量，新K线到来时 O(1) 更新
+
+real_feature_calculator.calc_features、daily_recommender_v29 的 calc_ma/calc_rsi/calc_macd
+每次都从整段历史重新切片、循环计算。这里为每只股票持久化一份状态：
+
+  tail        最近 TAIL 根有效K线的各字段（右对齐，不足处为 NaN），dates 为对应日期
+  count       累计K线数，last_date 最后一根K线的日期
+  ema_fast / ema_slow / dif
+              MACD 递推量：第 MACD_SLOW 根K线时以前 12 / 26 根的均值起算，之后逐根递推，
+              dif 保存最近 MACD_SIGNAL 个 DIF（DEA 为其均值），与 daily_recommender_v29.calc_macd 一致
+  first_close / run_sign / run_len / run_open
+              real_feature_calculator.calc_features 中依赖完整历史的量：首根收盘价（consistency、max_dd_10d），
+              以及最后一次平盘之后第一段同向涨跌的方向与长度（streak 从最新K线往回数、遇平盘停止，
+              结果恰为这一段），新K线只会延长这一段或将其封闭
+
+MA / RSI(14) / 量比 / 布林带 / ATR 等窗口指标都只看最近几十根K线，直接在 tail 上计算，
+结果与从完整历史计算逐位相同；只有 MACD、streak 这种依赖全部历史的量才需要递推。
+append() 只做一次窗口平移和几次标量运算，与历史长度无关。
+
+状态与列式K线存储放在同一目录（kline_cache/indicator_state.npz，单文件原子替换）：
+
+    from indicator_state import open_indicator_state
+    state = open_indicator_state()          # 读取并追加列式存储中的新K线，过期部分自动补齐
+    bars = state.window('600000', 40)       # {'close': ndarray, 'volume': ..., ...}
+    ma20 = state.ma_all(20)                 # 全市场 MA20 向量
+
+    python indicator_state.py build         # 从列式存储全量重建
+    python indicator_state.py info
+"""
+
+import os
+import time
+
+import numpy as np
+
+from kline_store import KLINE_CACHE, KLINE_JSON, STORE_DIR, normalize_code
+
+STATE_FILE = os.path.join(KLINE_CACHE, 'indicator_state.npz')
+STATE_VERSION = 1
+TAIL = 120                  # 保存的最近K线根数（覆盖 MA60 与 v29 周线所需的约 150 个自然日）
+FIELDS = ('close', 'volume', 'high', 'low', 'turn', 'pctChg')
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+HISTORY_ARRAYS = ('first_close', 'run_sign', 'run_len', 'run_open')
+
+
+class IndicatorState:
+    """全部股票的指标状态，按行存放（行号见 index）"""
+
+    def __init__(self, codes=(), fields=FIELDS, tail=TAIL):
+        self.codes = list(codes)
+        self.index = {c: i for i, c in enumerate(self.codes)}
+        self.fields = tuple(fields)
+        self.tail_len = tail
+        n = len(self.codes)
+        self.tail = {f: np.full((n, tail), np.nan) for f in self.fields}
+        self.dates = np.full((n, tail), np.datetime64('NaT'), dtype='datetime64[D]')
+        self.has = np.zeros((n, len(self.fields)), dtype=bool)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.last_date = np.full(n, '', dtype='U10')
+        self.ema_fast = np.full(n, np.nan)
+        self.ema_slow = np.full(n, np.nan)
+        self.dif = np.full((n, MACD_SIGNAL), np.nan)
+        self.first_close = np.full(n, np.nan)
+        self.run_sign = np.zeros(n, dtype=np.int8)
+        self.run_len = np.zeros(n, dtype=np.int64)
+        self.run_open = np.zeros(n, dtype=bool)
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return self._key(code) in self.index
+
+    def _key(self, code):
+        code = str(code)
+        return code if code in self.index else normalize_code(code)
+
+    def row(self, code):
+        return self.index.get(self._key(code))
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_series(cls, series, fields=FIELDS, tail=TAIL):
+        """由 {code: {'date': [...], field: ndarray, ...}} 构建（每只股票按日期升序、只含有效K线）
+
+        MACD 递推按列对齐后对所有股票同时推进，不逐只循环。
+        """
+        codes = [c for c, s in series.items() if len(s.get('close', ())) > 0]
+        state = cls(codes, fields=fields, tail=tail)
+        if not codes:
+            return state
+        lengths = np.array([len(series[c]['close']) for c in codes])
+        for i, code in enumerate(codes):
+            s = series[code]
+            n = lengths[i]
+            k = min(n, tail)
+            for j, f in enumerate(state.fields):
+                values = s.get(f)
+                if values is None:
+                    continue
+                state.has[i, j] = True
+                state.tail[f][i, tail - k:] = np.asarray(values, dtype=np.float64)[-k:]
+            state.dates[i, tail - k:] = np.array([str(d)[:10] for d in s['date'][-k:]], dtype='datetime64[D]')
+            state.last_date[i] = str(s['date'][-1])[:10]
+        state.count[:] = lengths
+        for i, code in enumerate(codes):
+            state._replay_streak(i, np.asarray(series[code]['close'], dtype=np.float64))
+
+        # 左对齐的收盘价矩阵，第 j 列为每只股票的第 j 根K线
+        closes = np.full((len(codes), int(lengths.max())), np.nan)
+        for i, code in enumerate(codes):
+            closes[i, :lengths[i]] = np.asarray(series[code]['close'], dtype=np.float64)
+        state._replay_macd(closes, lengths)
+        state.dirty = True
+        return state
+
+    def _replay_macd(self, closes, lengths):
+        seeded = lengths >= MACD_SLOW
+        if not seeded.any():
+            return
+        first = closes[seeded, :MACD_SLOW]
+        self.ema_fast[seeded] = np.mean(first[:, :MACD_FAST], axis=1)
+        self.ema_slow[seeded] = np.mean(first, axis=1)
+        alpha_f = 2 / (MACD_FAST + 1)
+        alpha_s = 2 / (MACD_SLOW + 1)
+        for j in range(MACD_SLOW, closes.shape[1]):
+            rows = np.flatnonzero(lengths > j)
+            c = closes[rows, j]
+            self.ema_fast[rows] = alpha_f * c + (1 - alpha_f) * self.ema_fast[rows]
+            self.ema_slow[rows] = alpha_s * c + (1 - alpha_s) * self.ema_slow[rows]
+            self.dif[rows, :-1] = self.dif[rows, 1:]
+            self.dif[rows, -1] = self.ema_fast[rows] - self.ema_slow[rows]
+
+    def _replay_streak(self, i, closes):
+        self.first_close[i] = closes[0]
+        moves = np.sign(np.diff(closes))
+        flat = np.flatnonzero(~((moves > 0) | (moves < 0)))   # 平盘（含 NaN）处 streak 循环停止
+        moves = moves[flat[-1] + 1:] if len(flat) else moves
+        if len(moves) == 0:
+            self.run_sign[i], self.run_len[i], self.run_open[i] = 0, 0, False
+            return
+        turns = np.flatnonzero(moves != moves[0])
+        self.run_sign[i] = moves[0]
+        self.run_len[i] = turns[0] if len(turns) else len(moves)
+        self.run_open[i] = len(turns) == 0
+
+    def _step_streak(self, i, prev, close):
+        if self.count[i] == 1:
+            self.first_close[i] = close
+            return
+        sign = 1 if close > prev else -1 if close < prev else 0
+        if sign == 0:
+            self.run_sign[i], self.run_len[i], self.run_open[i] = 0, 0, False
+        elif self.run_sign[i] == 0:
+            self.run_sign[i], self.run_len[i], self.run_open[i] = sign, 1, True
+        elif self.run_open[i]:
+            if sign == self.run_sign[i]:
+                self.run_len[i] += 1
+            else:
+                self.run_open[i] = False
+
+    def extend(self, other):
+        """并入另一份状态中本状态没有的股票"""
+        new = [c for c in other.codes if c not in self.index]
+        if not new:
+            return 0
+        rows = np.array([other.index[c] for c in new])
+        for f in self.fields:
+            src = other.tail.get(f)
+            add = src[rows] if src is not None else np.full((len(rows), self.tail_len), np.nan)
+            self.tail[f] = np.concatenate([self.tail[f], add])
+        has = np.zeros((len(rows), len(self.fields)), dtype=bool)
+        for j, f in enumerate(self.fields):
+            if f in other.fields:
+                has[:, j] = other.has[rows, other.fields.index(f)]
+        self.has = np.concatenate([self.has, has])
+        self.dates = np.concatenate([self.dates, other.dates[rows]])
+        self.count = np.concatenate([self.count, other.count[rows]])
+        self.last_date = np.concatenate([self.last_date, other.last_date[rows]])
+        self.ema_fast = np.concatenate([self.ema_fast, other.ema_fast[rows]])
+        self.ema_slow = np.concatenate([self.ema_slow, other.ema_slow[rows]])
+        self.dif = np.concatenate([self.dif, other.dif[rows]])
+        for name in HISTORY_ARRAYS:
+            setattr(self, name, np.concatenate([getattr(self, name), getattr(other, name)[rows]]))
+        for c in new:
+            self.index[c] = len(self.codes)
+            self.codes.append(c)
+        self.dirty = True
+        return len(new)
+
+    def copy(self):
+        other = IndicatorState((), fields=self.fields, tail=self.tail_len)
+        other.codes = list(self.codes)
+        other.index = dict(self.index)
+        other.tail = {f: m.copy() for f, m in self.tail.items()}
+        for name in ('dates', 'has', 'count', 'last_date', 'ema_fast', 'ema_slow', 'dif') + HISTORY_ARRAYS:
+            setattr(other, name, getattr(self, name).copy())
+        return other
+
+    # ------------------------------------------------------------------
+    # 增量更新
+    # ------------------------------------------------------------------
+    def append(self, code, date, bar):
+        """追加一根新K线（O(1)），日期不晚于 last_date 时忽略；返回是否追加
+
+        bar: {field: value}，缺失字段记为 NaN
+        """
+        date = str(date)[:10]
+        i = self.row(code)
+        if i is None:
+            i = len(self.codes)
+            self.extend(IndicatorState([self._key(code)], fields=self.fields, tail=self.tail_len))
+        elif date <= self.last_date[i]:
+            return False
+        prev = self.tail['close'][i, -1]
+        for j, f in enumerate(self.fields):
+            mat = self.tail[f]
+            mat[i, :-1] = mat[i, 1:]
+            value = bar.get(f)
+            try:
+                mat[i, -1] = float(value)
+                self.has[i, j] = True
+            except (TypeError, ValueError):
+                mat[i, -1] = np.nan
+        self.dates[i, :-1] = self.dates[i, 1:]
+        self.dates[i, -1] = np.datetime64(date, 'D')
+        self.count[i] += 1
+        self.last_date[i] = date
+        self._step_macd(i)
+        self._step_streak(i, prev, self.tail['close'][i, -1])
+        self.dirty = True
+        return True
+
+    def _step_macd(self, i):
+        n = self.count[i]
+        closes = self.tail['close'][i]
+        if n == MACD_SLOW:
+            first = closes[-MACD_SLOW:]
+            self.ema_fast[i] = np.mean(first[:MACD_FAST])
+            self.ema_slow[i] = np.mean(first)
+        elif n > MACD_SLOW:
+            alpha_f = 2 / (MACD_FAST + 1)
+            alpha_s = 2 / (MACD_SLOW + 1)
+            c = closes[-1]
+            self.ema_fast[i] = alpha_f * c + (1 - alpha_f) * self.ema_fast[i]
+            self.ema_slow[i] = alpha_s * c + (1 - alpha_s) * self.ema_slow[i]
+            self.dif[i, :-1] = self.dif[i, 1:]
+            self.dif[i, -1] = self.ema_fast[i] - self.ema_slow[i]
+
+    def append_records(self, code, records, date_key='date'):
+        """按日期顺序追加记录列表中晚于 last_date 的K线，返回追加条数"""
+        added = 0
+        for r in records:
+            if self.append(code, r.get(date_key), r):
+                added += 1
+        return added
+
+    def sync_with_store(self, store):
+        """追加列式存储中晚于各股票 last_date 的K线；存储中有而状态中没有的股票整段构建"""
+        t0 = time.time()
+        close = store.matrix('close')
+        mats = {f: (store.matrix(f), store.fields.index(f)) for f in self.fields if f in store.fields}
+        appended = 0
+        missing = []
+        for code, i_store in store.index.items():
+            i = self.index.get(code)
+            if i is None:
+                missing.append(code)
+                continue
+            lo = store.date_pos(self.last_date[i], side='right') if self.last_date[i] else 0
+            lo = max(lo, int(store.span[i_store, 0]))
+            hi = int(store.span[i_store, 1])
+            if lo >= hi:
+                continue
+            cols = lo + np.flatnonzero(np.isfinite(close[i_store, lo:hi]))
+            for j in cols:
+                bar = {f: m[i_store, j] for f, (m, k) in mats.items() if store.has[i_store, k]}
+                self.append(code, store.date_strs[j], bar)
+                appended += 1
+        added = self.extend(build_from_store(store, missing, fields=self.fields, tail=self.tail_len)) if missing else 0
+        if appended or added:
+            print(f"[indicator_state] 追加 {appended} 根K线, 新增 {added} 只股票 ({time.time() - t0:.1f}s)")
+        return appended, added
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def window(self, code, bars=None, before=None):
+        """最近 bars 根K线 {field: ndarray}（只含源数据中存在的字段）
+
+        before 给出时只取该日期之前的K线；窗口里剩下的K线不足 bars 根、而更早的历史
+        已不在 tail 中时返回 None（调用方应改用完整历史）。股票不存在也返回 None。
+        """
+        i = self.row(code)
+        if i is None:
+            return None
+        bars = bars or self.tail_len
+        start = max(self.tail_len - int(self.count[i]), 0)   # 左侧 NaT 填充之后
+        hi = self.tail_len
+        if before is not None:
+            cut = np.datetime64(str(before)[:10], 'D')
+            hi = start + int(np.searchsorted(self.dates[i, start:], cut, side='left'))
+        avail = hi - start
+        if avail < bars and self.count[i] > self.tail_len:
+            return None
+        lo = hi - min(avail, bars)
+        out = {}
+        for j, f in enumerate(self.fields):
+            if self.has[i, j]:
+                out[f] = self.tail[f][i, lo:hi]
+        return out
+
+    def history(self, code, before=None):
+        """依赖完整历史的量 {'first_close', 'streak'}（供 calc_features_from_bars）
+
+        before 给出且不晚于最后一根K线时返回 None：这些量只对应最新K线，无法回看。
+        """
+        i = self.row(code)
+        if i is None or self.count[i] == 0:
+            return None
+        if before is not None and np.datetime64(self.last_date[i], 'D') >= np.datetime64(str(before)[:10], 'D'):
+            return None
+        return {'first_close': float(self.first_close[i]),
+                'streak': int(self.run_sign[i]) * int(self.run_len[i])}
+
+    def ma_all(self, period, field='close'):
+        """全部股票的 MA(period)，K线不足为 NaN（与 np.mean(closes[-period:]) 一致）"""
+        with np.errstate(invalid='ignore'):
+            out = np.mean(self.tail[field][:, -period:], axis=1)
+        return np.where(self.count >= period, out, np.nan)
+
+    def ma(self, code, period, field='close'):
+        """单只股票 MA(period)，K线不足返回 None"""
+        i = self.row(code)
+        if i is None or self.count[i] < period:
+            return None
+        return float(np.mean(self.tail[field][i, -period:]))
+
+    def rsi(self, code, period=14):
+        """最近 period 个涨跌额的简单平均 RSI（与 daily_recommender_v29.calc_rsi 一致）"""
+        i = self.row(code)
+        if i is None or self.count[i] < period + 1:
+            return 50.0
+        diffs = np.diff(self.tail['close'][i, -(period + 1):])
+        avg_gain = float(np.mean(np.where(diffs > 0, diffs, 0.0)))
+        avg_loss = float(np.mean(np.where(diffs < 0, -diffs, 0.0)))
+        if avg_loss == 0:
+            return 100.0
+        return 100 - (100 / (1 + avg_gain / avg_loss))
+
+    def macd(self, code):
+        """(DIF, DEA)，K线不足 MACD_SLOW + MACD_SIGNAL 根时为 (0.0, 0.0)"""
+        i = self.row(code)
+        if i is None or self.count[i] < MACD_SLOW + MACD_SIGNAL:
+            return 0.0, 0.0
+        return float(self.dif[i, -1]), float(np.mean(self.dif[i]))
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+    def save(self, path=STATE_FILE):
+        """写入单个 .npz（先写临时文件再替换）"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        arrays = {f'tail_{f}': m for f, m in self.tail.items()}
+        with open(tmp, 'wb') as fp:
+            np.savez(fp, version=np.array(STATE_VERSION), codes=np.array(self.codes, dtype=str),
+                     fields=np.array(self.fields, dtype=str), has=self.has, count=self.count,
+                     dates=self.dates, last_date=self.last_date, ema_fast=self.ema_fast, ema_slow=self.ema_slow,
+                     dif=self.dif, **{name: getattr(self, name) for name in HISTORY_ARRAYS}, **arrays)
+        os.replace(tmp, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path=STATE_FILE):
+        with np.load(path) as z:
+            if int(z['version']) != STATE_VERSION:
+                raise ValueError(f"不支持的状态版本: {int(z['version'])}")
+            fields = tuple(str(f) for f in z['fields'])
+            tail = z[f'tail_{fields[0]}'].shape[1]
+            state = cls((), fields=fields, tail=tail)
+            state.codes = [str(c) for c in z['codes']]
+            state.index = {c: i for i, c in enumerate(state.codes)}
+            state.tail = {f: z[f'tail_{f}'] for f in fields}
+            state.dates = z['dates']
+            state.has = z['has']
+            state.count = z['count']
+            state.last_date = z['last_date']
+            state.ema_fast = z['ema_fast']
+            state.ema_slow = z['ema_slow']
+            state.dif = z['dif']
+            for name in HISTORY_ARRAYS:
+                setattr(state, name, z[name])
+        return state
+
+
+def build_from_store(store, codes=None, fields=FIELDS, tail=TAIL):
+    """从列式存储全量构建（codes 为空时取全部股票）"""
+    series = {}
+    for code in (store.codes if codes is None else codes):
+        arr = store.arrays(code, fields=list(fields))
+        if arr is None or 'close' not in arr or len(arr['close']) == 0:
+            continue
+        arr['date'] = np.datetime_as_string(arr['date'], unit='D')
+        series[normalize_code(code)] = arr
+    return IndicatorState.from_series(series, fields=fields, tail=tail)
+
+
+def open_indicator_state(path=STATE_FILE, store=None, sync=True, save=True):
+    """读取指标状态并与列式K线存储同步；状态不存在时全量构建。不可用时返回 None
+
+    sync=True 时列式存储不可用（不存在或落后于 K线 JSON）也返回 None，避免用过期状态评分。
+    """
+    try:
+        if store is None and sync:
+            from kline_store import open_kline_store
+            store = open_kline_store(STORE_DIR, source=KLINE_JSON)
+            if store is None:
+                return None
+        state = IndicatorState.load(path) if os.path.exists(path) else None
+        if state is None:
+            if store is None:
+                return None
+            t0 = time.time()
+            state = build_from_store(store)
+            print(f"[indicator_state] 构建完成: {len(state)} 只 ({time.time() - t0:.1f}s)")
+        elif store is not None and sync:
+            state.sync_with_store(store)
+        if save and state.dirty:
+            state.save(path)
+        return state
+    except Exception as e:
+        print(f"[indicator_state] 打开失败: {e}")
+        return None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='指标增量状态工具')
+    sub = parser.add_subparsers(dest='cmd')
+    p_build = sub.add_parser('build', help='从列式存储全量重建')
+    p_build.add_argument('--out', default=STATE_FILE)
+    p_info = sub.add_parser('info', help='查看状态概况')
+    p_info.add_argument('--file', default=STATE_FILE)
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        from kline_store import open_kline_store
+        store = open_kline_store(STORE_DIR, source=KLINE_JSON, auto_convert=True)
+        if store is None:
+            print("[indicator_state] 列式存储不可用")
+            return
+        t0 = time.time()
+        state = build_from_store(store)
+        state.save(args.out)
+        print(f"[indicator_state] 构建完成: {len(state)} 只 → {args.out} ({time.time() - t0:.1f}s)")
+    elif args.cmd == 'info':
+        state = IndicatorState.load(args.file)
+        dates = sorted(set(state.last_date.tolist()))
+        print(f"股票: {len(state)}  窗口: {state.tail_len}  字段: {', '.join(state.fields)}")
+        print(f"最后日期: {dates[0] if dates else '-'} ~ {dates[-1] if dates else '-'}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
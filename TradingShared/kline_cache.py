@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内共享K线缓存 - 一个进程只打开一次K线源，按代码查询
+
+选股器原来每次缓存未命中都 json.load 一遍 kline_full_latest.json 再只取一只股票，
+筛选 3000 只候选就要解析 3000 次全量文件。这里：
+  1. 每个源文件对应一个惰性加载的只读缓存对象（首次查询时才加载，加载过程加锁）
+  2. 列式存储 (kline_store) 新鲜时直接内存映射读取；否则 load_kline_json 读一次主文件 + 增量段
+  3. 代码统一规范化查找：600000 / sh600000 / sh.600000 / 600000.SH 都能命中
+  4. get_kline_cache() 检查源文件签名，文件被更新后下次获取时自动重新加载
+
+返回的记录列表在进程内共享，调用方只读不改。
+
+使用方法：
+    from kline_cache import get_kline_cache
+    cache = get_kline_cache()                  # 默认 kline_full_latest.json
+    rows = cache.records('600000')             # [{'date': ..., 'close': ...}, ...]
+    closes = cache.close_map('sh600000')       # {'YYYY-MM-DD': close}
+    for key, rows in cache.items(): ...
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from kline_store import KLINE_JSON, normalize_code, open_kline_store
+
+
+def _source_signature(source):
+    """源文件 + 增量段目录的 (大小, 修改时间)，用于判断缓存是否过期"""
+    sig = []
+    for path in (source, source + '.delta'):
+        try:
+            st = os.stat(path)
+            sig.append((st.st_size, st.st_mtime))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+
+class SharedKlineCache:
+    """单个K线源的只读缓存（线程安全，惰性加载）"""
+
+    def __init__(self, source=KLINE_JSON, use_store=True):
+        self.source = source
+        self.use_store = use_store
+        self.signature = None
+        self._store = None
+        self._raw = None           # JSON 路径: {原始键: 记录列表}
+        self._keys = {}            # 规范化代码 → 原始键
+        self._records = {}         # 列式存储路径: 已构建的记录列表
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _ensure(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self.signature = _source_signature(self.source)
+            store = None
+            if self.use_store and os.path.abspath(self.source) == os.path.abspath(KLINE_JSON):
+                store = open_kline_store(source=self.source)
+            if store is not None:
+                self._store = store
+                self._keys = {code: raw for code, raw in zip(store.codes, store.raw_keys)}
+            elif os.path.exists(self.source):
+                try:
+                    from kline_delta import load_kline_json
+                    raw = load_kline_json(self.source)
+                except Exception as e:
+                    print(f"[K线缓存] 加载 {os.path.basename(self.source)} 失败: {e}")
+                    raw = {}
+                self._raw = {k: v for k, v in raw.items() if isinstance(v, list)}
+                self._keys = {}
+                for key in self._raw:
+                    self._keys.setdefault(normalize_code(key), key)
+            else:
+                self._raw = {}
+            self._loaded = True
+
+    def is_stale(self):
+        """源文件在加载后被修改过"""
+        return self._loaded and self.signature != _source_signature(self.source)
+
+    def key_of(self, code):
+        """任意格式代码 → 源数据中的原始键，不存在返回 None"""
+        self._ensure()
+        if self._raw is not None and code in self._raw:
+            return code
+        return self._keys.get(normalize_code(code))
+
+    def __contains__(self, code):
+        return self.key_of(code) is not None
+
+    def __len__(self):
+        self._ensure()
+        return len(self._keys) if self._store is not None else len(self._raw)
+
+    def codes(self):
+        """源数据中的全部原始键"""
+        self._ensure()
+        if self._store is not None:
+            return list(self._store.raw_keys)
+        return list(self._raw)
+
+    def records(self, code):
+        """单只股票的K线记录列表（只读），不存在返回 []"""
+        key = self.key_of(code)
+        if key is None:
+            return []
+        if self._store is None:
+            return self._raw[key]
+        norm = normalize_code(key)
+        data = self._records.get(norm)
+        if data is None:
+            data = self._store.records(norm)
+            self._records[norm] = data
+        return data
+
+    def items(self):
+        """遍历 (原始键, 记录列表)"""
+        for key in self.codes():
+            yield key, self.records(key)
+
+    def close_map(self, code):
+        """{'YYYY-MM-DD': close}，只保留收盘价 > 0 的交易日"""
+        key = self.key_of(code)
+        if key is None:
+            return {}
+        if self._store is not None:
+            arr = self._store.arrays(normalize_code(key), fields=('close',))
+            close = arr.get('close')
+            if close is None:
+                return {}
+            keep = close > 0
+            dates = np.datetime_as_string(arr['date'][keep], unit='D')
+            return dict(zip(dates.tolist(), close[keep].astype(float).tolist()))
+        out = {}
+        for k in self._raw[key]:
+            d = str(k.get('date', ''))[:10]
+            c = float(k.get('close', 0))
+            if d and c > 0:
+                out[d] = c
+        return out
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_kline_cache(source=KLINE_JSON):
+    """进程内共享的缓存实例（每个源文件一个）；源文件更新后重新加载"""
+    key = os.path.abspath(source)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None or cache.is_stale():
+            cache = SharedKlineCache(source)
+            _caches[key] = cache
+        return cache
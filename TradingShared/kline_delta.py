@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K线增量段 - 新增日线只追加小文件，读取时合并，后台压缩回主文件
+
+各更新脚本原来每 SAVE_EVERY 批就把整个 kline_full_latest.json（几百MB）json.dump 一遍，
+结束时再写一遍。这里把新增部分按交易日写成增量段：
+
+    kline_full_latest.json            主文件（格式不变：{code: [record, ...]}）
+    kline_full_latest.json.delta/
+        2026-05-07.jsonl              该交易日新增的K线，每行 {"code": 主文件中的键, "bar": {...}}
+        2026-05-08.jsonl
+
+  1. checkpoint 只追加缓冲中的新行并 fsync，开销与新增条数成正比（几 KB）
+  2. 读取时 load_kline_json() 在主文件之上重放增量段；列式存储把增量段签名记入 meta，
+     增量段变化后自动视为过期
+  3. compact() 把增量段合并进主文件（临时文件 + os.replace）并重建列式存储，
+     由 spawn_compaction() 在独立进程中执行，不阻塞更新
+
+重放是幂等的（同一股票同一日期只保留先出现的一条），因此压缩时被并发追加过的段
+保留下来再次重放也不会产生重复。同一时间只应有一个进程写增量段。
+
+使用方法：
+    from kline_delta import DeltaWriter, load_kline_json
+
+    writer = DeltaWriter(KLINE_JSON)
+    writer.add('sh600000', new_rows)
+    writer.checkpoint()
+
+    raw = load_kline_json(KLINE_JSON)     # 主文件 + 增量段
+
+压缩：
+    python kline_delta.py compact [--base kline_full_latest.json]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from kline_store import KLINE_JSON, STORE_DIR, normalize_date
+
+SEGMENT_SUFFIX = '.jsonl'
+
+
+def delta_dir_for(base_file):
+    """主文件对应的增量段目录"""
+    return base_file + '.delta'
+
+
+def list_segments(base_file):
+    """按交易日排序的增量段文件名"""
+    delta_dir = delta_dir_for(base_file)
+    if not os.path.isdir(delta_dir):
+        return []
+    return sorted(n for n in os.listdir(delta_dir) if n.endswith(SEGMENT_SUFFIX))
+
+
+def delta_signature(base_file):
+    """{段文件名: 字节数}，用于判断列式存储是否包含了全部增量段"""
+    delta_dir = delta_dir_for(base_file)
+    sig = {}
+    for name in list_segments(base_file):
+        try:
+            sig[name] = os.path.getsize(os.path.join(delta_dir, name))
+        except OSError:
+            continue
+    return sig
+
+
+def merge_new_rows(existing, rows):
+    """把新K线合并进按日期升序的记录列表，返回新增条数
+
+    常见情况（新数据全部晚于最后一条且日期递增）直接追加，不再重建日期集合、整段重排；
+    否则按日期去重后重新排序，结果与原脚本的合并方式相同。
+    """
+    if not rows:
+        return 0
+    last = existing[-1].get('date', '') if existing else ''
+    dates = [r.get('date', '') for r in rows]
+    if dates[0] > last and all(a < b for a, b in zip(dates, dates[1:])):
+        existing.extend(rows)
+        return len(rows)
+
+    existing_dates = {r.get('date') for r in existing}
+    added = 0
+    for r in rows:
+        if r.get('date') not in existing_dates:
+            existing.append(r)
+            existing_dates.add(r.get('date'))
+            added += 1
+    if added:
+        existing.sort(key=lambda x: x.get('date', ''))
+    return added
+
+
+# ============================================================================
+# 读取
+# ============================================================================
+def read_segments(base_file, sizes=None):
+    """读取增量段，返回 {code: [bar, ...]}（按段的交易日顺序）
+
+    sizes 为 {段文件名: 字节数} 时只读这些段的前 sizes[name] 字节（压缩时使用）。
+    写了一半的最后一行（进程被杀）会被跳过。
+    """
+    delta_dir = delta_dir_for(base_file)
+    names = sorted(sizes) if sizes is not None else list_segments(base_file)
+    bars = {}
+    bad = 0
+    for name in names:
+        path = os.path.join(delta_dir, name)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read(sizes[name]) if sizes is not None else f.read()
+        except OSError as e:
+            print(f"[kline_delta] 读取 {name} 失败: {e}")
+            continue
+        for line in blob.decode('utf-8', errors='replace').splitlines():
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+                bars.setdefault(rec['code'], []).append(rec['bar'])
+            except (ValueError, KeyError, TypeError):
+                bad += 1
+    if bad:
+        print(f"[kline_delta] 跳过损坏行 {bad} 条")
+    return bars
+
+
+def apply_deltas(raw, base_file, sizes=None):
+    """把增量段重放进 {code: [record, ...]}（原地修改），返回新增条数"""
+    added = 0
+    for code, rows in read_segments(base_file, sizes).items():
+        existing = raw.get(code)
+        if not isinstance(existing, list):
+            existing = raw[code] = []
+        added += merge_new_rows(existing, rows)
+    return added
+
+
+def load_kline_json(base_file=KLINE_JSON):
+    """读取主文件并重放增量段，替代直接 json.load(kline_full_latest.json)"""
+    with open(base_file, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    if list_segments(base_file):
+        added = apply_deltas(raw, base_file)
+        if added:
+            print(f"[kline_delta] 重放增量段: +{added} 条")
+    return raw
+
+
+def last_dates(base_file=KLINE_JSON):
+    """每只股票（主文件中的键）的最后交易日；列式存储可用时不读主文件"""
+    tails = None
+    try:
+        from kline_store import KlineStore
+        if os.path.exists(os.path.join(STORE_DIR, 'meta.json')):
+            store = KlineStore(STORE_DIR)
+            if store.is_fresh(base_file, check_deltas=False):
+                tails = {key: store.date_strs[int(hi) - 1]
+                         for key, hi in zip(store.raw_keys, store.span[:, 1])}
+    except Exception as e:
+        print(f"[kline_delta] 列式存储不可用: {e}")
+    if tails is None:
+        with open(base_file, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        tails = {key: (records[-1].get('date', '') if records else '')
+                 for key, records in raw.items() if isinstance(records, list)}
+        del raw
+    for code, rows in read_segments(base_file).items():
+        newest = max((r.get('date', '') for r in rows), default='')
+        if newest > tails.get(code, ''):
+            tails[code] = newest
+    return tails
+
+
+# ============================================================================
+# 写入
+# ============================================================================
+class DeltaWriter:
+    """按交易日追加新K线；checkpoint() 之前只在内存中缓冲"""
+
+    def __init__(self, base_file=KLINE_JSON):
+        self.base_file = base_file
+        self.delta_dir = delta_dir_for(base_file)
+        self._buffer = {}
+        self.pending = 0
+        self.written = 0
+
+    def add(self, code, rows):
+        """缓冲一只股票的新K线（code 使用主文件中的键）"""
+        for r in rows:
+            d = normalize_date(r.get('date'))
+            if not d:
+                continue
+            line = json.dumps({'code': code, 'bar': r}, ensure_ascii=False)
+            self._buffer.setdefault(d, []).append(line)
+            self.pending += 1
+
+    def checkpoint(self):
+        """把缓冲追加到各交易日的增量段，返回写入字节数"""
+        if not self._buffer:
+            return 0
+        os.makedirs(self.delta_dir, exist_ok=True)
+        nbytes = 0
+        for day in sorted(self._buffer):
+            blob = ('\n'.join(self._buffer[day]) + '\n').encode('utf-8')
+            with open(os.path.join(self.delta_dir, day + SEGMENT_SUFFIX), 'ab') as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            nbytes += len(blob)
+        self.written += self.pending
+        self._buffer = {}
+        self.pending = 0
+        return nbytes
+
+
+# ============================================================================
+# 压缩
+# ============================================================================
+def compact(base_file=KLINE_JSON, rebuild_store=True, store_dir=STORE_DIR):
+    """把增量段合并进主文件并删除已合并的段；列式存储存在时一并重建"""
+    sizes = delta_signature(base_file)
+    if not sizes:
+        print("[kline_delta] 没有待合并的增量段")
+        return False
+
+    t0 = time.time()
+    with open(base_file, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    added = apply_deltas(raw, base_file, sizes)
+
+    tmp = base_file + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(raw, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, base_file)
+
+    # 压缩期间又被追加过的段保留，下次重放（幂等）
+    current = delta_signature(base_file)
+    retained = {}
+    for name, size in sizes.items():
+        if current.get(name) == size:
+            try:
+                os.remove(os.path.join(delta_dir_for(base_file), name))
+                continue
+            except OSError as e:
+                print(f"[kline_delta] 删除 {name} 失败: {e}")
+        retained[name] = size
+
+    # 存储签名只记实际并入的部分（保留段的前 sizes[name] 字节），
+    # 压缩期间新追加的K线使签名不一致，is_fresh 为 False 直到下次重放
+    if rebuild_store and os.path.exists(os.path.join(store_dir, 'meta.json')):
+        from kline_store import build_store
+        build_store(raw, store_dir=store_dir, source=base_file, deltas=retained)
+    print(f"[kline_delta] 压缩完成: {len(sizes)} 段, +{added} 条 ({time.time() - t0:.1f}s)")
+    return True
+
+
+def spawn_compaction(base_file=KLINE_JSON):
+    """在独立进程中执行 compact()，当前进程退出后继续运行；日志写到 <主文件>.compact.log"""
+    log_path = base_file + '.compact.log'
+    kwargs = {}
+    if os.name == 'nt':
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    try:
+        with open(log_path, 'a', encoding='utf-8') as log:
+            log.write(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] compact {base_file}\n")
+            log.flush()
+            proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'compact',
+                                     '--base', base_file],
+                                    stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                    close_fds=True, **kwargs)
+        print(f"[kline_delta] 后台压缩已启动 (pid {proc.pid})，日志: {log_path}")
+        return proc
+    except Exception as e:
+        print(f"[kline_delta] 启动后台压缩失败: {e}")
+        return None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='K线增量段工具')
+    sub = parser.add_subparsers(dest='cmd')
+    p_compact = sub.add_parser('compact', help='合并增量段到主文件')
+    p_compact.add_argument('--base', default=KLINE_JSON)
+    p_compact.add_argument('--no-store', action='store_true', help='不重建列式存储')
+    p_info = sub.add_parser('info', help='查看增量段')
+    p_info.add_argument('--base', default=KLINE_JSON)
+    args = parser.parse_args()
+
+    if args.cmd == 'compact':
+        compact(args.base, rebuild_store=not args.no_store)
+    elif args.cmd == 'info':
+        sig = delta_signature(args.base)
+        for name, size in sig.items():
+            print(f"  {name}: {size / 1024:.1f}KB")
+        print(f"共 {len(sig)} 段, {sum(sig.values()) / 1024:.1f}KB")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
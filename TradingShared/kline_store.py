@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K线列式存储 - 替代 kline_full_latest.json 的内存映射二进制格式
+
+kline_full_latest.json 每次加载都要 json.load 几百MB，再逐只构建 DataFrame。
+列式存储把全市场K线对齐到同一条交易日轴上：
+
+    kline_store/
+      meta.json        代码列表、日期轴、字段列表、源文件信息
+      close.npy ...    每个字段一个 float32 矩阵 (股票数 × 交易日数)，缺失为 NaN
+      span.npy         每只股票有效区间 [first, last+1) 的列下标 (int32)
+      has.npy          每只股票在源数据中是否含有该字段 (bool, 股票数 × 字段数)
+
+读取时用 numpy.load(mmap_mode='r') 打开，加载 3000+ 只股票只是打开几个文件。
+
+使用方法：
+    from kline_store import open_kline_store
+    store = open_kline_store()              # 不存在或已过期时返回 None
+    if store is not None:
+        df = store.frame('600000')          # 单只股票 DataFrame
+        kline = store.frames(min_days=30)   # {code: DataFrame}
+        close = store.matrix('close')       # (股票数 × 交易日数) memmap
+
+转换：
+    python kline_store.py convert [--source kline_full_latest.json] [--out kline_store]
+"""
+
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+SHARED_ROOT = os.path.dirname(os.path.abspath(__file__))
+KLINE_CACHE = os.path.join(SHARED_ROOT, 'data', 'kline_cache')
+KLINE_JSON = os.path.join(KLINE_CACHE, 'kline_full_latest.json')
+STORE_DIR = os.path.join(KLINE_CACHE, 'kline_store')
+
+STORE_VERSION = 2   # 2: 上证指数保留 sh 前缀（见 normalize_code）
+FIELDS = ('open', 'high', 'low', 'close', 'volume', 'amount', 'turn', 'pctChg')
+
+
+def normalize_code(code):
+    """统一为6位纯数字代码: sh600000 / sh.600000 / 600000.SH → 600000
+
+    上证指数（沪市 000xxx）保留前缀: sh000001 / 000001.SH → sh000001，
+    避免与深市股票（sz000001 平安银行 → 000001）撞成同一个键；不带市场的 000001 仍视为股票。
+    """
+    code = str(code).strip()
+    upper = code.upper()
+    market = None
+    if upper.endswith(('.SH', '.SZ', '.BJ')):
+        market, code = upper[-2:], code[:-3]
+    elif upper.startswith(('SH.', 'SZ.', 'BJ.')):
+        market, code = upper[:2], code[3:]
+    elif upper.startswith(('SH', 'SZ', 'BJ')):
+        market, code = upper[:2], code[2:]
+    if market == 'SH' and code.startswith('000'):
+        return 'sh' + code
+    return code
+
+
+def normalize_date(value):
+    """统一为 'YYYY-MM-DD'，支持毫秒时间戳 / 'YYYYMMDD' / 带时间的字符串"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        if value != value:
+            return None
+        if value > 1e11:
+            return datetime.fromtimestamp(value / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+        value = str(int(value))
+    s = str(value).strip()
+    if len(s) == 8 and s.isdigit():
+        return f'{s[:4]}-{s[4:6]}-{s[6:]}'
+    if len(s) >= 10:
+        return s[:10]
+    return None
+
+
+def _to_float(value):
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return np.nan
+    return v
+
+
+# ============================================================================
+# 转换器
+# ============================================================================
+def build_store(raw, store_dir=STORE_DIR, source=None, fields=FIELDS, deltas=None):
+    """把 {code: [record, ...]} 结构写成列式存储
+
+    同一只股票的多个原始键（如 sh600000 与 600000）按日期合并，后出现的覆盖先出现的。
+    写入先落到临时目录，完成后整体替换，读者不会看到半成品。
+    deltas 为已并入 raw 的增量段签名（见 kline_delta.delta_signature）。
+    """
+    per_code = {}
+    raw_keys = {}
+    all_dates = set()
+    field_pos = {f: i for i, f in enumerate(fields)}
+
+    for key, records in raw.items():
+        if not isinstance(records, list) or not records:
+            continue
+        code = normalize_code(key)
+        bars = per_code.setdefault(code, {})
+        raw_keys.setdefault(code, key)
+        for r in records:
+            if not isinstance(r, dict):
+                continue
+            d = normalize_date(r.get('date'))
+            if not d:
+                continue
+            bars[d] = r
+            all_dates.add(d)
+
+    codes = sorted(c for c, bars in per_code.items() if bars)
+    dates = sorted(all_dates)
+    date_pos = {d: j for j, d in enumerate(dates)}
+    n_codes, n_dates = len(codes), len(dates)
+
+    mats = {f: np.full((n_codes, n_dates), np.nan, dtype=np.float32) for f in fields}
+    has = np.zeros((n_codes, len(fields)), dtype=bool)
+    span = np.zeros((n_codes, 2), dtype=np.int32)
+
+    for i, code in enumerate(codes):
+        bars = per_code[code]
+        cols = []
+        for d, r in bars.items():
+            j = date_pos[d]
+            cols.append(j)
+            for f, v in r.items():
+                k = field_pos.get(f)
+                if k is None:
+                    continue
+                has[i, k] = True
+                mats[f][i, j] = _to_float(v)
+        span[i] = (min(cols), max(cols) + 1)
+
+    tmp_dir = store_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    for f in fields:
+        np.save(os.path.join(tmp_dir, f'{f}.npy'), mats[f])
+    np.save(os.path.join(tmp_dir, 'span.npy'), span)
+    np.save(os.path.join(tmp_dir, 'has.npy'), has)
+
+    meta = {
+        'version': STORE_VERSION,
+        'fields': list(fields),
+        'codes': codes,
+        'raw_keys': [raw_keys[c] for c in codes],
+        'dates': dates,
+        'built_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'deltas': dict(deltas or {}),
+    }
+    if source and os.path.exists(source):
+        st = os.stat(source)
+        meta['source'] = os.path.basename(source)
+        meta['source_mtime'] = st.st_mtime
+        meta['source_size'] = st.st_size
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as fp:
+        json.dump(meta, fp, ensure_ascii=False)
+
+    _swap_dir(tmp_dir, store_dir)
+    return meta
+
+
+def _swap_dir(tmp_dir, store_dir):
+    old_dir = store_dir + '.old'
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(store_dir):
+        os.replace(store_dir, old_dir)
+    os.replace(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def convert_json_to_store(json_path=KLINE_JSON, store_dir=STORE_DIR):
+    """从 kline_full_latest.json（含增量段）生成列式存储，返回 meta"""
+    from kline_delta import apply_deltas, delta_signature
+
+    t0 = time.time()
+    print(f"[kline_store] 读取 {os.path.basename(json_path)} "
+          f"({os.path.getsize(json_path) / 1024 / 1024:.1f}MB)...")
+    with open(json_path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    deltas = delta_signature(json_path)
+    if deltas:
+        apply_deltas(raw, json_path, deltas)
+    meta = build_store(raw, store_dir=store_dir, source=json_path, deltas=deltas)
+    del raw
+    print(f"[kline_store] 完成: {len(meta['codes'])} 只 × {len(meta['dates'])} 日 "
+          f"→ {store_dir} ({time.time() - t0:.1f}s)")
+    return meta
+
+
+# ============================================================================
+# 读取
+# ============================================================================
+class KlineStore:
+    """只读的列式K线存储，字段矩阵按需内存映射"""
+
+    def __init__(self, store_dir=STORE_DIR, mmap=True):
+        self.store_dir = store_dir
+        self._mmap_mode = 'r' if mmap else None
+        with open(os.path.join(store_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != STORE_VERSION:
+            raise ValueError(f"不支持的存储版本: {self.meta.get('version')}")
+        self.fields = tuple(self.meta['fields'])
+        self.codes = self.meta['codes']
+        self.raw_keys = self.meta.get('raw_keys', self.codes)
+        self.date_strs = self.meta['dates']
+        self.dates = np.array(self.date_strs, dtype='datetime64[D]')
+        self.index = {c: i for i, c in enumerate(self.codes)}
+        self._field_pos = {f: i for i, f in enumerate(self.fields)}
+        self._mats = {}
+        self.span = np.load(os.path.join(store_dir, 'span.npy'))
+        self.has = np.load(os.path.join(store_dir, 'has.npy'))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return iter(self.codes)
+
+    def __contains__(self, code):
+        return normalize_code(code) in self.index
+
+    def row(self, code):
+        """代码 → 行号，不存在返回 None"""
+        return self.index.get(normalize_code(code))
+
+    def date_pos(self, date, side='left'):
+        """日期在交易日轴上的插入位置（searchsorted 语义）"""
+        d = np.datetime64(normalize_date(date) if isinstance(date, str) else date, 'D')
+        return int(np.searchsorted(self.dates, d, side=side))
+
+    def matrix(self, field):
+        """字段矩阵 (股票数 × 交易日数)，只读 memmap"""
+        mat = self._mats.get(field)
+        if mat is None:
+            if field not in self._field_pos:
+                raise KeyError(field)
+            mat = np.load(os.path.join(self.store_dir, f'{field}.npy'), mmap_mode=self._mmap_mode)
+            self._mats[field] = mat
+        return mat
+
+    def fields_of(self, code):
+        """该股票源数据中存在的字段"""
+        i = self.row(code)
+        if i is None:
+            return ()
+        return tuple(f for f, k in self._field_pos.items() if self.has[i, k])
+
+    def arrays(self, code, fields=None, tail=None):
+        """单只股票的有效K线（剔除停牌等缺失日），返回 {'date': datetime64[D], field: ndarray}
+
+        fields 只保留源数据中存在的字段，与 JSON 路径下 `col in df.columns` 的判断一致。
+        """
+        i = self.row(code)
+        if i is None:
+            return None
+        lo, hi = int(self.span[i, 0]), int(self.span[i, 1])
+        close = np.asarray(self.matrix('close')[i, lo:hi])
+        valid = np.isfinite(close)
+        if tail is not None:
+            keep = np.flatnonzero(valid)[-tail:]
+            valid = np.zeros_like(valid)
+            valid[keep] = True
+        present = self.fields_of(code)
+        if fields is not None:
+            present = [f for f in fields if f in present]
+        out = {'date': self.dates[lo:hi][valid]}
+        for f in present:
+            out[f] = np.asarray(self.matrix(f)[i, lo:hi])[valid]
+        return out
+
+    def records(self, code, tail=None):
+        """兼容 JSON 格式的记录列表 [{'date': 'YYYY-MM-DD', 'close': ...}, ...]"""
+        arr = self.arrays(code, tail=tail)
+        if arr is None:
+            return []
+        fields = [f for f in arr if f != 'date']
+        dates = np.datetime_as_string(arr['date'], unit='D')
+        cols = [arr[f].tolist() for f in fields]
+        return [dict(zip(['date'] + fields, row)) for row in zip(dates.tolist(), *cols)]
+
+    def frame(self, code, fields=None, tail=None):
+        """单只股票 DataFrame，列: date(datetime64[ns]) + 字段(float32)"""
+        import pandas as pd
+
+        arr = self.arrays(code, fields=fields, tail=tail)
+        if arr is None:
+            return None
+        arr['date'] = pd.to_datetime(arr['date'])
+        return pd.DataFrame(arr)
+
+    def frames(self, codes=None, min_days=0, fields=None, tail=None):
+        """批量构建 {code: DataFrame}，codes 为空时取全部"""
+        if codes is None:
+            codes = self.codes
+        out = {}
+        for code in codes:
+            df = self.frame(code, fields=fields, tail=tail)
+            if df is None or len(df) < max(min_days, 1):
+                continue
+            out[normalize_code(code)] = df
+        return out
+
+    def is_fresh(self, source=KLINE_JSON, check_deltas=True):
+        """源 JSON 未在转换后被修改，且（check_deltas 时）增量段与转换时一致"""
+        if not source or not os.path.exists(source):
+            return True
+        if self.meta.get('source') != os.path.basename(source):
+            return False
+        st = os.stat(source)
+        if not (self.meta.get('source_size') == st.st_size
+                and self.meta.get('source_mtime', 0) >= st.st_mtime):
+            return False
+        if check_deltas:
+            from kline_delta import delta_signature
+            return self.meta.get('deltas', {}) == delta_signature(source)
+        return True
+
+
+def open_kline_store(store_dir=STORE_DIR, source=KLINE_JSON, auto_convert=False):
+    """打开列式存储；不存在或落后于源 JSON 时返回 None（auto_convert=True 则先转换）"""
+    meta_file = os.path.join(store_dir, 'meta.json')
+    try:
+        if os.path.exists(meta_file):
+            try:
+                store = KlineStore(store_dir)
+            except ValueError as e:  # 旧版本存储（代码规则不同），需要重新转换
+                print(f"[kline_store] {e}，需要重新转换")
+                store = None
+            if store is not None and store.is_fresh(source):
+                return store
+        if auto_convert and source and os.path.exists(source):
+            convert_json_to_store(source, store_dir)
+            return KlineStore(store_dir)
+    except Exception as e:
+        print(f"[kline_store] 打开失败: {e}")
+    return None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='K线列式存储工具')
+    sub = parser.add_subparsers(dest='cmd')
+    p_conv = sub.add_parser('convert', help='从 JSON 生成列式存储')
+    p_conv.add_argument('--source', default=KLINE_JSON)
+    p_conv.add_argument('--out', default=STORE_DIR)
+    p_info = sub.add_parser('info', help='查看存储概况')
+    p_info.add_argument('--dir', default=STORE_DIR)
+    args = parser.parse_args()
+
+    if args.cmd == 'convert':
+        convert_json_to_store(args.source, args.out)
+    elif args.cmd == 'info':
+        store = KlineStore(args.dir)
+        print(f"股票: {len(store)}  交易日: {len(store.dates)} "
+              f"({store.date_strs[0] if store.date_strs else '-'} ~ "
+              f"{store.date_strs[-1] if store.date_strs else '-'})")
+        print(f"字段: {', '.join(store.fields)}")
+        print(f"构建: {store.meta.get('built_at')}  源: {store.meta.get('source', '-')}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+K线增量更新（统一入口）- 取代 update_kline_incremental / v2 / v3 / v4 及 TradingAgent/update_kline_* 各版本
+
+流程：
+  1. 每只股票的最后交易日：列式存储可用时直接读 span，不加载主文件；再叠加未压缩的增量段
+  2. KlineFetchEngine 并发抓取（数据源按 FETCH_SOURCES 顺序回退，各自限速）
+  3. 新K线按交易日追加到增量段（kline_delta），每 CHECKPOINT_EVERY 只 checkpoint 一次，
+     只写新增的几 KB，不再整文件 json.dump
+  4. 更新上证指数（小文件，直接重写）与状态文件
+  5. 启动后台压缩：增量段并入 kline_full_latest.json 并重建列式存储
+
+用法：
+    python kline_update.py                       # 目标日期默认为最近交易日
+    python kline_update.py --target 2026-05-08 --sources tencent,sina
+    python kline_update.py --compact-now         # 前台压缩（不启动后台进程）
+    python kline_update.py --no-compact          # 只写增量段
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+SHARED_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SHARED_ROOT)
+sys.path.insert(0, os.path.join(SHARED_ROOT, 'api'))
+
+from kline_store import KLINE_JSON
+from kline_delta import DeltaWriter, compact, last_dates, merge_new_rows, spawn_compaction
+from kline_fetch_engine import FetchJob, KlineFetchEngine
+
+INDEX_FILE = os.path.join(SHARED_ROOT, 'data', 'index_shanghai_full.json')
+STATUS_FILE = os.path.join(SHARED_ROOT, 'data', 'kline_update_status.json')
+INDEX_CODE = 'sh000001'
+
+FETCH_SOURCES = ('tencent', 'sina')
+CHECKPOINT_EVERY = 500   # 每抓完多少只股票写一次增量段
+PROGRESS_EVERY = 200
+
+
+def get_latest_trade_date(now=None):
+    """最近交易日（跳过周末；16:00 前取前一交易日）"""
+    now = now or datetime.now()
+    day = now if now.hour >= 16 else now - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime('%Y-%m-%d')
+
+
+def _next_day(date_str):
+    return (datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def update_stocks(engine, base_file, target_date, end_date):
+    """抓取落后于 target_date 的股票，新K线写入增量段；返回统计"""
+    t0 = time.time()
+    tails = last_dates(base_file)
+    todo = [(code, d) for code, d in tails.items() if d and d < target_date]
+    print(f"[1] 股票 {len(tails)} 只, 需更新 {len(todo)} 只 ({time.time() - t0:.1f}s)")
+    if not todo:
+        return {'updated': 0, 'failed': 0, 'new_rows': 0}
+
+    writer = DeltaWriter(base_file)
+    stats = {'updated': 0, 'failed': 0, 'new_rows': 0, 'done': 0}
+    failed_codes = []
+
+    def after_one():
+        stats['done'] += 1
+        if stats['done'] % CHECKPOINT_EVERY == 0:
+            nbytes = writer.checkpoint()
+            print(f"  [checkpoint] {stats['done']}/{len(todo)} 写入 {nbytes / 1024:.1f}KB")
+
+    def on_result(job, rows, source):
+        rows = [r for r in rows if tails[job.code] < r['date'] <= end_date]
+        if rows:
+            writer.add(job.code, rows)
+            stats['updated'] += 1
+            stats['new_rows'] += len(rows)
+        else:
+            stats['failed'] += 1
+            failed_codes.append(job.code)
+        after_one()
+
+    def on_failure(job, error):
+        stats['failed'] += 1
+        failed_codes.append(job.code)
+        after_one()
+
+    jobs = [FetchJob(code, start=_next_day(last), end=end_date) for code, last in todo]
+    run_stats = engine.run(jobs, on_result, on_failure, progress_every=PROGRESS_EVERY)
+    nbytes = writer.checkpoint()
+    print(f"  [checkpoint] 完成 写入 {nbytes / 1024:.1f}KB")
+    print(f"[完成] 更新 {stats['updated']} 只, 失败/无数据 {stats['failed']} 只, "
+          f"新增 {stats['new_rows']} 条, 耗时 {run_stats['elapsed']:.0f}s "
+          f"(来源: {run_stats['by_source']})")
+    if failed_codes:
+        print(f"  失败代码示例: {failed_codes[:20]}")
+    return stats
+
+
+def update_index(engine, end_date, index_file=INDEX_FILE):
+    """上证指数（记录列表格式）增量更新，返回新增条数"""
+    if not os.path.exists(index_file):
+        print(f"[2] 指数文件不存在，跳过: {index_file}")
+        return 0
+    with open(index_file, 'r', encoding='utf-8') as f:
+        idx = json.load(f)
+    if not isinstance(idx, list):
+        print("[2] 指数文件不是记录列表格式，跳过")
+        return 0
+    last = idx[-1].get('date', '') if idx else ''
+    if last >= end_date:
+        print(f"[2] 指数已是最新: {last}")
+        return 0
+
+    got = {}
+    engine.run([FetchJob(INDEX_CODE, start=_next_day(last) if last else None, end=end_date)],
+               lambda job, rows, source: got.setdefault('rows', rows), progress_every=0)
+    added = merge_new_rows(idx, got.get('rows') or [])
+    if added:
+        with open(index_file, 'w', encoding='utf-8') as f:
+            json.dump(idx, f, ensure_ascii=False)
+        print(f"[2] 指数新增 {added} 条: {idx[-1].get('date')}")
+    else:
+        print("[2] 指数无新数据")
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description='K线增量更新（增量段 + 后台压缩）')
+    parser.add_argument('--base', default=KLINE_JSON, help='K线主文件')
+    parser.add_argument('--target', default=None, help='目标日期，默认最近交易日')
+    parser.add_argument('--sources', default=','.join(FETCH_SOURCES), help='数据源（回退顺序）')
+    parser.add_argument('--no-index', action='store_true', help='不更新上证指数')
+    parser.add_argument('--no-compact', action='store_true', help='只写增量段，不压缩')
+    parser.add_argument('--compact-now', action='store_true', help='在当前进程中压缩')
+    args = parser.parse_args()
+
+    target_date = args.target or get_latest_trade_date()
+    end_date = max(target_date, datetime.now().strftime('%Y-%m-%d'))
+    print("=" * 60)
+    print(f"K线增量更新  目标日期: {target_date}  主文件: {os.path.basename(args.base)}")
+    print("=" * 60)
+
+    engine = KlineFetchEngine(sources=[s.strip() for s in args.sources.split(',') if s.strip()])
+    stats = update_stocks(engine, args.base, target_date, end_date)
+    if not args.no_index:
+        update_index(engine, end_date)
+
+    try:
+        with open(STATUS_FILE, 'w', encoding='utf-8') as f:
+            json.dump({
+                'last_update_date': target_date,
+                'last_update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'update_type': 'incremental_delta',
+                'updated_stocks': stats['updated'],
+                'failed_stocks': stats['failed'],
+                'new_rows': stats['new_rows'],
+                'data_source': args.sources,
+            }, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"写入状态文件失败: {e}")
+
+    if args.compact_now:
+        compact(args.base)
+    elif not args.no_compact and stats['new_rows']:
+        spawn_compaction(args.base)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 响应缓存 - 按内容寻址的本地 SQLite 缓存
+
+每日推荐重跑、回测回放时，同一只股票同一天、同一批新闻会生成完全相同的提示词，
+每次都要付出完整的网络延迟和 token 成本。这里按
+    sha256(provider, model, system_prompt, user_prompt, temperature, max_tokens)
+缓存 LLM 的原始响应文本：
+  1. 存在 data/llm_cache.sqlite（WAL 模式，多线程各用一个连接）
+  2. 条目超过 TTL 视为未命中；条目数超过上限时按最近访问时间淘汰最旧的 10%
+  3. 只缓存成功的响应（调用方负责只 put 解析成功的内容）
+  4. 命中/未命中/写入/淘汰计数通过 stats() 暴露
+
+绕过缓存：
+  - 单次调用: 各客户端 chat(..., use_cache=False)
+  - 全局: 环境变量 LLM_CACHE_BYPASS=1，或 set_cache_enabled(False)
+
+使用方法：
+    from llm_cache import get_llm_cache
+    cache = get_llm_cache()
+    key = cache.key('DeepSeek', 'deepseek-chat', system, user, 0.3)
+    text = cache.get(key)
+    if text is None:
+        text = call_api(...)
+        cache.put(key, text, provider='DeepSeek', model='deepseek-chat')
+
+    python llm_cache.py stats | purge | clear
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'llm_cache.sqlite')
+CACHE_TTL = 7 * 24 * 3600     # 条目有效期（秒）
+MAX_ENTRIES = 50000           # 条目数上限，超过后按最近访问时间淘汰
+EVICT_FRACTION = 0.1          # 每次淘汰的比例
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_BYPASS', '') not in ('1', 'true', 'True')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    provider TEXT,
+    model TEXT,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed);
+"""
+
+
+def cache_key(provider, model, system_prompt, user_prompt, temperature, max_tokens=None):
+    """(provider, model, system, user, temperature, max_tokens) → sha256 十六进制"""
+    payload = json.dumps([provider or '', model or '', system_prompt or '', user_prompt or '',
+                          round(float(temperature or 0), 4), max_tokens],
+                         ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite 响应缓存（线程安全，每个线程一个连接）"""
+
+    def __init__(self, path=CACHE_FILE, ttl=CACHE_TTL, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts_since_check = 0
+        self._ready = False
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._ready:
+                conn.executescript(_SCHEMA)
+                self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    # ------------------------------------------------------------------
+    # 查询/写入
+    # ------------------------------------------------------------------
+    key = staticmethod(cache_key)
+
+    def get(self, key):
+        """命中返回响应文本，未命中/过期/禁用返回 None"""
+        if not (self.enabled and LLM_CACHE_ENABLED):
+            return None
+        try:
+            conn = self._conn()
+            row = conn.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+            now = time.time()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self._count('misses')
+                return None
+            conn.execute('UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?', (now, key))
+            conn.commit()
+            self._count('hits')
+            return row[0]
+        except Exception as e:
+            print(f"[LLM缓存] 读取失败: {e}")
+            return None
+
+    def get_any(self, keys):
+        """按顺序查找多个键（如 fallback 链上的各个 provider），返回 (key, 响应) 或 (None, None)
+
+        整个链只记一次命中/未命中。
+        """
+        if not (self.enabled and LLM_CACHE_ENABLED):
+            return None, None
+        try:
+            conn = self._conn()
+            now = time.time()
+            for key in keys:
+                row = conn.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is not None and not (self.ttl and now - row[1] > self.ttl):
+                    conn.execute('UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?', (now, key))
+                    conn.commit()
+                    self._count('hits')
+                    return key, row[0]
+            self._count('misses')
+        except Exception as e:
+            print(f"[LLM缓存] 读取失败: {e}")
+        return None, None
+
+    def put(self, key, response, provider='', model=''):
+        """写入一条成功的响应"""
+        if not (self.enabled and LLM_CACHE_ENABLED) or not response:
+            return False
+        try:
+            conn = self._conn()
+            now = time.time()
+            conn.execute('INSERT OR REPLACE INTO responses (key, provider, model, response, created, accessed, hits) '
+                         'VALUES (?, ?, ?, ?, ?, ?, 0)', (key, provider, model, response, now, now))
+            conn.commit()
+            self._count('writes')
+            with self._lock:
+                self._puts_since_check += 1
+                check = self._puts_since_check >= 100
+                if check:
+                    self._puts_since_check = 0
+            if check:
+                self.evict()
+            return True
+        except Exception as e:
+            print(f"[LLM缓存] 写入失败: {e}")
+            return False
+
+    # ------------------------------------------------------------------
+    # 维护
+    # ------------------------------------------------------------------
+    def evict(self):
+        """删除过期条目；条目数超过上限时按最近访问时间淘汰最旧的一批，返回删除条数"""
+        try:
+            conn = self._conn()
+            removed = 0
+            if self.ttl:
+                removed += conn.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.ttl,)).rowcount
+            count = conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            if count > self.max_entries:
+                drop = count - int(self.max_entries * (1 - EVICT_FRACTION))
+                removed += conn.execute('DELETE FROM responses WHERE key IN '
+                                        '(SELECT key FROM responses ORDER BY accessed LIMIT ?)', (drop,)).rowcount
+            conn.commit()
+            if removed:
+                self._count('evictions', removed)
+            return removed
+        except Exception as e:
+            print(f"[LLM缓存] 淘汰失败: {e}")
+            return 0
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute('DELETE FROM responses')
+        conn.commit()
+
+    def stats(self):
+        """命中/未命中计数（本进程）+ 缓存条目数"""
+        try:
+            entries = self._conn().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        except Exception:
+            entries = None
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': entries,
+            'enabled': self.enabled and LLM_CACHE_ENABLED,
+        }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """进程内共享的缓存实例"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMResponseCache()
+        return _shared_cache
+
+
+def set_cache_enabled(enabled):
+    """全局开关（例如需要强制重新生成时）"""
+    get_llm_cache().enabled = bool(enabled)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='LLM 响应缓存')
+    parser.add_argument('cmd', choices=['stats', 'purge', 'clear'])
+    args = parser.parse_args()
+    cache = get_llm_cache()
+    if args.cmd == 'stats':
+        print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+    elif args.cmd == 'purge':
+        print(f"[LLM缓存] 删除 {cache.evict()} 条")
+    else:
+        cache.clear()
+        print("[LLM缓存] 已清空")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 """
 增量更新 V19 股票池 K 线数据 (2026-05-06 ~ 2026-05-09)
 直接使用 EmQuantAPI，不通过 Choice Worker
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import json
 import sys
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+综合股票数据存储 - 替代 comprehensive_stock_data_part_N.json 分卷文件的 SQLite 键值存储
+
+分卷 JSON 的问题：每次保存都要整卷读出再以 indent=2 整卷写回，读最后一卷只为数条数，
+每次都重写 stock_file_index.json；加载时把所有分卷 json.load 成一个大字典，
+GUI 查一只股票的基本面也要解析整卷文件。这里改为：
+  1. 每只股票每类数据一条记录 (code, kind) → JSON，kind 见 FIELD_KINDS；
+     其余顶层小字段（name/timestamp/...）合并为 meta 记录
+  2. upsert() 一个事务批量写入；只写入数据中出现的字段，未出现的类别保持不变（局部更新）
+  3. get()/load_all() 可按 kind 投影读取，get_value() 用 json_extract 只取记录里的某个路径
+  4. 首次打开时自动把已有分卷导入（import_json_parts），export_json_parts() 可反向导出
+
+使用方法：
+    from stock_data_store import open_stock_data_store
+    store = open_stock_data_store('data/comprehensive_stock_data.json')
+    store.upsert({'600000': {'kline_data': {...}, 'timestamp': '...'}})
+    info = store.get('600000', kinds=('basic', 'industry'))    # {'basic_info':..., 'industry_concept':...}
+    price = store.get_value('600000', 'kline', '$.latest_price')
+    all_data = store.load_all(kinds=('kline', 'meta'))
+
+    python stock_data_store.py stats | import | export [--data-file data/comprehensive_stock_data.json]
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 顶层字段 → 存储类别
+FIELD_KINDS = {
+    'kline_data': 'kline',
+    'basic_info': 'basic',
+    'financial_data': 'financial',
+    'industry_concept': 'industry',
+    'fund_flow': 'fund_flow',
+    'technical_indicators': 'technical',
+    'news_announcements': 'news',
+}
+KIND_FIELDS = {kind: field for field, kind in FIELD_KINDS.items()}
+META_KIND = 'meta'
+ALL_KINDS = tuple(KIND_FIELDS) + (META_KIND,)
+
+_CHUNK = 500   # IN (...) 查询每批的代码数
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    code TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (code, kind)
+);
+CREATE INDEX IF NOT EXISTS idx_records_kind ON records(kind);
+"""
+
+
+def store_path_for(data_file):
+    """comprehensive_stock_data.json → 同目录的 comprehensive_stock_data.sqlite"""
+    base, _ = os.path.splitext(os.path.abspath(data_file))
+    return base + '.sqlite'
+
+
+def _part_number(path):
+    try:
+        return int(path.split('_part_')[-1].replace('.json', ''))
+    except ValueError:
+        return 0
+
+
+def _check_kinds(kinds):
+    if kinds is None:
+        return None
+    kinds = tuple(kinds)
+    unknown = [k for k in kinds if k not in ALL_KINDS]
+    if unknown:
+        raise ValueError(f"未知的数据类别: {unknown}（可选: {ALL_KINDS}）")
+    return kinds
+
+
+class StockDataStore:
+    """按 (股票, 数据类别) 存取综合数据（线程安全，每个线程一个连接）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._ready = False
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._ready:
+                conn.executescript(_SCHEMA)
+                self._ready = True
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def upsert(self, data, encoder=None):
+        """批量写入 {code: 股票数据}，一个事务完成，返回写入的股票数
+
+        每只股票只写入其中出现的字段；meta 字段与已有的 meta 合并。
+        """
+        if not data:
+            return 0
+        now = time.time()
+        rows = []
+        meta_updates = {}
+        for code, stock in data.items():
+            if not isinstance(stock, dict):
+                continue
+            meta = {}
+            for field, value in stock.items():
+                kind = FIELD_KINDS.get(field)
+                if kind is None:
+                    meta[field] = value
+                else:
+                    rows.append((code, kind, json.dumps(value, ensure_ascii=False, cls=encoder), now))
+            if meta:
+                meta_updates[code] = meta
+
+        conn = self._conn()
+        with conn:
+            if meta_updates:
+                existing = self._fetch(conn, list(meta_updates), (META_KIND,))
+                for code, meta in meta_updates.items():
+                    merged = existing.get(code, {}).get(META_KIND) or {}
+                    merged.update(meta)
+                    rows.append((code, META_KIND, json.dumps(merged, ensure_ascii=False, cls=encoder), now))
+            conn.executemany(
+                'INSERT INTO records (code, kind, payload, updated) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(code, kind) DO UPDATE SET payload = excluded.payload, updated = excluded.updated',
+                rows)
+        return len({r[0] for r in rows})
+
+    def delete(self, codes):
+        """删除股票的全部记录"""
+        codes = list(codes)
+        conn = self._conn()
+        with conn:
+            for i in range(0, len(codes), _CHUNK):
+                chunk = codes[i:i + _CHUNK]
+                conn.execute(f"DELETE FROM records WHERE code IN ({','.join('?' * len(chunk))})", chunk)
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _fetch(conn, codes, kinds):
+        """{code: {kind: payload}}"""
+        out = {}
+        kind_sql, kind_args = '', []
+        if kinds is not None:
+            kind_sql = f" AND kind IN ({','.join('?' * len(kinds))})"
+            kind_args = list(kinds)
+        for i in range(0, len(codes), _CHUNK):
+            chunk = codes[i:i + _CHUNK]
+            cur = conn.execute(f"SELECT code, kind, payload FROM records WHERE code IN "
+                               f"({','.join('?' * len(chunk))}){kind_sql}", chunk + kind_args)
+            for code, kind, payload in cur:
+                out.setdefault(code, {})[kind] = json.loads(payload) if payload is not None else None
+        return out
+
+    @staticmethod
+    def _assemble(parts):
+        """{kind: payload} → 与分卷 JSON 中相同结构的股票字典"""
+        stock = dict(parts.get(META_KIND) or {})
+        for kind, value in parts.items():
+            if kind != META_KIND:
+                stock[KIND_FIELDS[kind]] = value
+        return stock
+
+    def get(self, code, kinds=None):
+        """单只股票（kinds 指定时只取这些类别），不存在返回 None"""
+        kinds = _check_kinds(kinds)
+        parts = self._fetch(self._conn(), [code], kinds).get(code)
+        return self._assemble(parts) if parts else None
+
+    def get_many(self, codes, kinds=None):
+        kinds = _check_kinds(kinds)
+        return {code: self._assemble(parts)
+                for code, parts in self._fetch(self._conn(), list(codes), kinds).items()}
+
+    def get_field(self, code, field):
+        """单个顶层字段（如 'financial_data' / 'name'），不存在返回 None"""
+        kind = FIELD_KINDS.get(field, META_KIND)
+        stock = self.get(code, kinds=(kind,))
+        return stock.get(field) if stock else None
+
+    def get_value(self, code, kind, json_path='$'):
+        """记录内某个 JSON 路径的值（json_extract，不解析整条记录）"""
+        _check_kinds((kind,))
+        row = self._conn().execute('SELECT json_extract(payload, ?) FROM records WHERE code = ? AND kind = ?',
+                                   (json_path, code, kind)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        value = row[0]
+        if isinstance(value, str) and value[:1] in '[{':
+            try:
+                return json.loads(value)
+            except ValueError:
+                pass
+        return value
+
+    def load_all(self, kinds=None):
+        """全部股票 {code: 股票数据}，按首次写入顺序"""
+        kinds = _check_kinds(kinds)
+        sql = 'SELECT code, kind, payload FROM records'
+        args = []
+        if kinds is not None:
+            sql += f" WHERE kind IN ({','.join('?' * len(kinds))})"
+            args = list(kinds)
+        grouped = {}
+        for code, kind, payload in self._conn().execute(sql + ' ORDER BY rowid', args):
+            grouped.setdefault(code, {})[kind] = json.loads(payload) if payload is not None else None
+        return {code: self._assemble(parts) for code, parts in grouped.items()}
+
+    def codes(self):
+        return [r[0] for r in self._conn().execute(
+            'SELECT code FROM records GROUP BY code ORDER BY MIN(rowid)')]
+
+    def __contains__(self, code):
+        return self._conn().execute('SELECT 1 FROM records WHERE code = ? LIMIT 1', (code,)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(DISTINCT code) FROM records').fetchone()[0]
+
+    def last_modified(self):
+        """最近一次写入的时间戳（无数据返回 None）"""
+        return self._conn().execute('SELECT MAX(updated) FROM records').fetchone()[0]
+
+    def stats(self):
+        conn = self._conn()
+        kinds = dict(conn.execute('SELECT kind, COUNT(*) FROM records GROUP BY kind').fetchall())
+        return {
+            'path': self.path,
+            'stocks': len(self),
+            'records': kinds,
+            'size_mb': round(os.path.getsize(self.path) / 1024 / 1024, 1) if os.path.exists(self.path) else 0,
+        }
+
+    # ------------------------------------------------------------------
+    # 与分卷 JSON 互转
+    # ------------------------------------------------------------------
+    def import_json_parts(self, part_files):
+        """导入 comprehensive_stock_data_part_N.json（按分卷编号顺序，后者覆盖前者）"""
+        total = 0
+        for path in sorted(part_files, key=_part_number):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = json.load(f)
+                stocks = content.get('stocks', content) if isinstance(content, dict) else {}
+                total += self.upsert(stocks)
+                print(f"[数据存储] 导入 {os.path.basename(path)}: {len(stocks)} 只股票")
+            except Exception as e:
+                print(f"[数据存储] 导入 {path} 失败: {e}")
+        return total
+
+    def export_json_parts(self, data_file, part_size=200):
+        """导出为分卷 JSON（供仍按分卷读取的旧脚本使用），返回写出的文件列表"""
+        base_dir = os.path.dirname(os.path.abspath(data_file))
+        base_name = os.path.basename(data_file).replace('.json', '')
+        codes = self.codes()
+        written, index = [], {}
+        for n, i in enumerate(range(0, len(codes), part_size), start=1):
+            chunk = self.get_many(codes[i:i + part_size])
+            stocks = {code: chunk[code] for code in codes[i:i + part_size] if code in chunk}
+            path = os.path.join(base_dir, f"{base_name}_part_{n}.json")
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'stocks': stocks, 'total_stocks': len(stocks),
+                           'last_updated': time.strftime('%Y-%m-%dT%H:%M:%S')}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            index.update({code: os.path.basename(path) for code in stocks})
+            written.append(path)
+        with open(os.path.join(base_dir, 'stock_file_index.json'), 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        return written
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_stock_data_store(data_file, migrate=True):
+    """data_file 对应的共享存储实例；存储为空且存在分卷 JSON 时先导入"""
+    path = store_path_for(data_file)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = StockDataStore(path)
+            if migrate and len(store) == 0:
+                base_dir = os.path.dirname(os.path.abspath(data_file))
+                base_name = os.path.basename(data_file).replace('.json', '')
+                parts = glob.glob(os.path.join(base_dir, f"{base_name}_part_*.json"))
+                if parts:
+                    t0 = time.time()
+                    n = store.import_json_parts(parts)
+                    print(f"[数据存储] 已从 {len(parts)} 个分卷导入 {n} 只股票 ({time.time() - t0:.1f}s)")
+            _stores[path] = store
+        return store
+
+
+def main():
+    import argparse
+
+    default_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'comprehensive_stock_data.json')
+    parser = argparse.ArgumentParser(description='综合股票数据存储')
+    parser.add_argument('cmd', choices=['stats', 'import', 'export'])
+    parser.add_argument('--data-file', default=default_file)
+    args = parser.parse_args()
+
+    store = open_stock_data_store(args.data_file, migrate=(args.cmd == 'stats'))
+    if args.cmd == 'import':
+        base_name = os.path.basename(args.data_file).replace('.json', '')
+        parts = glob.glob(os.path.join(os.path.dirname(os.path.abspath(args.data_file)), f"{base_name}_part_*.json"))
+        store.import_json_parts(parts)
+    elif args.cmd == 'export':
+        files = store.export_json_parts(args.data_file)
+        print(f"[数据存储] 已导出 {len(files)} 个分卷")
+    print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@
 K线缓存增量更新脚本
 从 2026-04-25 补全到最新日期
 数据源：BaoStock（免费稳定）
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import json
 import os
@@ -3,6 +3,7 @@
 """
 K线缓存快速增量更新 v3
 优化：跳过已更新的股票、减少延迟
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import sys
 sys.stdout.reconfigure(line_buffering=True)
@@ -21,6 +22,9 @@ import json
 import time
 from datetime import datetime, timedelta
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TradingShared', 'api'))
+from kline_fetch_engine import KlineFetchEngine, FetchJob, merge_new_rows
+
 DATA_DIR = r'D:\GitHub\TradingAgents\TradingShared\data\kline_cache'
 INDEX_DIR = r'D:\GitHub\TradingAgents\TradingShared\data'
 KLINE_FILE = os.path.join(DATA_DIR, 'kline_full_latest.json')
@@ -29,9 +33,8 @@ STATUS_FILE = os.path.join(INDEX_DIR, 'kline_update_status.json')
 
 END_DATE = datetime.now().strftime('%Y-%m-%d')
 BATCH_SIZE = 50
-SLEEP_REQ = 0.05  # Very short sleep between requests
-SLEEP_BATCH = 0.3  # Short sleep between batches
 SAVE_EVERY = 10
+FETCH_SOURCES = ('tencent', 'sina')  # Concurrent fetch, fallback order; rate limits in kline_fetch_engine
 TARGET_DATE = '2026-05-06'  # Only update stocks before this date
 
 
@@ -127,53 +130,34 @@ def main():
         return
     
     session = create_session()
-    updated = 0
-    failed = 0
     total = len(codes_to_update)
-    total_batches = (total + BATCH_SIZE - 1) // BATCH_SIZE
-    
+    stats = {'updated': 0, 'done': 0}
     start_time = time.time()
-    
-    for batch_idx in range(total_batches):
-        bs_idx = batch_idx * BATCH_SIZE
-        be_idx = min(bs_idx + BATCH_SIZE, total)
-        batch = codes_to_update[bs_idx:be_idx]
-        
-        batch_updated = 0
-        for code, last_date in batch:
-            fetch_start = (datetime.strptime(last_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
-            
-            new_rows = fetch_kline(session, code, fetch_start)
-            
-            if new_rows:
-                existing = data[code]
-                existing_dates = {r.get('date') for r in existing}
-                added = 0
-                for row in new_rows:
-                    if row['date'] not in existing_dates:
-                        existing.append(row)
-                        added += 1
-                if added > 0:
-                    existing.sort(key=lambda x: x.get('date', ''))
-                    data[code] = existing
-                    updated += 1
-                    batch_updated += 1
-            
-            time.sleep(SLEEP_REQ)
-        
-        if batch_idx < total_batches - 1:
-            time.sleep(SLEEP_BATCH)
-        
-        elapsed = time.time() - start_time
-        pct = (batch_idx + 1) / total_batches * 100
-        eta = elapsed / (batch_idx + 1) * (total_batches - batch_idx - 1)
-        print(f'[批次 {batch_idx+1}/{total_batches}] {be_idx}/{total} 更新{batch_updated}只 | {pct:.0f}% ETA:{eta:.0f}s', flush=True)
-        
-        if (batch_idx + 1) % SAVE_EVERY == 0:
+
+    def on_result(job, new_rows, source):
+        stats['done'] += 1
+        if new_rows and merge_new_rows(data[job.code], new_rows) > 0:
+            stats['updated'] += 1
+        if stats['done'] % BATCH_SIZE == 0 or stats['done'] == total:
+            elapsed = time.time() - start_time
+            eta = elapsed / stats['done'] * (total - stats['done'])
+            print(f'[进度] {stats["done"]}/{total} 更新{stats["updated"]}只 | '
+                  f'{stats["done"]/total*100:.0f}% ETA:{eta:.0f}s', flush=True)
+        if stats['done'] % (SAVE_EVERY * BATCH_SIZE) == 0:
             with open(KLINE_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False)
             print(f'  [已保存]', flush=True)
-    
+
+    def on_failure(job, error):
+        stats['done'] += 1
+        print(f'  [ERR] {job.code}: {error}', flush=True)
+
+    jobs = [FetchJob(code, start=(datetime.strptime(last_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'),
+                     end=END_DATE)
+            for code, last_date in codes_to_update]
+    KlineFetchEngine(sources=FETCH_SOURCES).run(jobs, on_result, on_failure, progress_every=0)
+    updated = stats['updated']
+
     # Final save
     with open(KLINE_FILE, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False)
@@ -3,6 +3,7 @@
 """
 K线缓存快速增量更新 v4
 修复：正确处理已有前缀的代码
+注意：日常增量更新请使用 TradingShared/kline_update.py（新K线写增量段 + 后台压缩，不再整文件重写）
 """
 import sys
 sys.stdout.reconfigure(line_buffering=True)
@@ -21,6 +22,9 @@ import json
 import time
 from datetime import datetime, timedelta
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TradingShared', 'api'))
+from kline_fetch_engine import KlineFetchEngine, FetchJob, merge_new_rows
+
 DATA_DIR = r'D:\GitHub\TradingAgents\TradingShared\data\kline_cache'
 INDEX_DIR = r'D:\GitHub\TradingAgents\TradingShared\data'
 KLINE_FILE = os.path.join(DATA_DIR, 'kline_full_latest.json')
@@ -29,9 +33,9 @@ STATUS_FILE = os.path.join(INDEX_DIR, 'kline_update_status.json')
 
 END_DATE = datetime.now().strftime('%Y-%m-%d')
 BATCH_SIZE = 50
-SLEEP_REQ = 0.05
-SLEEP_BATCH = 0.3
 SAVE_EVERY = 10
+# 并发抓取：数据源顺序即回退顺序，限速见 kline_fetch_engine.SOURCE_LIMITS
+FETCH_SOURCES = ('tencent', 'sina')
 TARGET_DATE = '2026-05-06'
 
 
@@ -45,68 +49,6 @@ def create_session():
     return session
 
 
-def to_tencent_code(code):
-    """Convert cache code to tencent format. Cache codes already have sh/sz prefix."""
-    # Already in correct format (sh600000, sz000001)
-    if code.startswith('sh') or code.startswith('sz'):
-        return code
-    # Pure numeric
-    if code.startswith('6'):
-        return f'sh{code}'
-    elif code.startswith(('0', '3')):
-        return f'sz{code}'
-    return f'sz{code}'
-
-
-def fetch_kline(session, code, start_date):
-    tc = to_tencent_code(code)
-    try:
-        url = 'http://web.ifzq.gtimg.cn/appstock/app/fqkline/get'
-        params = {
-            '_var': 'kline_day',
-            'param': f'{tc},day,{start_date},{END_DATE},320,qfq',
-            'r': str(time.time())
-        }
-        resp = session.get(url, params=params, timeout=10)
-        if resp.status_code != 200:
-            return None
-        
-        text = resp.text
-        if '=' in text:
-            text = text.split('=', 1)[1].strip()
-        if text.endswith(';'):
-            text = text[:-1]
-        
-        data = json.loads(text)
-        if data.get('code') != 0:
-            return None
-        
-        sd = data.get('data', {}).get(tc, {})
-        klines = sd.get('qfqday', []) or sd.get('day', [])
-        if not klines:
-            return None
-        
-        result = []
-        for row in klines:
-            if len(row) < 6:
-                continue
-            try:
-                result.append({
-                    'date': row[0],
-                    'open': float(row[1]),
-                    'high': float(row[3]),
-                    'low': float(row[4]),
-                    'close': float(row[2]),
-                    'volume': float(row[5]),
-                })
-            except (ValueError, IndexError):
-                continue
-        return result if result else None
-    except Exception as e:
-        print(f'  [ERR] {code}: {e}', flush=True)
-        return None
-
-
 def main():
     print(f'[v4] K线快速增量更新', flush=True)
     print(f'目标日期: {TARGET_DATE}', flush=True)
@@ -130,57 +72,39 @@ def main():
         print('[INFO] 所有股票已是最新!', flush=True)
     
     session = create_session()
-    updated = 0
-    failed = 0
     total = len(codes_to_update)
-    total_batches = (total + BATCH_SIZE - 1) // BATCH_SIZE
-    
+    stats = {'updated': 0, 'failed': 0, 'done': 0}
     start_time = time.time()
-    
-    for batch_idx in range(total_batches):
-        bs_idx = batch_idx * BATCH_SIZE
-        be_idx = min(bs_idx + BATCH_SIZE, total)
-        batch = codes_to_update[bs_idx:be_idx]
-        
-        batch_updated = 0
-        batch_failed = 0
-        for code, last_date in batch:
-            fetch_start = (datetime.strptime(last_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
-            
-            new_rows = fetch_kline(session, code, fetch_start)
-            
-            if new_rows:
-                existing = data[code]
-                existing_dates = {r.get('date') for r in existing}
-                added = 0
-                for row in new_rows:
-                    if row['date'] not in existing_dates:
-                        existing.append(row)
-                        added += 1
-                if added > 0:
-                    existing.sort(key=lambda x: x.get('date', ''))
-                    data[code] = existing
-                    updated += 1
-                    batch_updated += 1
-            else:
-                batch_failed += 1
-                failed += 1
-            
-            time.sleep(SLEEP_REQ)
-        
-        if batch_idx < total_batches - 1:
-            time.sleep(SLEEP_BATCH)
-        
-        elapsed = time.time() - start_time
-        pct = (batch_idx + 1) / total_batches * 100
-        eta = elapsed / (batch_idx + 1) * (total_batches - batch_idx - 1) if batch_idx > 0 else 0
-        print(f'[批次 {batch_idx+1}/{total_batches}] {be_idx}/{total} +{batch_updated} -{batch_failed} | {pct:.0f}% ETA:{eta:.0f}s', flush=True)
-        
-        if (batch_idx + 1) % SAVE_EVERY == 0:
+
+    def on_result(job, new_rows, source):
+        stats['done'] += 1
+        if new_rows:
+            if merge_new_rows(data[job.code], new_rows) > 0:
+                stats['updated'] += 1
+        else:
+            stats['failed'] += 1
+        if stats['done'] % BATCH_SIZE == 0 or stats['done'] == total:
+            elapsed = time.time() - start_time
+            eta = elapsed / stats['done'] * (total - stats['done'])
+            print(f'[进度] {stats["done"]}/{total} +{stats["updated"]} -{stats["failed"]} | '
+                  f'{stats["done"]/total*100:.0f}% ETA:{eta:.0f}s', flush=True)
+        if stats['done'] % (SAVE_EVERY * BATCH_SIZE) == 0:
             with open(KLINE_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False)
             print(f'  [已保存]', flush=True)
-    
+
+    def on_failure(job, error):
+        stats['done'] += 1
+        stats['failed'] += 1
+        print(f'  [ERR] {job.code}: {error}', flush=True)
+
+    jobs = [FetchJob(code, start=(datetime.strptime(last_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'),
+                     end=END_DATE)
+            for code, last_date in codes_to_update]
+    KlineFetchEngine(sources=FETCH_SOURCES).run(jobs, on_result, on_failure, progress_every=0)
+    updated = stats['updated']
+    failed = stats['failed']
+
     # Final save
     with open(KLINE_FILE, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False)